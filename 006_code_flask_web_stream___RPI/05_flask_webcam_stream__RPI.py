@@ -84,49 +84,59 @@ http://localhost:5000/
 
 
 import yaml
-import cv2
 import sys
 import threading
 import time
 import queue
 import copy
 import os
-import numpy as np
 from flask import Flask, Response, render_template, jsonify, request
 import argparse
 from utils_rpi.camera_checker import CameraChecker
-from utils_rpi.test_cam_backend import test_camera_backends
+from utils_rpi.camera_pool import CameraPool, PooledCamera
+from utils_rpi.lazy_import import lazy_import, is_module_available, get_import_times
+from utils_rpi.virtual_camera import is_virtual_device, open_virtual_camera, get_virtual_cameras_for_api
+from utils_rpi.frame_hub import FrameHub, CapturedFrame, mjpeg_part
+from utils_rpi.recorder import SegmentedRecorder
+from utils_rpi.frame_bus import FrameBusPublisher
+from utils_rpi.overflow_tier import OverflowTier
+from utils_rpi.subscriber_pacing import SubscriberPacing
+from utils_rpi.mosaic import MosaicStream
+from utils_rpi.capture_group import CaptureGroupManager, frameset_to_jpeg
+from utils_rpi.usb_capture import UsbFrameReader
+from utils_rpi.idle_suspend import IdleSuspend
+from utils_rpi.core_budget import CoreBudget, IntervalStats
+from utils_rpi.thermal_governor import ThermalGovernor
+from utils_rpi.tag_analysis import TagAnalysis
+from utils_rpi.pose_feed import PoseFeed, compact_json
+from utils_rpi.overlay_meta import OverlayMeta
+from utils_rpi.stream_settings import (ConfigWatcher, CAPTURE_KEYS, csi_key, diff_settings,
+                                       extract_settings, validate_settings)
+from collections import deque
+from contextlib import nullcontext
 from datetime import datetime
 
 # Импортируем логгер
 from utils_rpi.logger import create_logger
 
+# Тяжелые модули импортируются при первом обращении (в фоне, вместе с камерой)
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
 # Добавляем путь к utils_rpi
 current_dir = os.path.dirname(os.path.abspath(__file__))
 utils_path = os.path.join(current_dir, 'utils_rpi')
 if utils_path not in sys.path:
     sys.path.append(utils_path)
 
-# Пробуем импортировать CSI Camera Manager
-try:
-    from utils_rpi.csi_camera_manager import CSICameraManager
-    PICAMERA2_AVAILABLE = True
-
-except ImportError as e:
-    print(f"⚠️  Не удалось загрузить CSICameraManager: {e}")    
-    print("   Установите: pip install picamera2")
-    print("   Или проверьте наличие файла utils_rpi/csi_camera_manager.py")
-    PICAMERA2_AVAILABLE = False
-    CSICameraManager = None
-
-try:
-    from picamera2 import Picamera2    
-    PICAMERA2_AVAILABLE = True
-except ImportError:
-    PICAMERA2_AVAILABLE = False
+# Наличие Picamera2 проверяем без импорта - сам модуль грузится при поиске камер
+PICAMERA2_AVAILABLE = is_module_available('picamera2')
+if not PICAMERA2_AVAILABLE:
     print("⚠️  Picamera2 не установлен. CSI камеры не будут доступны.")
     print("   Установите: pip install picamera2")
 
+SERVER_START_TIME = time.time()
+
 
 def load_config(config_path="config_rpi.yaml"):
     """Загрузка конфигурации из YAML файла"""
@@ -149,53 +159,25 @@ def load_config(config_path="config_rpi.yaml"):
 class CameraStreamer:
     """Класс для управления камерой и стримингом"""
     
-    def __init__(self, config, logger, camera_info):
+    def __init__(self, config, logger, camera_info=None, config_path=None):
         self.config = config
         self.logger = logger
         
-        # # Инициализируем менеджер CSI камер
-        # self.csi_manager = CSICameraManager(config, logger)
-        
-        # # Определяем тип текущей камеры
-        # if camera_info['type'] == 'csi':
-        #     self.camera_type = 'csi'            
-        #     self.current_picam2 = camera_info.get('picam2')
-        #     self.csi_manager.current_picam2 = self.current_picam2
-        #     self.csi_manager.current_camera = camera_info.get('csi_manager', {}).current_camera
-        #     self.current_v4l2_camera = None
-        # else:
-        #     self.camera_type = 'v4l2'
-        #     self.current_v4l2_camera = camera_info.get('camera')
-        #     self.current_picam2 = None
-
         # ===== ВАЖНО: ИНИЦИАЛИЗИРУЕМ csi_settings =====
         self.csi_settings = {}  # ← ЭТО ЕСТЬ!
 
-        # Определяем тип текущей камеры
-        if camera_info['type'] == 'csi':
-            self.camera_type = 'csi'
-            # Используем существующий csi_manager из camera_info
-            self.csi_manager = camera_info.get('csi_manager')
-            self.current_picam2 = camera_info.get('picam2')
-            self.current_v4l2_camera = None
-            self.current_camera_idx = camera_info.get('camera_idx', 0)
-            
-            print(f"✅ CSI камера инициализирована: индекс {self.current_camera_idx}")
-
-            # ===== ВАЖНО: ЗАГРУЖАЕМ НАСТРОЙКИ =====
-            self._load_csi_settings()
-            
-            # Проверим, что загрузилось
-            if self.csi_settings:
-                print(f"📋 Загружены настройки для {self.csi_settings.get('name', 'CSI camera')}")
-                print(f"   Режим фокуса: {self.csi_settings.get('af_mode', 'unknown')}")
-                print(f"   Позиция линзы: {self.csi_settings.get('lens_position', 0.0)}")
-
-        else:
-            self.camera_type = 'v4l2'
-            self.current_v4l2_camera = camera_info.get('camera')
-            self.current_picam2 = None
-            self.csi_manager = None            
+        # Камера подключается позже (attach_camera) - сервер стартует без нее
+        self.camera_type = 'v4l2'
+        self.current_v4l2_camera = None
+        self.current_picam2 = None
+        self.csi_manager = None
+        self.camera_preconfigured = False
+        
+        # Состояние фоновой инициализации камер
+        self.camera_init_state = 'pending'  # pending, initializing, ready, failed
+        self.camera_init_error = None
+        self.camera_init_ms = None
+        self.first_frame_ms = None
 
         # Состояние стрима
         self.stream_active = False
@@ -216,7 +198,92 @@ class CameraStreamer:
         
         # Словарь для отслеживания активных соединений
         self.active_clients = {}
-        self.MAX_STREAMS_PER_CLIENT = 1
+        self.MAX_STREAMS_PER_CLIENT = config['server'].get('max_streams_per_client', 1)
+        
+        # Измерения на стороне зрителей (FPS, пропуски, задержка захват -> показ)
+        self.viewer_stats = {}
+        
+        # Пул "тёплых" камер для быстрого переключения
+        self.camera_pool = CameraPool(config, logger)
+        
+        # Ядра CPU стадий (захват, кодирование, детекция, HTTP) и потоки OpenCV
+        self.core_budget = CoreBudget(config, logger)
+        # Интервал между кадрами захвата (разброс - показатель конкуренции за ядра)
+        self.capture_timing = IntervalStats()
+        
+        # Общее кодирование кадров: один JPEG на кадр для всех клиентов и записи
+        self.frame_hub = FrameHub(config, logger, self.frame_buffer, self.core_budget)
+        self.mjpeg_passthrough = False
+        
+        # Чтение USB камеры: очередь драйвера, пропуск устаревших буферов, возраст кадра
+        self.usb_reader = UsbFrameReader(config)
+        
+        # Урезанный общий поток для клиентов сверх лимитов (вместо отказа)
+        self.overflow_tier = OverflowTier(config, logger, self.frame_hub)
+        
+        # Своя частота и ширина кадра клиента (/video_feed?fps=2&width=640)
+        self.subscriber_pacing = SubscriberPacing(config, logger, self.frame_hub)
+        
+        # Детекция AprilTag в своем потоке (кэш результатов, разметка ?overlay=tags)
+        self.tag_analysis = TagAnalysis(config, logger, self.frame_hub, self.core_budget)
+        # Позы меток без видео: /api/poses/latest и поток SSE /api/poses/stream
+        self.pose_feed = PoseFeed(config, logger, self.tag_analysis)
+        # Фигуры разметки для canvas браузера поверх чистого /video_feed (/api/overlay/stream)
+        self.overlay_meta = OverlayMeta(config, logger, self.tag_analysis)
+        
+        # Последний кадр одним JPEG из памяти (/api/frame.jpg): ETag, ожидание ?after=
+        frame_endpoint = config.get('frame_endpoint', {}) or {}
+        self.frame_max_wait_s = float(frame_endpoint.get('max_wait_s', 30))
+        self.frame_max_waiters = int(frame_endpoint.get('max_waiters', 32))
+        self.frame_waiters = 0
+        self.frame_endpoint_stats = {'requests': 0, 'sent': 0, 'not_modified': 0,
+                                     'long_polls': 0, 'timeouts': 0, 'rejected': 0}
+        
+        # Мозаика всех открытых камер (активная + пул) в одном потоке
+        self.mosaic = MosaicStream(config, logger, self.get_mosaic_sources,
+                                   self.camera_pool.set_frame_retention)
+        
+        # Группы синхронного захвата (стерео): свои камеры, кадры наборами по времени сенсора
+        self.capture_groups = CaptureGroupManager(config, logger, self._open_group_camera)
+        
+        # Непрерывная запись в сегменты MJPEG-AVI
+        self.recorder = SegmentedRecorder(config, logger, self.frame_hub.measured_fps)
+        self.frame_hub.subscribe(self.recorder.on_frame)
+        
+        # Шина кадров в разделяемой памяти для других процессов (трекер, тесты)
+        self.frame_bus = FrameBusPublisher(config, logger)
+        if self.frame_bus.start():
+            self.frame_hub.subscribe_raw(self.frame_bus.on_frame)
+        
+        # Приостановка захвата без потребителей кадров
+        self.idle_suspend = IdleSuspend(config, logger)
+        self.idle_suspend.add_demand('video_feed', lambda: self.active_streams > 0)
+        self.idle_suspend.add_demand('overflow_tier', lambda: self.overflow_tier.subscribers > 0)
+        self.idle_suspend.add_demand('mosaic', lambda: self.mosaic.subscribers > 0)
+        self.idle_suspend.add_demand('recording', lambda: self.recorder.active)
+        self.idle_suspend.add_demand('frame_bus', lambda: self.frame_bus.reader_count() > 0)
+        self.idle_suspend.add_demand('tag_analysis', self.tag_analysis.wants_frames)
+        
+        # Снижение параметров потоков по температуре и загрузке - раньше троттлинга SoC
+        self.thermal_governor = ThermalGovernor(config, logger)
+        self.thermal_governor.register('main', self._governor_main_settings,
+                                       lambda changes: self.apply_stream_settings(changes, source='governor'))
+        self.thermal_governor.register('mosaic', lambda keys: {'fps': self.mosaic.fps},
+                                       lambda changes: self.mosaic.set_fps(changes['fps']))
+        self.thermal_governor.register('overflow', lambda keys: {'fps': self.overflow_tier.fps},
+                                       lambda changes: setattr(self.overflow_tier, 'fps', float(changes['fps'])))
+        self.thermal_governor.register('camera_pool', lambda keys: {'idle_fps': self.camera_pool.idle_fps},
+                                       lambda changes: self.camera_pool.set_idle_fps(changes['idle_fps']))
+        
+        # Изменение параметров стрима без перезапуска (API и слежение за файлом)
+        hot_reload = config.get('hot_reload', {}) or {}
+        self.settings_lock = threading.Lock()
+        self.reconfigure_history = deque(maxlen=int(hot_reload.get('history', 20)))
+        self._file_config = copy.deepcopy(config)
+        self.config_watcher = None
+        if config_path and hot_reload.get('watch_config', True):
+            self.config_watcher = ConfigWatcher(config_path, self._on_config_file_changed, logger,
+                                                float(hot_reload.get('interval_s', 1.0)))
         
         # Определяем путь к шаблонам
         templates_folder = config.get('paths', {}).get('templates_folder', 'templates')
@@ -260,13 +327,9 @@ class CameraStreamer:
         # Настройка маршрутов
         self.setup_routes()
         
-        # Сканируем доступные камеры
-        try:
-            self.camera_checker = CameraChecker(logger=self.logger)
-            self.available_cameras = self.camera_checker.detect_cameras()
-        except Exception as e:
-            print(f"⚠️  Ошибка сканирования камер: {e}")
-            self.available_cameras = []
+        # Сканирование камер выполняется в фоне (initialize_cameras)
+        self.camera_checker = None
+        self.available_cameras = []
         
         # Добавляем отслеживание времени активности стримов
         self.stream_sessions = {}  # client_id -> timestamp
@@ -283,6 +346,108 @@ class CameraStreamer:
         self.cameras_cache_time = 0
         self.CAMERAS_CACHE_TTL = 30  # секунд
 
+        if camera_info is not None:
+            self.attach_camera(camera_info)
+
+    def attach_camera(self, camera_info):
+        """Подключение найденной камеры (результат test_camera_backends)"""
+        # Определяем тип текущей камеры
+        if camera_info['type'] == 'csi':
+            self.camera_type = 'csi'
+            # Используем существующий csi_manager из camera_info
+            self.csi_manager = camera_info.get('csi_manager')
+            self.current_picam2 = camera_info.get('picam2')
+            self.current_v4l2_camera = None
+            self.current_camera_idx = camera_info.get('camera_idx', 0)
+            
+            print(f"✅ CSI камера инициализирована: индекс {self.current_camera_idx}")
+
+            # ===== ВАЖНО: ЗАГРУЖАЕМ НАСТРОЙКИ =====
+            self._load_csi_settings()
+            
+            # Проверим, что загрузилось
+            if self.csi_settings:
+                print(f"📋 Загружены настройки для {self.csi_settings.get('name', 'CSI camera')}")
+                print(f"   Режим фокуса: {self.csi_settings.get('af_mode', 'unknown')}")
+                print(f"   Позиция линзы: {self.csi_settings.get('lens_position', 0.0)}")
+
+        else:
+            self.camera_type = 'v4l2'
+            self.current_v4l2_camera = camera_info.get('camera')
+            self.current_picam2 = None
+            self.csi_manager = None            
+
+            # Перебор мог найти рабочую камеру на другом устройстве
+            if camera_info.get('device') is not None:
+                self.config['camera']['device'] = camera_info['device']
+
+        # Камера уже открыта и настроена при поиске (профиль запуска) -
+        # первый запуск стрима обойдется без переоткрытия устройства
+        self.camera_preconfigured = camera_info.get('preconfigured', False)
+
+    def initialize_cameras(self):
+        """Фоновый поиск камеры и сканирование устройств (сервер уже отвечает)"""
+        self.camera_init_state = 'initializing'
+        init_start = time.time()
+        
+        # Пул потоков OpenCV создается до первой обработки кадров - с ядрами из core_budget
+        self.core_budget.setup_opencv()
+
+        try:
+            print("=" * 60)
+            print("🔍 Поиск рабочей камеры...")
+            print("=" * 60)
+
+            # Импорт тянет OpenCV и Picamera2 - выполняем только здесь
+            from utils_rpi.test_cam_backend import test_camera_backends
+            camera_info = test_camera_backends(self.config, self.logger)
+
+            if camera_info is None:
+                self.camera_init_state = 'failed'
+                self.camera_init_error = 'НЕ НАЙДЕНА РАБОЧАЯ КАМЕРА'
+                self.logger.log_error("НЕ НАЙДЕНА РАБОЧАЯ КАМЕРА!")
+                print("\n❌ НЕ НАЙДЕНА РАБОЧАЯ КАМЕРА!")
+            else:
+                with self.camera_lock:
+                    self.attach_camera(camera_info)
+                self.camera_init_state = 'ready'
+                self.camera_init_ms = round((time.time() - init_start) * 1000, 1)
+                print(f"\n✅ Камера найдена и готова к работе! ({self.camera_init_ms} мс)")
+
+                # ✅ АВТОЗАПУСК СТРИМА ПРИ СТАРТЕ СЕРВЕРА
+                if self.config.get('camera', {}).get('auto_start', False):
+                    print("🚀 Автозапуск стрима включен - запускаю...")
+                    self.logger.log_info("Автозапуск стрима включен в конфигурации")
+                    self.start_stream_internal()
+
+        except Exception as e:
+            self.camera_init_state = 'failed'
+            self.camera_init_error = str(e)
+            self.logger.log_error(f"Ошибка инициализации камеры: {e}")
+            import traceback
+            traceback.print_exc()
+
+        # Сканирование всех устройств нужно только для /api/cameras - после камеры
+        try:
+            self.camera_checker = CameraChecker(logger=self.logger)
+            self.available_cameras = self.camera_checker.detect_cameras()
+        except Exception as e:
+            print(f"⚠️  Ошибка сканирования камер: {e}")
+            self.available_cameras = []
+
+        log_all_available_cameras(self.logger)
+
+    def get_camera_init_info(self):
+        """Состояние фоновой инициализации для API"""
+        return {
+            'state': self.camera_init_state,
+            'error': self.camera_init_error,
+            'camera_init_ms': self.camera_init_ms,
+            'first_frame_ms': self.first_frame_ms,
+            'uptime_s': round(time.time() - SERVER_START_TIME, 1),
+            'lazy_imports_ms': get_import_times(),
+        }
+
 
     def _load_csi_settings(self):
         """Загружает настройки для конкретной CSI камеры"""
@@ -578,6 +743,10 @@ class CameraStreamer:
                     controls_to_set["AfWindows"] = [(win_x, win_y, win_w, win_h)]
                     print(f"      Окно фокуса: {win_x},{win_y},{win_w},{win_h}")
             
+            # ===== ЧАСТОТА КАДРОВ =====
+            if settings.get('fps'):
+                controls_to_set["FrameRate"] = float(settings['fps'])
+            
             # Применяем настройки
             if controls_to_set:
                 print(f"⚙️ Применяем контролы: {list(controls_to_set.keys())}")
@@ -638,6 +807,25 @@ class CameraStreamer:
         self.cleanup_timer.daemon = True
         self.cleanup_timer.start()
 
+    def get_viewer_stats(self, max_age=30.0):
+        """Свежие отчеты зрителей (устаревшие удаляются)"""
+        now = time.time()
+        reports = list(self.viewer_stats.items())
+        for viewer_id, report in reports:
+            if now - report['updated'] > max_age:
+                self.viewer_stats.pop(viewer_id, None)
+        return [dict(report, age_s=round(now - report['updated'], 1))
+                for _, report in reports if now - report['updated'] <= max_age]
+    
+    def get_mosaic_sources(self):
+        """Последние кадры для мозаики: активная камера (FrameHub) и камеры пула"""
+        sources = []
+        latest = self.frame_hub.get_latest()
+        if self.stream_active and latest is not None:
+            sources.append((latest.camera_id, latest.frame, latest.capture_mono))
+        sources.extend(self.camera_pool.get_latest_frames())
+        return sources
+    
     def get_client_info(self):
         """Получение информации о клиенте"""
         if hasattr(request, 'remote_addr'):
@@ -650,6 +838,8 @@ class CameraStreamer:
     def capture_frames(self):
         """Захват кадров с камеры в буфер"""
         print(f"📹 Запущен поток захвата кадров. Тип камеры: {self.camera_type}")
+        self.core_budget.pin_current('capture')
+        self.capture_timing.reset()
         
         self.buffer_active = True
         frames_captured = 0
@@ -741,6 +931,14 @@ class CameraStreamer:
         while self.stream_active and self.buffer_active:
             try:
                 frame = None
+                jpeg = None
+                capture_mono = None
+                
+                # Нет потребителей дольше grace_s - захват приостанавливается до спроса
+                if self.idle_suspend.should_suspend():
+                    self._capture_idle()
+                    self.capture_timing.reset()
+                    continue
                 
                 # ----- CSI КАМЕРА -----
                 if self.camera_type == 'csi' and self.current_picam2:
@@ -752,8 +950,9 @@ class CameraStreamer:
                             time.sleep(0.5)
                             continue
                         
-                        # Захватываем кадр
-                        array = self.current_picam2.capture_array()
+                        # Захватываем кадр (под блокировкой: перенастройка режима на лету)
+                        with self.camera_lock:
+                            array = self.current_picam2.capture_array()
                         
                         if array is not None and array.size > 0:
                             # Конвертируем RGB -> BGR для OpenCV
@@ -825,7 +1024,7 @@ class CameraStreamer:
                     with self.camera_lock:
                         if self.current_v4l2_camera and self.current_v4l2_camera.isOpened():
                             try:
-                                ret, frame = self.current_v4l2_camera.read()
+                                ret, frame, jpeg, capture_mono = self._read_v4l2_frame()
                                 
                                 if ret and frame is not None:
                                     consecutive_errors = 0
@@ -852,15 +1051,24 @@ class CameraStreamer:
                 if frame is not None and frame.size > 0:
                     self.frame_count += 1
                     frames_captured += 1
+                    self.capture_timing.tick()
+                    
+                    # Время от старта процесса до первого кадра (холодный старт)
+                    if self.first_frame_ms is None:
+                        self.first_frame_ms = round((time.time() - SERVER_START_TIME) * 1000, 1)
                     
                     # Логируем каждые 30 кадров
                     if frames_captured % 30 == 0:
                         h, w = frame.shape[:2]
                         print(f"📊 Захвачено кадров: {frames_captured}, Тип: {self.camera_type}, Размер: {w}x{h}")
                     
-                    # Сохраняем последний кадр
-                    with self.frame_lock:
-                        self.last_frame = frame.copy()
+                    # Повтор предыдущего кадра (зависшая камера / неподвижная сцена) не кодируется
+                    duplicate = self.frame_hub.duplicates.check(frame, jpeg)
+                    
+                    # Сохраняем последний кадр (повтор уже сохранен)
+                    if not duplicate:
+                        with self.frame_lock:
+                            self.last_frame = frame.copy()
                     
                     # Добавляем в буфер (с ограничением размера)
                     try:
@@ -870,12 +1078,25 @@ class CameraStreamer:
                             except queue.Empty:
                                 pass
                         
-                        self.frame_buffer.put_nowait(frame)
+                        camera_id = str(self.config['camera'].get('device', ''))
+                        capture_ts = None
+                        if capture_mono is not None:
+                            # Время буфера драйвера, а не момент чтения
+                            capture_ts = time.time() - (time.monotonic() - capture_mono)
+                        self.frame_buffer.put_nowait(CapturedFrame(frame, camera_id, jpeg, capture_ts, capture_mono,
+                                                                   duplicate))
+                        self.idle_suspend.on_frame()
                     except Exception as e:
                         print(f"⚠️ Ошибка буфера: {e}")
+                    
+                    # Кадр не меняется дольше stall_s - перезапуск камеры, не дожидаясь ошибок чтения
+                    if self.frame_hub.duplicates.needs_recovery():
+                        self._recover_stalled_camera()
                 
                 # Небольшая задержка для снижения нагрузки CPU
-                time.sleep(0.01)
+                # (в режиме низкой задержки grab() сам ждет следующего кадра)
+                if not (self.usb_reader.low_latency and self.camera_type == 'v4l2'):
+                    time.sleep(0.01)
                 
             except Exception as e:
                 # Критическая ошибка в основном цикле
@@ -895,48 +1116,195 @@ class CameraStreamer:
         
         print(f"📹 Поток захвата кадров остановлен. Всего кадров: {frames_captured}")
             
-    def generate_from_buffer(self):
-        """Генератор для получения кадров из буфера"""
-        while self.stream_active:
+    def _recover_stalled_camera(self):
+        """Перезапуск камеры, отдающей один и тот же кадр (поток захвата)"""
+        device_path = str(self.config['camera'].get('device', ''))
+        print(f"🔄 Камера {device_path} зависла (повтор кадра), перезапускаю...")
+        self.logger.log_error(f"Камера {device_path} отдает один и тот же кадр, перезапуск")
+        
+        with self.camera_lock:
             try:
-                # Получаем кадр из буфера с таймаутом
-                frame = self.frame_buffer.get(timeout=2.0)
-                
-                # Кодируем в JPEG
-                jpeg_quality = self.config['camera'].get('jpeg_quality', 85)
-                ret, jpeg = cv2.imencode('.jpg', frame, 
-                                         [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
-                
-                if ret:
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + 
-                           jpeg.tobytes() + b'\r\n')
-                else:
-                    time.sleep(0.01)
+                if self.camera_type == 'csi' and self.current_picam2:
+                    self.current_picam2.stop()
+                    time.sleep(0.2)
+                    self.current_picam2.start()
+                elif self.camera_type == 'v4l2' and self.current_v4l2_camera:
+                    # Режим, в котором камера работала: камера только с YUYV не переводится в MJPG
+                    previous = self.current_v4l2_camera
+                    camera_config = self.config['camera']
+                    fourcc = int(previous.get(cv2.CAP_PROP_FOURCC))
+                    width = int(previous.get(cv2.CAP_PROP_FRAME_WIDTH)) or camera_config.get('width', 1024)
+                    height = int(previous.get(cv2.CAP_PROP_FRAME_HEIGHT)) or camera_config.get('height', 768)
+                    fps = previous.get(cv2.CAP_PROP_FPS) or camera_config.get('fps', 15)
+                    previous.release()
                     
-            except queue.Empty:
-                # Если буфер пуст, ждем немного
-                time.sleep(0.1)
+                    camera = self._open_v4l2_device(device_path, cv2.CAP_V4L2)
+                    if camera is None or not camera.isOpened():
+                        self.current_v4l2_camera = None
+                        self.camera_init_state = 'failed'
+                        self.camera_init_error = f"Камера {device_path} не открылась после перезапуска"
+                        print(f"❌ {self.camera_init_error}")
+                        self.logger.log_error(self.camera_init_error)
+                        return
+                    if fourcc:
+                        camera.set(cv2.CAP_PROP_FOURCC, fourcc)
+                    camera.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+                    camera.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+                    camera.set(cv2.CAP_PROP_FPS, fps)
+                    self.current_v4l2_camera = camera
+                    self.usb_reader.configure(camera, device_path)
+                    self._setup_mjpeg_passthrough()
+                print("✅ Камера перезапущена")
             except Exception as e:
-                self.logger.log_error(f"Ошибка в generate_from_buffer: {e}")
-                time.sleep(0.1)
+                print(f"❌ Ошибка перезапуска зависшей камеры: {e}")
+                self.logger.log_error(f"Ошибка перезапуска зависшей камеры: {e}")
+        
+        self.frame_hub.duplicates.on_recovered()
     
-    def get_fallback_image(self):
-        """Возвращает статичное изображение при перегрузке"""
-        # Создаем простое изображение
-        img = np.zeros((480, 640, 3), dtype=np.uint8)
-        img[:] = (40, 40, 40)  # Серый фон
+    def _capture_idle(self):
+        """Приостановленный захват: кадры не читаются (stop) или читаются редко без декодирования (throttle)"""
+        policy = self.idle_suspend
+        policy.enter_suspend()
+        self._set_camera_idle(True)
+        try:
+            interval = 1.0 / max(policy.idle_fps, 0.1) if policy.mode == 'throttle' else 0.5
+            woken = False
+            while self.stream_active and self.buffer_active and not policy.has_demand(force=woken):
+                if policy.mode == 'throttle':
+                    with self.camera_lock:
+                        try:
+                            if self.camera_type == 'csi' and self.current_picam2:
+                                self.current_picam2.capture_metadata()
+                            elif self.current_v4l2_camera:
+                                self.current_v4l2_camera.grab()
+                            policy.idle_frames += 1
+                        except Exception:
+                            pass
+                woken = policy.wait_wake(interval)
+        finally:
+            self._set_camera_idle(False)
+            # Кадры до паузы не отдаем как новые
+            while not self.frame_buffer.empty():
+                try:
+                    self.frame_buffer.get_nowait()
+                except queue.Empty:
+                    break
+            self.frame_hub.reset()
+            policy.exit_suspend()
+    
+    def _set_camera_idle(self, idle):
+        """Камера при приостановке: снижение FPS / остановка CSI, сброс устаревших буферов USB"""
+        policy = self.idle_suspend
+        with self.camera_lock:
+            try:
+                if self.camera_type == 'csi' and self.current_picam2:
+                    if policy.mode == 'stop':
+                        if idle:
+                            self.current_picam2.stop()
+                        else:
+                            self.current_picam2.start()
+                    else:
+                        fps = policy.idle_fps if idle else float(self.csi_settings.get('fps') or 30)
+                        self.current_picam2.set_controls({"FrameRate": fps})
+                elif self.current_v4l2_camera and not idle and not self.usb_reader.low_latency:
+                    # Очередь драйвера заполнилась во время паузы - старые буферы не декодируем
+                    buffers = int(self.current_v4l2_camera.get(cv2.CAP_PROP_BUFFERSIZE) or 4)
+                    for _ in range(buffers):
+                        self.current_v4l2_camera.grab()
+            except Exception as e:
+                self.logger.log_error(f"Ошибка перевода камеры в режим {'ожидания' if idle else 'работы'}: {e}")
+    
+    def generate_from_buffer(self, fps=None, width=None, roi=None, overlay=None):
+        """
+        Генератор MJPEG потока: общий JPEG из FrameHub (кодируется один раз)
+        
+        Args:
+            fps, width, roi: Своя частота, ширина и область кадра клиента (?fps=, ?width=, ?roi=);
+                None - каждый кадр как есть
+            overlay: Разметка кадра (?overlay=tags) из TagAnalysis.overlay() или None
+        """
+        if overlay is not None:
+            self.tag_analysis.acquire_overlay()
+            try:
+                yield from self.subscriber_pacing.generate(fps, width, lambda: self.stream_active, roi, overlay)
+            finally:
+                self.tag_analysis.release_overlay()
+            return
+        if fps or width or roi:
+            # Клиент сам пропускает кадры - в оценку пропускной способности не входит
+            yield from self.subscriber_pacing.generate(fps, width, lambda: self.stream_active, roi)
+            return
         
-        # Добавляем текст
-        font = cv2.FONT_HERSHEY_SIMPLEX
-        cv2.putText(img, 'Too many streams', (150, 200), font, 1, (255, 255, 255), 2)
-        cv2.putText(img, 'Please try again later', (120, 250), font, 0.7, (200, 200, 200), 2)
+        last_seq = 0
+        # Доставка клиенту: медленные клиенты снижают целевой битрейт (adaptive_quality)
+        meter = self.frame_hub.quality.clients.register()
+        try:
+            while self.stream_active:
+                try:
+                    encoded = self.frame_hub.wait_next(last_seq, timeout=2.0)
+                    if encoded is None:
+                        time.sleep(0.01)
+                        continue
+                    
+                    last_seq = encoded.seq
+                    # Заголовки кадра: номер, время захвата и отправки, камера
+                    yield mjpeg_part(encoded.jpeg, encoded)
+                    meter.on_sent(len(encoded.jpeg), encoded.seq)
+                        
+                except Exception as e:
+                    self.logger.log_error(f"Ошибка в generate_from_buffer: {e}")
+                    time.sleep(0.1)
+        finally:
+            self.frame_hub.quality.clients.unregister(meter)
+    
+    def _read_v4l2_frame(self):
+        """
+        Чтение кадра USB камеры (вызывать под camera_lock)
         
-        ret, buffer = cv2.imencode('.jpg', img)
-        frame_bytes = buffer.tobytes()
+        Returns:
+            (ret, frame, jpeg, capture_mono): jpeg - сжатый кадр камеры, если OpenCV отдал
+            MJPEG без декодирования; capture_mono - время буфера драйвера (time.monotonic)
+        """
+        device_path = str(self.config['camera'].get('device', ''))
+        ret, frame, capture_mono = self.usb_reader.read(self.current_v4l2_camera, device_path)
+        if not ret or frame is None:
+            return False, None, None, None
         
+        # CONVERT_RGB=0 для MJPG: вместо BGR кадра приходит буфер JPEG (FF D8 ...)
+        if frame.ndim < 3 and frame.dtype == np.uint8 and frame.size > 2 \
+                and frame.flat[0] == 0xFF and frame.flat[1] == 0xD8:
+            jpeg = frame.tobytes()
+            decoded = cv2.imdecode(frame.reshape(-1), cv2.IMREAD_COLOR)
+            if decoded is None:
+                return False, None, None, None
+            return True, decoded, jpeg, capture_mono
+        
+        return True, frame, None, capture_mono
+    
+    def _setup_mjpeg_passthrough(self):
+        """Сжатые кадры MJPEG камеры идут в стрим и запись без перекодирования"""
+        self.mjpeg_passthrough = False
+        if not self.config['camera'].get('mjpeg_passthrough', False):
+            return
+        if self.camera_type != 'v4l2' or not self.current_v4l2_camera:
+            return
+        
+        try:
+            fourcc = int(self.current_v4l2_camera.get(cv2.CAP_PROP_FOURCC))
+            fourcc_str = ''.join(chr((fourcc >> (8 * i)) & 0xFF) for i in range(4))
+            if fourcc_str != 'MJPG':
+                return
+            
+            if self.current_v4l2_camera.set(cv2.CAP_PROP_CONVERT_RGB, 0):
+                self.mjpeg_passthrough = True
+                print("🎞️ MJPEG без перекодирования: JPEG камеры идет в стрим и запись")
+        except Exception as e:
+            print(f"⚠️ Не удалось включить MJPEG passthrough: {e}")
+    
+    def get_fallback_image(self):
+        """Возвращает статичное изображение при перегрузке (заглушка из памяти)"""
         return Response(
-            b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n',
+            self.overflow_tier.placeholders.get_part('too_many'),
             mimetype='multipart/x-mixed-replace; boundary=frame'
         )
     
@@ -945,8 +1313,16 @@ class CameraStreamer:
         if not self.stream_active:
             print("=== DEBUG: start_stream_internal() called ===")
             
+            # Камера только что открыта и настроена в test_camera_backends
+            preconfigured = (self.camera_preconfigured and self.camera_type == 'v4l2'
+                             and self.current_v4l2_camera is not None
+                             and self.current_v4l2_camera.isOpened())
+            self.camera_preconfigured = False
+            if preconfigured:
+                print("⚡ Камера уже открыта при поиске, пропускаю переоткрытие")
+            
             # ВАЖНО: Полностью пересоздаем камеру для чистоты
-            if self.camera_type == 'v4l2':
+            if self.camera_type == 'v4l2' and not preconfigured:
                 # Закрываем старую камеру если есть
                 if self.current_v4l2_camera:
                     self.current_v4l2_camera.release()
@@ -956,9 +1332,9 @@ class CameraStreamer:
                 # Открываем заново
                 device_path = self.config['camera'].get('device', '/dev/video8')
                 print(f"📷 Открываю камеру {device_path}...")
-                self.current_v4l2_camera = cv2.VideoCapture(device_path, cv2.CAP_V4L2)
+                self.current_v4l2_camera = self._open_v4l2_device(device_path, cv2.CAP_V4L2)
                 
-                if not self.current_v4l2_camera.isOpened():
+                if not self.current_v4l2_camera or not self.current_v4l2_camera.isOpened():
                     print("❌ Не удалось открыть камеру")
                     return
                 
@@ -975,25 +1351,34 @@ class CameraStreamer:
                     
                     print(f"📷 НАСТРОЙКА USB камеры: {width}x{height} @ {fps}fps")
                     
-                    # ВАЖНО: Порядок из теста - сначала кодек
                     fourcc = cv2.VideoWriter_fourcc('M', 'J', 'P', 'G')
-                    print(f"🎬 Устанавливаю кодек MJPG...")
-                    self.current_v4l2_camera.set(cv2.CAP_PROP_FOURCC, fourcc)
-                    time.sleep(0.1)
-                    
-                    # Потом разрешение
-                    print(f"📐 Устанавливаю разрешение {width}x{height}...")
-                    self.current_v4l2_camera.set(cv2.CAP_PROP_FRAME_WIDTH, width)
-                    self.current_v4l2_camera.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
-                    
-                    # Устанавливаем FPS
-                    self.current_v4l2_camera.set(cv2.CAP_PROP_FPS, fps)
+                    # Камера, открытая при поиске: режим не переустанавливаем, если поиск
+                    # уже выставил MJPG и разрешение из конфига (смена режима - пауза потока)
+                    mode_ready = (preconfigured
+                                  and int(self.current_v4l2_camera.get(cv2.CAP_PROP_FOURCC)) == fourcc
+                                  and int(self.current_v4l2_camera.get(cv2.CAP_PROP_FRAME_WIDTH)) == width
+                                  and int(self.current_v4l2_camera.get(cv2.CAP_PROP_FRAME_HEIGHT)) == height)
+                    if mode_ready:
+                        print("⚡ Кодек MJPG и разрешение установлены при поиске")
+                    else:
+                        # ВАЖНО: Порядок из теста - сначала кодек
+                        print(f"🎬 Устанавливаю кодек MJPG...")
+                        self.current_v4l2_camera.set(cv2.CAP_PROP_FOURCC, fourcc)
+                        time.sleep(0.1)
+                        
+                        # Потом разрешение
+                        print(f"📐 Устанавливаю разрешение {width}x{height}...")
+                        self.current_v4l2_camera.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+                        self.current_v4l2_camera.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+                        
+                        # Устанавливаем FPS
+                        self.current_v4l2_camera.set(cv2.CAP_PROP_FPS, fps)
                     
-                    # Для глобального затвора
+                    # Для глобального затвора (поиск его не ставит - и для камеры из поиска)
                     self.current_v4l2_camera.set(cv2.CAP_PROP_AUTO_EXPOSURE, 0.25)
                     
                     # Даем время на применение
-                    time.sleep(0.3)
+                    time.sleep(0.1 if mode_ready else 0.3)
                     
                     # ПРОВЕРЯЕМ реальные настройки
                     actual_width = int(self.current_v4l2_camera.get(cv2.CAP_PROP_FRAME_WIDTH))
@@ -1011,13 +1396,14 @@ class CameraStreamer:
                     self.config['camera']['height'] = actual_height
                     self.config['camera']['fps'] = actual_fps
                     
-                    # Проверяем захват кадра
-                    ret, test_frame = self.current_v4l2_camera.read()
-                    if ret and test_frame is not None:
-                        h, w = test_frame.shape[:2]
-                        print(f"📸 Тестовый кадр: {w}x{h}")
-                    else:
-                        print("⚠️ Не удалось получить тестовый кадр")
+                    # Проверяем захват кадра (камера из поиска кадр уже отдала)
+                    if not preconfigured:
+                        ret, test_frame = self.current_v4l2_camera.read()
+                        if ret and test_frame is not None:
+                            h, w = test_frame.shape[:2]
+                            print(f"📸 Тестовый кадр: {w}x{h}")
+                        else:
+                            print("⚠️ Не удалось получить тестовый кадр")
                     
                 except Exception as e:
                     print(f"❌ Ошибка настройки USB камеры: {e}")
@@ -1058,10 +1444,19 @@ class CameraStreamer:
                         break
                 print(f"✅ Очищено {cleared} элементов из буфера")
             
+            if self.camera_type == 'v4l2' and self.current_v4l2_camera:
+                self.usb_reader.configure(self.current_v4l2_camera, self.config['camera'].get('device', ''))
+            self._setup_mjpeg_passthrough()
+            
             self.stream_active = True
             self.buffer_active = True
             self.frame_count = 0
             
+            # Поток кодирования кадров (общий для всех клиентов)
+            self.frame_hub.start()
+            if self.recorder.auto_start and not self.recorder.active:
+                self.recorder.start()
+            
             # Убедимся, что старый поток завершен
             if self.buffer_thread and self.buffer_thread.is_alive():
                 print("⚠️ Старый поток все еще активен, останавливаем...")
@@ -1125,6 +1520,9 @@ class CameraStreamer:
                     print("⚠️ Поток захчета не завершился вовремя")
                 self.buffer_thread = None
             
+            # Поток кодирования больше не нужен (запись закроет сегмент по паузе)
+            self.frame_hub.stop()
+            
             print("📹 Стрим остановлен")
             self.logger.log_info("Стрим видеопотока остановлен")
         
@@ -1133,6 +1531,314 @@ class CameraStreamer:
         time.sleep(0.5)
         self.start_stream_internal()
 
+    def _open_v4l2_device(self, device_path, api=None):
+        """Открытие камеры по пути устройства (USB или виртуальная)"""
+        if is_virtual_device(device_path):
+            return open_virtual_camera(self.config, device_path)
+        if api is None:
+            return cv2.VideoCapture(device_path)
+        return cv2.VideoCapture(device_path, api)
+
+    def _park_current_camera(self):
+        """Возврат текущей камеры в пул вместо закрытия (вызывать под camera_lock)"""
+        device_path = str(self.config['camera'].get('device', ''))
+
+        if self.camera_type == 'csi' and self.current_picam2:
+            session = PooledCamera(device_path, 'csi', self.current_picam2,
+                                   self.csi_settings.get('width', 0),
+                                   self.csi_settings.get('height', 0))
+            # Менеджер больше не владеет этой камерой - её закроет пул
+            if self.csi_manager and self.csi_manager.current_picam2 is self.current_picam2:
+                self.csi_manager.current_picam2 = None
+                self.csi_manager.current_camera = None
+        elif self.current_v4l2_camera:
+            if self.mjpeg_passthrough:
+                # Холостой захват пула и мозаика читают BGR кадры, а не сжатый буфер MJPEG
+                try:
+                    self.current_v4l2_camera.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+                except Exception as e:
+                    print(f"⚠️ Не удалось вернуть CONVERT_RGB камере {device_path}: {e}")
+                self.mjpeg_passthrough = False
+            try:
+                width = int(self.current_v4l2_camera.get(cv2.CAP_PROP_FRAME_WIDTH))
+                height = int(self.current_v4l2_camera.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            except Exception:
+                width, height = 0, 0
+            session = PooledCamera(device_path, 'v4l2', self.current_v4l2_camera, width, height)
+        else:
+            return
+
+        self.current_picam2 = None
+        self.current_v4l2_camera = None
+        self.camera_pool.release(session)
+        print(f"🅿️ Камера {device_path} оставлена открытой в пуле")
+
+    def _activate_pooled_camera(self, session):
+        """
+        Подмена указателя на камеру из пула (вызывать под camera_lock)
+
+        Камера уже открыта и настроена, но настройка после открытия из
+        start_stream_internal повторяется: очередь драйвера и MJPEG без
+        перекодирования (V4L2), csi_settings этого сенсора (CSI), реальные
+        разрешение и частота в config['camera'].
+        """
+        self.camera_type = session.camera_type
+        self.config['camera']['device'] = session.device_path
+        self.frame_count = 0
+
+        if session.camera_type == 'csi':
+            camera_idx = int(session.device_path.split('_')[1])
+            self.current_picam2 = session.handle
+            self.current_v4l2_camera = None
+            self.current_camera_idx = camera_idx
+            if self.csi_manager:
+                self.csi_manager.current_picam2 = session.handle
+                self.csi_manager.current_camera = camera_idx
+            self.mjpeg_passthrough = False
+            self._load_csi_settings()
+            width = session.width or self.csi_settings.get('width')
+            height = session.height or self.csi_settings.get('height')
+            fps = self.csi_settings.get('fps')
+        else:
+            self.current_v4l2_camera = session.handle
+            self.current_picam2 = None
+            self.usb_reader.configure(session.handle, session.device_path)
+            self._setup_mjpeg_passthrough()
+            try:
+                width = int(session.handle.get(cv2.CAP_PROP_FRAME_WIDTH))
+                height = int(session.handle.get(cv2.CAP_PROP_FRAME_HEIGHT))
+                fps = session.handle.get(cv2.CAP_PROP_FPS)
+            except Exception:
+                width, height, fps = session.width, session.height, None
+
+        # Реальные значения в конфиг, как после настройки в start_stream_internal
+        if width and height:
+            self.config['camera']['width'] = width
+            self.config['camera']['height'] = height
+        if fps:
+            self.config['camera']['fps'] = fps
+
+        # Кадры предыдущей камеры больше не нужны
+        while not self.frame_buffer.empty():
+            try:
+                self.frame_buffer.get_nowait()
+            except queue.Empty:
+                break
+        self.frame_hub.reset()
+
+    def _open_group_camera(self, device_path, width, height, fps):
+        """Открытие камеры для группы захвата: (camera_type, handle)"""
+        if str(device_path) == str(self.config['camera'].get('device', '')) and self.stream_active:
+            raise RuntimeError('камера используется основным стримом')
+        
+        if str(device_path).startswith('csi_'):
+            from picamera2 import Picamera2
+            picam2 = Picamera2(int(str(device_path).split('_')[1]))
+            # RGB888 у Picamera2 - массив в порядке BGR (как у OpenCV)
+            config = picam2.create_video_configuration(
+                main={"size": (width, height), "format": "RGB888"},
+                controls={"FrameRate": fps}
+            )
+            picam2.configure(config)
+            picam2.start()
+            return 'csi', picam2
+        
+        camera = self._open_v4l2_device(device_path)
+        if not camera.isOpened():
+            raise RuntimeError('устройство не открывается')
+        camera.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        camera.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        camera.set(cv2.CAP_PROP_FPS, fps)
+        camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return 'v4l2', camera
+    
+    # ===== ПАРАМЕТРЫ СТРИМА БЕЗ ПЕРЕЗАПУСКА =====
+    
+    def _on_config_file_changed(self, new_config):
+        """Файл конфигурации изменен: применяем только изменившиеся параметры"""
+        old_settings = extract_settings(self._file_config, self.camera_type)
+        new_settings = extract_settings(new_config, self.camera_type)
+        self._file_config = new_config
+        
+        changes = diff_settings(old_settings, new_settings)
+        if changes:
+            print(f"📝 Конфигурация изменена: {changes}")
+            self.apply_stream_settings(changes, source='file')
+    
+    def apply_stream_settings(self, changes, source='api'):
+        """
+        Применение параметров стрима без остановки сервера
+        
+        Args:
+            changes: Параметры (jpeg_quality, width, height, fps, motion_gate)
+            source: Источник изменения ('api', 'file' или 'governor')
+            
+        Returns:
+            Отчет: примененные параметры, действия с камерой, время перенастройки
+        """
+        changes, errors = validate_settings(changes)
+        report = {
+            'time': datetime.now().strftime('%H:%M:%S'),
+            'source': source,
+            'requested': changes,
+            'applied': {},
+            'actions': [],
+            'errors': errors,
+            'notes': [],
+            'apply_ms': 0.0,
+            'first_frame_ms': None,
+        }
+        capture = {key: changes[key] for key in CAPTURE_KEYS if key in changes}
+        
+        start = time.perf_counter()
+        # Перенастройка захвата и ожидание первого кадра - на работающей камере
+        awake = self.idle_suspend.keep_awake('settings') if capture else nullcontext()
+        with awake, self.settings_lock:
+            frame_count = self.frame_count
+            
+            # Кодирование: FrameHub читает конфигурацию на каждом кадре
+            if 'jpeg_quality' in changes:
+                self.config['camera']['jpeg_quality'] = changes['jpeg_quality']
+                report['applied']['jpeg_quality'] = changes['jpeg_quality']
+                report['actions'].append('encode')
+                if self.mjpeg_passthrough:
+                    report['notes'].append('MJPEG без перекодирования: качество задает камера')
+            
+            if 'motion_gate' in changes:
+                # Конфигурация меняется только после того, как MotionGate принял параметры
+                gate_config = dict(self.config.get('motion_gate', {}) or {})
+                gate_config.update(changes['motion_gate'])
+                try:
+                    self.frame_hub.motion_gate.configure({'motion_gate': gate_config})
+                except (TypeError, ValueError) as e:
+                    report['errors']['motion_gate'] = str(e)
+                else:
+                    self.config['motion_gate'] = gate_config
+                    report['applied']['motion_gate'] = changes['motion_gate']
+                    report['actions'].append('motion_gate')
+            
+            # Захват: минимальная перенастройка устройства
+            if capture:
+                if not self.stream_active:
+                    self._store_capture_settings(capture)
+                    report['applied'].update(capture)
+                    report['actions'].append('deferred')
+                    report['notes'].append('Стрим не запущен: параметры захвата применятся при запуске')
+                elif self.camera_type == 'csi':
+                    self._reconfigure_csi(capture, report)
+                else:
+                    self._reconfigure_v4l2(capture, report)
+        
+        report['apply_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        
+        # Время до первого кадра с новыми параметрами захвата
+        if capture and self.stream_active and not report['errors'].get('camera'):
+            size = (report['applied'].get('width'), report['applied'].get('height'))
+            report['first_frame_ms'] = self._wait_reconfigured_frame(frame_count, size, start)
+        
+        self.reconfigure_history.append(report)
+        print(f"⚙️ Параметры стрима ({source}): {report['applied']} "
+              f"[{', '.join(report['actions']) or '-'}] за {report['apply_ms']} мс"
+              + (f", первый кадр через {report['first_frame_ms']} мс" if report['first_frame_ms'] is not None else ""))
+        if report['errors']:
+            print(f"⚠️ Не применено: {report['errors']}")
+        self.logger.log_info(f"Перенастройка стрима ({source}): {report['applied']}, "
+                             f"действия {report['actions']}, {report['apply_ms']} мс")
+        return report
+    
+    def _governor_main_settings(self, keys):
+        """Текущие параметры основного стрима для терморегулятора (базовые для восстановления)"""
+        settings = extract_settings(self.config, self.camera_type)
+        frame = self.last_frame
+        if frame is not None:
+            # Разрешение не задано в конфигурации - берем фактическое
+            settings.setdefault('width', frame.shape[1])
+            settings.setdefault('height', frame.shape[0])
+        return {key: settings[key] for key in keys if key in settings}
+    
+    def _store_capture_settings(self, capture):
+        """Параметры захвата в конфигурации (для следующего запуска стрима)"""
+        if self.camera_type == 'csi':
+            key = csi_key(self.config['camera'].get('device', 'csi_0'))
+            self.config.setdefault('csi_cameras', {}).setdefault(key, {}).update(capture)
+            if self.csi_settings:
+                self.csi_settings.update(capture)
+        else:
+            self.config['camera'].update(capture)
+    
+    def _reconfigure_v4l2(self, capture, report):
+        """USB камера: set() на открытом устройстве без переоткрытия"""
+        camera_config = self.config['camera']
+        with self.camera_lock:
+            camera = self.current_v4l2_camera
+            if camera is None or not camera.isOpened():
+                report['errors']['camera'] = 'камера не открыта'
+                return
+            
+            if 'width' in capture or 'height' in capture:
+                width = capture.get('width', camera_config.get('width') or int(camera.get(cv2.CAP_PROP_FRAME_WIDTH)))
+                height = capture.get('height', camera_config.get('height') or int(camera.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+                # OpenCV сам перезапускает поток V4L2 с новым форматом (кодек MJPG сохраняется)
+                camera.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+                camera.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+                report['actions'].append('v4l2_set_size')
+            if 'fps' in capture:
+                camera.set(cv2.CAP_PROP_FPS, capture['fps'])
+                report['actions'].append('v4l2_set_fps')
+            
+            actual = {
+                'width': int(camera.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                'height': int(camera.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                'fps': camera.get(cv2.CAP_PROP_FPS),
+            }
+        
+        camera_config.update(actual)
+        for key, value in capture.items():
+            report['applied'][key] = actual[key]
+            if abs(actual[key] - value) > 0.5:
+                report['notes'].append(f'{key}: камера выбрала {actual[key]} вместо {value}')
+        if 'width' in capture or 'height' in capture:
+            report['applied'].update(width=actual['width'], height=actual['height'])
+    
+    def _reconfigure_csi(self, capture, report):
+        """CSI камера: FrameRate на лету, смена разрешения - переключение режима Picamera2"""
+        settings = self.csi_settings or self._load_csi_settings()
+        size_changed = any(key in capture and capture[key] != settings.get(key) for key in ('width', 'height'))
+        
+        with self.camera_lock:
+            if self.current_picam2 is None:
+                report['errors']['camera'] = 'камера не открыта'
+                return
+            
+            settings.update(capture)
+            if size_changed:
+                # Остановка, новая конфигурация и запуск на том же объекте Picamera2
+                self.current_picam2.stop()
+                self._configure_csi_camera()
+                report['actions'].append('csi_mode_switch')
+            elif 'fps' in capture:
+                self.current_picam2.set_controls({"FrameRate": float(capture['fps'])})
+                report['actions'].append('csi_frame_rate')
+        
+        self._store_capture_settings(capture)
+        report['applied'].update(capture)
+        if size_changed:
+            report['applied'].update(width=settings['width'], height=settings['height'])
+    
+    def _wait_reconfigured_frame(self, frame_count, size, start, timeout=3.0):
+        """Мс от начала перенастройки до первого нового кадра (нужного размера)"""
+        width, height = size
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline and self.stream_active:
+            if self.frame_count > frame_count:
+                with self.frame_lock:
+                    frame = self.last_frame
+                if frame is not None and (width is None or (frame.shape[1], frame.shape[0]) == (width, height)):
+                    return round((time.perf_counter() - start) * 1000, 1)
+                frame_count = self.frame_count
+            time.sleep(0.005)
+        return None
+    
     def capture_frame_to_file(self):
         """Захват одного кадра и сохранение в файл"""
         try:
@@ -1152,7 +1858,7 @@ class CameraStreamer:
                 # Захват с USB камеры через V4L2
                 with self.camera_lock:
                     if self.current_v4l2_camera and self.current_v4l2_camera.isOpened():
-                        ret, frame = self.current_v4l2_camera.read()
+                        ret, frame, _, _ = self._read_v4l2_frame()
                         if not ret or frame is None:
                             self.logger.log_error("Не удалось прочитать кадр с USB камеры")
                             return None
@@ -1181,6 +1887,8 @@ class CameraStreamer:
         @self.app.before_request
         def log_request():
             """Логирование всех запросов"""
+            # Потоки запросов (генераторы MJPEG) - на ядрах стадии http
+            self.core_budget.pin_current('http')
             if request.endpoint and request.endpoint not in ['static', 'video_feed']:
                 user_ip, user_agent = self.get_client_info()
                 self.logger.log_info(f"🌐 Запрос: {request.method} {request.path}")
@@ -1210,28 +1918,62 @@ class CameraStreamer:
             # Получаем IP клиента
             client_ip = request.remote_addr if hasattr(request, 'remote_addr') else 'unknown'
             client_id = f"{client_ip}_{request.args.get('t', str(time.time()))}"
-            
+            fps, width, roi = self.subscriber_pacing.parse(request.args)
+            overlay = None
+            if request.args.get('overlay'):
+                overlay = self.tag_analysis.overlay(request.args.get('overlay'))
+                if overlay is None:
+                    print(f"⚠️ Разметка '{request.args.get('overlay')}' недоступна (tag_analysis не запущен)")
+                elif not self.subscriber_pacing.can_acquire(width, roi, overlay):
+                    print(f"⚠️ Разметка '{overlay[0]}': уже кодируется "
+                          f"{self.subscriber_pacing.max_widths} копий (subscriber_pacing.max_widths)")
+                    return self.get_fallback_image()
+
+            overflow = False
             with self.stream_lock:
                 # Проверяем лимит для конкретного клиента
                 client_streams = self.active_clients.get(client_ip, 0)
                 if client_streams >= self.MAX_STREAMS_PER_CLIENT:
                     print(f"⚠️  Клиент {client_ip} уже имеет активный стрим")
-                    return self.get_fallback_image()
+                    overflow = True
                 
                 # Проверяем общий лимит
-                if self.active_streams >= self.MAX_CONCURRENT_STREAMS:
+                elif self.active_streams >= self.MAX_CONCURRENT_STREAMS:
                     print(f"⚠️  Превышено общее количество стримов: {self.active_streams}/{self.MAX_CONCURRENT_STREAMS}")
+                    overflow = True
+                
+                else:
+                    # Увеличиваем счетчики
+                    self.active_streams += 1
+                    self.active_clients[client_ip] = client_streams + 1
+                    
+                    print(f"📹 Клиент {client_ip} запросил video_feed (клиентских: {client_streams+1}, всего: {self.active_streams})"
+                          + (f", fps={fps}" if fps else "") + (f", width={width}" if width else "")
+                          + (f", roi={roi[0]}" if roi else "") + (f", overlay={overlay[0]}" if overlay else ""))
+            
+            # Сверх лимита - общий урезанный поток, если и он заполнен - заглушка
+            if overflow:
+                if not self.overflow_tier.acquire():
                     return self.get_fallback_image()
+                self.idle_suspend.wake('overflow_tier')
+                print(f"📉 Клиент {client_ip} переведен на урезанный поток "
+                      f"(подписчиков: {self.overflow_tier.subscribers})")
                 
-                # Увеличиваем счетчики
-                self.active_streams += 1
-                self.active_clients[client_ip] = client_streams + 1
+                def generate_overflow():
+                    try:
+                        for chunk in self.overflow_tier.generate(lambda: self.stream_active):
+                            yield chunk
+                    finally:
+                        self.overflow_tier.release()
                 
-                print(f"📹 Клиент {client_ip} запросил video_feed (клиентских: {client_streams+1}, всего: {self.active_streams})")
+                return Response(generate_overflow(),
+                                mimetype='multipart/x-mixed-replace; boundary=frame')
+            
+            self.idle_suspend.wake('video_feed')
             
             def generate_with_cleanup():
                 try:
-                    for chunk in self.generate_from_buffer():
+                    for chunk in self.generate_from_buffer(fps, width, roi, overlay):
                         yield chunk
                 except GeneratorExit:
                     print(f"📹 Клиент {client_ip} отключился")
@@ -1253,6 +1995,156 @@ class CameraStreamer:
             
             return Response(generate_with_cleanup(),
                             mimetype='multipart/x-mixed-replace; boundary=frame')
+        
+        @self.app.route('/api/frame.jpg')
+        def latest_frame_jpeg():
+            """
+            Последний сжатый кадр из памяти (без декодирования, кодирования и диска)
+            
+            ETag - номер кадра, If-None-Match с текущим номером (или *) - 304.
+            ?after=<seq> - ждать кадра новее seq (не дольше ?timeout=, по умолчанию max_wait_s);
+            seq больше текущего (сервер перезапущен, нумерация началась заново) - последний кадр сразу.
+            """
+            stats = self.frame_endpoint_stats
+            stats['requests'] += 1
+            after = request.args.get('after', type=int)
+            timeout = min(request.args.get('timeout', self.frame_max_wait_s, type=float), self.frame_max_wait_s)
+            
+            # Запрос - спрос на кадры: захват не уходит в приостановку, пока его опрашивают
+            self.idle_suspend.wake('frame_jpg')
+            encoded = self.frame_hub.get_latest()
+            if after is not None and (encoded is None or after > encoded.seq):
+                # Номер не из текущей нумерации кадров - ждать нечего
+                after = None
+            stale = self.idle_suspend.suspended
+            if after is not None or encoded is None or stale:
+                with self.stream_lock:
+                    if self.frame_waiters >= self.frame_max_waiters:
+                        stats['rejected'] += 1
+                        return jsonify({'status': 'error', 'message': 'Слишком много ожидающих запросов'}), 503
+                    self.frame_waiters += 1
+                try:
+                    with self.idle_suspend.keep_awake('frame_jpg'):
+                        if after is not None:
+                            stats['long_polls'] += 1
+                            last_seq = after
+                        else:
+                            # Нет кадра или захват был приостановлен - ждем свежий, не дольше 3 с
+                            last_seq = encoded.seq if encoded is not None else 0
+                            timeout = min(timeout, 3.0)
+                        newer = self.frame_hub.wait_next(last_seq, timeout=max(0.0, timeout))
+                finally:
+                    with self.stream_lock:
+                        self.frame_waiters -= 1
+                
+                if newer is not None:
+                    encoded = newer
+                elif after is not None:
+                    stats['timeouts'] += 1
+                    encoded = self.frame_hub.get_latest()
+                    if encoded is None or encoded.seq <= after:
+                        # Нового кадра нет: у клиента уже последний
+                        response = Response(status=304)
+                        if encoded is not None:
+                            response.headers['ETag'] = f'"{encoded.seq}"'
+                        return response
+            
+            if encoded is None:
+                return jsonify({'status': 'error', 'message': 'Нет кадров (стрим не запущен)'}), 503
+            
+            etag = f'"{encoded.seq}"'
+            # Список тегов через запятую, W/ и * - разбор werkzeug (слабое сравнение, RFC 7232)
+            if request.if_none_match.contains_weak(str(encoded.seq)):
+                stats['not_modified'] += 1
+                response = Response(status=304)
+            else:
+                stats['sent'] += 1
+                response = Response(encoded.jpeg, mimetype='image/jpeg')
+                response.headers['X-Capture-Monotonic'] = f"{encoded.capture_mono:.6f}"
+                response.headers['X-Camera-Id'] = str(encoded.camera_id)
+            response.headers['ETag'] = etag
+            response.headers['X-Frame-Seq'] = str(encoded.seq)
+            # Кэш может хранить кадр, но обязан сверять ETag
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        
+        @self.app.route('/api/poses/latest')
+        def poses_latest():
+            """Позы меток последнего результата детекции (компактный JSON)"""
+            if not self.pose_feed.available():
+                return jsonify({'status': 'error', 'message': 'Анализ меток не запущен (tag_analysis)'}), 503
+            self.idle_suspend.wake('tag_analysis')
+            latest = self.pose_feed.latest()
+            if latest is None:
+                return jsonify({'status': 'error', 'message': 'Результатов детекции еще нет'}), 503
+            response = Response(compact_json(latest), mimetype='application/json')
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        
+        @self.app.route('/api/poses/stream')
+        def poses_stream():
+            """Поток поз (SSE): событие на каждый результат детекции, неизменившиеся позы пропускаются"""
+            client_ip = request.remote_addr if hasattr(request, 'remote_addr') else 'unknown'
+            if not self.pose_feed.available():
+                return jsonify({'status': 'error', 'message': 'Анализ меток не запущен (tag_analysis)'}), 503
+            subscriber = self.pose_feed.acquire(client_ip)
+            if subscriber is None:
+                return jsonify({'status': 'error', 'message': 'Слишком много подписчиков потока поз'}), 503
+            self.idle_suspend.wake('tag_analysis')
+            print(f"🎯 Клиент {client_ip} подписался на позы (подписчиков: {len(self.pose_feed.subscribers)})")
+            
+            def generate_poses():
+                try:
+                    yield from self.pose_feed.generate(subscriber)
+                finally:
+                    self.pose_feed.release(subscriber)
+                    print(f"🎯 Клиент {client_ip} отписался от поз")
+            
+            response = Response(generate_poses(), mimetype='text/event-stream')
+            response.headers['Cache-Control'] = 'no-cache'
+            # nginx не должен копить события в буфере
+            response.headers['X-Accel-Buffering'] = 'no'
+            return response
+        
+        @self.app.route('/api/overlay/stream')
+        def overlay_stream():
+            """Фигуры разметки (SSE) по номеру кадра - браузер рисует их на canvas поверх /video_feed"""
+            if not self.overlay_meta.available():
+                return jsonify({'status': 'error', 'message': 'Анализ меток не запущен (tag_analysis)'}), 503
+            if not self.overlay_meta.acquire():
+                return jsonify({'status': 'error', 'message': 'Слишком много подписчиков разметки'}), 503
+            self.idle_suspend.wake('tag_analysis')
+            
+            def generate_overlay():
+                try:
+                    yield from self.overlay_meta.generate()
+                finally:
+                    self.overlay_meta.release()
+            
+            response = Response(generate_overlay(), mimetype='text/event-stream')
+            response.headers['Cache-Control'] = 'no-cache'
+            response.headers['X-Accel-Buffering'] = 'no'
+            return response
+        
+        @self.app.route('/video_feed/mosaic')
+        def video_feed_mosaic():
+            """Мозаика всех открытых камер (свой лимит зрителей, один JPEG на всех)"""
+            client_ip = request.remote_addr if hasattr(request, 'remote_addr') else 'unknown'
+            if not self.mosaic.acquire():
+                return self.get_fallback_image()
+            self.idle_suspend.wake('mosaic')
+            print(f"🧩 Клиент {client_ip} открыл мозаику (зрителей: {self.mosaic.subscribers})")
+            
+            def generate_mosaic():
+                try:
+                    for chunk in self.mosaic.generate():
+                        yield chunk
+                finally:
+                    self.mosaic.release()
+                    print(f"🧩 Клиент {client_ip} закрыл мозаику")
+            
+            return Response(generate_mosaic(),
+                            mimetype='multipart/x-mixed-replace; boundary=frame')
             
         @self.app.route('/api/stream/start', methods=['POST'])
         def start_stream():
@@ -1345,6 +2237,37 @@ class CameraStreamer:
                 'camera_ready': camera_ready,
                 'camera_device': camera_device,
                 'camera_type': self.camera_type,
+                'camera_init': self.get_camera_init_info(),
+                'camera_pool': self.camera_pool.get_status(),
+                'frame_hub': self.frame_hub.get_status(),
+                'mjpeg_passthrough': self.mjpeg_passthrough,
+                'usb_capture': self.usb_reader.get_status(),
+                'idle_suspend': self.idle_suspend.get_status(),
+                'capture_timing': self.capture_timing.get_status(),
+                'core_budget': self.core_budget.get_status(),
+                'thermal_governor': self.thermal_governor.get_status(),
+                'tag_analysis': self.tag_analysis.get_status(),
+                'pose_feed': self.pose_feed.get_status(),
+                'overlay_meta': self.overlay_meta.get_status(),
+                'recording': self.recorder.get_status(),
+                'frame_bus': self.frame_bus.get_status(),
+                'viewers': self.get_viewer_stats(),
+                'stream_tiers': {
+                    'full': {
+                        'subscribers': self.active_streams,
+                        'max_streams': self.MAX_CONCURRENT_STREAMS,
+                        'max_streams_per_client': self.MAX_STREAMS_PER_CLIENT,
+                    },
+                    'overflow': self.overflow_tier.get_status(),
+                    'mosaic': self.mosaic.get_status(),
+                    'paced': self.subscriber_pacing.get_status(),
+                    'frame_jpg': dict(self.frame_endpoint_stats, waiters=self.frame_waiters),
+                },
+                'capture_groups': self.capture_groups.get_status(),
+                'hot_reload': {
+                    'watcher': self.config_watcher.get_status() if self.config_watcher else {'enabled': False},
+                    'last_reconfigure': self.reconfigure_history[-1] if self.reconfigure_history else None,
+                },
                 'config': {
                     'device': str(self.config['camera']['device']),  # Преобразуем в строку
                     'backend': self.config['camera']['backend'],
@@ -1354,12 +2277,143 @@ class CameraStreamer:
                 }
             })
         
+        @self.app.route('/api/recording/start', methods=['POST'])
+        def start_recording():
+            """Запуск непрерывной записи в сегменты"""
+            user_ip, user_agent = self.get_client_info()
+            
+            if not self.recorder.start():
+                return jsonify({'status': 'already_running', 'message': 'Запись уже идет',
+                                'recording': self.recorder.get_status()})
+            self.idle_suspend.wake('recording')
+            
+            self.logger.log_web_action('start_recording', 'success', f"Recording to {self.recorder.path}",
+                                       user_ip, user_agent)
+            return jsonify({'status': 'started', 'message': 'Запись запущена',
+                            'recording': self.recorder.get_status()})
+        
+        @self.app.route('/api/recording/stop', methods=['POST'])
+        def stop_recording():
+            """Остановка записи"""
+            user_ip, user_agent = self.get_client_info()
+            
+            if not self.recorder.stop():
+                return jsonify({'status': 'already_stopped', 'message': 'Запись не идет',
+                                'recording': self.recorder.get_status()})
+            
+            self.logger.log_web_action('stop_recording', 'success',
+                                       f"Frames {self.recorder.frames_written}, dropped {self.recorder.frames_dropped}",
+                                       user_ip, user_agent)
+            return jsonify({'status': 'stopped', 'message': 'Запись остановлена',
+                            'recording': self.recorder.get_status()})
+        
+        @self.app.route('/api/recording/status')
+        def recording_status():
+            """Статистика записи: MB/s, отброшенные кадры, сегменты"""
+            return jsonify(self.recorder.get_status())
+        
+        @self.app.route('/api/stream/settings', methods=['GET'])
+        def get_stream_settings():
+            """Текущие параметры стрима и история перенастроек"""
+            return jsonify({
+                'settings': extract_settings(self.config, self.camera_type),
+                'capture_keys': list(CAPTURE_KEYS),
+                'watcher': self.config_watcher.get_status() if self.config_watcher else {'enabled': False},
+                'history': list(self.reconfigure_history),
+            })
+        
+        @self.app.route('/api/stream/settings', methods=['POST'])
+        def update_stream_settings():
+            """Изменение параметров без перезапуска: {"jpeg_quality": 70, "fps": 15, "width": 1280, "height": 720}"""
+            user_ip, user_agent = self.get_client_info()
+            changes = request.get_json(silent=True) or {}
+            if not isinstance(changes, dict) or not changes:
+                return jsonify({'status': 'error', 'message': 'Ожидается JSON объект с параметрами'}), 400
+            
+            report = self.apply_stream_settings(changes, source='api')
+            if not report['applied'] and report['errors']:
+                return jsonify({'status': 'error', 'message': 'Параметры не применены', 'report': report}), 400
+            
+            self.logger.log_web_action('update_stream_settings', 'success',
+                                       f"{report['applied']} за {report['apply_ms']} мс", user_ip, user_agent)
+            return jsonify({'status': 'applied', 'report': report})
+        
+        @self.app.route('/api/stream/clock')
+        def stream_clock():
+            """Время сервера для синхронизации часов клиента (задержка захват -> показ)"""
+            return jsonify({'time': time.time(), 'monotonic': time.monotonic()})
+        
+        @self.app.route('/api/stream/viewer_stats', methods=['GET', 'POST'])
+        def viewer_stats():
+            """Отчеты зрителей: FPS доставки, пропуски кадров, задержка (static/js/app.js)"""
+            if request.method == 'GET':
+                return jsonify({'viewers': self.get_viewer_stats()})
+            
+            report = request.get_json(silent=True) or {}
+            viewer_id = str(report.get('viewer_id', ''))[:64]
+            if not viewer_id:
+                return jsonify({'status': 'error', 'message': 'Нет viewer_id'}), 400
+            
+            report['ip'] = request.remote_addr
+            report['updated'] = time.time()
+            self.viewer_stats[viewer_id] = report
+            return jsonify({'status': 'ok'})
+        
+        @self.app.route('/api/capture_groups')
+        def capture_groups_status():
+            """Группы захвата: ошибка синхронизации и доля несопоставленных кадров"""
+            return jsonify(self.capture_groups.get_status())
+        
+        @self.app.route('/api/capture_groups/<name>/<action>', methods=['POST'])
+        def capture_group_control(name, action):
+            """Запуск / остановка группы захвата"""
+            group = self.capture_groups.get(name)
+            if group is None:
+                return jsonify({'status': 'error', 'message': f'Группа {name} не найдена'}), 404
+            if action == 'start':
+                ok = group.start()
+            elif action == 'stop':
+                group.stop()
+                ok = True
+            else:
+                return jsonify({'status': 'error', 'message': f'Неизвестное действие {action}'}), 400
+            return jsonify({'status': 'success' if ok else 'error', 'group': group.get_status()})
+        
+        @self.app.route('/api/capture_groups/<name>/frameset.jpg')
+        def capture_group_frameset(name):
+            """Последний набор кадров группы рядом одним JPEG (?after=seq - дождаться более нового)"""
+            group = self.capture_groups.get(name)
+            if group is None or not group.running:
+                return jsonify({'status': 'error', 'message': f'Группа {name} не запущена'}), 404
+            frameset = group.wait_next(request.args.get('after', 0, type=int), timeout=2.0)
+            if frameset is None:
+                return jsonify({'status': 'error', 'message': 'Нет сопоставленных кадров'}), 504
+            jpeg = frameset_to_jpeg(frameset)
+            response = Response(jpeg, mimetype='image/jpeg')
+            response.headers['X-Frameset-Seq'] = str(frameset.seq)
+            response.headers['X-Sync-Error-Ms'] = f"{frameset.sync_error_ms:.3f}"
+            response.headers['X-Capture-Monotonic'] = ';'.join(
+                f"{device}={ts:.6f}" for device, ts in frameset.timestamps.items())
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+        
         @self.app.route('/api/cameras')
         def get_cameras():
             """Получение списка доступных камер (USB + CSI)"""
             try:
                 available_cameras = []
                 
+                # Сканирование устройств еще идет в фоне
+                if self.camera_checker is None:
+                    return jsonify({
+                        'cameras': [],
+                        'total': 0,
+                        'initializing': True,
+                        'camera_init': self.camera_init_state,
+                        'current_camera_type': self.camera_type,
+                        'current_device': self.config['camera'].get('device', '')
+                    })
+                
                 # 1. USB камеры через V4L2 (исключая CSI)
                 usb_cameras = self.camera_checker.get_cameras_for_api()
                 
@@ -1400,6 +2454,14 @@ class CameraStreamer:
                     else:
                         print(f"❌ Пропускаем камеру (не is_camera): {device_path} - {name}")
                 
+                # Виртуальные камеры (тесты без железа)
+                if (self.config['camera'].get('backend', '').lower() == 'virtual'
+                        or is_virtual_device(self.config['camera'].get('device', ''))):
+                    current_device = str(self.config['camera'].get('device', ''))
+                    for cam in get_virtual_cameras_for_api(self.config):
+                        cam['is_current'] = cam['device_path'] == current_device
+                        available_cameras.append(cam)
+                
                 # 2. 🔴 ИСПРАВЛЕНО: CSI камеры с проверкой на None
                 if hasattr(self, 'csi_manager') and self.csi_manager is not None:
                     try:
@@ -1455,10 +2517,42 @@ class CameraStreamer:
                 device_path = request.json.get('device_path')
                 if not device_path:
                     return jsonify({'status': 'error', 'message': 'Не указан путь к устройству'})
-                
+                if str(device_path) in self.capture_groups.reserved_devices():
+                    return jsonify({'status': 'error', 'message': f'Камера {device_path} занята группой захвата'})
+                
+                # Камера из пула: переключение подменой указателя, без остановки стрима
+                if self.camera_pool.enabled and device_path != str(self.config['camera'].get('device', '')):
+                    switch_start = time.time()
+                    if device_path.startswith('csi_'):
+                        target_fps = self.config.get('csi_cameras', {}).get(device_path, {}).get('fps')
+                    else:
+                        target_fps = None
+                    session = self.camera_pool.acquire(device_path, fps=target_fps)
+
+                    if session:
+                        with self.camera_lock:
+                            self._park_current_camera()
+                            self._activate_pooled_camera(session)
+
+                        switch_ms = round((time.time() - switch_start) * 1000, 1)
+                        self.camera_pool.last_switch_ms = switch_ms
+                        print(f"⚡ Переключились на {device_path} из пула за {switch_ms} мс")
+                        self.logger.log_web_action('select_camera', 'success',
+                                                   f'Pooled switch to {device_path} ({switch_ms} ms)',
+                                                   user_ip, user_agent)
+
+                        return jsonify({
+                            'status': 'success',
+                            'message': f'Переключились на {device_path} (из пула)',
+                            'device_path': device_path,
+                            'type': 'CSI' if session.camera_type == 'csi' else 'USB',
+                            'pooled': True,
+                            'switch_ms': switch_ms
+                        })
+
                 # Получаем текущее состояние стрима
                 was_streaming = self.stream_active  # Используем self
-                
+
                 # Если стрим активен, временно приостанавливаем
                 if self.stream_active:  # Используем self
                     self.stop_stream_internal()  # Используем self
@@ -1469,8 +2563,11 @@ class CameraStreamer:
                     try:
                         camera_idx = int(device_path.split('_')[1])
                         
-                        # Закрываем текущую камеру
-                        if self.camera_type == 'csi':  # Используем self
+                        # Закрываем текущую камеру (или оставляем её в пуле)
+                        if self.camera_pool.enabled:
+                            with self.camera_lock:
+                                self._park_current_camera()
+                        elif self.camera_type == 'csi':  # Используем self
                             self.csi_manager.close_current()  # Используем self
                         elif self.camera_type == 'v4l2' and self.current_v4l2_camera:  # Используем self
                             self.current_v4l2_camera.release()  # Используем self
@@ -1503,8 +2600,11 @@ class CameraStreamer:
                 
                 else:
                     # Это USB камера через V4L2
-                    # Закрываем текущую камеру
-                    if self.camera_type == 'csi':  # Используем self
+                    # Закрываем текущую камеру (или оставляем её в пуле)
+                    if self.camera_pool.enabled:
+                        with self.camera_lock:
+                            self._park_current_camera()
+                    elif self.camera_type == 'csi':  # Используем self
                         self.csi_manager.close_current()  # Используем self
                         self.current_picam2 = None  # Используем self
                     elif self.camera_type == 'v4l2' and self.current_v4l2_camera:  # Используем self
@@ -1513,8 +2613,8 @@ class CameraStreamer:
                     # Открываем USB камеру
                     with self.camera_lock:  # Используем self
                         try:
-                            new_camera = cv2.VideoCapture(device_path)
-                            if new_camera.isOpened():
+                            new_camera = self._open_v4l2_device(device_path)
+                            if new_camera and new_camera.isOpened():
                                 # Настраиваем параметры
                                 if 'width' in self.config['camera'] and 'height' in self.config['camera']:  # Используем self
                                     new_camera.set(cv2.CAP_PROP_FRAME_WIDTH, self.config['camera']['width'])
@@ -1525,6 +2625,10 @@ class CameraStreamer:
                                 self.current_picam2 = None  # Используем self
                                 self.config['camera']['device'] = device_path  # Используем self
                                 self.frame_count = 0  # Используем self
+                                if self.camera_init_state == 'failed':
+                                    # Прежняя камера не открылась после перезапуска - рабочая камера снова есть
+                                    self.camera_init_state = 'ready'
+                                    self.camera_init_error = None
                                 
                                 print(f"📹 Переключились на USB камеру {device_path}")
                                 
@@ -1801,14 +2905,17 @@ class CameraStreamer:
             def generate_test():
                 try:
                     frame_count = 0
+                    last_seq = 0
                     while self.stream_active:
                         try:
-                            frame = self.frame_buffer.get(timeout=2.0)
+                            encoded = self.frame_hub.wait_next(last_seq, timeout=2.0)
+                            if encoded is None:
+                                yield f"data: Буфер пуст (таймаут), активных потоков: {self.active_streams}\n\n"
+                                time.sleep(0.1)
+                                continue
+                            last_seq = encoded.seq
                             frame_count += 1
-                            yield f"data: Кадр {frame_count} получен, размер буфера: {self.frame_buffer.qsize()}\n\n"
-                        except queue.Empty:
-                            yield f"data: Буфер пуст (таймаут), активных потоков: {self.active_streams}\n\n"
-                            time.sleep(0.1)
+                            yield f"data: Кадр {frame_count} получен (seq {encoded.seq}), размер буфера: {self.frame_buffer.qsize()}\n\n"
                         except Exception as e:
                             yield f"data: Ошибка: {str(e)}\n\n"
                             time.sleep(0.1)
@@ -1841,8 +2948,9 @@ class CameraStreamer:
                 photos_dir = os.path.join(current_dir, 'static', 'photos')
                 os.makedirs(photos_dir, exist_ok=True)
                 
-                # Получаем кадр
-                frame = self.capture_frame_to_file()
+                # Получаем кадр (приостановленный захват возобновляется на время снимка)
+                with self.idle_suspend.keep_awake('photo'):
+                    frame = self.capture_frame_to_file()
                 if frame is None:
                     self.logger.log_web_action('capture_picture', 'error', 
                                             'Failed to capture frame', user_ip, user_agent)
@@ -2090,6 +3198,15 @@ class CameraStreamer:
             print("Нажмите Ctrl+C для остановки")
             print("=" * 60)
             
+            if self.config_watcher:
+                self.config_watcher.start()
+            
+            self.thermal_governor.start()
+            self.tag_analysis.start()
+            
+            # Камеры групп открываются в фоне - HTTP сервер не ждет их прогрева
+            threading.Thread(target=self.capture_groups.start_auto, daemon=True).start()
+            
             self.app.run(
                 host=app_config['host'],
                 port=app_config['port'],
@@ -2114,6 +3231,20 @@ class CameraStreamer:
         if hasattr(self, 'stream_active') and self.stream_active:
             self.stop_stream_internal()
         
+        # Дописываем и закрываем текущий сегмент записи
+        self.recorder.stop()
+        
+        # Удаляем сегмент шины кадров (читатели получат таймаут)
+        self.frame_bus.stop()
+        
+        if self.config_watcher:
+            self.config_watcher.stop()
+        
+        self.thermal_governor.stop()
+        self.tag_analysis.stop()
+        
+        self.capture_groups.stop_all()
+        
         # Закрываем камеры
         if self.camera_type == 'csi':
             if hasattr(self, 'csi_manager'):
@@ -2127,6 +3258,9 @@ class CameraStreamer:
                     except Exception as e:
                         print(f"⚠️  Ошибка при освобождении USB камеры: {e}")
         
+        # Закрываем камеры, оставленные в пуле
+        self.camera_pool.close_all()
+        
         print("👋 Сервер остановлен")
 
     def get_stream_state_info(self):
@@ -2211,32 +3345,11 @@ def main():
     # Логируем информацию о запуске
     logger.log_startup_info(config)
     
-    print("=" * 60)
-    print("🔍 Поиск рабочей камеры...")
-    print("=" * 60)
-    
-    camera_info = test_camera_backends(config, logger)
-
-    # ВРЕМЕННО ОТКЛЮЧАЕМ - вызывает конфликт с уже открытой камерой
-    log_all_available_cameras(logger)   # ← ЗАКОММЕНТИРУЙТЕ ЭТУ СТРОКУ
-    
-    if camera_info is None:
-        logger.log_error("НЕ НАЙДЕНА РАБОЧАЯ КАМЕРА!")
-        print("\n❌ НЕ НАЙДЕНА РАБОЧАЯ КАМЕРА!")
-        sys.exit(1)
-    
-    print("\n✅ Камера найдена и готова к работе!")
-    
-    # Создаем и запускаем стример
+    # Создаем и запускаем стример: HTTP сервер поднимается сразу,
+    # поиск камеры и сканирование устройств идут в фоне
     try:
-        streamer = CameraStreamer(config, logger, camera_info)
-
-        # ✅ АВТОЗАПУСК СТРИМА ПРИ СТАРТЕ СЕРВЕРА
-        if config.get('camera', {}).get('auto_start', False):
-            print("🚀 Автозапуск стрима включен - запускаю...")
-            logger.log_info("Автозапуск стрима включен в конфигурации")
-            streamer.start_stream_internal()
-
+        streamer = CameraStreamer(config, logger, config_path=args.config)
+        threading.Thread(target=streamer.initialize_cameras, daemon=True).start()
         streamer.run()
     except Exception as e:
         print(f"❌ Ошибка создания CameraStreamer: {e}")
@@ -0,0 +1,117 @@
+"""
+Камера из шины кадров стримера (разделяемая память)
+
+Стример (05_flask_webcam_stream__RPI.py, frame_bus.enabled) владеет
+камерой и пишет кадры в шину; трекер подключается к ней как читатель
+и работает параллельно с веб-стримом без второго открытия устройства.
+"""
+import importlib
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from .base_camera import BaseCamera
+
+# Каталог стримера: клиентская библиотека шины лежит в его utils_rpi
+STREAMER_DIR = str(Path(__file__).resolve().parents[3])
+
+
+def load_frame_bus_reader():
+    """
+    FrameBusReader из utils_rpi стримера
+
+    Внутри стримера utils_rpi уже импортируется; в отдельном процессе трекера
+    каталог стримера добавляется в sys.path только на время импорта.
+    """
+    try:
+        return importlib.import_module('utils_rpi.frame_bus').FrameBusReader
+    except ImportError:
+        pass
+    sys.path.insert(0, STREAMER_DIR)
+    try:
+        return importlib.import_module('utils_rpi.frame_bus').FrameBusReader
+    finally:
+        sys.path.remove(STREAMER_DIR)
+
+
+class BusCamera(BaseCamera):
+    """Чтение кадров из шины кадров (FrameBusReader)"""
+    
+    def __init__(self, config: dict):
+        super().__init__(config)
+        self.bus_name = config.get('bus_name', 'pics_keeper_bus')
+        self.timeout = config.get('timeout', 1.0)
+        self.connect_timeout = config.get('connect_timeout', 10.0)
+        # Трекер рисует поверх кадра - по умолчанию копия, чтобы не портить кадры
+        # других читателей; zero_copy только для чтения без изменения кадра
+        self.zero_copy = config.get('zero_copy', False)
+        self.report_interval = config.get('report_interval', 10.0)
+        self.reader = None
+        self.last_frame = None
+        self._last_report = 0.0
+    
+    def initialize(self) -> bool:
+        """Подключение к шине и ожидание первого кадра"""
+        try:
+            frame_bus_reader = load_frame_bus_reader()
+        except ImportError as e:
+            print(f"❌ Frame bus client not available: {e}")
+            return False
+        deadline = time.time() + self.connect_timeout
+        while self.reader is None:
+            try:
+                self.reader = frame_bus_reader(self.bus_name)
+            except FileNotFoundError:
+                if time.time() >= deadline:
+                    print(f"❌ Frame bus '{self.bus_name}' not found (is frame_bus.enabled set in the streamer?)")
+                    return False
+                time.sleep(0.5)
+            except Exception as e:
+                print(f"❌ Frame bus connection error: {e}")
+                return False
+        
+        frame = self.reader.read_next(timeout=self.connect_timeout, copy=True)
+        if frame is None:
+            print(f"❌ No frames on bus '{self.bus_name}'")
+            return False
+        
+        self.height, self.width = frame.image.shape[:2]
+        self.last_frame = frame
+        print(f"✅ Bus camera: {self.width}x{self.height} from '{self.bus_name}' (camera {frame.camera_id})")
+        return True
+    
+    def get_frame(self) -> np.ndarray:
+        """Следующий кадр из шины"""
+        if self.reader is None:
+            return None
+        
+        frame = self.reader.read_next(timeout=self.timeout, copy=not self.zero_copy)
+        if frame is None:
+            if not self.reader.writer_alive:
+                print("⚠️ Frame bus writer is gone")
+            return None
+        
+        self.last_frame = frame
+        self._report()
+        return frame.image
+    
+    def _report(self):
+        """Периодический отчет об отставании и потерях"""
+        now = time.time()
+        if not self.report_interval or now - self._last_report < self.report_interval:
+            return
+        self._last_report = now
+        status = self.reader.get_status()
+        print(f"🚌 Bus lag: {status['lag_ms']} ms, {status['lag_frames']} frames; "
+              f"missed {status['frames_missed']}, overruns {status['overruns']}")
+    
+    def get_status(self) -> dict:
+        """Статистика читателя шины"""
+        return self.reader.get_status() if self.reader else {}
+    
+    def release(self):
+        """Отключение от шины"""
+        if self.reader:
+            self.reader.close()
+            self.reader = None
@@ -14,7 +14,7 @@ class CameraFactory:
         Создание камеры по типу
         
         Args:
-            camera_type: 'usb' или 'csi'
+            camera_type: 'usb', 'csi' или 'bus' (шина кадров стримера)
             config: конфигурация камеры
             
         Returns:
@@ -24,5 +24,9 @@ class CameraFactory:
             return USBCamera(config)
         elif camera_type == 'csi':
             return CSICamera(config)
+        elif camera_type == 'bus':
+            # Шина нужна только этому типу: клиент шины не импортируется остальными
+            from .bus_camera import BusCamera
+            return BusCamera(config)
         else:
             raise ValueError(f"Unknown camera type: {camera_type}")
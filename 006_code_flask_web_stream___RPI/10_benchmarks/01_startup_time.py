@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+
+# 01_startup_time.py
+
+"""
+Бенчмарк холодного старта сервера 05_flask_webcam_stream__RPI.py
+
+Измеряет:
+  1. Время импорта модулей сервера (python -X importtime): self и cumulative
+  2. Время холодного импорта тяжелых модулей по отдельности (cv2, numpy, picamera2)
+  3. Время от запуска процесса до первого ответа 200 на / и /api/stream/status,
+     а также время инициализации камеры (блок camera_init в статусе)
+
+Запуск:
+  python3 10_benchmarks/01_startup_time.py --runs 3 --output startup_report.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import yaml
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_SCRIPT = os.path.join(PROJECT_DIR, '05_flask_webcam_stream__RPI.py')
+HEAVY_MODULES = ['cv2', 'numpy', 'picamera2', 'flask', 'yaml']
+
+
+def measure_server_imports():
+    """Разбор вывода -X importtime при загрузке модуля сервера (без запуска main)"""
+    code = (
+        "import importlib.util;"
+        f"s=importlib.util.spec_from_file_location('server', {SERVER_SCRIPT!r});"
+        "m=importlib.util.module_from_spec(s);s.loader.exec_module(m)"
+    )
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            cwd=PROJECT_DIR, capture_output=True, text=True)
+    total_ms = (time.perf_counter() - start) * 1000
+
+    modules = []
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            _, rest = line.split(':', 1)
+            self_us, cumulative_us, name = rest.split('|', 2)
+            modules.append({
+                'module': name.strip(),
+                'depth': (len(name) - len(name.lstrip()) - 1) // 2,
+                'self_ms': int(self_us) / 1000,
+                'cumulative_ms': int(cumulative_us) / 1000,
+            })
+        except ValueError:
+            continue
+
+    loaded = {m['module'] for m in modules}
+    return {
+        'process_ms': round(total_ms, 1),
+        'modules_total': len(modules),
+        'heavy_loaded_at_import': [name for name in HEAVY_MODULES if name in loaded],
+        'top_cumulative': sorted(modules, key=lambda m: m['cumulative_ms'], reverse=True)[:15],
+    }
+
+
+def measure_heavy_module(name):
+    """Холодный импорт одного модуля в отдельном процессе (мс)"""
+    code = (
+        "import time;t=time.perf_counter();"
+        f"import {name};"
+        "print((time.perf_counter()-t)*1000)"
+    )
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return round(float(result.stdout.strip().splitlines()[-1]), 1)
+
+
+def wait_http_200(url, timeout):
+    """Ожидание первого ответа 200 (мс от начала ожидания или None)"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return response.read()
+        except Exception:
+            pass
+        time.sleep(0.02)
+    return None
+
+
+def measure_server_start(config_path, port, timeout):
+    """Запуск сервера и замер времени до первых ответов"""
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f)
+
+    config['server']['port'] = port
+    config['server']['debug'] = False
+    config['camera']['auto_start'] = True
+
+    with tempfile.NamedTemporaryFile('w', suffix='.yaml', delete=False, dir=PROJECT_DIR) as tmp:
+        yaml.safe_dump(config, tmp, allow_unicode=True)
+        tmp_config = tmp.name
+
+    base = f"http://127.0.0.1:{port}"
+    result = {}
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, SERVER_SCRIPT, '--config', tmp_config],
+                               cwd=PROJECT_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if wait_http_200(base + '/', timeout) is not None:
+            result['index_ms'] = round((time.perf_counter() - start) * 1000, 1)
+
+        body = wait_http_200(base + '/api/stream/status', timeout)
+        if body is not None:
+            result['status_ms'] = round((time.perf_counter() - start) * 1000, 1)
+
+        # Ждем окончания фоновой инициализации камеры
+        deadline = time.time() + timeout
+        while body is not None and time.time() < deadline:
+            camera_init = json.loads(body).get('camera_init', {})
+            if camera_init.get('state') in ('ready', 'failed') and (
+                    camera_init.get('state') == 'failed' or camera_init.get('first_frame_ms')):
+                result['camera_init'] = camera_init
+                break
+            time.sleep(0.1)
+            body = wait_http_200(base + '/api/stream/status', 1)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        os.remove(tmp_config)
+
+    return result
+
+
+def median_of(runs, key):
+    values = [run[key] for run in runs if run.get(key) is not None]
+    return round(statistics.median(values), 1) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк холодного старта сервера')
+    parser.add_argument('--config', '-c', default=os.path.join(PROJECT_DIR, 'config_rpi.yaml'),
+                        help='Конфигурация сервера')
+    parser.add_argument('--port', type=int, default=5099, help='Порт тестового сервера')
+    parser.add_argument('--runs', type=int, default=3, help='Количество запусков (медиана)')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Таймаут ожидания (с)')
+    parser.add_argument('--output', '-o', help='Путь для JSON отчета')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("⏱️  БЕНЧМАРК ХОЛОДНОГО СТАРТА")
+    print("=" * 60)
+
+    imports = measure_server_imports()
+    print(f"\n📦 Импорт модуля сервера: {imports['process_ms']} мс (процесс целиком)")
+    print(f"   Тяжелые модули при импорте: {imports['heavy_loaded_at_import'] or 'нет'}")
+    for item in imports['top_cumulative'][:10]:
+        print(f"   {item['cumulative_ms']:8.1f} мс  {item['module']}")
+
+    heavy = {}
+    print("\n🐘 Холодный импорт тяжелых модулей:")
+    for name in HEAVY_MODULES:
+        heavy[name] = measure_heavy_module(name)
+        value = f"{heavy[name]} мс" if heavy[name] is not None else "не установлен"
+        print(f"   {name:10s} {value}")
+
+    runs = []
+    print(f"\n🚀 Запуск сервера ({args.runs} раз):")
+    for i in range(args.runs):
+        run = measure_server_start(args.config, args.port, args.timeout)
+        init = run.get('camera_init', {})
+        run['camera_state'] = init.get('state')
+        run['first_frame_ms'] = init.get('first_frame_ms')
+        runs.append(run)
+        print(f"   #{i + 1}: / = {run.get('index_ms')} мс, status = {run.get('status_ms')} мс, "
+              f"камера = {run['camera_state']}, первый кадр = {run['first_frame_ms']} мс")
+
+    summary = {
+        'index_ms': median_of(runs, 'index_ms'),
+        'status_ms': median_of(runs, 'status_ms'),
+        'first_frame_ms': median_of(runs, 'first_frame_ms'),
+    }
+    print(f"\n📊 Медиана: {summary}")
+
+    if args.output:
+        report = {
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': sys.version.split()[0],
+            'server_imports': imports,
+            'heavy_modules_ms': heavy,
+            'runs': runs,
+            'median': summary,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"💾 Отчет сохранен: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+
+# 02_load_test.py
+
+"""
+Нагрузочный тест стримера: N одновременных клиентов /video_feed
+
+Для каждого клиента записывается:
+  - доставленный FPS и объем данных
+  - интервалы между кадрами (mean, p50, p95, p99, max)
+  - отказ (заглушка "Too many streams" или обрыв соединения)
+Для сервера (если известен PID или сервер запущен тестом):
+  - загрузка CPU (%) и RSS (МБ) по /proc/<pid>
+
+Запуск с виртуальной камерой (без железа):
+  python3 10_benchmarks/02_load_test.py --launch --clients 4 --duration 20 --output load_report.json
+
+Тест уже работающего сервера:
+  python3 10_benchmarks/02_load_test.py --url http://192.168.1.10:5000 --clients 2 --pid 1234
+
+Клиенты с ограниченной частотой и шириной (панели, настенные экраны):
+  python3 10_benchmarks/02_load_test.py --launch --clients 4 --query "fps=2&width=640"
+"""
+
+import argparse
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+import yaml
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_SCRIPT = os.path.join(PROJECT_DIR, '05_flask_webcam_stream__RPI.py')
+BOUNDARY = b'--frame\r\n'
+
+
+def percentile(values, p):
+    """Перцентиль без numpy (ближайший ранг)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(p / 100.0 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+class StreamClient(threading.Thread):
+    """Клиент MJPEG потока, считающий кадры по границам multipart"""
+
+    def __init__(self, client_id, url, duration, warmup):
+        super().__init__(daemon=True)
+        self.client_id = client_id
+        self.url = url
+        self.duration = duration
+        self.warmup = warmup
+
+        self.frame_times = []
+        self.bytes_received = 0
+        self.error = None
+        self.closed_early = False
+
+    def run(self):
+        parsed = urllib.parse.urlparse(self.url)
+        path = f"{parsed.path or '/video_feed'}?t=load{self.client_id}_{time.time()}"
+        if parsed.query:
+            path += '&' + parsed.query
+        start = time.time()
+        try:
+            conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=10)
+            conn.request('GET', path)
+            response = conn.getresponse()
+            if response.status != 200:
+                self.error = f"HTTP {response.status}"
+                return
+
+            tail = b''
+            while time.time() - start < self.warmup + self.duration:
+                chunk = response.read1(65536)
+                if not chunk:
+                    self.closed_early = True
+                    break
+                self.bytes_received += len(chunk)
+
+                data = tail + chunk
+                now = time.time()
+                pos = data.find(BOUNDARY)
+                while pos != -1:
+                    if now - start >= self.warmup:
+                        self.frame_times.append(now)
+                    pos = data.find(BOUNDARY, pos + len(BOUNDARY))
+                tail = data[-(len(BOUNDARY) - 1):]
+            conn.close()
+        except Exception as e:
+            self.error = str(e)
+
+    def get_report(self):
+        intervals = [(b - a) * 1000 for a, b in zip(self.frame_times, self.frame_times[1:])]
+        span = self.frame_times[-1] - self.frame_times[0] if len(self.frame_times) > 1 else 0
+        # Заглушка при перегрузке - один кадр и закрытие соединения
+        rejected = self.closed_early and len(self.frame_times) <= 1
+        return {
+            'client': self.client_id,
+            'frames': len(self.frame_times),
+            'fps': round((len(self.frame_times) - 1) / span, 2) if span > 0 else 0.0,
+            'mbytes': round(self.bytes_received / (1024 * 1024), 2),
+            'interval_ms': {
+                'mean': round(statistics.mean(intervals), 1) if intervals else None,
+                'p50': round(percentile(intervals, 50), 1) if intervals else None,
+                'p95': round(percentile(intervals, 95), 1) if intervals else None,
+                'p99': round(percentile(intervals, 99), 1) if intervals else None,
+                'max': round(max(intervals), 1) if intervals else None,
+            },
+            'rejected': rejected,
+            'closed_early': self.closed_early,
+            'error': self.error,
+        }
+
+
+class ProcessSampler(threading.Thread):
+    """Периодический замер CPU и RSS процесса по /proc"""
+
+    def __init__(self, pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self.running = True
+        self.clock_ticks = os.sysconf('SC_CLK_TCK')
+
+    def _read_cpu_ticks(self):
+        with open(f"/proc/{self.pid}/stat", 'r') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        # utime и stime - 14 и 15 поля (после имени процесса - 12 и 13)
+        return int(fields[11]) + int(fields[12])
+
+    def _read_rss_mb(self):
+        with open(f"/proc/{self.pid}/status", 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+        return 0.0
+
+    def run(self):
+        try:
+            last_ticks = self._read_cpu_ticks()
+            last_time = time.time()
+            while self.running:
+                time.sleep(self.interval)
+                ticks = self._read_cpu_ticks()
+                now = time.time()
+                cpu = (ticks - last_ticks) / self.clock_ticks / (now - last_time) * 100
+                self.samples.append({'t': round(now, 2), 'cpu_percent': round(cpu, 1),
+                                     'rss_mb': round(self._read_rss_mb(), 1)})
+                last_ticks, last_time = ticks, now
+        except OSError:
+            pass
+
+    def get_report(self):
+        if not self.samples:
+            return None
+        cpu = [s['cpu_percent'] for s in self.samples]
+        rss = [s['rss_mb'] for s in self.samples]
+        return {
+            'pid': self.pid,
+            'cpu_percent': {'mean': round(statistics.mean(cpu), 1), 'max': max(cpu)},
+            'rss_mb': {'mean': round(statistics.mean(rss), 1), 'max': max(rss)},
+            'samples': self.samples,
+        }
+
+
+def http_json(url, method='GET', timeout=2):
+    request = urllib.request.Request(url, method=method, data=b'' if method == 'POST' else None)
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def launch_server(args):
+    """Запуск сервера с виртуальной камерой на отдельном порту"""
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f)
+
+    config['server']['port'] = args.port
+    config['server']['debug'] = False
+    # Все клиенты идут с одного IP - поднимаем лимиты под тест
+    config['server']['max_concurrent_streams'] = max(args.clients, config['server'].get('max_concurrent_streams', 4))
+    config['server']['max_streams_per_client'] = args.clients
+    config['camera']['backend'] = 'virtual'
+    config['camera']['device'] = 'virtual_0'
+    config['camera']['auto_start'] = True
+
+    virtual = config.setdefault('virtual_camera', {})
+    if args.source:
+        virtual['source'] = args.source
+    if args.path:
+        virtual['path'] = args.path
+    if args.width and args.height:
+        virtual['width'], virtual['height'] = args.width, args.height
+    if args.fps:
+        virtual['fps'] = args.fps
+
+    tmp = tempfile.NamedTemporaryFile('w', suffix='.yaml', delete=False, dir=PROJECT_DIR)
+    yaml.safe_dump(config, tmp, allow_unicode=True)
+    tmp.close()
+
+    log = open(os.path.join(tempfile.gettempdir(), 'load_test_server.log'), 'w')
+    process = subprocess.Popen([sys.executable, SERVER_SCRIPT, '--config', tmp.name],
+                               cwd=PROJECT_DIR, stdout=log, stderr=subprocess.STDOUT)
+    return process, tmp.name
+
+
+def wait_stream_ready(base, timeout):
+    """Ожидание готовности камеры и запуск стрима при необходимости"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            status = http_json(base + '/api/stream/status')
+            state = status.get('camera_init', {}).get('state', 'ready')
+            if state == 'failed':
+                return False
+            if status.get('stream_active') and status.get('frame_count', 0) > 0:
+                return True
+            if state == 'ready' and not status.get('stream_active'):
+                http_json(base + '/api/stream/start', method='POST')
+        except Exception:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест /video_feed')
+    parser.add_argument('--url', default=None, help='Адрес сервера (по умолчанию - запущенный тестом)')
+    parser.add_argument('--launch', action='store_true', help='Запустить сервер с виртуальной камерой')
+    parser.add_argument('--config', '-c', default=os.path.join(PROJECT_DIR, 'config_rpi.yaml'))
+    parser.add_argument('--port', type=int, default=5098, help='Порт запускаемого сервера')
+    parser.add_argument('--source', choices=['synthetic', 'file', 'images'], help='Источник виртуальной камеры')
+    parser.add_argument('--path', help='Видеофайл или папка изображений')
+    parser.add_argument('--width', type=int)
+    parser.add_argument('--height', type=int)
+    parser.add_argument('--fps', type=float)
+    parser.add_argument('--clients', '-n', type=int, default=4, help='Число одновременных клиентов')
+    parser.add_argument('--duration', '-d', type=float, default=15.0, help='Длительность замера (с)')
+    parser.add_argument('--warmup', type=float, default=2.0, help='Прогрев перед замером (с)')
+    parser.add_argument('--query', '-q', default='', help='Параметры клиента, например "fps=2&width=640"')
+    parser.add_argument('--pid', type=int, help='PID сервера для замера CPU/RSS')
+    parser.add_argument('--output', '-o', help='Путь для JSON отчета')
+    args = parser.parse_args()
+
+    process, tmp_config = None, None
+    if args.launch:
+        process, tmp_config = launch_server(args)
+        base = f"http://127.0.0.1:{args.port}"
+        pid = process.pid
+    else:
+        base = (args.url or 'http://127.0.0.1:5000').rstrip('/')
+        pid = args.pid
+
+    print("=" * 60)
+    print(f"🔥 НАГРУЗОЧНЫЙ ТЕСТ: {args.clients} клиентов, {args.duration} с → {base}")
+    print("=" * 60)
+
+    try:
+        if not wait_stream_ready(base, 30):
+            print("❌ Стрим не готов (камера не найдена или сервер недоступен)")
+            sys.exit(1)
+
+        sampler = None
+        if pid and os.path.exists(f"/proc/{pid}"):
+            sampler = ProcessSampler(pid)
+            sampler.start()
+
+        feed_url = base + '/video_feed' + (f"?{args.query}" if args.query else '')
+        clients = [StreamClient(i, feed_url, args.duration, args.warmup)
+                   for i in range(args.clients)]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join(args.warmup + args.duration + 15)
+
+        if sampler:
+            sampler.running = False
+            sampler.join(2)
+
+        client_reports = [client.get_report() for client in clients]
+        served = [r for r in client_reports if not r['rejected'] and not r['error']]
+
+        for r in client_reports:
+            state = '⛔ отказ' if r['rejected'] else (f"❌ {r['error']}" if r['error'] else '✅')
+            print(f"   #{r['client']}: {r['fps']:6.2f} fps, {r['frames']} кадров, "
+                  f"p95 интервал {r['interval_ms']['p95']} мс, {r['mbytes']} МБ {state}")
+
+        summary = {
+            'clients': args.clients,
+            'served': len(served),
+            'rejected': sum(1 for r in client_reports if r['rejected']),
+            'fps_mean': round(statistics.mean(r['fps'] for r in served), 2) if served else 0.0,
+            'fps_min': min((r['fps'] for r in served), default=0.0),
+            'interval_p95_ms': max((r['interval_ms']['p95'] or 0 for r in served), default=None),
+            'total_mbytes_per_s': round(sum(r['mbytes'] for r in client_reports) / args.duration, 2),
+        }
+        server = sampler.get_report() if sampler else None
+        if server:
+            summary['server_cpu_percent'] = server['cpu_percent']['mean']
+            summary['server_rss_mb'] = server['rss_mb']['max']
+
+        print(f"\n📊 Итог: {summary}")
+
+        try:
+            status = http_json(base + '/api/stream/status')
+        except Exception:
+            status = None
+
+        if args.output:
+            report = {
+                'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'url': base,
+                'duration_s': args.duration,
+                'warmup_s': args.warmup,
+                'summary': summary,
+                'clients': client_reports,
+                'server': server,
+                'server_status': status,
+            }
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+            print(f"💾 Отчет сохранен: {args.output}")
+    finally:
+        if process:
+            process.terminate()
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if tmp_config:
+            os.remove(tmp_config)
+
+
+if __name__ == '__main__':
+    main()
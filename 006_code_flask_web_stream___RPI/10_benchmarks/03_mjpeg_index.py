@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+# 03_mjpeg_index.py
+
+"""
+Бенчмарк индекса кадров MJPEG (utils_rpi/mjpeg_index.py)
+
+Измеряет на большом .mjpg файле:
+  1. Построение индекса (векторный поиск маркеров по mmap), ГБ/с
+  2. Загрузку индекса из файла-спутника
+  3. Произвольный доступ к кадру N: индекс против последовательного поиска с начала файла
+  4. Декодирование диапазона кадров: 1 поток против N потоков
+
+Если файл не указан, генерируется синтетическая запись заданного размера
+(склейка JPEG кадров, как у v4l2-ctl --stream-to).
+
+Запуск:
+  python3 10_benchmarks/03_mjpeg_index.py --size-gb 4 --output index_report.json
+  python3 10_benchmarks/03_mjpeg_index.py --file v4l2_test_videos/MJPG_1920x1080_30fps.mjpg --fps 30
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from utils_rpi.mjpeg_index import MjpegReader, build_index, index_path  # noqa: E402
+
+
+def generate_recording(path, size_gb, width, height, quality):
+    """Синтетическая запись: 64 разных JPEG кадра, повторяемых до нужного размера"""
+    frames = []
+    for i in range(64):
+        img = np.full((height, width, 3), (i * 4) % 256, dtype=np.uint8)
+        cv2.putText(img, f"frame {i}", (50, height // 2), cv2.FONT_HERSHEY_SIMPLEX, 3, (255, 255, 255), 5)
+        noise = np.random.randint(0, 32, (height, width, 3), dtype=np.uint8)
+        ret, jpeg = cv2.imencode('.jpg', cv2.add(img, noise), [cv2.IMWRITE_JPEG_QUALITY, quality])
+        frames.append(jpeg.tobytes())
+
+    target = int(size_gb * 1024 ** 3)
+    written = 0
+    count = 0
+    with open(path, 'wb', buffering=8 * 1024 * 1024) as f:
+        while written < target:
+            jpeg = frames[count % len(frames)]
+            f.write(jpeg)
+            written += len(jpeg)
+            count += 1
+    return count
+
+
+def naive_seek(path, n):
+    """Поиск кадра N последовательным чтением с начала файла (без индекса)"""
+    found = -1
+    tail = b''
+    position = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(4 * 1024 * 1024)
+            if not chunk:
+                return None
+            data = tail + chunk
+            pos = data.find(b'\xff\xd8')
+            while pos != -1:
+                found += 1
+                if found == n:
+                    return position - len(tail) + pos
+                pos = data.find(b'\xff\xd8', pos + 2)
+            tail = data[-1:]
+            position += len(chunk)
+
+
+def drop_page_cache(path):
+    """Сброс страниц файла из кэша (если ОС позволяет) для честного холодного замера"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        os.close(fd)
+    except (AttributeError, OSError):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк индекса кадров MJPEG')
+    parser.add_argument('--file', '-f', help='Готовый .mjpg файл')
+    parser.add_argument('--size-gb', type=float, default=1.0, help='Размер синтетической записи (ГБ)')
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--quality', type=int, default=85)
+    parser.add_argument('--fps', type=float, default=30.0, help='FPS записи (для выборки по времени)')
+    parser.add_argument('--random-reads', type=int, default=1000, help='Число случайных обращений к кадрам')
+    parser.add_argument('--decode-frames', type=int, default=300, help='Кадров в тесте декодирования')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4)
+    parser.add_argument('--keep', action='store_true', help='Не удалять синтетическую запись')
+    parser.add_argument('--output', '-o', help='Путь для JSON отчета')
+    args = parser.parse_args()
+
+    generated = False
+    path = args.file
+    if not path:
+        path = os.path.join(tempfile.gettempdir(), f"bench_{args.width}x{args.height}_{args.size_gb}gb.mjpg")
+        print(f"🧪 Генерация записи {args.size_gb} ГБ: {path}")
+        start = time.perf_counter()
+        count = generate_recording(path, args.size_gb, args.width, args.height, args.quality)
+        print(f"   {count} кадров за {time.perf_counter() - start:.1f} с")
+        generated = True
+
+    file_gb = os.path.getsize(path) / 1024 ** 3
+    report = {'file': path, 'file_gb': round(file_gb, 3)}
+
+    try:
+        # 1. Построение индекса
+        drop_page_cache(path)
+        index = build_index(path, fps=args.fps)
+        frames = int(index['offsets'].size)
+        report['build'] = {
+            'frames': frames,
+            'seconds': round(index['build_s'], 3),
+            'gb_per_s': round(file_gb / index['build_s'], 2) if index['build_s'] else None,
+            'sidecar_kb': round(os.path.getsize(index_path(path)) / 1024, 1),
+        }
+        print(f"\n📇 Индекс: {frames} кадров за {index['build_s']:.2f} с "
+              f"({report['build']['gb_per_s']} ГБ/с), спутник {report['build']['sidecar_kb']} КБ")
+
+        # 2. Загрузка индекса из файла-спутника
+        start = time.perf_counter()
+        reader = MjpegReader(path, fps=args.fps)
+        report['load_index_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        print(f"📂 Загрузка индекса: {report['load_index_ms']} мс (из спутника: {reader.index_loaded})")
+
+        # 3. Произвольный доступ
+        targets = [random.randrange(frames) for _ in range(args.random_reads)]
+        drop_page_cache(path)
+        times = []
+        for n in targets:
+            start = time.perf_counter()
+            reader.get_jpeg(n)
+            times.append((time.perf_counter() - start) * 1000)
+        times.sort()
+        report['random_access_ms'] = {
+            'p50': round(times[len(times) // 2], 3),
+            'p95': round(times[int(len(times) * 0.95)], 3),
+            'max': round(times[-1], 3),
+        }
+
+        naive_n = frames - 1
+        start = time.perf_counter()
+        naive_offset = naive_seek(path, naive_n)
+        naive_ms = (time.perf_counter() - start) * 1000
+        # В AVI маркеры встречаются и в заголовках чанков - сверка только для склеенных JPEG
+        if not path.lower().endswith('.avi'):
+            assert naive_offset == int(reader.offsets[naive_n]), "Индекс не совпал с последовательным поиском"
+        report['naive_seek_last_frame_ms'] = round(naive_ms, 1)
+        print(f"🎯 Кадр по индексу: p50 {report['random_access_ms']['p50']} мс, "
+              f"p95 {report['random_access_ms']['p95']} мс; "
+              f"без индекса (последний кадр): {report['naive_seek_last_frame_ms']} мс")
+
+        # Выборка по времени
+        t_mid = (frames / args.fps) / 2
+        span = reader.time_range(t_mid, t_mid + 1.0)
+        report['time_range_1s_frames'] = len(span)
+
+        # 4. Декодирование диапазона
+        count = min(args.decode_frames, frames)
+        first = random.randrange(max(1, frames - count))
+        frame_range = range(first, first + count)
+        decode = {}
+        for workers in sorted({1, args.workers}):
+            start = time.perf_counter()
+            results = reader.decode_range(frame_range, workers=workers,
+                                          func=lambda n, frame: float(frame.mean()))
+            elapsed = time.perf_counter() - start
+            decode[str(workers)] = round(len(results) / elapsed, 1)
+            print(f"🧵 Декодирование {count} кадров, потоков {workers}: {decode[str(workers)]} кадров/с")
+        report['decode_fps'] = decode
+
+        reader.close()
+    finally:
+        if generated and not args.keep:
+            os.remove(path)
+            if os.path.exists(index_path(path)):
+                os.remove(index_path(path))
+
+    if args.output:
+        report['timestamp'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        report['cpu_count'] = os.cpu_count()
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"💾 Отчет сохранен: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
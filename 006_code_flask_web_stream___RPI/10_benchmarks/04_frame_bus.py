@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+# 04_frame_bus.py
+
+"""
+Бенчмарк шины кадров в разделяемой памяти (utils_rpi/frame_bus.py)
+
+Режимы:
+  1. Собственный писатель: синтетические кадры с заданной частотой и N процессов-читателей
+  2. --attach: читатели подключаются к шине работающего сервера (frame_bus.enabled)
+
+Каждый читатель измеряет полученный FPS, отставание от захвата (мс),
+пропущенные кадры и overruns (слот перезаписан во время чтения/обработки).
+--work-ms имитирует обработку кадра (детектор) для проверки медленных читателей.
+
+Запуск:
+  python3 10_benchmarks/04_frame_bus.py --readers 4 --fps 30 --duration 10
+  python3 10_benchmarks/04_frame_bus.py --readers 2 --work-ms 80 --zero-copy
+  python3 10_benchmarks/04_frame_bus.py --attach pics_keeper_bus --readers 3 --output bus_report.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from utils_rpi.frame_bus import FrameBusReader, FrameBusWriter  # noqa: E402
+
+
+def reader_process(name, duration, zero_copy, work_ms, results):
+    """Процесс-читатель: статистика за duration секунд"""
+    reader = FrameBusReader(name)
+    lags = []
+    end = time.time() + duration
+    first = None
+    while time.time() < end:
+        frame = reader.read_next(timeout=1.0, copy=not zero_copy)
+        if frame is None:
+            continue
+        first = first or time.time()
+        lags.append(reader.lag_ms)
+        frame.image[0, 0, 0]  # Обращение к данным кадра
+        if work_ms:
+            time.sleep(work_ms / 1000.0)
+        if zero_copy:
+            reader.is_valid(frame)
+
+    status = reader.get_status()
+    elapsed = time.time() - first if first else 0.0
+    lags.sort()
+    status.update({
+        'pid': os.getpid(),
+        'fps': round(status['frames_read'] / elapsed, 1) if elapsed else 0.0,
+        'lag_p50_ms': round(lags[len(lags) // 2], 2) if lags else None,
+        'lag_p95_ms': round(lags[int(len(lags) * 0.95)], 2) if lags else None,
+    })
+    reader.close()
+    results.put(status)
+
+
+def writer_loop(writer, width, height, fps, duration):
+    """Синтетические кадры с постоянной частотой"""
+    frames = [np.full((height, width, 3), i * 16, dtype=np.uint8) for i in range(16)]
+    interval = 1.0 / fps
+    next_ts = time.time()
+    end = next_ts + duration
+    while time.time() < end:
+        writer.write(frames[writer.seq % len(frames)], camera_id='bench')
+        next_ts += interval
+        delay = next_ts - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк шины кадров')
+    parser.add_argument('--attach', help='Имя шины работающего сервера (без собственного писателя)')
+    parser.add_argument('--readers', type=int, default=3, help='Процессов-читателей')
+    parser.add_argument('--duration', type=float, default=10.0, help='Длительность (с)')
+    parser.add_argument('--fps', type=float, default=30.0, help='Частота писателя')
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--slots', type=int, default=8)
+    parser.add_argument('--zero-copy', action='store_true', help='Читать без копирования')
+    parser.add_argument('--work-ms', type=float, default=0.0, help='Имитация обработки кадра (мс)')
+    parser.add_argument('--output', '-o', help='Путь для JSON отчета')
+    args = parser.parse_args()
+
+    name = args.attach or f"bench_bus_{os.getpid()}"
+    writer = None
+    if not args.attach:
+        writer = FrameBusWriter(name, args.slots, args.width, args.height)
+
+    results = multiprocessing.Queue()
+    readers = [multiprocessing.Process(target=reader_process,
+                                       args=(name, args.duration, args.zero_copy, args.work_ms, results))
+               for _ in range(args.readers)]
+    for process in readers:
+        process.start()
+
+    report = {'bus': name, 'readers': args.readers, 'zero_copy': args.zero_copy, 'work_ms': args.work_ms}
+    try:
+        if writer:
+            time.sleep(0.5)  # Читатели успевают подключиться
+            writer_loop(writer, args.width, args.height, args.fps, args.duration)
+            report['writer'] = writer.get_status()
+            report['writer'].pop('readers', None)
+        stats = [results.get(timeout=args.duration + 10) for _ in readers]
+    finally:
+        for process in readers:
+            process.join(timeout=5)
+        if writer:
+            writer.close()
+
+    report['reader_stats'] = stats
+    if writer:
+        print(f"\n🚌 Писатель: {report['writer']['frames_written']} кадров "
+              f"{args.width}x{args.height}, запись {report['writer']['avg_write_ms']} мс/кадр")
+    for s in stats:
+        print(f"📖 Читатель {s['pid']}: {s['fps']} fps, отставание p50 {s['lag_p50_ms']} мс "
+              f"p95 {s['lag_p95_ms']} мс, пропущено {s['frames_missed']}, overruns {s['overruns']}")
+
+    if args.output:
+        report['timestamp'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"💾 Отчет сохранен: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+# 05_adaptive_quality.py
+
+"""
+Бенчмарк адаптивного качества JPEG (utils_rpi/quality_controller.py)
+
+Кодирует одну и ту же последовательность кадров:
+  1. со статическим качеством (--static-quality)
+  2. с QualityController под цель --target-kbps
+  3. с QualityController и уменьшением разрешения (--resize)
+
+и сравнивает стабильность битрейта по секундам (среднее, разброс, доля секунд
+в пределах ±10% от цели) и стоимость кодирования (мс CPU на кадр).
+
+Источник кадров: запись (.mjpg / MJPEG-AVI по индексу), видеофайл, папка
+с изображениями или синтетическая сцена со сменой темных и детальных участков.
+
+Запуск:
+  python3 10_benchmarks/05_adaptive_quality.py --target-kbps 8000 --output quality_report.json
+  python3 10_benchmarks/05_adaptive_quality.py --file recordings/seg_0001.avi --target-kbps 2000
+"""
+
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+import cv2
+import numpy as np
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from utils_rpi.quality_controller import QualityController  # noqa: E402
+
+
+def synthetic_sequence(count, width, height):
+    """Смена сцен каждые 3 с (при 30 fps): темная, детальная текстура, градиент с движением"""
+    rng = np.random.default_rng(1)
+    noise = cv2.GaussianBlur(rng.integers(0, 256, (height, width, 3), dtype=np.uint8), (0, 0), 2.5)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    gradient = np.repeat(np.tile(x.astype(np.uint8)[None, :], (height, 1))[:, :, None], 3, axis=2)
+    for i in range(count):
+        scene = (i // 90) % 3
+        if scene == 0:
+            frame = np.full((height, width, 3), 20, dtype=np.uint8)
+            cv2.putText(frame, f"dark {i}", (50, height // 2), cv2.FONT_HERSHEY_SIMPLEX, 2, (60, 60, 60), 3)
+        elif scene == 1:
+            frame = np.roll(noise, i * 7, axis=1)
+        else:
+            frame = gradient.copy()
+            cv2.circle(frame, ((i * 13) % width, height // 2), height // 6, (0, 0, 255), -1)
+        yield frame
+
+
+def file_sequence(path, count):
+    """Кадры записи: MJPEG по индексу, видеофайл или папка с изображениями"""
+    if os.path.isdir(path):
+        files = sorted(p for p in glob.glob(os.path.join(path, '*')) if p.lower().endswith(('.jpg', '.jpeg', '.png')))
+        for i in range(count):
+            yield cv2.imread(files[i % len(files)])
+        return
+
+    if path.lower().endswith(('.mjpg', '.mjpeg', '.avi')):
+        from utils_rpi.mjpeg_index import MjpegReader
+        with MjpegReader(path) as reader:
+            for i in range(min(count, len(reader))):
+                yield reader.get_frame(i)
+        return
+
+    cap = cv2.VideoCapture(path)
+    for _ in range(count):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        yield frame
+    cap.release()
+
+
+def run(frames, fps, target_kbps, static_quality=None, resize=False, min_quality=30, max_quality=92):
+    """Кодирование последовательности; битрейт по секундам и время на кадр"""
+    controller = None
+    if static_quality is None:
+        controller = QualityController({'adaptive_quality': {
+            'enabled': True, 'target_kbps': target_kbps, 'min_quality': min_quality,
+            'max_quality': max_quality, 'allow_resize': resize, 'use_client_throughput': False,
+        }}, initial_quality=75)
+
+    per_second = []
+    second_bytes = 0
+    qualities = []
+    cpu_ms = []
+    frames_per_second = max(1, int(round(fps)))
+    for i, frame in enumerate(frames):
+        start = time.process_time()
+        if controller:
+            quality = controller.jpeg_quality
+            if controller.scale < 1.0:
+                h, w = frame.shape[:2]
+                frame = cv2.resize(frame, (int(w * controller.scale) // 2 * 2, int(h * controller.scale) // 2 * 2),
+                                   interpolation=cv2.INTER_AREA)
+        else:
+            quality = static_quality
+        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if controller:
+            controller.update(len(buffer), fps)
+        cpu_ms.append((time.process_time() - start) * 1000)
+
+        qualities.append(quality)
+        second_bytes += len(buffer)
+        if (i + 1) % frames_per_second == 0:
+            per_second.append(second_bytes * 8 / 1000)
+            second_bytes = 0
+
+    # Первые 2 с - выход контроллера на цель
+    steady = per_second[2:] or per_second
+    within = sum(1 for kbps in steady if abs(kbps - target_kbps) <= target_kbps * 0.1)
+    # Превышение цели - то, что важно для канала (недобор бывает на max_quality в простых сценах)
+    over = sum(1 for kbps in steady if kbps > target_kbps * 1.1)
+    mean = statistics.mean(steady)
+    stdev = statistics.pstdev(steady)
+    return {
+        'mean_kbps': round(mean, 1),
+        'stdev_kbps': round(stdev, 1),
+        'cv_percent': round(stdev / mean * 100, 1) if mean else None,
+        'min_kbps': round(min(steady), 1),
+        'max_kbps': round(max(steady), 1),
+        'within_10pct_of_target': round(within / len(steady) * 100, 1),
+        'over_target_percent': round(over / len(steady) * 100, 1),
+        'mean_quality': round(statistics.mean(qualities), 1),
+        'cpu_ms_per_frame': round(statistics.mean(cpu_ms), 3),
+        'final_scale': round(controller.scale, 3) if controller else 1.0,
+        'per_second_kbps': [round(kbps) for kbps in per_second],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк адаптивного качества JPEG')
+    parser.add_argument('--file', '-f', help='Запись (.mjpg / .avi), видеофайл или папка с изображениями')
+    parser.add_argument('--frames', type=int, default=900, help='Кадров в последовательности')
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--fps', type=float, default=30.0)
+    parser.add_argument('--target-kbps', type=float, default=8000.0)
+    parser.add_argument('--static-quality', type=int, default=85, help='Качество статического режима')
+    parser.add_argument('--output', '-o', help='Путь для JSON отчета')
+    args = parser.parse_args()
+
+    # Последовательность загружается в память один раз - все режимы кодируют одни и те же кадры
+    source = file_sequence(args.file, args.frames) if args.file else \
+        synthetic_sequence(args.frames, args.width, args.height)
+    frames = list(source)
+    if not frames:
+        print("❌ Нет кадров")
+        sys.exit(1)
+    h, w = frames[0].shape[:2]
+    print(f"🎞️ {len(frames)} кадров {w}x{h}, цель {args.target_kbps:.0f} кбит/с при {args.fps} fps")
+
+    report = {'source': args.file or 'synthetic', 'frames': len(frames), 'resolution': f"{w}x{h}",
+              'fps': args.fps, 'target_kbps': args.target_kbps, 'modes': {}}
+    modes = {
+        f'static_q{args.static_quality}': dict(static_quality=args.static_quality),
+        'adaptive': dict(),
+        'adaptive_resize': dict(resize=True),
+    }
+    for name, options in modes.items():
+        result = run(frames, args.fps, args.target_kbps, **options)
+        report['modes'][name] = result
+        print(f"📊 {name:>16}: {result['mean_kbps']:8.0f} кбит/с ± {result['stdev_kbps']:.0f} "
+              f"(CV {result['cv_percent']}%), ±10%: {result['within_10pct_of_target']}% секунд, "
+              f"выше цели: {result['over_target_percent']}%, "
+              f"качество {result['mean_quality']}, {result['cpu_ms_per_frame']} мс/кадр")
+
+    if args.output:
+        report['timestamp'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        report['cpu_count'] = os.cpu_count()
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"💾 Отчет сохранен: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
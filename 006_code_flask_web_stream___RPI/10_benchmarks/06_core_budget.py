@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+
+# 06_core_budget.py
+
+"""
+Разброс интервала кадров захвата с распределением ядер (core_budget) и без
+
+Сервер с виртуальной камерой запускается дважды - core_budget.enabled false и true
+(ядра стадий - из конфигурации). В обоих прогонах работают:
+  - N клиентов /video_feed (потоки запросов Flask);
+  - фоновая нагрузка, имитирующая детектор (процесс с --load-threads потоками
+    OpenCV); при включенном core_budget процесс нагрузки закрепляется за ядрами
+    стадии detection - как внешний трекер, настроенный по тому же бюджету.
+Для каждого прогона записываются:
+  - интервал между кадрами захвата (capture_timing из /api/stream/status):
+    mean, std, p95, p99, max;
+  - частота захвата и доставленная клиентам частота;
+  - CPU сервера.
+
+Запуск:
+  python3 10_benchmarks/06_core_budget.py --clients 2 --duration 20 --load-threads 4 --output core_budget.json
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+import yaml
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_SCRIPT = os.path.join(PROJECT_DIR, '05_flask_webcam_stream__RPI.py')
+BOUNDARY = b'--frame\r\n'
+
+
+def http_json(url, method='GET', timeout=2):
+    request = urllib.request.Request(url, method=method, data=b'' if method == 'POST' else None)
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def load_worker(cores, threads, stop_event):
+    """Нагрузка, похожая на детектор: размытие и пороги на кадре в нескольких потоках"""
+    import cv2
+    import numpy as np
+
+    if cores and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    cv2.setNumThreads(1)
+    frame = np.random.randint(0, 255, (1200, 1920), dtype=np.uint8)
+
+    def spin():
+        while not stop_event.is_set():
+            blurred = cv2.GaussianBlur(frame, (9, 9), 0)
+            cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 15, 5)
+
+    workers = [threading.Thread(target=spin, daemon=True) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    stop_event.wait()
+
+
+class FeedClient(threading.Thread):
+    """Клиент MJPEG: число полученных кадров"""
+
+    def __init__(self, port, client_id, duration):
+        super().__init__(daemon=True)
+        self.port = port
+        self.client_id = client_id
+        self.duration = duration
+        self.frames = 0
+        self.error = None
+
+    def run(self):
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=10)
+            conn.request('GET', f'/video_feed?t=core{self.client_id}_{time.time()}')
+            response = conn.getresponse()
+            deadline = time.time() + self.duration
+            tail = b''
+            while time.time() < deadline:
+                chunk = response.read1(65536) if hasattr(response, 'read1') else response.read(65536)
+                if not chunk:
+                    break
+                data = tail + chunk
+                self.frames += data.count(BOUNDARY)
+                tail = data[-len(BOUNDARY):]
+            conn.close()
+        except Exception as e:
+            self.error = str(e)
+
+
+def cpu_ticks(pid):
+    with open(f'/proc/{pid}/stat', 'r') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return int(fields[11]) + int(fields[12])
+
+
+def launch_server(args, budget_enabled, port):
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f)
+
+    config['server']['port'] = port
+    config['server']['debug'] = False
+    config['server']['max_concurrent_streams'] = max(args.clients, config['server'].get('max_concurrent_streams', 4))
+    config['server']['max_streams_per_client'] = args.clients
+    config['camera']['backend'] = 'virtual'
+    config['camera']['device'] = 'virtual_0'
+    config['camera']['auto_start'] = True
+    config.setdefault('virtual_camera', {})['fps'] = args.fps
+    config.setdefault('core_budget', {})['enabled'] = budget_enabled
+
+    tmp = tempfile.NamedTemporaryFile('w', suffix='.yaml', delete=False, dir=PROJECT_DIR)
+    yaml.safe_dump(config, tmp, allow_unicode=True)
+    tmp.close()
+
+    log = open(os.path.join(tempfile.gettempdir(), 'core_budget_server.log'), 'w')
+    process = subprocess.Popen([sys.executable, SERVER_SCRIPT, '--config', tmp.name],
+                               cwd=PROJECT_DIR, stdout=log, stderr=subprocess.STDOUT)
+    return process, tmp.name, config
+
+
+def wait_stream_ready(base, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            status = http_json(base + '/api/stream/status')
+            if status.get('stream_active') and status.get('frame_count', 0) > 0:
+                return True
+        except Exception:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def run_once(args, budget_enabled, port):
+    """Один прогон: сервер + клиенты + нагрузка"""
+    process, tmp_config, config = launch_server(args, budget_enabled, port)
+    base = f"http://127.0.0.1:{port}"
+    stop_event = multiprocessing.Event()
+    load = None
+    try:
+        if not wait_stream_ready(base, 30):
+            return {'error': 'стрим не готов'}
+
+        available = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else []
+        detection_cores = []
+        if budget_enabled:
+            stages = (config.get('core_budget', {}) or {}).get('stages', {}) or {}
+            detection_cores = [core for core in stages.get('detection', []) if core in available]
+        if args.load_threads > 0:
+            load = multiprocessing.Process(target=load_worker,
+                                           args=(detection_cores, args.load_threads, stop_event), daemon=True)
+            load.start()
+
+        time.sleep(args.warmup)
+        clients = [FeedClient(port, i, args.duration) for i in range(args.clients)]
+        ticks_start, time_start = cpu_ticks(process.pid), time.time()
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join(args.duration + 15)
+        elapsed = time.time() - time_start
+        cpu_percent = 100.0 * (cpu_ticks(process.pid) - ticks_start) / os.sysconf('SC_CLK_TCK') / elapsed
+
+        status = http_json(base + '/api/stream/status')
+        return {
+            'core_budget': budget_enabled,
+            'detection_cores': detection_cores,
+            'capture_timing': status.get('capture_timing'),
+            'delivered_fps': [round(client.frames / args.duration, 2) for client in clients],
+            'client_errors': [client.error for client in clients if client.error],
+            'server_cpu_percent': round(cpu_percent, 1),
+            'core_budget_status': status.get('core_budget'),
+        }
+    finally:
+        stop_event.set()
+        if load:
+            load.join(2)
+            if load.is_alive():
+                load.terminate()
+        process.terminate()
+        try:
+            process.wait(5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        os.unlink(tmp_config)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Разброс интервала кадров с core_budget и без')
+    parser.add_argument('--config', '-c', default=os.path.join(PROJECT_DIR, 'config_rpi.yaml'))
+    parser.add_argument('--port', type=int, default=5097)
+    parser.add_argument('--fps', type=float, default=30, help='FPS виртуальной камеры')
+    parser.add_argument('--clients', '-n', type=int, default=2)
+    parser.add_argument('--load-threads', type=int, default=4, help='Потоки фоновой нагрузки (0 - без нее)')
+    parser.add_argument('--duration', '-d', type=float, default=15.0)
+    parser.add_argument('--warmup', type=float, default=3.0)
+    parser.add_argument('--output', '-o', help='Путь для JSON отчета')
+    args = parser.parse_args()
+
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else []
+    print("=" * 60)
+    print(f"🧮 CORE BUDGET: {args.clients} клиентов, нагрузка {args.load_threads} потоков, ядра {cores}")
+    print("=" * 60)
+
+    runs = []
+    for budget_enabled in (False, True):
+        print(f"\n▶️ core_budget.enabled = {budget_enabled}")
+        result = run_once(args, budget_enabled, args.port)
+        runs.append(result)
+        timing = result.get('capture_timing') or {}
+        print(f"   захват: {timing.get('fps')} fps, интервал std {timing.get('std_ms')} мс, "
+              f"p95 {timing.get('p95_ms')} мс, p99 {timing.get('p99_ms')} мс, max {timing.get('max_ms')} мс")
+        print(f"   клиенты: {result.get('delivered_fps')} fps, CPU сервера {result.get('server_cpu_percent')}%")
+
+    if len(cores) < 4:
+        print(f"\n⚠️ Доступно ядер: {len(cores)} - стадиям не хватает своих ядер, разница будет мала")
+
+    if args.output:
+        report = {
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'cores': cores,
+            'clients': args.clients,
+            'load_threads': args.load_threads,
+            'duration_s': args.duration,
+            'runs': runs,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"💾 Отчет сохранен: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
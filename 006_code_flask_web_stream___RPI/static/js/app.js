@@ -749,6 +749,12 @@ class StreamController {
     }
     
     refreshVideo() {
+        // Поток читает StreamMeter - переподключаем его
+        if (streamMeter && streamMeter.active) {
+            streamMeter.stop();
+            streamMeter.start();
+            return;
+        }
         if (this.videoElement) {
             const src = this.videoElement.src;
             this.videoElement.src = '';
@@ -803,8 +809,491 @@ class StreamController {
     }
 }
 
+// ----------------- Измерение потока на стороне зрителя -----------------
+// Читает /video_feed через fetch, разбирает заголовки частей multipart
+// (X-Frame-Seq, X-Capture-Monotonic, X-Send-Monotonic, X-Send-Timestamp, X-Camera-Id)
+// и показывает кадры в том же <img>. Считает FPS доставки, пропуски кадров
+// и задержку от захвата до показа; отчет отправляется на /api/stream/viewer_stats.
+class StreamMeter {
+    constructor(imgElement, statsElement, url = '/video_feed') {
+        this.img = imgElement;
+        this.statsElement = statsElement;
+        this.url = url;
+        this.viewerId = 'v' + Math.random().toString(36).slice(2, 10);
+        
+        this.active = false;
+        this.abort = null;
+        this.objectUrl = null;
+        this.clockOffsetMs = 0;   // Время сервера минус время клиента
+        this.clockRttMs = null;
+        
+        this.resetWindow();
+        this.totalFrames = 0;
+        this.totalGaps = 0;
+        this.lastSeq = null;
+        this.lastReport = null;
+        this.reportTimer = null;
+        this.showStats = true;
+        // Вызываются после показа кадра: { seq, captureMono } (OverlayLayer)
+        this.frameListeners = [];
+    }
+    
+    resetWindow() {
+        this.windowStart = performance.now();
+        this.windowFrames = 0;
+        this.windowGaps = 0;
+        this.windowMaxIntervalMs = 0;
+        this.latencies = [];
+        this.lastFrameTime = null;
+    }
+    
+    nowMs() {
+        return performance.timeOrigin + performance.now();
+    }
+    
+    async syncClock(samples = 5) {
+        // NTP-подобная оценка: берем замер с минимальным RTT
+        let best = null;
+        for (let i = 0; i < samples; i++) {
+            const t0 = this.nowMs();
+            const response = await fetch('/api/stream/clock', { cache: 'no-store' });
+            const data = await response.json();
+            const t1 = this.nowMs();
+            const rtt = t1 - t0;
+            if (!best || rtt < best.rtt) {
+                best = { rtt, offset: data.time * 1000 - (t0 + t1) / 2 };
+            }
+        }
+        this.clockOffsetMs = best.offset;
+        this.clockRttMs = best.rtt;
+    }
+    
+    async start() {
+        if (this.active) return;
+        this.active = true;
+        
+        // Закрываем обычный поток <img> (лимит потоков на клиента)
+        this.savedSrc = this.img.getAttribute('src');
+        this.savedOnload = this.img.onload;
+        this.img.onload = null;
+        this.img.removeAttribute('src');
+        
+        try {
+            await this.syncClock();
+        } catch (error) {
+            console.warn('⚠️ Синхронизация часов не удалась:', error);
+        }
+        await new Promise(resolve => setTimeout(resolve, 300));
+        
+        this.resetWindow();
+        this.reportTimer = setInterval(() => this.sendReport(), 5000);
+        this.readStream().catch(error => {
+            if (this.active) console.error('❌ Ошибка чтения потока:', error);
+        });
+        console.log('📈 Измерение потока запущено');
+    }
+    
+    stop() {
+        if (!this.active) return;
+        this.active = false;
+        if (this.abort) this.abort.abort();
+        if (this.reportTimer) clearInterval(this.reportTimer);
+        if (this.objectUrl) URL.revokeObjectURL(this.objectUrl);
+        this.objectUrl = null;
+        
+        this.img.onload = this.savedOnload;
+        this.img.src = (this.savedSrc || this.url).split('?')[0] + '?t=' + Date.now();
+        if (this.statsElement) this.statsElement.textContent = '';
+        console.log('📈 Измерение потока остановлено');
+    }
+    
+    async readStream() {
+        this.abort = new AbortController();
+        const response = await fetch(this.url + '?t=' + Date.now(), { signal: this.abort.signal });
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder('ascii');
+        let buffer = new Uint8Array(0);
+        
+        while (this.active) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            
+            const merged = new Uint8Array(buffer.length + value.length);
+            merged.set(buffer);
+            merged.set(value, buffer.length);
+            buffer = merged;
+            
+            // Разбор частей: заголовки до \r\n\r\n, затем Content-Length байт JPEG
+            while (true) {
+                const headerEnd = this.findHeaderEnd(buffer);
+                if (headerEnd < 0) break;
+                const headers = this.parseHeaders(decoder.decode(buffer.subarray(0, headerEnd)));
+                const length = parseInt(headers['content-length'] || '0', 10);
+                if (!length) {
+                    buffer = buffer.subarray(headerEnd + 4);
+                    continue;
+                }
+                if (buffer.length < headerEnd + 4 + length) break;
+                
+                const jpeg = buffer.slice(headerEnd + 4, headerEnd + 4 + length);
+                buffer = buffer.subarray(headerEnd + 4 + length);
+                this.onFrame(headers, jpeg);
+            }
+        }
+    }
+    
+    findHeaderEnd(buffer) {
+        for (let i = 0; i + 3 < buffer.length; i++) {
+            if (buffer[i] === 13 && buffer[i + 1] === 10 && buffer[i + 2] === 13 && buffer[i + 3] === 10) {
+                return i;
+            }
+        }
+        return -1;
+    }
+    
+    parseHeaders(text) {
+        const headers = {};
+        text.split('\r\n').forEach(line => {
+            const idx = line.indexOf(':');
+            if (idx > 0) headers[line.slice(0, idx).trim().toLowerCase()] = line.slice(idx + 1).trim();
+        });
+        return headers;
+    }
+    
+    onFrame(headers, jpeg) {
+        const seq = parseInt(headers['x-frame-seq'], 10);
+        if (!isNaN(seq)) {
+            if (this.lastSeq !== null && seq > this.lastSeq + 1) {
+                this.windowGaps += seq - this.lastSeq - 1;
+                this.totalGaps += seq - this.lastSeq - 1;
+            }
+            this.lastSeq = seq;
+        }
+        
+        // Время захвата в часах сервера: время отправки минус возраст кадра на сервере
+        let captureWallMs = null;
+        if (headers['x-send-timestamp'] && headers['x-capture-monotonic']) {
+            const ageMs = (parseFloat(headers['x-send-monotonic']) - parseFloat(headers['x-capture-monotonic'])) * 1000;
+            captureWallMs = parseFloat(headers['x-send-timestamp']) * 1000 - ageMs;
+        }
+        this.cameraId = headers['x-camera-id'] || this.cameraId;
+        const shown = {
+            seq: isNaN(seq) ? null : seq,
+            captureMono: headers['x-capture-monotonic'] ? parseFloat(headers['x-capture-monotonic']) : null,
+        };
+        
+        const previousUrl = this.objectUrl;
+        this.objectUrl = URL.createObjectURL(new Blob([jpeg], { type: 'image/jpeg' }));
+        this.img.src = this.objectUrl;
+        this.img.decode().then(() => {
+            requestAnimationFrame(() => {
+                // Кадр показан: задержка захват -> показ
+                if (captureWallMs !== null) {
+                    this.latencies.push(this.nowMs() + this.clockOffsetMs - captureWallMs);
+                }
+                this.frameListeners.forEach(listener => listener(shown));
+            });
+        }).catch(() => {}).finally(() => {
+            if (previousUrl) URL.revokeObjectURL(previousUrl);
+        });
+        
+        const now = performance.now();
+        if (this.lastFrameTime !== null) {
+            this.windowMaxIntervalMs = Math.max(this.windowMaxIntervalMs, now - this.lastFrameTime);
+        }
+        this.lastFrameTime = now;
+        this.windowFrames++;
+        this.totalFrames++;
+        
+        if (now - this.windowStart >= 2000) {
+            this.closeWindow(now);
+        }
+    }
+    
+    percentile(sorted, p) {
+        if (!sorted.length) return null;
+        return Math.round(sorted[Math.min(sorted.length - 1, Math.floor(sorted.length * p))]);
+    }
+    
+    closeWindow(now) {
+        const seconds = (now - this.windowStart) / 1000;
+        const latencies = this.latencies.slice().sort((a, b) => a - b);
+        this.lastReport = {
+            viewer_id: this.viewerId,
+            camera_id: this.cameraId || null,
+            fps: Math.round(this.windowFrames / seconds * 10) / 10,
+            gaps: this.windowGaps,
+            gaps_total: this.totalGaps,
+            frames_total: this.totalFrames,
+            max_interval_ms: Math.round(this.windowMaxIntervalMs),
+            latency_p50_ms: this.percentile(latencies, 0.5),
+            latency_p95_ms: this.percentile(latencies, 0.95),
+            latency_max_ms: latencies.length ? Math.round(latencies[latencies.length - 1]) : null,
+            clock_rtt_ms: this.clockRttMs !== null ? Math.round(this.clockRttMs) : null,
+            user_agent: navigator.userAgent.slice(0, 120),
+        };
+        if (this.statsElement && this.showStats) {
+            const r = this.lastReport;
+            this.statsElement.textContent =
+                `FPS: ${r.fps} | пропуски: ${r.gaps} | задержка: ${r.latency_p50_ms ?? '--'} мс (p95 ${r.latency_p95_ms ?? '--'})`;
+        }
+        this.resetWindow();
+    }
+    
+    async sendReport() {
+        if (!this.lastReport) return;
+        try {
+            await fetch('/api/stream/viewer_stats', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(this.lastReport),
+            });
+        } catch (error) {
+            console.warn('⚠️ Отчет зрителя не отправлен:', error);
+        }
+    }
+}
+
+/**
+ * Разметка AprilTag, нарисованная в браузере поверх чистого /video_feed.
+ * Фигуры (углы, оси, грани пирамиды в пикселях кадра камеры) приходят по SSE
+ * /api/overlay/stream с номером кадра; кадры и их номера читает StreamMeter.
+ * Для показанного кадра рисуются последние фигуры с seq <= номера кадра:
+ * детекция отстает на несколько кадров, фигуры "из будущего" не рисуются.
+ */
+class OverlayLayer {
+    constructor(imgElement, canvasElement, statsElement) {
+        this.img = imgElement;
+        this.canvas = canvasElement;
+        this.ctx = canvasElement.getContext('2d');
+        this.statsElement = statsElement;
+        this.layers = { tags: false, axes: false, pyramid: false };
+        
+        this.source = null;
+        this.metas = [];          // Последние фигуры по возрастанию seq
+        this.staleS = 2.0;
+        this.ownsMeter = false;   // StreamMeter запущен разметкой (остановить при выключении)
+        this.listener = shown => this.onFrame(shown);
+        this.lagFrames = [];
+    }
+    
+    get enabled() {
+        return this.layers.tags || this.layers.axes || this.layers.pyramid;
+    }
+    
+    setLayers(layers) {
+        const wasEnabled = this.enabled;
+        this.layers = layers;
+        if (this.enabled && !wasEnabled) this.start();
+        if (!this.enabled && wasEnabled) this.stop();
+    }
+    
+    start() {
+        const meter = ensureStreamMeter();
+        meter.frameListeners.push(this.listener);
+        if (!meter.active) {
+            this.ownsMeter = true;
+            meter.showStats = false;
+            meter.start();
+        }
+        
+        this.source = new EventSource('/api/overlay/stream');
+        this.source.addEventListener('config', event => {
+            const config = JSON.parse(event.data);
+            this.staleS = config.stale_s;
+        });
+        this.source.onmessage = event => {
+            this.metas.push(JSON.parse(event.data));
+            if (this.metas.length > 30) this.metas.shift();
+        };
+        this.source.onerror = () => {
+            if (this.statsElement) this.statsElement.textContent = 'Разметка: нет данных';
+        };
+        this.canvas.style.display = 'block';
+        console.log('🏷️ Разметка в браузере включена');
+    }
+    
+    stop() {
+        if (this.source) this.source.close();
+        this.source = null;
+        this.metas = [];
+        
+        if (streamMeter) {
+            streamMeter.frameListeners = streamMeter.frameListeners.filter(l => l !== this.listener);
+            if (this.ownsMeter) {
+                streamMeter.stop();
+                streamMeter.showStats = true;
+            }
+        }
+        this.ownsMeter = false;
+        this.canvas.style.display = 'none';
+        if (this.statsElement) this.statsElement.textContent = '';
+        console.log('🏷️ Разметка в браузере выключена');
+    }
+    
+    selectMeta(shown) {
+        // Последние фигуры по кадру не новее показанного
+        for (let i = this.metas.length - 1; i >= 0; i--) {
+            const meta = this.metas[i];
+            if (shown.seq === null || meta.seq <= shown.seq) {
+                if (shown.captureMono !== null && shown.captureMono - meta.cm > this.staleS) return null;
+                return meta;
+            }
+        }
+        return null;
+    }
+    
+    placeCanvas() {
+        // Канвас - ровно поверх изображения (object-fit: contain, центрирование во flex)
+        const width = this.img.offsetWidth;
+        const height = this.img.offsetHeight;
+        this.canvas.style.left = this.img.offsetLeft + 'px';
+        this.canvas.style.top = this.img.offsetTop + 'px';
+        this.canvas.style.width = width + 'px';
+        this.canvas.style.height = height + 'px';
+        const ratio = window.devicePixelRatio || 1;
+        if (this.canvas.width !== Math.round(width * ratio) || this.canvas.height !== Math.round(height * ratio)) {
+            this.canvas.width = Math.round(width * ratio);
+            this.canvas.height = Math.round(height * ratio);
+        }
+        return { width, height, ratio };
+    }
+    
+    onFrame(shown) {
+        if (!this.enabled) return;
+        const { width, height, ratio } = this.placeCanvas();
+        const ctx = this.ctx;
+        ctx.setTransform(1, 0, 0, 1, 0, 0);
+        ctx.clearRect(0, 0, this.canvas.width, this.canvas.height);
+        
+        const meta = this.selectMeta(shown);
+        if (!meta || !width || !height) return;
+        // Пиксели кадра камеры -> пиксели канваса
+        ctx.setTransform(ratio * width / meta.w, 0, 0, ratio * height / meta.h, 0, 0);
+        const px = meta.w / width;   // 1 px экрана в пикселях кадра
+        
+        meta.tags.forEach(tag => {
+            if (this.layers.pyramid && tag.f) this.drawPyramid(tag, px);
+            if (this.layers.tags) this.drawTag(tag, px);
+            if (this.layers.axes && tag.a) this.drawAxes(tag.a, px);
+        });
+        
+        if (shown.seq !== null) {
+            this.lagFrames.push(shown.seq - meta.seq);
+            if (this.lagFrames.length >= 30) {
+                const sorted = this.lagFrames.sort((a, b) => a - b);
+                if (this.statsElement) {
+                    this.statsElement.textContent = `Разметка: -${sorted[Math.floor(sorted.length / 2)]} кадр.`;
+                }
+                this.lagFrames = [];
+            }
+        }
+    }
+    
+    polygon(points) {
+        const ctx = this.ctx;
+        ctx.beginPath();
+        ctx.moveTo(points[0], points[1]);
+        for (let i = 2; i < points.length; i += 2) ctx.lineTo(points[i], points[i + 1]);
+        ctx.closePath();
+    }
+    
+    drawTag(tag, px) {
+        // Цвета трекера: целевая метка - желтая, остальные - зеленые
+        const ctx = this.ctx;
+        const color = tag.t ? 'rgb(255, 255, 0)' : 'rgb(0, 255, 0)';
+        ctx.lineWidth = 2 * px;
+        ctx.strokeStyle = color;
+        this.polygon(tag.c);
+        ctx.stroke();
+        
+        ctx.fillStyle = color;
+        ctx.font = `${Math.round(14 * px)}px sans-serif`;
+        ctx.fillText(`ID ${tag.id}`, tag.c[0], tag.c[1] - 6 * px);
+    }
+    
+    drawAxes(a, px) {
+        // X - красная, Y - зеленая, Z - синяя
+        const ctx = this.ctx;
+        ctx.lineWidth = 3 * px;
+        [[2, 'rgb(255, 0, 0)'], [4, 'rgb(0, 255, 0)'], [6, 'rgb(0, 0, 255)']].forEach(([i, color]) => {
+            ctx.strokeStyle = color;
+            ctx.beginPath();
+            ctx.moveTo(a[0], a[1]);
+            ctx.lineTo(a[i], a[i + 1]);
+            ctx.stroke();
+        });
+    }
+    
+    drawPyramid(tag, px) {
+        const ctx = this.ctx;
+        ctx.lineWidth = 2 * px;
+        (tag.v || []).forEach(face => {
+            const points = tag.f[face];
+            if (!points) return;
+            const rgb = OverlayLayer.FACE_COLORS[face] || '255, 255, 255';
+            this.polygon(points);
+            ctx.fillStyle = `rgba(${rgb}, 0.25)`;
+            ctx.fill();
+            ctx.strokeStyle = `rgb(${rgb})`;
+            ctx.stroke();
+        });
+    }
+}
+
+// Цвета граней пирамиды трекера (RGB)
+OverlayLayer.FACE_COLORS = {
+    FRONT: '255, 255, 0',
+    BACK: '255, 0, 255',
+    LEFT: '0, 255, 255',
+    RIGHT: '0, 128, 255',
+};
+
 // Глобальный экземпляр контроллера
 let streamController = null;
+let streamMeter = null;
+let overlayLayer = null;
+
+function ensureStreamMeter() {
+    if (!streamMeter) {
+        streamMeter = new StreamMeter(document.getElementById('video-stream'), document.getElementById('stream-stats'));
+    }
+    return streamMeter;
+}
+
+// Включение/выключение измерения потока (кнопка или ?stats=1 в адресе страницы)
+function toggleStreamStats() {
+    const img = document.getElementById('video-stream');
+    if (!img) return;
+    const meter = ensureStreamMeter();
+    if (overlayLayer && overlayLayer.enabled && meter.active) {
+        // Поток нужен разметке - переключаем только показ статистики
+        meter.showStats = !meter.showStats;
+        overlayLayer.ownsMeter = !meter.showStats;
+        if (!meter.showStats && meter.statsElement) meter.statsElement.textContent = '';
+        return;
+    }
+    if (meter.active) {
+        meter.stop();
+    } else {
+        meter.start();
+    }
+}
+
+// Слои разметки из флажков под видео
+function toggleOverlayLayer() {
+    const img = document.getElementById('video-stream');
+    const canvas = document.getElementById('overlay-canvas');
+    if (!img || !canvas) return;
+    if (!overlayLayer) {
+        overlayLayer = new OverlayLayer(img, canvas, document.getElementById('overlay-stats'));
+    }
+    overlayLayer.setLayers({
+        tags: document.getElementById('overlay-tags').checked,
+        axes: document.getElementById('overlay-axes').checked,
+        pyramid: document.getElementById('overlay-pyramid').checked,
+    });
+}
 
 // Инициализация после полной загрузки страницы
 document.addEventListener('DOMContentLoaded', () => {
@@ -814,6 +1303,9 @@ document.addEventListener('DOMContentLoaded', () => {
             streamController = new StreamController();
             console.log('✅ StreamController инициализирован');
         }
+        if (new URLSearchParams(window.location.search).get('stats') === '1') {
+            toggleStreamStats();
+        }
     }, 500);
 });
 
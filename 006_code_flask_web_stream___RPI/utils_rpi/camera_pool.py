@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+
+# camera_pool.py
+
+"""
+Пул "тёплых" камер для мгновенного переключения.
+
+Держит до K недавно использованных камер открытыми и в режиме
+холостого захвата с минимальной частотой. Повторный выбор камеры из пула
+сводится к подмене указателя в CameraStreamer без открытия устройства
+и повторного старта ISP.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from utils_rpi.lazy_import import lazy_import
+
+# Тяжелые модули импортируются при первом обращении: импорт сервера их не загружает
+cv2 = lazy_import('cv2')
+
+
+class PooledCamera:
+    """Открытая камера, которая может находиться в пуле"""
+
+    def __init__(self, device_path, camera_type, handle, width=0, height=0, buffers=4):
+        """
+        Args:
+            device_path: Путь устройства ('/dev/video2', 'csi_0', ...)
+            camera_type: 'csi' или 'v4l2'
+            handle: Picamera2 или cv2.VideoCapture
+            width, height: Разрешение захвата (для оценки памяти)
+            buffers: Количество буферов драйвера/ISP (для оценки памяти)
+        """
+        self.device_path = str(device_path)
+        self.camera_type = camera_type
+        self.handle = handle
+        self.width = int(width or 0)
+        self.height = int(height or 0)
+        self.buffers = buffers
+
+        self.opened_at = time.time()
+        self.last_used = time.time()
+        self.switch_count = 0
+
+        # Холостой захват
+        self.idle_active = False
+        self.idle_thread = None
+        self.idle_frames = 0
+        self.idle_fps = 1.0
+        self.idle_cpu_time = 0.0
+        self.idle_started_at = None
+
+        # Последний кадр для мозаики: (frame, capture_mono), пока retain_fps > 0
+        self.retain_fps = 0.0
+        self.latest_frame = None
+
+    @property
+    def memory_bytes(self):
+        """Оценка памяти, удерживаемой открытой камерой (буферы BGR)"""
+        return self.width * self.height * 3 * self.buffers
+
+    @property
+    def idle_cpu_percent(self):
+        """Загрузка CPU потоком холостого захвата, %"""
+        if not self.idle_active or not self.idle_started_at:
+            return 0.0
+        elapsed = time.time() - self.idle_started_at
+        if elapsed <= 0:
+            return 0.0
+        return 100.0 * self.idle_cpu_time / elapsed
+
+    def start_idle(self, idle_fps):
+        """Перевод камеры в режим холостого захвата"""
+        if self.idle_active:
+            return
+
+        self.idle_active = True
+        self.idle_fps = idle_fps
+        self.idle_frames = 0
+        self.idle_cpu_time = 0.0
+        self.idle_started_at = time.time()
+
+        if self.camera_type == 'csi':
+            # ISP продолжает работать сам, снижаем только частоту кадров сенсора
+            try:
+                frame_duration = int(1_000_000 / max(idle_fps, 1))
+                self.handle.set_controls({"FrameDurationLimits": (frame_duration, frame_duration)})
+            except Exception as e:
+                print(f"⚠️ Пул: не удалось снизить FPS {self.device_path}: {e}")
+
+        self.idle_thread = threading.Thread(
+            target=self._idle_loop, daemon=True
+        )
+        self.idle_thread.start()
+
+    def set_retain(self, fps, idle_fps):
+        """
+        Хранить последний кадр (fps > 0) или вернуться к grab() без декодирования
+
+        Холостой цикл на это время работает с частотой max(fps, idle_fps).
+        """
+        self.retain_fps = float(fps or 0)
+        self.idle_fps = idle_fps
+        if not self.retain_fps:
+            self.latest_frame = None
+        if self.camera_type == 'csi' and self.idle_active:
+            try:
+                frame_duration = int(1_000_000 / max(self.retain_fps, idle_fps, 1))
+                self.handle.set_controls({"FrameDurationLimits": (frame_duration, frame_duration)})
+            except Exception as e:
+                print(f"⚠️ Пул: не удалось изменить FPS {self.device_path}: {e}")
+
+    def _read_frame(self):
+        """Полный кадр BGR из холостой камеры"""
+        if self.camera_type == 'csi':
+            array = self.handle.capture_array()
+            if array is None or array.ndim != 3:
+                return None
+            if array.shape[2] == 3:
+                return cv2.cvtColor(array, cv2.COLOR_RGB2BGR)
+            return array[:, :, :3].copy()
+        ret, frame = self.handle.read()
+        return frame if ret else None
+
+    def stop_idle(self, fps=None):
+        """Выход из холостого режима перед активным использованием"""
+        if not self.idle_active:
+            return
+
+        self.idle_active = False
+        if self.idle_thread and self.idle_thread.is_alive():
+            self.idle_thread.join(timeout=1.0)
+        self.idle_thread = None
+        self.retain_fps = 0.0
+        self.latest_frame = None
+
+        if self.camera_type == 'csi' and fps:
+            # Возвращаем рабочую частоту кадров сенсора
+            try:
+                frame_duration = int(1_000_000 / fps)
+                self.handle.set_controls({"FrameDurationLimits": (frame_duration, frame_duration)})
+            except Exception as e:
+                print(f"⚠️ Пул: не удалось восстановить FPS {self.device_path}: {e}")
+
+    def _idle_loop(self):
+        """Холостой захват: не даём драйверу накапливать устаревшие буферы"""
+        while self.idle_active:
+            interval = 1.0 / max(self.retain_fps, self.idle_fps, 0.1)
+            cpu_start = time.thread_time()
+            try:
+                if self.retain_fps:
+                    # Мозаика: кадр декодируется и хранится до следующего
+                    frame = self._read_frame()
+                    if frame is not None:
+                        self.latest_frame = (frame, time.monotonic())
+                elif self.camera_type == 'csi':
+                    # Метаданные дешевле полного кадра и держат пайплайн живым
+                    self.handle.capture_metadata()
+                else:
+                    # grab() без retrieve() - без декодирования кадра
+                    self.handle.grab()
+                self.idle_frames += 1
+            except Exception:
+                pass
+            self.idle_cpu_time += time.thread_time() - cpu_start
+
+            # Спим короткими интервалами, чтобы быстро выйти по stop_idle()
+            deadline = time.time() + interval
+            while self.idle_active and time.time() < deadline:
+                time.sleep(min(0.05, interval))
+
+    def close(self):
+        """Полное закрытие устройства"""
+        self.stop_idle()
+        try:
+            if self.camera_type == 'csi':
+                self.handle.stop()
+                self.handle.close()
+            else:
+                self.handle.release()
+        except Exception as e:
+            print(f"⚠️ Пул: ошибка закрытия {self.device_path}: {e}")
+
+    def get_status(self):
+        """Состояние камеры для API"""
+        return {
+            'device_path': self.device_path,
+            'camera_type': self.camera_type,
+            'resolution': f"{self.width}x{self.height}",
+            'idle': self.idle_active,
+            'idle_frames': self.idle_frames,
+            'retain_fps': self.retain_fps,
+            'idle_cpu_percent': round(self.idle_cpu_percent, 2),
+            'memory_mb': round(self.memory_bytes / (1024 * 1024), 1),
+            'switch_count': self.switch_count,
+            'idle_seconds': round(time.time() - self.last_used, 1),
+        }
+
+
+class CameraPool:
+    """LRU-пул открытых камер с бюджетом памяти и CPU"""
+
+    def __init__(self, config, logger):
+        pool_config = config.get('camera_pool', {}) or {}
+
+        self.logger = logger
+        self.enabled = pool_config.get('enabled', False)
+        self.max_size = int(pool_config.get('max_size', 2))
+        self.idle_fps = float(pool_config.get('idle_fps', 1))
+        self.memory_budget_mb = float(pool_config.get('memory_budget_mb', 256))
+        self.cpu_budget_percent = float(pool_config.get('cpu_budget_percent', 15))
+
+        # Частота хранения кадров для мозаики (0 - только grab())
+        self.retain_fps = 0.0
+
+        # device_path -> PooledCamera, порядок = порядок использования (LRU в начале)
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+        # Статистика
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.last_switch_ms = None
+
+    def contains(self, device_path):
+        """Есть ли камера в пуле"""
+        with self.lock:
+            return str(device_path) in self.sessions
+
+    def acquire(self, device_path, fps=None):
+        """
+        Забрать камеру из пула для активного использования
+
+        Args:
+            device_path: Путь устройства
+            fps: Рабочий FPS, который нужно вернуть камере после холостого режима
+
+        Returns:
+            PooledCamera или None, если камеры в пуле нет
+        """
+        if not self.enabled:
+            return None
+
+        with self.lock:
+            session = self.sessions.pop(str(device_path), None)
+            if session is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        session.stop_idle(fps)
+        session.last_used = time.time()
+        session.switch_count += 1
+        return session
+
+    def release(self, session):
+        """
+        Вернуть ставшую неактивной камеру в пул
+
+        Если пул выключен или камера не помещается в бюджет - камера закрывается.
+        """
+        if session is None:
+            return
+
+        if not self.enabled or self.max_size <= 0:
+            session.close()
+            return
+
+        session.last_used = time.time()
+        with self.lock:
+            old = self.sessions.pop(session.device_path, None)
+            if old is not None and old is not session:
+                # Дубликат того же устройства - держим только один дескриптор
+                self._close_async(old)
+            self.sessions[session.device_path] = session
+
+        session.start_idle(self.idle_fps)
+        if self.retain_fps:
+            session.set_retain(self.retain_fps, self.idle_fps)
+        self.enforce_budget()
+
+    def set_frame_retention(self, fps):
+        """Камерам пула хранить последний декодированный кадр (fps > 0) или перестать"""
+        with self.lock:
+            self.retain_fps = float(fps or 0)
+            sessions = list(self.sessions.values())
+        for session in sessions:
+            session.set_retain(self.retain_fps, self.idle_fps)
+
+    def set_idle_fps(self, fps):
+        """Частота холостого захвата камер пула на лету"""
+        with self.lock:
+            self.idle_fps = float(fps)
+            sessions = list(self.sessions.values())
+        for session in sessions:
+            session.set_retain(self.retain_fps, self.idle_fps)
+
+    def get_latest_frames(self):
+        """
+        Последние кадры камер пула
+
+        Returns:
+            Список (device_path, frame или None, capture_mono)
+        """
+        with self.lock:
+            sessions = list(self.sessions.values())
+        frames = []
+        for session in sessions:
+            latest = session.latest_frame
+            if latest is None:
+                frames.append((session.device_path, None, 0.0))
+            else:
+                frames.append((session.device_path, latest[0], latest[1]))
+        return frames
+
+    def enforce_budget(self):
+        """Вытеснение LRU-камер при превышении размера, памяти или CPU"""
+        to_close = []
+        with self.lock:
+            while self.sessions and self._over_budget_locked():
+                _, victim = self.sessions.popitem(last=False)
+                to_close.append(victim)
+                self.evictions += 1
+
+        for victim in to_close:
+            print(f"♻️ Пул: вытеснена камера {victim.device_path}")
+            self.logger.log_info(f"Пул камер: вытеснена {victim.device_path}")
+            victim.close()
+
+    def _over_budget_locked(self):
+        """Проверка бюджетов (вызывается под self.lock)"""
+        if len(self.sessions) > self.max_size:
+            return True
+
+        memory_mb = sum(s.memory_bytes for s in self.sessions.values()) / (1024 * 1024)
+        if memory_mb > self.memory_budget_mb:
+            return True
+
+        cpu_percent = sum(s.idle_cpu_percent for s in self.sessions.values())
+        if cpu_percent > self.cpu_budget_percent:
+            return True
+
+        return False
+
+    def _close_async(self, session):
+        """Закрытие камеры в фоне, чтобы не задерживать переключение"""
+        threading.Thread(target=session.close, daemon=True).start()
+
+    def close_all(self):
+        """Закрыть все камеры пула"""
+        with self.lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+
+        for session in sessions:
+            session.close()
+
+    def get_status(self):
+        """Состояние пула для /api/stream/status"""
+        with self.lock:
+            sessions = [s.get_status() for s in self.sessions.values()]
+
+        return {
+            'enabled': self.enabled,
+            'max_size': self.max_size,
+            'size': len(sessions),
+            'idle_fps': self.idle_fps,
+            'retain_fps': self.retain_fps,
+            'memory_mb': round(sum(s['memory_mb'] for s in sessions), 1),
+            'memory_budget_mb': self.memory_budget_mb,
+            'idle_cpu_percent': round(sum(s['idle_cpu_percent'] for s in sessions), 2),
+            'cpu_budget_percent': self.cpu_budget_percent,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'last_switch_ms': self.last_switch_ms,
+            'cameras': sessions,
+        }
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+
+# capture_group.py
+
+"""
+Группы синхронного захвата нескольких камер (стерео, многоракурсная оценка позы).
+
+Каждая камера группы читается своим потоком, кадр помечается временем
+сенсора (Picamera2: SensorTimestamp), драйвера (V4L2: CAP_PROP_POS_MSEC -
+время буфера) или, если их нет, временем получения. FrameMatcher собирает
+из кадров разных камер наборы FrameSet, в которых разброс времени не больше
+tolerance_ms. Кадр, для которого пары уже не будет (у всех остальных камер
+есть кадры новее на tolerance), считается несопоставленным.
+
+Метки приводятся к time.monotonic(): SensorTimestamp и время буферов V4L2
+идут в CLOCK_MONOTONIC, виртуальная камера отдает time.time().
+"""
+
+import threading
+import time
+from collections import deque
+
+from utils_rpi.lazy_import import lazy_import
+from utils_rpi.usb_capture import device_timestamp_to_monotonic
+
+# Тяжелые модули импортируются при первом обращении: импорт сервера их не загружает
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+# Границы гистограммы ошибки синхронизации (мс)
+SYNC_ERROR_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50)
+
+
+class FrameSet:
+    """Набор кадров разных камер, снятых в пределах допуска"""
+
+    __slots__ = ('seq', 'frames', 'timestamps', 'sync_error_ms', 'created_mono')
+
+    def __init__(self, seq, frames, timestamps, sync_error_ms):
+        """
+        Args:
+            seq: Номер набора в группе
+            frames: device_path -> BGR кадр
+            timestamps: device_path -> время захвата (time.monotonic)
+            sync_error_ms: Разброс времени кадров набора
+        """
+        self.seq = seq
+        self.frames = frames
+        self.timestamps = timestamps
+        self.sync_error_ms = sync_error_ms
+        self.created_mono = time.monotonic()
+
+
+class FrameMatcher:
+    """Сопоставление кадров нескольких камер по времени захвата"""
+
+    def __init__(self, devices, tolerance_ms=5.0, queue_len=8):
+        self.devices = list(devices)
+        self.tolerance_s = tolerance_ms / 1000.0
+        self.lock = threading.Lock()
+        self.queues = {device: deque() for device in self.devices}
+        self.queue_len = queue_len
+
+        # Статистика
+        self.frames_total = {device: 0 for device in self.devices}
+        self.unmatched = {device: 0 for device in self.devices}
+        self.matched_sets = 0
+        self.sync_errors_ms = deque(maxlen=1000)
+        self.histogram = [0] * (len(SYNC_ERROR_BUCKETS_MS) + 1)
+
+    def push(self, device, frame, timestamp):
+        """
+        Новый кадр камеры
+
+        Returns:
+            Список (frames, timestamps, sync_error_ms) собранных наборов (обычно 0 или 1)
+        """
+        with self.lock:
+            queue = self.queues[device]
+            if len(queue) >= self.queue_len:
+                # Другая камера группы молчит - старые кадры уже не сопоставить
+                queue.popleft()
+                self.unmatched[device] += 1
+            queue.append((timestamp, frame))
+            self.frames_total[device] += 1
+            return self._match_locked()
+
+    def _match_locked(self):
+        sets = []
+        while all(self.queues.values()):
+            heads = [queue[0][0] for queue in self.queues.values()]
+            newest, oldest = max(heads), min(heads)
+            if newest - oldest <= self.tolerance_s:
+                frames, timestamps = {}, {}
+                for device, queue in self.queues.items():
+                    timestamps[device], frames[device] = queue.popleft()
+                error_ms = (newest - oldest) * 1000
+                self._record(error_ms)
+                sets.append((frames, timestamps, error_ms))
+                continue
+            # Кадры старше newest - tolerance пары не получат: у остальных камер кадры новее
+            for device, queue in self.queues.items():
+                if queue[0][0] < newest - self.tolerance_s:
+                    queue.popleft()
+                    self.unmatched[device] += 1
+        return sets
+
+    def _record(self, error_ms):
+        self.matched_sets += 1
+        self.sync_errors_ms.append(error_ms)
+        for i, edge in enumerate(SYNC_ERROR_BUCKETS_MS):
+            if error_ms <= edge:
+                self.histogram[i] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+    def get_status(self):
+        with self.lock:
+            errors = np.array(self.sync_errors_ms) if self.sync_errors_ms else None
+            frames_total = sum(self.frames_total.values())
+            unmatched_total = sum(self.unmatched.values())
+            return {
+                'tolerance_ms': self.tolerance_s * 1000,
+                'matched_sets': self.matched_sets,
+                'frames_total': dict(self.frames_total),
+                'unmatched': dict(self.unmatched),
+                'unmatched_percent': round(100.0 * unmatched_total / frames_total, 1) if frames_total else 0.0,
+                'sync_error_ms': {
+                    'samples': len(errors),
+                    'mean': round(float(errors.mean()), 3),
+                    'p50': round(float(np.percentile(errors, 50)), 3),
+                    'p95': round(float(np.percentile(errors, 95)), 3),
+                    'p99': round(float(np.percentile(errors, 99)), 3),
+                    'max': round(float(errors.max()), 3),
+                } if errors is not None else None,
+                # Список по возрастанию границ (le_ms=None - больше последней границы)
+                'histogram': [{'le_ms': edge, 'count': count} for edge, count
+                              in zip(list(SYNC_ERROR_BUCKETS_MS) + [None], self.histogram)],
+            }
+
+
+class GroupMember:
+    """Камера группы: чтение кадра с меткой времени захвата"""
+
+    def __init__(self, device_path, camera_type, handle):
+        self.device_path = str(device_path)
+        self.camera_type = camera_type
+        self.handle = handle
+        self.timestamp_source = None  # 'sensor', 'driver' или 'arrival'
+        self.frames = 0
+        self.errors = 0
+
+    def _to_monotonic(self, timestamp, arrival, source):
+        """Метка устройства в time.monotonic() или время получения, если метка непригодна"""
+        converted = device_timestamp_to_monotonic(timestamp, arrival)
+        if converted is None:
+            self.timestamp_source = 'arrival'
+            return arrival
+        self.timestamp_source = source
+        return converted
+
+    def read(self):
+        """
+        Returns:
+            (frame, timestamp) или (None, None)
+        """
+        if self.camera_type == 'csi':
+            request = self.handle.capture_request()
+            try:
+                frame = request.make_array('main')
+                metadata = request.get_metadata()
+            finally:
+                request.release()
+            arrival = time.monotonic()
+            sensor_ns = metadata.get('SensorTimestamp')
+            timestamp = sensor_ns / 1e9 if sensor_ns else None
+            return frame, self._to_monotonic(timestamp, arrival, 'sensor')
+
+        ret, frame = self.handle.read()
+        arrival = time.monotonic()
+        if not ret or frame is None:
+            return None, None
+        timestamp = self.handle.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        return frame, self._to_monotonic(timestamp, arrival, 'driver')
+
+    def close(self):
+        try:
+            if self.camera_type == 'csi':
+                self.handle.stop()
+                self.handle.close()
+            else:
+                self.handle.release()
+        except Exception as e:
+            print(f"⚠️ Группа: ошибка закрытия {self.device_path}: {e}")
+
+
+class CaptureGroup:
+    """Камеры, кадры которых выдаются наборами с общим моментом съемки"""
+
+    def __init__(self, name, group_config, logger, open_fn):
+        """
+        Args:
+            name: Имя группы
+            group_config: devices, width, height, fps, tolerance_ms
+            logger: Логгер
+            open_fn: Функция open_fn(device_path, width, height, fps) -> (camera_type, handle)
+        """
+        self.name = name
+        self.logger = logger
+        self.open_fn = open_fn
+        self.devices = [str(device) for device in group_config.get('devices', [])]
+        self.width = int(group_config.get('width', 1280))
+        self.height = int(group_config.get('height', 720))
+        self.fps = float(group_config.get('fps', 30))
+        self.tolerance_ms = float(group_config.get('tolerance_ms', 5))
+
+        self.members = []
+        self.threads = []
+        self.running = False
+        self.matcher = None
+        self.last_error = None
+
+        self.condition = threading.Condition()
+        self.latest = None
+        self.seq = 0
+        self.subscribers = []
+
+    def start(self):
+        """Открытие камер группы и запуск захвата"""
+        if self.running:
+            return True
+        if len(self.devices) < 2:
+            self.last_error = 'в группе меньше двух камер'
+            return False
+
+        members = []
+        try:
+            for device in self.devices:
+                camera_type, handle = self.open_fn(device, self.width, self.height, self.fps)
+                members.append(GroupMember(device, camera_type, handle))
+        except Exception as e:
+            for member in members:
+                member.close()
+            self.last_error = f"{device}: {e}"
+            self.logger.log_error(f"Группа {self.name}: не удалось открыть {device}: {e}")
+            return False
+
+        self.members = members
+        self.matcher = FrameMatcher(self.devices, self.tolerance_ms)
+        self.last_error = None
+        self.running = True
+        self.threads = [threading.Thread(target=self._capture_loop, args=(member,), daemon=True)
+                        for member in members]
+        for thread in self.threads:
+            thread.start()
+
+        print(f"🎞️ Группа захвата {self.name}: {', '.join(self.devices)} (допуск {self.tolerance_ms} мс)")
+        self.logger.log_info(f"Группа захвата {self.name} запущена: {self.devices}")
+        return True
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        for thread in self.threads:
+            thread.join(timeout=2.0)
+        for member in self.members:
+            member.close()
+        self.threads = []
+        self.members = []
+        with self.condition:
+            self.condition.notify_all()
+        self.logger.log_info(f"Группа захвата {self.name} остановлена")
+
+    def subscribe(self, callback):
+        """Подписка на каждый FrameSet (вызывается в потоке захвата, не блокировать)"""
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def _capture_loop(self, member):
+        while self.running:
+            try:
+                frame, timestamp = member.read()
+            except Exception as e:
+                member.errors += 1
+                self.logger.log_error(f"Группа {self.name}: ошибка чтения {member.device_path}: {e}")
+                time.sleep(0.1)
+                continue
+            if frame is None:
+                member.errors += 1
+                time.sleep(0.01)
+                continue
+            member.frames += 1
+
+            for frames, timestamps, error_ms in self.matcher.push(member.device_path, frame, timestamp):
+                with self.condition:
+                    self.seq += 1
+                    frameset = FrameSet(self.seq, frames, timestamps, error_ms)
+                    self.latest = frameset
+                    self.condition.notify_all()
+                for callback in list(self.subscribers):
+                    try:
+                        callback(frameset)
+                    except Exception as e:
+                        self.logger.log_error(f"Ошибка подписчика группы {self.name}: {e}")
+
+    def wait_next(self, last_seq, timeout=2.0):
+        """
+        Ожидание набора новее last_seq
+
+        Returns:
+            FrameSet или None (таймаут / остановка)
+        """
+        deadline = time.time() + timeout
+        with self.condition:
+            while self.running and (self.latest is None or self.latest.seq <= last_seq):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+            if self.latest is None or self.latest.seq <= last_seq:
+                return None
+            return self.latest
+
+    def get_status(self):
+        return {
+            'running': self.running,
+            'devices': self.devices,
+            'resolution': f"{self.width}x{self.height}",
+            'fps': self.fps,
+            'last_error': self.last_error,
+            'seq': self.seq,
+            'members': [{
+                'device_path': member.device_path,
+                'timestamp_source': member.timestamp_source,
+                'frames': member.frames,
+                'errors': member.errors,
+            } for member in self.members],
+            'sync': self.matcher.get_status() if self.matcher else None,
+        }
+
+
+def frameset_to_jpeg(frameset, jpeg_quality=80):
+    """Кадры набора рядом (по порядку камер) одним JPEG"""
+    frames = list(frameset.frames.values())
+    height = min(frame.shape[0] for frame in frames)
+    row = [frame if frame.shape[0] == height else
+           cv2.resize(frame, (int(frame.shape[1] * height / frame.shape[0]), height),
+                      interpolation=cv2.INTER_AREA)
+           for frame in frames]
+    ret, buffer = cv2.imencode('.jpg', cv2.hconcat(row), [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+    return buffer.tobytes() if ret else None
+
+
+class CaptureGroupManager:
+    """Группы захвата из секции capture_groups"""
+
+    def __init__(self, config, logger, open_fn):
+        groups_config = config.get('capture_groups', {}) or {}
+        self.logger = logger
+        self.auto_start = groups_config.get('auto_start', False)
+        self.groups = {
+            name: CaptureGroup(name, group_config or {}, logger, open_fn)
+            for name, group_config in (groups_config.get('groups', {}) or {}).items()
+        }
+
+    def get(self, name):
+        return self.groups.get(name)
+
+    def start_auto(self):
+        if not self.auto_start:
+            return
+        for group in self.groups.values():
+            group.start()
+
+    def stop_all(self):
+        for group in self.groups.values():
+            group.stop()
+
+    def reserved_devices(self):
+        """Устройства, занятые запущенными группами"""
+        return {device for group in self.groups.values() if group.running for device in group.devices}
+
+    def get_status(self):
+        return {name: group.get_status() for name, group in self.groups.items()}
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+# core_budget.py
+
+"""
+Распределение ядер CPU между стадиями: захват, кодирование, детекция, HTTP.
+
+На CM5 пул потоков OpenCV, детектор AprilTag (nthreads), потоки запросов
+Flask и захват делят четыре ядра, из-за чего интервал между кадрами в
+capture_frames "плавает". CoreBudget закрепляет поток каждой стадии за
+своими ядрами (sched_setaffinity для потока - на Linux действует на
+вызывающий поток, дочерние потоки наследуют маску):
+  - capture: поток capture_frames;
+  - encode: поток кодирования FrameHub;
+  - detection: потоки анализа кадров (nthreads детектора - detection_threads);
+  - http: потоки запросов Flask (генераторы MJPEG, копии ?width= / ?roi=).
+
+Число потоков OpenCV (cv2.setNumThreads) общее для процесса, поэтому
+задается одно на процесс (opencv_threads), а ядра его пула - через
+opencv_cores: пул создается из потока, закрепленного за этими ядрами,
+и рабочие потоки наследуют маску.
+
+Статистика: для каждого закрепленного потока - время CPU и ядро, на котором
+он выполнялся последним (/proc/self/task/<tid>/stat); IntervalStats -
+разброс интервала между кадрами захвата (с распределением ядер и без).
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+from utils_rpi.lazy_import import lazy_import
+
+# Тяжелые модули импортируются при первом обращении: импорт сервера их не загружает
+np = lazy_import('numpy')
+
+
+DEFAULT_STAGES = {
+    'capture': [0],
+    'encode': [1],
+    'detection': [2, 3],
+    'http': [1, 2, 3],
+}
+
+_CLK_TCK = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+def read_thread_stat(tid):
+    """(время CPU потока в секундах, последнее ядро) или None, если поток завершен"""
+    try:
+        with open(f'/proc/self/task/{tid}/stat', 'r') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+    except (OSError, IndexError):
+        return None
+    # Поля после имени: [0] - состояние (поле 3), utime - поле 14, stime - 15, processor - 39
+    return (int(fields[11]) + int(fields[12])) / _CLK_TCK, int(fields[36])
+
+
+class IntervalStats:
+    """Интервалы между событиями (кадрами захвата): частота и разброс"""
+
+    def __init__(self, maxlen=600):
+        self.intervals_ms = deque(maxlen=maxlen)
+        self.last = None
+
+    def tick(self, now=None):
+        now = time.monotonic() if now is None else now
+        if self.last is not None:
+            self.intervals_ms.append((now - self.last) * 1000)
+        self.last = now
+
+    def reset(self):
+        """Пауза в потоке событий (приостановка захвата) - не интервал"""
+        self.last = None
+
+    def get_status(self):
+        intervals = np.array(list(self.intervals_ms))
+        if not len(intervals):
+            return None
+        mean = float(intervals.mean())
+        return {
+            'fps': round(1000.0 / mean, 2) if mean > 0 else 0.0,
+            'mean_ms': round(mean, 2),
+            'std_ms': round(float(intervals.std()), 2),
+            'p50_ms': round(float(np.percentile(intervals, 50)), 2),
+            'p95_ms': round(float(np.percentile(intervals, 95)), 2),
+            'p99_ms': round(float(np.percentile(intervals, 99)), 2),
+            'max_ms': round(float(intervals.max()), 2),
+            'samples': len(intervals),
+        }
+
+
+class CoreBudget:
+    """Закрепление потоков стадий за ядрами и число потоков OpenCV"""
+
+    def __init__(self, config, logger):
+        budget_config = config.get('core_budget', {}) or {}
+
+        self.logger = logger
+        self.enabled = budget_config.get('enabled', False) and hasattr(os, 'sched_setaffinity')
+        try:
+            self.available = sorted(os.sched_getaffinity(0))
+        except AttributeError:
+            self.available = list(range(os.cpu_count() or 1))
+
+        stages = dict(DEFAULT_STAGES)
+        stages.update(budget_config.get('stages', {}) or {})
+        self.stages = {stage: self._valid_cores(stage, cores) for stage, cores in stages.items()}
+        self.opencv_threads = budget_config.get('opencv_threads')
+        self.opencv_cores = self._valid_cores('opencv', budget_config.get('opencv_cores') or [])
+        self.detection_threads = int(budget_config.get('detection_threads', 2))
+
+        self.lock = threading.Lock()
+        # native_id -> (стадия, имя потока)
+        self.pinned = {}
+        self.errors = 0
+        self.opencv_configured = False
+        self._local = threading.local()
+
+    def _valid_cores(self, stage, cores):
+        """Ядра из доступных процессу (лишние отбрасываются с предупреждением)"""
+        cores = [int(core) for core in (cores or [])]
+        valid = [core for core in cores if core in self.available]
+        if self.enabled and len(valid) != len(cores):
+            print(f"⚠️ core_budget.{stage}: ядер {sorted(set(cores) - set(valid))} нет "
+                  f"(доступны {self.available})")
+        return valid
+
+    def pin_current(self, stage):
+        """
+        Закрепление вызывающего потока за ядрами стадии
+
+        Returns:
+            True - поток закреплен (повторный вызов в том же потоке ничего не делает)
+        """
+        if not self.enabled:
+            return False
+        cores = self.stages.get(stage)
+        if not cores:
+            return False
+        if getattr(self._local, 'stage', None) == stage:
+            return True
+
+        tid = threading.get_native_id()
+        try:
+            os.sched_setaffinity(tid, cores)
+        except OSError as e:
+            self.errors += 1
+            self.logger.log_error(f"Не удалось закрепить поток {stage} за ядрами {cores}: {e}")
+            return False
+
+        self._local.stage = stage
+        with self.lock:
+            if len(self.pinned) > 64:
+                # Потоки запросов Flask живут недолго - забываем завершенные
+                self.pinned = {t: v for t, v in self.pinned.items() if read_thread_stat(t) is not None}
+            self.pinned[tid] = (stage, threading.current_thread().name)
+        return True
+
+    def setup_opencv(self):
+        """Число потоков OpenCV и ядра его пула (вызывать до первой обработки кадров)"""
+        if not self.enabled or self.opencv_configured:
+            return
+        self.opencv_configured = True
+
+        import cv2
+
+        def init_pool():
+            if self.opencv_cores:
+                os.sched_setaffinity(threading.get_native_id(), self.opencv_cores)
+            if self.opencv_threads is not None:
+                cv2.setNumThreads(int(self.opencv_threads))
+            # Параллельная операция создает рабочие потоки пула с маской этого потока
+            cv2.GaussianBlur(np.zeros((480, 640, 3), dtype=np.uint8), (5, 5), 0)
+
+        thread = threading.Thread(target=init_pool, name='opencv-pool-init', daemon=True)
+        thread.start()
+        thread.join(timeout=5.0)
+        print(f"🧮 OpenCV: {cv2.getNumThreads()} потоков, ядра пула {self.opencv_cores or self.available}")
+
+    def get_status(self):
+        with self.lock:
+            pinned = dict(self.pinned)
+        threads = []
+        for tid, (stage, name) in sorted(pinned.items()):
+            stat = read_thread_stat(tid)
+            if stat is None:
+                continue
+            cpu_s, last_core = stat
+            threads.append({'tid': tid, 'stage': stage, 'thread': name,
+                            'cpu_s': round(cpu_s, 2), 'last_core': last_core})
+        return {
+            'enabled': self.enabled,
+            'available_cores': self.available,
+            'stages': self.stages,
+            'opencv_threads': self.opencv_threads,
+            'opencv_cores': self.opencv_cores,
+            'detection_threads': self.detection_threads,
+            'threads': threads,
+            'errors': self.errors,
+        }
@@ -42,6 +42,10 @@ class CSICameraManager:
             self.logger.log_info("🔍 Поиск CSI камер через Picamera2...")
             print("🔍 Поиск CSI камер через Picamera2...")
             
+            # Быстрый путь: список камер libcamera без открытия устройств
+            if self._detect_from_global_info():
+                return self.cameras
+            
             # Пробуем обнаружить камеры через Picamera2
             for cam_idx in range(2):  # Проверяем до 2 камер
                 try:
@@ -93,6 +97,38 @@ class CSICameraManager:
         
         return self.cameras
     
+    def _detect_from_global_info(self):
+        """
+        Обнаружение через Picamera2.global_camera_info()
+        
+        Камеры не открываются (в отличие от Picamera2(idx)), поэтому
+        метод быстрый и безопасен, даже если одна из камер уже занята.
+        """
+        try:
+            global_info = Picamera2.global_camera_info()
+        except Exception as e:
+            print(f"  global_camera_info недоступен: {e}")
+            return False
+        
+        for cam_idx, info in enumerate(global_info):
+            model = info.get('Model', 'Unknown CSI Camera')
+            print(f"  Камера #{cam_idx}: ✓ найдена: {model}")
+            self.cameras.append({
+                'index': cam_idx,
+                'device': f'csi_{cam_idx}',
+                'name': f'CSI Camera {cam_idx} ({model})',
+                'type': 'CSI',
+                'model': model,
+                'picamera2': True
+            })
+            self.logger.log_info(f"Обнаружена CSI камера: {model} (индекс: {cam_idx})")
+        
+        if not self.cameras:
+            self.logger.log_info("CSI камеры не обнаружены")
+        else:
+            self.logger.log_info(f"Обнаружено CSI камер: {len(self.cameras)}")
+        return True
+    
     def open_csi_camera(self, camera_idx):
         """Открытие CSI камеры через Picamera2"""
         if not PICAMERA2_AVAILABLE:
@@ -122,7 +158,8 @@ class CSICameraManager:
             
             # Даем камере время на инициализацию
             import time
-            time.sleep(1)
+            warmup_time = self.config.get('rpi_settings', {}).get('warmup_time', 1.0)
+            time.sleep(warmup_time)
             
             print(f"✅ CSI камера #{camera_idx} открыта успешно")
             print(f"   Разрешение: {width}x{height}, FPS: {fps}")
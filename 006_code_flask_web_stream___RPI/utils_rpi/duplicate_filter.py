@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+# duplicate_filter.py
+
+"""
+Повторяющиеся кадры: пропуск кодирования и обнаружение зависшей камеры.
+
+Некоторые USB камеры при сбое отдают один и тот же буфер, неподвижная
+сцена с фиксированной экспозицией дает одинаковые кадры. Для каждого кадра
+считается дешевый отпечаток: CRC32 сжатого буфера камеры (MJPEG без
+перекодирования) или прореженной сетки пикселей (каждый sample_step-й
+пиксель по обеим осям). Кадр с тем же отпечатком, что и предыдущий, не
+кодируется и не рассылается заново.
+
+Если отпечаток не меняется дольше stall_s, камера помечается зависшей и
+(при recover) перезапускается. Если и после перезапуска кадр тот же,
+это неподвижная сцена, а не сбой: повторных перезапусков не будет, пока
+картинка не изменится.
+"""
+
+import time
+import zlib
+
+from utils_rpi.lazy_import import lazy_import
+
+# Тяжелые модули импортируются при первом обращении: импорт сервера их не загружает
+np = lazy_import('numpy')
+
+
+def frame_fingerprint(frame, jpeg=None, step=8):
+    """
+    Отпечаток кадра
+
+    Args:
+        frame: BGR кадр
+        jpeg: Сжатый буфер камеры (если есть - отпечаток по нему, без прореживания)
+        step: Шаг прореживания пикселей
+
+    Returns:
+        (размер кадра, CRC32)
+    """
+    if jpeg is not None:
+        return len(jpeg), zlib.crc32(jpeg)
+    offset = step // 2
+    sampled = np.ascontiguousarray(frame[offset::step, offset::step])
+    return frame.shape, zlib.crc32(sampled)
+
+
+class DuplicateFilter:
+    """Повторы кадров подряд и зависание камеры"""
+
+    def __init__(self, config):
+        filter_config = config.get('duplicate_filter', {}) or {}
+
+        self.enabled = filter_config.get('enabled', False)
+        self.sample_step = max(1, int(filter_config.get('sample_step', 8)))
+        self.stall_s = float(filter_config.get('stall_s', 2.0))
+        self.recover = filter_config.get('recover', True)
+
+        self.last_fingerprint = None
+        self.last_change_mono = time.monotonic()
+        self.run_length = 0
+        self.stalled = False
+        self.static_scene = False
+        self._verify_after_recovery = False
+
+        # Статистика
+        self.frames_checked = 0
+        self.duplicates = 0
+        self.encodes_skipped = 0
+        self.check_ms_total = 0.0
+        self.stalls = 0
+        self.recoveries = 0
+        self.longest_run = 0
+
+    def reset(self):
+        """Смена камеры: сравнение начинается заново"""
+        self.last_fingerprint = None
+        self.last_change_mono = time.monotonic()
+        self.run_length = 0
+        self.stalled = False
+        self.static_scene = False
+        self._verify_after_recovery = False
+
+    def check(self, frame, jpeg=None):
+        """
+        Проверка кадра (поток захвата)
+
+        Returns:
+            True - кадр повторяет предыдущий
+        """
+        if not self.enabled:
+            return False
+
+        start = time.perf_counter()
+        fingerprint = frame_fingerprint(frame, jpeg, self.sample_step)
+        now = time.monotonic()
+        self.frames_checked += 1
+        self.check_ms_total += (time.perf_counter() - start) * 1000
+
+        if fingerprint != self.last_fingerprint:
+            if self.stalled:
+                print(f"✅ Камера снова отдает новые кадры (повторов подряд: {self.run_length})")
+            self.last_fingerprint = fingerprint
+            self.last_change_mono = now
+            self.run_length = 0
+            self.stalled = False
+            self.static_scene = False
+            self._verify_after_recovery = False
+            return False
+
+        self.duplicates += 1
+        self.run_length += 1
+        self.longest_run = max(self.longest_run, self.run_length)
+
+        if self._verify_after_recovery:
+            # Перезапущенная камера отдала тот же кадр - сцена неподвижна
+            self._verify_after_recovery = False
+            self.static_scene = True
+            print("ℹ️ После перезапуска кадр тот же: неподвижная сцена, перезапуски отключены до изменения")
+
+        if not self.stalled and now - self.last_change_mono >= self.stall_s:
+            self.stalled = True
+            self.stalls += 1
+            print(f"⚠️ Камера отдает один и тот же кадр {now - self.last_change_mono:.1f} с "
+                  f"({self.run_length} повторов)")
+        return True
+
+    def needs_recovery(self):
+        """Пора перезапускать камеру (однократно на каждое зависание)"""
+        return (self.enabled and self.recover and self.stalled and not self.static_scene
+                and not self._verify_after_recovery)
+
+    def on_recovered(self):
+        """Камера перезапущена: первый кадр покажет, был ли это сбой"""
+        self.recoveries += 1
+        self._verify_after_recovery = True
+
+    def get_status(self):
+        checked = self.frames_checked
+        return {
+            'enabled': self.enabled,
+            'frames_checked': checked,
+            'duplicates': self.duplicates,
+            'duplicate_percent': round(100.0 * self.duplicates / checked, 1) if checked else 0.0,
+            'encodes_skipped': self.encodes_skipped,
+            'avg_check_ms': round(self.check_ms_total / checked, 3) if checked else 0.0,
+            'run_length': self.run_length,
+            'longest_run': self.longest_run,
+            'unchanged_s': round(time.monotonic() - self.last_change_mono, 1),
+            'stalled': self.stalled,
+            'static_scene': self.static_scene,
+            'stalls': self.stalls,
+            'recoveries': self.recoveries,
+        }
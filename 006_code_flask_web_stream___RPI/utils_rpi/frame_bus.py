@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+
+# frame_bus.py
+
+"""
+Шина кадров в разделяемой памяти: одна камера - несколько процессов.
+
+Процесс, владеющий камерой (стример), пишет кадры в кольцо заранее выделенных
+слотов в разделяемой памяти (multiprocessing.shared_memory). Каждый слот
+защищен номером кадра в начале и в конце записи (seqlock), поэтому читатели
+не блокируют писателя. Читатели (трекер AprilTag, тестовые скрипты)
+подключаются по имени шины и получают кадр как numpy массив поверх
+разделяемой памяти - без копирования.
+
+Разметка памяти:
+  заголовок шины | таблица читателей | заголовки слотов | данные слотов
+
+Клиент:
+    reader = FrameBusReader('pics_keeper_bus')
+    frame = reader.read_next(timeout=1.0)   # BusFrame: seq, image (view), capture_ts
+    ...обработка frame.image...
+    if not reader.is_valid(frame):          # Писатель успел перезаписать слот
+        ...результат по кадру недостоверен...
+"""
+
+import os
+import struct
+import time
+from multiprocessing import shared_memory
+
+from utils_rpi.lazy_import import lazy_import
+
+# Тяжелые модули импортируются при первом обращении: импорт сервера их не загружает
+np = lazy_import('numpy')
+
+
+BUS_MAGIC = b'FBUS'
+BUS_VERSION = 1
+
+# Заголовок шины
+_BUS_HEADER = struct.Struct('<4sIIIQIIIIQd')   # magic, version, slots, max_readers, slot_size,
+                                               # max_w, max_h, channels, writer_pid, write_seq, heartbeat
+_BUS_HEADER_SIZE = 64
+_WRITE_SEQ_OFFSET = 40
+_HEARTBEAT_OFFSET = 48
+
+# Запись читателя: pid, last_seq, frames_read, missed, overruns, lag_ms, heartbeat
+_READER = struct.Struct('<IQQQQdd')
+_READER_SIZE = 64
+
+# Заголовок слота: seq_begin, seq_end, width, height, channels, capture_ts, capture_mono, camera_id
+_SLOT = struct.Struct('<QQIIIdd16s')
+_SLOT_SIZE = 64
+_SLOT_SEQ_END_OFFSET = 8
+
+
+def _attach_untracked(name):
+    """
+    Подключение к существующему сегменту без регистрации в resource_tracker
+
+    Иначе до Python 3.13 читатель удаляет сегмент писателя при своем выходе,
+    а в дочерних процессах снимает с учета регистрацию писателя.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+
+    from multiprocessing import resource_tracker
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args, **kwargs: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+def _pid_alive(pid):
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+class BusFrame:
+    """Кадр из шины (image - представление разделяемой памяти или копия)"""
+
+    __slots__ = ('seq', 'image', 'capture_ts', 'capture_mono', 'camera_id', 'slot')
+
+    def __init__(self, seq, image, capture_ts, capture_mono, camera_id, slot):
+        self.seq = seq
+        self.image = image
+        self.capture_ts = capture_ts
+        self.capture_mono = capture_mono
+        self.camera_id = camera_id
+        self.slot = slot
+
+
+class _FrameBusLayout:
+    """Общая разметка разделяемой памяти для писателя и читателя"""
+
+    def _init_layout(self, slots, max_readers, slot_size):
+        self.slots = slots
+        self.max_readers = max_readers
+        self.slot_size = slot_size
+        self.readers_offset = _BUS_HEADER_SIZE
+        self.slot_headers_offset = self.readers_offset + max_readers * _READER_SIZE
+        data_offset = self.slot_headers_offset + slots * _SLOT_SIZE
+        # Данные слотов выровнены по 64 байта
+        self.data_offset = (data_offset + 63) // 64 * 64
+
+    @staticmethod
+    def total_size(slots, max_readers, slot_size):
+        header = _BUS_HEADER_SIZE + max_readers * _READER_SIZE + slots * _SLOT_SIZE
+        return (header + 63) // 64 * 64 + slots * slot_size
+
+    def _slot_header_offset(self, slot):
+        return self.slot_headers_offset + slot * _SLOT_SIZE
+
+    def _slot_data(self, slot, width, height, channels):
+        offset = self.data_offset + slot * self.slot_size
+        shape = (height, width, channels) if channels > 1 else (height, width)
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf, offset=offset)
+
+    def _read_slot_header(self, slot):
+        return _SLOT.unpack_from(self.shm.buf, self._slot_header_offset(slot))
+
+    def _read_write_seq(self):
+        return struct.unpack_from('<Q', self.shm.buf, _WRITE_SEQ_OFFSET)[0]
+
+    def _read_readers(self):
+        readers = []
+        for i in range(self.max_readers):
+            pid, last_seq, frames, missed, overruns, lag_ms, heartbeat = \
+                _READER.unpack_from(self.shm.buf, self.readers_offset + i * _READER_SIZE)
+            if pid and _pid_alive(pid):
+                readers.append({
+                    'pid': pid,
+                    'last_seq': last_seq,
+                    'frames_read': frames,
+                    'frames_missed': missed,
+                    'overruns': overruns,
+                    'lag_ms': round(lag_ms, 1),
+                    'seconds_since_read': round(time.time() - heartbeat, 1) if heartbeat else None,
+                })
+        return readers
+
+
+class FrameBusWriter(_FrameBusLayout):
+    """Писатель: процесс, владеющий камерой"""
+
+    def __init__(self, name, slots=8, max_width=1920, max_height=1200, channels=3, max_readers=8):
+        self.name = name
+        self._init_layout(slots, max_readers, max_width * max_height * channels)
+        self.max_width = max_width
+        self.max_height = max_height
+        self.channels = channels
+
+        size = self.total_size(slots, max_readers, self.slot_size)
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Сегмент остался от упавшего процесса - пересоздаем
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        self.shm.buf[:self.data_offset] = bytes(self.data_offset)
+        _BUS_HEADER.pack_into(self.shm.buf, 0, BUS_MAGIC, BUS_VERSION, slots, max_readers, self.slot_size,
+                              max_width, max_height, channels, os.getpid(), 0, time.time())
+
+        self.seq = 0
+        self.frames_written = 0
+        self.frames_oversize = 0
+        self.write_ms_total = 0.0
+
+        print(f"🚌 Шина кадров '{name}': {slots} слотов по {self.slot_size / (1024 * 1024):.1f} МБ")
+
+    def write(self, image, capture_ts=None, capture_mono=None, camera_id=''):
+        """Публикация кадра (копия в следующий слот кольца)"""
+        height, width = image.shape[:2]
+        channels = image.shape[2] if image.ndim == 3 else 1
+        if width * height * channels > self.slot_size:
+            self.frames_oversize += 1
+            return None
+
+        start = time.perf_counter()
+        seq = self.seq + 1
+        slot = seq % self.slots
+        header_offset = self._slot_header_offset(slot)
+
+        # seqlock: seq_begin - запись начата, seq_end - запись завершена
+        _SLOT.pack_into(self.shm.buf, header_offset, seq, 0, width, height, channels,
+                        capture_ts or time.time(), capture_mono or time.monotonic(),
+                        str(camera_id).encode('utf-8')[:16])
+        np.copyto(self._slot_data(slot, width, height, channels), image.reshape(
+            (height, width, channels) if channels > 1 else (height, width)))
+        struct.pack_into('<Q', self.shm.buf, header_offset + _SLOT_SEQ_END_OFFSET, seq)
+
+        struct.pack_into('<Qd', self.shm.buf, _WRITE_SEQ_OFFSET, seq, time.time())
+        self.seq = seq
+        self.frames_written += 1
+        self.write_ms_total += (time.perf_counter() - start) * 1000
+        return seq
+
+    def close(self):
+        """Закрытие и удаление сегмента"""
+        try:
+            self.shm.close()
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    def get_status(self):
+        """Статистика писателя и подключенных читателей"""
+        readers = self._read_readers()
+        for reader in readers:
+            reader['lag_frames'] = self.seq - reader['last_seq']
+        return {
+            'name': self.name,
+            'slots': self.slots,
+            'slot_mb': round(self.slot_size / (1024 * 1024), 2),
+            'seq': self.seq,
+            'frames_written': self.frames_written,
+            'frames_oversize': self.frames_oversize,
+            'avg_write_ms': round(self.write_ms_total / self.frames_written, 3) if self.frames_written else 0.0,
+            'readers': readers,
+        }
+
+
+class FrameBusReader(_FrameBusLayout):
+    """Читатель: подключение к шине по имени"""
+
+    def __init__(self, name):
+        self.name = name
+        self.shm = _attach_untracked(name)
+
+        magic, version, slots, max_readers, slot_size, max_w, max_h, channels, writer_pid, _, _ = \
+            _BUS_HEADER.unpack_from(self.shm.buf, 0)
+        if magic != BUS_MAGIC or version != BUS_VERSION:
+            self.shm.close()
+            raise ValueError(f"Сегмент '{name}' не является шиной кадров версии {BUS_VERSION}")
+
+        self._init_layout(slots, max_readers, slot_size)
+        self.writer_pid = writer_pid
+        self.last_seq = 0
+
+        # Статистика
+        self.frames_read = 0
+        self.frames_missed = 0
+        self.overruns = 0
+        self.lag_ms = 0.0
+
+        self.reader_slot = self._claim_reader_slot()
+
+    def _claim_reader_slot(self):
+        """Регистрация в таблице читателей (для статистики на стороне писателя)"""
+        pid = os.getpid()
+        for i in range(self.max_readers):
+            offset = self.readers_offset + i * _READER_SIZE
+            current = struct.unpack_from('<I', self.shm.buf, offset)[0]
+            if current == 0 or current == pid or not _pid_alive(current):
+                _READER.pack_into(self.shm.buf, offset, pid, 0, 0, 0, 0, 0.0, time.time())
+                time.sleep(0.001)
+                if struct.unpack_from('<I', self.shm.buf, offset)[0] == pid:
+                    return i
+        return None
+
+    def _publish_stats(self):
+        if self.reader_slot is None:
+            return
+        _READER.pack_into(self.shm.buf, self.readers_offset + self.reader_slot * _READER_SIZE,
+                          os.getpid(), self.last_seq, self.frames_read, self.frames_missed,
+                          self.overruns, self.lag_ms, time.time())
+
+    @property
+    def writer_alive(self):
+        return _pid_alive(self.writer_pid)
+
+    def latest_seq(self):
+        return self._read_write_seq()
+
+    def _read_slot(self, seq, copy):
+        """Кадр seq из слота или None (слот уже перезаписан / еще пишется)"""
+        slot = seq % self.slots
+        seq_begin, seq_end, width, height, channels, capture_ts, capture_mono, camera_id = \
+            self._read_slot_header(slot)
+        if seq_begin != seq or seq_end != seq:
+            return None
+
+        image = self._slot_data(slot, width, height, channels)
+        if copy:
+            image = image.copy()
+            # Проверка после копирования: писатель не начал запись в этот слот
+            if self._read_slot_header(slot)[0] != seq:
+                return None
+        return BusFrame(seq, image, capture_ts, capture_mono,
+                        camera_id.rstrip(b'\x00').decode('utf-8', 'ignore'), slot)
+
+    def read_next(self, timeout=1.0, copy=False, poll_interval=0.001):
+        """
+        Следующий кадр (самый свежий, пропущенные учитываются как missed)
+
+        Args:
+            timeout: Ожидание нового кадра (с)
+            copy: Скопировать кадр (иначе image - представление разделяемой памяти,
+                  действительное, пока писатель не сделает круг по кольцу)
+
+        Returns:
+            BusFrame или None по таймауту
+        """
+        deadline = time.time() + timeout
+        while True:
+            seq = self._read_write_seq()
+            if seq > self.last_seq:
+                frame = self._read_slot(seq, copy)
+                if frame is not None:
+                    if self.last_seq:
+                        self.frames_missed += max(0, seq - self.last_seq - 1)
+                    self.last_seq = seq
+                    self.frames_read += 1
+                    self.lag_ms = (time.time() - frame.capture_ts) * 1000
+                    self._publish_stats()
+                    return frame
+                self.overruns += 1
+            if time.time() >= deadline:
+                return None
+            time.sleep(poll_interval)
+
+    def is_valid(self, frame):
+        """
+        Кадр без копирования все еще цел (писатель не перезаписал слот)
+
+        Вызывается после обработки frame.image; False - результат недостоверен
+        и засчитывается как overrun.
+        """
+        valid = self._read_slot_header(frame.slot)[0] == frame.seq
+        if not valid:
+            self.overruns += 1
+            self._publish_stats()
+        return valid
+
+    def close(self):
+        if self.reader_slot is not None:
+            _READER.pack_into(self.shm.buf, self.readers_offset + self.reader_slot * _READER_SIZE,
+                              0, 0, 0, 0, 0, 0.0, 0.0)
+        self.shm.close()
+
+    def get_status(self):
+        return {
+            'name': self.name,
+            'last_seq': self.last_seq,
+            'lag_frames': self._read_write_seq() - self.last_seq,
+            'lag_ms': round(self.lag_ms, 1),
+            'frames_read': self.frames_read,
+            'frames_missed': self.frames_missed,
+            'overruns': self.overruns,
+            'writer_alive': self.writer_alive,
+        }
+
+
+class FrameBusPublisher:
+    """Публикация кадров стримера в шину (подписчик FrameHub.subscribe_raw)"""
+
+    def __init__(self, config, logger):
+        bus_config = config.get('frame_bus', {}) or {}
+
+        self.logger = logger
+        self.enabled = bus_config.get('enabled', False)
+        self.name = bus_config.get('name', 'pics_keeper_bus')
+        self.slots = int(bus_config.get('slots', 8))
+        self.max_width = int(bus_config.get('max_width', 1920))
+        self.max_height = int(bus_config.get('max_height', 1200))
+        self.writer = None
+        self.error = None
+
+    def start(self):
+        """Создание сегмента разделяемой памяти"""
+        if not self.enabled or self.writer is not None:
+            return self.writer is not None
+        try:
+            self.writer = FrameBusWriter(self.name, self.slots, self.max_width, self.max_height)
+            self.logger.log_info(f"Шина кадров '{self.name}' создана")
+            return True
+        except Exception as e:
+            self.error = str(e)
+            self.enabled = False
+            self.logger.log_error(f"Не удалось создать шину кадров '{self.name}': {e}")
+            return False
+
+    def stop(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            self.logger.log_info(f"Шина кадров '{self.name}' закрыта")
+
+    def on_frame(self, captured):
+        """Кадр из потока кодирования FrameHub (CapturedFrame)"""
+        if self.writer is not None:
+            self.writer.write(captured.frame, captured.capture_ts, captured.capture_mono, captured.camera_id)
+
+    def reader_count(self):
+        """Число подключенных читателей (живые процессы)"""
+        return len(self.writer._read_readers()) if self.writer is not None else 0
+
+    def get_status(self):
+        if self.writer is None:
+            return {'enabled': self.enabled, 'name': self.name, 'error': self.error}
+        status = self.writer.get_status()
+        status['enabled'] = True
+        return status
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+
+# frame_hub.py
+
+"""
+Общий конвейер кодирования кадров для всех потребителей стрима.
+
+Поток захвата кладет кадры в очередь (CapturedFrame), поток кодирования
+FrameHub сжимает каждый кадр в JPEG один раз и публикует последний
+EncodedFrame. Клиенты /video_feed, запись и другие потребители читают
+один и тот же JPEG и не забирают кадры друг у друга.
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+
+from utils_rpi.duplicate_filter import DuplicateFilter
+from utils_rpi.lazy_import import lazy_import
+from utils_rpi.motion_gate import MotionGate
+from utils_rpi.quality_controller import QualityController
+
+# Тяжелые модули импортируются при первом обращении: импорт сервера их не загружает
+cv2 = lazy_import('cv2')
+
+
+def mjpeg_part(jpeg, encoded=None):
+    """
+    Часть multipart/x-mixed-replace с одним JPEG
+
+    С encoded добавляются заголовки кадра для измерений на клиенте:
+    X-Frame-Seq, X-Capture-Monotonic, X-Send-Monotonic, X-Send-Timestamp
+    (время отправки - в момент вызова) и X-Camera-Id.
+    """
+    headers = f"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n"
+    if encoded is not None:
+        headers += (f"X-Frame-Seq: {encoded.seq}\r\n"
+                    f"X-Capture-Monotonic: {encoded.capture_mono:.6f}\r\n"
+                    f"X-Send-Monotonic: {time.monotonic():.6f}\r\n"
+                    f"X-Send-Timestamp: {time.time():.6f}\r\n"
+                    f"X-Camera-Id: {encoded.camera_id}\r\n")
+    return (headers + "\r\n").encode('ascii', 'replace') + jpeg + b'\r\n'
+
+
+class CapturedFrame:
+    """Кадр из потока захвата"""
+
+    __slots__ = ('frame', 'capture_ts', 'capture_mono', 'jpeg', 'camera_id', 'duplicate')
+
+    def __init__(self, frame, camera_id='', jpeg=None, capture_ts=None, capture_mono=None, duplicate=False):
+        """
+        Args:
+            frame: BGR кадр (numpy)
+            camera_id: Устройство, с которого получен кадр
+            jpeg: Сжатые данные от камеры (MJPEG без перекодирования) или None
+            capture_ts, capture_mono: Время захвата (time.time / time.monotonic)
+            duplicate: Кадр повторяет предыдущий (DuplicateFilter) - не кодируется
+        """
+        self.frame = frame
+        self.duplicate = duplicate
+        self.camera_id = camera_id
+        self.jpeg = jpeg
+        self.capture_ts = capture_ts if capture_ts is not None else time.time()
+        self.capture_mono = capture_mono if capture_mono is not None else time.monotonic()
+
+
+class EncodedFrame:
+    """Кадр, сжатый в JPEG (общий для всех клиентов)"""
+
+    __slots__ = ('seq', 'jpeg', 'frame', 'source', 'capture_ts', 'capture_mono',
+                 'camera_id', 'width', 'height', 'passthrough', 'encode_ms')
+
+    def __init__(self, seq, jpeg, captured, passthrough, encode_ms, frame=None):
+        self.seq = seq
+        self.jpeg = jpeg
+        self.frame = captured.frame if frame is None else frame
+        # Кадр камеры в полном разрешении (frame может быть уменьшен adaptive_quality)
+        self.source = captured.frame
+        self.capture_ts = captured.capture_ts
+        self.capture_mono = captured.capture_mono
+        self.camera_id = captured.camera_id
+        self.height, self.width = self.frame.shape[:2]
+        self.passthrough = passthrough
+        self.encode_ms = encode_ms
+
+
+class FrameHub:
+    """Кодирование кадра один раз и раздача последнего JPEG всем читателям"""
+
+    def __init__(self, config, logger, source_queue, core_budget=None):
+        """
+        Args:
+            config: Конфигурация (jpeg_quality читается при каждом кадре)
+            logger: Логгер
+            source_queue: Очередь CapturedFrame от потока захвата
+            core_budget: CoreBudget - ядра потока кодирования (стадия encode) или None
+        """
+        self.config = config
+        self.logger = logger
+        self.source_queue = source_queue
+        self.core_budget = core_budget
+
+        self.condition = threading.Condition()
+        self.latest = None
+        self.seq = 0
+
+        self.subscribers = []
+        self.raw_subscribers = []
+        self.running = False
+        self.thread = None
+
+        # Снижение частоты в покое (кадр без движения не кодируется)
+        self.motion_gate = MotionGate(config)
+        
+        # Качество JPEG под целевой битрейт (adaptive_quality)
+        self.quality = QualityController(config)
+        
+        # Повторы кадров (отпечаток считает поток захвата) и зависание камеры
+        self.duplicates = DuplicateFilter(config)
+
+        # Статистика
+        self.frames_encoded = 0
+        self.frames_passthrough = 0
+        self.encode_ms_total = 0.0
+        self.bytes_total = 0
+        self.source_fps = 0.0
+        self.last_capture_ts = None
+        # Время захвата последних кадров - частота за окно (measured_fps)
+        self.capture_times = deque(maxlen=60)
+        self.capture_camera = None
+
+    def start(self):
+        """Запуск потока кодирования"""
+        if self.thread and self.thread.is_alive():
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._encode_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Остановка потока кодирования и пробуждение читателей"""
+        self.running = False
+        with self.condition:
+            self.condition.notify_all()
+        if self.thread and self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2.0)
+        self.thread = None
+
+    def reset(self):
+        """Сброс последнего кадра (смена камеры)"""
+        with self.condition:
+            self.latest = None
+        self.motion_gate.reset()
+        self.duplicates.reset()
+        self.last_capture_ts = None
+
+    def subscribe(self, callback):
+        """
+        Подписка на каждый новый EncodedFrame
+
+        Callback вызывается в потоке кодирования и не должен блокировать
+        (например, put_nowait в собственную очередь потребителя).
+        """
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+        if callback in self.raw_subscribers:
+            self.raw_subscribers.remove(callback)
+
+    def subscribe_raw(self, callback):
+        """
+        Подписка на каждый CapturedFrame до детектора движения и кодирования
+
+        Для потребителей несжатых кадров (шина кадров для других процессов):
+        получают все кадры камеры, даже в покое.
+        """
+        self.raw_subscribers.append(callback)
+
+    def _encode_loop(self):
+        """Основной цикл: очередь захвата -> JPEG -> публикация"""
+        if self.core_budget is not None:
+            self.core_budget.pin_current('encode')
+        while self.running:
+            try:
+                captured = self.source_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            try:
+                self._update_source_fps(captured.capture_ts, captured.camera_id)
+                for callback in list(self.raw_subscribers):
+                    try:
+                        callback(captured)
+                    except Exception as e:
+                        self.logger.log_error(f"Ошибка подписчика FrameHub: {e}")
+
+                # Тот же кадр, что и предыдущий: клиенты уже его получили
+                if captured.duplicate:
+                    self.duplicates.encodes_skipped += 1
+                    continue
+
+                if not self.motion_gate.should_publish(captured.frame, captured.capture_ts):
+                    continue
+
+                encoded = self._encode(captured)
+                if encoded is None:
+                    continue
+
+                with self.condition:
+                    self.latest = encoded
+                    self.condition.notify_all()
+
+                for callback in list(self.subscribers):
+                    try:
+                        callback(encoded)
+                    except Exception as e:
+                        self.logger.log_error(f"Ошибка подписчика FrameHub: {e}")
+
+            except Exception as e:
+                self.logger.log_error(f"Ошибка кодирования кадра: {e}")
+                time.sleep(0.01)
+
+    def _update_source_fps(self, capture_ts, camera_id=None):
+        """Скользящая оценка частоты кадров источника"""
+        if (camera_id != self.capture_camera or self.last_capture_ts is None
+                or not 0 < capture_ts - self.last_capture_ts <= 1.0):
+            # Другая камера или пауза захвата - окно measured_fps начинается заново
+            self.capture_camera = camera_id
+            self.capture_times.clear()
+        if self.last_capture_ts is not None and capture_ts > self.last_capture_ts:
+            fps = 1.0 / (capture_ts - self.last_capture_ts)
+            self.source_fps = fps if not self.source_fps else self.source_fps * 0.9 + fps * 0.1
+        self.last_capture_ts = capture_ts
+        self.capture_times.append(capture_ts)
+
+    def measured_fps(self, min_frames=10):
+        """
+        Частота источника за окно последних кадров (source_fps сглажена и долго прогревается)
+
+        Returns:
+            Кадров в секунду, 0.0 - пока кадров меньше min_frames
+        """
+        times = list(self.capture_times)
+        if len(times) < min_frames or times[-1] <= times[0]:
+            return 0.0
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def _encode(self, captured):
+        """JPEG кадра: данные камеры без перекодирования или cv2.imencode"""
+        start = time.perf_counter()
+        frame = captured.frame
+        if captured.jpeg is not None:
+            jpeg = captured.jpeg
+            passthrough = True
+        else:
+            if self.quality.enabled:
+                jpeg_quality = self.quality.jpeg_quality
+                if self.quality.scale < 1.0:
+                    h, w = frame.shape[:2]
+                    size = (max(2, int(w * self.quality.scale) // 2 * 2), max(2, int(h * self.quality.scale) // 2 * 2))
+                    frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            else:
+                jpeg_quality = self.config['camera'].get('jpeg_quality', 85)
+            ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+            if not ret:
+                return None
+            jpeg = buffer.tobytes()
+            passthrough = False
+            # Обратная связь по размеру кадра (частота с учетом пропусков в покое)
+            self.quality.update(len(jpeg), self.source_fps * (1.0 - self.motion_gate.skip_rate))
+
+        encode_ms = (time.perf_counter() - start) * 1000
+        self.seq += 1
+        self.frames_encoded += 1
+        if passthrough:
+            self.frames_passthrough += 1
+        self.encode_ms_total += encode_ms
+        self.bytes_total += len(jpeg)
+        return EncodedFrame(self.seq, jpeg, captured, passthrough, encode_ms, frame)
+
+    def wait_next(self, last_seq, timeout=2.0):
+        """
+        Ожидание кадра новее last_seq
+
+        Returns:
+            EncodedFrame или None (таймаут / остановка)
+        """
+        deadline = time.time() + timeout
+        with self.condition:
+            while self.running and (self.latest is None or self.latest.seq <= last_seq):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+            if self.latest is None or self.latest.seq <= last_seq:
+                return None
+            return self.latest
+
+    def get_latest(self):
+        """Последний кадр без ожидания"""
+        return self.latest
+
+    def get_status(self):
+        """Статистика для API"""
+        latest = self.latest
+        avg_encode_ms = self.encode_ms_total / self.frames_encoded if self.frames_encoded else 0.0
+        avg_bytes = self.bytes_total / self.frames_encoded if self.frames_encoded else 0
+        return {
+            'running': self.running,
+            'seq': self.seq,
+            'source_fps': round(self.source_fps, 1),
+            'frames_encoded': self.frames_encoded,
+            'frames_passthrough': self.frames_passthrough,
+            'avg_encode_ms': round(avg_encode_ms, 2),
+            'subscribers': len(self.subscribers),
+            'latest_bytes': len(latest.jpeg) if latest else 0,
+            'latest_camera': latest.camera_id if latest else None,
+            'motion': self.motion_gate.get_status(avg_encode_ms, avg_bytes, self.source_fps),
+            'duplicates': self.duplicates.get_status(),
+            'adaptive_quality': self.quality.get_status(),
+        }
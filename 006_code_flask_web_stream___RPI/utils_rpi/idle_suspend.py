@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+# idle_suspend.py
+
+"""
+Приостановка захвата, когда кадры никому не нужны.
+
+При camera.auto_start поток capture_frames круглосуточно читает, конвертирует
+и кладет в очередь полные кадры, даже если нет ни одного зрителя. IdleSuspend
+собирает "спрос" на кадры (клиенты /video_feed, уровень переполнения, мозаика,
+запись, читатели шины кадров, разовые задачи через keep_awake) и, если спроса
+нет дольше grace_s, переводит захват в режим:
+  - throttle: камера остается в работе, кадры забираются с частотой idle_fps
+    без декодирования (grab / capture_metadata), у CSI снижается FPS сенсора;
+  - stop: захват не читает камеру (CSI камера останавливается).
+Новый клиент будит захват сразу (wake), время от пробуждения до первого
+кадра и загрузка CPU процесса в каждом состоянии идут в статистику.
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+THERMAL_ZONE = '/sys/class/thermal/thermal_zone0/temp'
+
+
+def read_soc_temp():
+    """Температура SoC (°C) или None"""
+    try:
+        with open(THERMAL_ZONE, 'r') as f:
+            return int(f.read().strip()) / 1000.0
+    except (OSError, ValueError):
+        return None
+
+
+class IdleSuspend:
+    """Политика приостановки захвата без потребителей"""
+
+    def __init__(self, config, logger):
+        idle_config = config.get('idle_suspend', {}) or {}
+
+        self.logger = logger
+        self.enabled = idle_config.get('enabled', False)
+        self.grace_s = float(idle_config.get('grace_s', 15))
+        self.mode = idle_config.get('mode', 'throttle')
+        self.idle_fps = float(idle_config.get('idle_fps', 1))
+        self.check_interval = 0.25
+
+        # Источники спроса: имя -> функция без аргументов (True - кадры нужны)
+        self.demands = {}
+        self.holds = {}
+        self.lock = threading.Lock()
+        self.wake_event = threading.Event()
+
+        self.suspended = False
+        self.last_demand_mono = time.monotonic()
+        self._last_check = 0.0
+        self._last_reasons = []
+        self._wake_mono = None
+        self._resuming = False
+
+        # Статистика: CPU процесса по состояниям
+        self.suspends = 0
+        self.resumes = 0
+        self.idle_frames = 0
+        self.resume_ms = deque(maxlen=50)
+        self.last_wake_reason = None
+        self._state_start = (time.monotonic(), time.process_time())
+        self._accounting = {'active': [0.0, 0.0], 'suspended': [0.0, 0.0]}  # [wall_s, cpu_s]
+        self._temps = {'active': None, 'suspended': None}
+
+    # ===== СПРОС НА КАДРЫ =====
+
+    def add_demand(self, name, fn):
+        self.demands[name] = fn
+
+    @contextmanager
+    def keep_awake(self, name, timeout=3.0):
+        """Разовая задача, которой нужны кадры (снимок, перенастройка): ждет возобновления захвата"""
+        with self.lock:
+            self.holds[name] = self.holds.get(name, 0) + 1
+        self.wake(name)
+        deadline = time.monotonic() + timeout
+        while self.suspended and time.monotonic() < deadline:
+            time.sleep(0.01)
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.holds[name] -= 1
+                if self.holds[name] <= 0:
+                    del self.holds[name]
+
+    def demand_reasons(self):
+        """Кто сейчас требует кадры"""
+        reasons = [name for name, fn in list(self.demands.items()) if self._safe_call(fn)]
+        with self.lock:
+            reasons.extend(self.holds)
+        return reasons
+
+    def _safe_call(self, fn):
+        try:
+            return bool(fn())
+        except Exception:
+            return False
+
+    def has_demand(self, force=False):
+        """Есть ли спрос (проверка не чаще check_interval, force - сразу)"""
+        now = time.monotonic()
+        if force or now - self._last_check >= self.check_interval:
+            self._last_check = now
+            self._last_reasons = self.demand_reasons()
+            if self._last_reasons:
+                self.last_demand_mono = now
+        return bool(self._last_reasons)
+
+    def should_suspend(self):
+        """Вызывается из потока захвата на каждом кадре"""
+        if not self.enabled or self.suspended:
+            return False
+        if self.has_demand():
+            return False
+        return time.monotonic() - self.last_demand_mono >= self.grace_s
+
+    # ===== ПЕРЕХОДЫ =====
+
+    def wake(self, reason):
+        """Новый потребитель: разбудить захват"""
+        self.last_demand_mono = time.monotonic()
+        if self.suspended and self._wake_mono is None:
+            self._wake_mono = time.monotonic()
+            self.last_wake_reason = reason
+        self.wake_event.set()
+
+    def wait_wake(self, timeout):
+        """Ожидание пробуждения в приостановленном состоянии"""
+        woken = self.wake_event.wait(timeout)
+        self.wake_event.clear()
+        return woken
+
+    def _switch_state(self, new_state):
+        now, cpu = time.monotonic(), time.process_time()
+        old_state = 'suspended' if new_state == 'active' else 'active'
+        start_wall, start_cpu = self._state_start
+        self._accounting[old_state][0] += now - start_wall
+        self._accounting[old_state][1] += cpu - start_cpu
+        self._temps[old_state] = read_soc_temp()
+        self._state_start = (now, cpu)
+
+    def enter_suspend(self):
+        self._switch_state('suspended')
+        self.suspended = True
+        self.suspends += 1
+        self._wake_mono = None
+        self.wake_event.clear()
+        print(f"💤 Захват приостановлен ({self.mode}): нет потребителей {self.grace_s:.0f} с")
+        self.logger.log_info(f"Захват приостановлен ({self.mode})")
+
+    def exit_suspend(self):
+        self._switch_state('active')
+        self.suspended = False
+        self.resumes += 1
+        self._resuming = True
+        if self._wake_mono is None:
+            # Спрос найден опросом, а не через wake()
+            self._wake_mono = time.monotonic()
+            self.last_wake_reason = ', '.join(self._last_reasons) or None
+        print(f"⏰ Захват возобновлен ({self.last_wake_reason})")
+
+    def on_frame(self):
+        """Первый кадр после возобновления - время пробуждения"""
+        if self._resuming and self._wake_mono is not None:
+            self.resume_ms.append((time.monotonic() - self._wake_mono) * 1000)
+            self._resuming = False
+            self._wake_mono = None
+
+    # ===== СТАТИСТИКА =====
+
+    def get_status(self):
+        now, cpu = time.monotonic(), time.process_time()
+        state = 'suspended' if self.suspended else 'active'
+        accounting = {key: list(value) for key, value in self._accounting.items()}
+        accounting[state][0] += now - self._state_start[0]
+        accounting[state][1] += cpu - self._state_start[1]
+
+        cpu_percent = {key: round(100.0 * cpu_s / wall_s, 1) if wall_s > 0 else None
+                       for key, (wall_s, cpu_s) in accounting.items()}
+        savings = None
+        if cpu_percent['active'] and cpu_percent['suspended'] is not None:
+            savings = round(cpu_percent['active'] - cpu_percent['suspended'], 1)
+
+        resume = list(self.resume_ms)
+        return {
+            'enabled': self.enabled,
+            'mode': self.mode,
+            'grace_s': self.grace_s,
+            'state': state,
+            'demand': self._last_reasons,
+            'idle_s': round(now - self.last_demand_mono, 1),
+            'suspends': self.suspends,
+            'resumes': self.resumes,
+            'idle_frames': self.idle_frames,
+            'last_wake_reason': self.last_wake_reason,
+            'resume_ms': {
+                'last': round(resume[-1], 1),
+                'mean': round(sum(resume) / len(resume), 1),
+                'max': round(max(resume), 1),
+            } if resume else None,
+            'process_cpu_percent': cpu_percent,
+            'cpu_savings_percent': savings,
+            'time_s': {key: round(wall_s, 1) for key, (wall_s, _) in accounting.items()},
+            'soc_temp_c': {'now': read_soc_temp(), 'end_of_active': self._temps['active'],
+                           'end_of_suspended': self._temps['suspended']},
+        }
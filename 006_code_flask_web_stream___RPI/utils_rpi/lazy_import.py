@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+# lazy_import.py
+
+"""
+Отложенный импорт тяжелых модулей (OpenCV, NumPy, Picamera2).
+
+Модуль импортируется при первом обращении к его атрибуту, поэтому
+HTTP сервер поднимается сразу, а OpenCV грузится в фоне вместе с камерой.
+"""
+
+import importlib
+import importlib.util
+import sys
+import threading
+import time
+
+# Время фактического импорта модулей: имя -> мс
+_import_times = {}
+# Один прокси на модуль: время импорта замеряется один раз, а не затирается повторной загрузкой
+_proxies = {}
+_proxies_lock = threading.Lock()
+
+
+class LazyModule:
+    """Прокси модуля, который импортирует его при первом обращении"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """Импорт модуля (потокобезопасно, один раз)"""
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    preloaded = self._name in sys.modules
+                    start = time.perf_counter()
+                    module = importlib.import_module(self._name)
+                    # Модуль уже загружен в обход прокси - время импорта неизвестно, не пишем 0
+                    if not preloaded:
+                        _import_times[self._name] = round((time.perf_counter() - start) * 1000, 1)
+                    self._module = module
+        return self._module
+
+    @property
+    def is_loaded(self):
+        """Был ли модуль уже импортирован"""
+        return self._module is not None
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<LazyModule '{self._name}' ({state})>"
+
+
+def lazy_import(name):
+    """Ленивый прокси для модуля (общий для всех модулей, импортирующих name)"""
+    with _proxies_lock:
+        if name not in _proxies:
+            _proxies[name] = LazyModule(name)
+        return _proxies[name]
+
+
+def load_now(proxy):
+    """
+    Импорт модуля прокси сейчас (перед кодом, который импортирует его напрямую)
+
+    Функция, а не метод прокси: любой атрибут прокси - атрибут модуля (np.load)
+    """
+    return proxy._load()
+
+
+def is_module_available(name):
+    """Проверка наличия модуля без его импорта"""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def get_import_times():
+    """Время импорта модулей, загруженных через lazy_import (мс)"""
+    return dict(_import_times)
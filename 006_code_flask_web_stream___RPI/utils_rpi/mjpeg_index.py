@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+
+# mjpeg_index.py
+
+"""
+Индекс кадров для записанных MJPEG файлов (произвольный доступ к кадру).
+
+Файлы .mjpg от V4L2VideoTester.capture_video (v4l2-ctl --stream-to) - это
+склеенные JPEG кадры без заголовка. Индексатор отображает файл в память (mmap),
+ищет маркеры начала (FF D8) и конца (FF D9) кадров векторно через numpy
+и сохраняет смещения в файл-спутник <файл>.idx.npz. После этого кадр N
+или диапазон по времени читается без чтения остального файла. Если маркеры
+не чередуются (миниатюра EXIF в APP1 со своими FF D8 / FF D9), кадр
+проходится по сегментам заголовка до SOS, и конец - первый EOI после него.
+
+Сегменты MJPEG-AVI из recorder.py индексируются по структуре RIFF, а не по
+маркерам: байты FF D8 / FF D9 встречаются и в полях размеров чанков 00dc,
+и в записях idx1. Смещения берутся из idx1 (векторно), а если его нет
+(запись еще идет) - обходом чанков списка movi. Пустой чанк 00dc - повтор
+предыдущего кадра (так запись сохраняет время при паузах в кадрах), пустые
+чанки в начале - первого кадра.
+"""
+
+import mmap
+import os
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+INDEX_VERSION = 3
+INDEX_SUFFIX = '.idx.npz'
+
+# Запись idx1: id чанка, флаги, смещение, размер
+_IDX1_ENTRY = np.dtype([('chunk', 'S4'), ('flags', '<u4'), ('offset', '<u4'), ('size', '<u4')])
+
+
+def _find_markers(data, chunk_size):
+    """
+    Позиции маркеров SOI (FF D8) и EOI (FF D9) - векторный поиск по блокам
+
+    За один проход по блоку ищутся байты FF, затем по ним проверяется
+    следующий байт. В сжатых данных JPEG байт FF редок (FF 00), поэтому
+    второй шаг работает с малым массивом.
+    """
+    total = len(data)
+    soi_found = []
+    eoi_found = []
+
+    for start in range(0, total, chunk_size):
+        # +1 байт перекрытия: маркер на границе блоков не теряется
+        end = min(total, start + chunk_size + 1)
+        block = np.frombuffer(data, dtype=np.uint8, count=end - start, offset=start)
+        ff = np.flatnonzero(block[:-1] == 0xFF)
+        if ff.size == 0:
+            continue
+        following = block[ff + 1]
+        soi_found.append(ff[following == 0xD8] + start)
+        eoi_found.append(ff[following == 0xD9] + start)
+
+    if not soi_found:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    return (np.concatenate(soi_found).astype(np.int64),
+            np.concatenate(eoi_found).astype(np.int64))
+
+
+def _is_avi(data):
+    return len(data) >= 12 and data[0:4] == b'RIFF' and data[8:12] == b'AVI '
+
+
+def _is_video_chunk(chunk):
+    """Чанк кадра потока видео: 00dc (сжатый) или 00db"""
+    return chunk[2:4] in (b'dc', b'db')
+
+
+def _read_avi_fps(data):
+    """FPS из заголовка AVI (сегменты recorder.py), иначе 0"""
+    if len(data) >= 36 and _is_avi(data):
+        us_per_frame = struct.unpack('<I', data[32:36])[0]
+        if us_per_frame:
+            return 1000000.0 / us_per_frame
+    return 0.0
+
+
+def _find_movi(data):
+    """
+    Позиция fourcc 'movi' и конец списка movi
+
+    Незакрытый сегмент записи хранит в заголовке размер-заглушку -
+    тогда список считается до конца файла.
+    """
+    total = len(data)
+    pos = 12
+    while pos + 12 <= total:
+        chunk, size = struct.unpack_from('<4sI', data, pos)
+        if chunk == b'LIST' and data[pos + 8:pos + 12] == b'movi':
+            end = pos + 8 + size if size > 4 else total
+            return pos + 8, min(end, total)
+        pos += 8 + size + (size % 2)
+    return None, None
+
+
+def _read_idx1(data, movi, movi_end):
+    """
+    Смещения и размеры кадров из индекса idx1 (None - индекса нет или он не сходится с файлом)
+
+    Смещения idx1 по стандарту отсчитываются от fourcc 'movi', но некоторые
+    программы пишут абсолютные - база определяется по первому кадру.
+    """
+    total = len(data)
+    pos = movi_end + (movi_end % 2)
+    while pos + 8 <= total:
+        chunk, size = struct.unpack_from('<4sI', data, pos)
+        if chunk == b'idx1':
+            break
+        pos += 8 + size + (size % 2)
+    else:
+        return None
+
+    count = min(size, total - pos - 8) // _IDX1_ENTRY.itemsize
+    entries = np.frombuffer(data, dtype=_IDX1_ENTRY, count=count, offset=pos + 8)
+    entries = entries[np.char.endswith(entries['chunk'], b'dc') | np.char.endswith(entries['chunk'], b'db')]
+    if entries.size == 0:
+        return None
+
+    first = int(entries['offset'][0])
+    for base in (movi, 0):
+        if data[base + first:base + first + 4] == entries['chunk'][0]:
+            break
+    else:
+        return None
+
+    offsets = entries['offset'].astype(np.int64) + base + 8
+    sizes = entries['size'].astype(np.int64)
+    if int(offsets[-1] + sizes[-1]) > total:
+        return None
+    return offsets, sizes
+
+
+def _walk_movi(data, movi, movi_end):
+    """Смещения и размеры кадров обходом чанков movi (оборванный последний чанк отбрасывается)"""
+    offsets = []
+    sizes = []
+    pos = movi + 4
+    while pos + 8 <= movi_end:
+        chunk, size = struct.unpack_from('<4sI', data, pos)
+        if chunk == b'LIST':
+            # Группа 'rec ' - ее чанки идут следом
+            pos += 12
+            continue
+        if pos + 8 + size > movi_end:
+            break
+        if _is_video_chunk(chunk):
+            offsets.append(pos + 8)
+            sizes.append(size)
+        pos += 8 + size + (size % 2)
+    return np.asarray(offsets, dtype=np.int64), np.asarray(sizes, dtype=np.int64)
+
+
+def _repeat_empty_frames(offsets, sizes):
+    """
+    Пустые чанки AVI - повтор предыдущего кадра: им назначаются его смещение и размер,
+    чтобы номер кадра по-прежнему соответствовал времени (пустые чанки до первого
+    кадра - его слоты, они не отбрасываются)
+    """
+    real = sizes > 0
+    if real.all():
+        return offsets, sizes
+    if not real.any():
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    source = np.where(real, np.arange(sizes.size), 0)
+    np.maximum.accumulate(source, out=source)
+    first = int(np.argmax(real))
+    source[:first] = first
+    return offsets[source], sizes[source]
+
+
+def _index_avi(data):
+    """Кадры MJPEG-AVI по idx1 или чанкам movi"""
+    movi, movi_end = _find_movi(data)
+    if movi is None:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    frames = _read_idx1(data, movi, movi_end)
+    if frames is None:
+        frames = _walk_movi(data, movi, movi_end)
+    return _repeat_empty_frames(*frames)
+
+
+def _jpeg_end(data, start, eoi):
+    """
+    Конец JPEG, начинающегося с SOI в start (None - заголовок оборван или поврежден)
+
+    Сегменты до SOS пропускаются по их длинам (так пропускается и миниатюра
+    EXIF внутри APP1), конец - первый EOI после заголовка SOS: в сжатых
+    данных FF экранируется (FF 00), EOI там не встречается.
+    """
+    total = len(data)
+    pos = start + 2
+    while pos + 4 <= total:
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1  # Байт-заполнитель перед маркером
+            continue
+        if marker == 0xD9:
+            return pos + 2
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            pos += 2  # Маркеры без длины
+            continue
+        length = struct.unpack_from('>H', data, pos + 2)[0]
+        if marker == 0xDA:
+            j = np.searchsorted(eoi, pos + 2 + length)
+            return int(eoi[j]) + 2 if j < eoi.size else None
+        pos += 2 + length
+    return None
+
+
+def _pair_frames(data, soi, eoi):
+    """
+    Кадры из позиций маркеров: начало - SOI, конец - EOI после данных кадра
+
+    Если маркеры строго чередуются - конец кадра первый EOI после SOI
+    (векторно), иначе кадр проходится по сегментам (_jpeg_end), а при
+    поврежденном заголовке берется первый EOI. Следующий кадр начинается
+    с первого SOI после конца предыдущего, поэтому мусор между кадрами пропускается.
+    """
+    offsets = []
+    sizes = []
+    if soi.size == 0 or eoi.size == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    # Обычный случай: маркеры строго чередуются SOI, EOI, SOI, EOI...
+    if soi.size == eoi.size and np.all(soi < eoi) and np.all(eoi[:-1] < soi[1:]):
+        return soi, eoi + 2 - soi
+
+    i = 0
+    while i < soi.size:
+        start = int(soi[i])
+        end = _jpeg_end(data, start, eoi)
+        if end is None:
+            j = np.searchsorted(eoi, start + 2)
+            if j >= eoi.size:
+                break  # Оборванный последний кадр
+            end = int(eoi[j]) + 2
+        offsets.append(start)
+        sizes.append(end - start)
+        i = np.searchsorted(soi, end)
+
+    return np.asarray(offsets, dtype=np.int64), np.asarray(sizes, dtype=np.int64)
+
+
+def index_path(path):
+    """Путь к файлу-спутнику индекса"""
+    return path + INDEX_SUFFIX
+
+
+def build_index(path, fps=None, chunk_mb=64, save=True):
+    """
+    Построение индекса кадров
+
+    Args:
+        path: MJPEG файл (.mjpg или MJPEG-AVI)
+        fps: Частота кадров записи (для выборки по времени)
+        chunk_mb: Размер блока векторного поиска маркеров (.mjpg)
+        save: Сохранить файл-спутник
+
+    Returns:
+        Словарь: offsets, sizes, fps, build_s, file_size
+    """
+    start = time.perf_counter()
+    file_size = os.path.getsize(path)
+
+    with open(path, 'rb') as f:
+        if file_size == 0:
+            offsets = sizes = np.empty(0, dtype=np.int64)
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                # Последовательное чтение: ядро читает файл с упреждением
+                if hasattr(data, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+                    data.madvise(mmap.MADV_SEQUENTIAL)
+                if _is_avi(data):
+                    offsets, sizes = _index_avi(data)
+                    fps = fps or _read_avi_fps(data)
+                else:
+                    soi, eoi = _find_markers(data, chunk_mb * 1024 * 1024)
+                    offsets, sizes = _pair_frames(data, soi, eoi)
+
+    index = {
+        'offsets': offsets,
+        'sizes': sizes,
+        'fps': float(fps or 0.0),
+        'file_size': file_size,
+        'mtime': os.path.getmtime(path),
+        'build_s': time.perf_counter() - start,
+    }
+
+    if save:
+        np.savez(index_path(path), version=INDEX_VERSION, offsets=offsets, sizes=sizes.astype(np.int32),
+                 fps=index['fps'], file_size=file_size, mtime=index['mtime'])
+    return index
+
+
+def load_index(path):
+    """Загрузка файла-спутника, если он соответствует файлу записи"""
+    sidecar = index_path(path)
+    if not os.path.exists(sidecar):
+        return None
+
+    try:
+        with np.load(sidecar) as data:
+            if int(data['version']) != INDEX_VERSION:
+                return None
+            if int(data['file_size']) != os.path.getsize(path) or \
+                    float(data['mtime']) != os.path.getmtime(path):
+                # Файл дописан или изменен - индекс устарел
+                return None
+            return {
+                'offsets': data['offsets'].astype(np.int64),
+                'sizes': data['sizes'].astype(np.int64),
+                'fps': float(data['fps']),
+                'file_size': int(data['file_size']),
+                'mtime': float(data['mtime']),
+                'build_s': 0.0,
+            }
+    except (OSError, ValueError, KeyError) as e:
+        print(f"⚠️ Не удалось прочитать индекс {sidecar}: {e}")
+        return None
+
+
+class MjpegReader:
+    """Произвольный доступ к кадрам MJPEG файла по индексу"""
+
+    def __init__(self, path, fps=None, rebuild=False):
+        """
+        Args:
+            path: MJPEG файл
+            fps: Частота кадров (если не сохранена в индексе)
+            rebuild: Перестроить индекс даже при наличии файла-спутника
+        """
+        self.path = path
+        index = None if rebuild else load_index(path)
+        self.index_loaded = index is not None
+        if index is None:
+            index = build_index(path, fps=fps)
+
+        self.offsets = index['offsets']
+        self.sizes = index['sizes']
+        self.fps = float(fps or index['fps'] or 0.0)
+        self.build_s = index['build_s']
+
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if index['file_size'] else b''
+
+    def __len__(self):
+        return int(self.offsets.size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    @property
+    def duration(self):
+        """Длительность записи (с), если известен FPS"""
+        return len(self) / self.fps if self.fps else None
+
+    def get_jpeg(self, n):
+        """Сжатые данные кадра N (без чтения остального файла)"""
+        if n < 0:
+            n += len(self)
+        if not 0 <= n < len(self):
+            raise IndexError(f"Кадр {n} вне диапазона 0..{len(self) - 1}")
+        start = int(self.offsets[n])
+        return self.data[start:start + int(self.sizes[n])]
+
+    def get_frame(self, n, flags=cv2.IMREAD_COLOR):
+        """Декодированный кадр N"""
+        jpeg = self.get_jpeg(n)
+        return cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), flags)
+
+    def frame_at(self, t):
+        """Номер кадра для времени t (с от начала записи)"""
+        if not self.fps:
+            raise ValueError("FPS записи неизвестен - укажите fps")
+        return min(len(self) - 1, max(0, int(t * self.fps)))
+
+    def time_range(self, t_start, t_end):
+        """Номера кадров интервала времени, включая кадр момента t_end"""
+        return range(self.frame_at(t_start), self.frame_at(t_end) + 1)
+
+    def iter_jpegs(self, frames):
+        """Сжатые кадры по списку/диапазону номеров"""
+        for n in frames:
+            yield n, self.get_jpeg(n)
+
+    def decode_range(self, frames, workers=4, flags=cv2.IMREAD_COLOR, func=None):
+        """
+        Параллельное декодирование кадров (cv2.imdecode отпускает GIL)
+
+        Args:
+            frames: Номера кадров (range, список)
+            workers: Количество потоков
+            flags: Флаги cv2.imdecode (IMREAD_GRAYSCALE для анализа)
+            func: Функция анализа кадра func(n, frame) - вместо кадров
+                  возвращаются ее результаты (кадры не накапливаются в памяти)
+
+        Returns:
+            Список кадров или результатов func в порядке frames
+        """
+        def work(n):
+            frame = self.get_frame(n, flags)
+            return func(n, frame) if func else frame
+
+        frames = list(frames)
+        if workers <= 1:
+            return [work(n) for n in frames]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(work, frames))
+
+    def get_status(self):
+        return {
+            'path': self.path,
+            'frames': len(self),
+            'fps': self.fps,
+            'duration_s': round(self.duration, 2) if self.duration else None,
+            'index_loaded': self.index_loaded,
+            'build_s': round(self.build_s, 3),
+        }
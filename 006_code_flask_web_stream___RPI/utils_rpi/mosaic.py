@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+
+# mosaic.py
+
+"""
+Мозаика всех открытых камер в одном потоке (/video_feed/mosaic).
+
+Вместо нескольких вкладок (каждая - свой слот стрима и свое кодирование)
+последние кадры всех камер раскладываются плиткой на одном холсте.
+Холст выделяется один раз, кадры уменьшаются сразу в свою клетку
+(cv2.resize с dst - без промежуточных копий), неизменившиеся плитки
+не перерисовываются. Холст сжимается в JPEG один раз на тик и раздается
+всем зрителям мозаики.
+
+Частота мозаики задается таймером и не зависит от камер: на каждом тике
+берется последний имеющийся кадр каждой камеры, медленная камера просто
+дольше показывает старый кадр (с пометкой, если он устарел).
+"""
+
+import math
+import threading
+import time
+
+from utils_rpi.frame_hub import CapturedFrame, EncodedFrame, mjpeg_part
+from utils_rpi.lazy_import import lazy_import
+
+# Тяжелые модули импортируются при первом обращении: импорт сервера их не загружает
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+
+class MosaicComposer:
+    """Раскладка кадров на заранее выделенном холсте"""
+
+    def __init__(self, width=1280, height=720, columns=0, labels=True, stale_s=3.0):
+        """
+        Args:
+            width, height: Размер холста
+            columns: Число столбцов (0 - автоматически, ceil(sqrt(N)))
+            labels: Подписывать плитки именем камеры
+            stale_s: Возраст кадра, после которого плитка помечается устаревшей
+        """
+        self.width = width
+        self.height = height
+        self.columns = columns
+        self.labels = labels
+        self.stale_s = stale_s
+
+        self.canvas = np.zeros((height, width, 3), dtype=np.uint8)
+        self.cells = []
+        # Индекс плитки -> (камера, ключ кадра, устарел) последней отрисовки
+        self.drawn = {}
+        # Индекс плитки -> (ox, oy, w, h) кадра внутри клетки
+        self.fits = {}
+
+        # Статистика
+        self.tiles_resized = 0
+        self.tiles_reused = 0
+
+    def _layout(self, count):
+        """Клетки (x, y, w, h) для count плиток; холст очищается"""
+        self.canvas[:] = 0
+        self.drawn = {}
+        self.fits = {}
+        self.cells = []
+        if count == 0:
+            self._draw_text('No cameras', (0, 0, self.width, self.height))
+            return
+
+        cols = self.columns if self.columns > 0 else math.ceil(math.sqrt(count))
+        cols = min(cols, count)
+        rows = math.ceil(count / cols)
+        cell_w = self.width // cols
+        cell_h = self.height // rows
+        for i in range(count):
+            row, col = divmod(i, cols)
+            self.cells.append((col * cell_w, row * cell_h, cell_w, cell_h))
+
+    def _draw_text(self, text, cell, color=(200, 200, 200)):
+        x, y, w, h = cell
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        (tw, th), _ = cv2.getTextSize(text, font, 0.8, 2)
+        cv2.putText(self.canvas, text, (x + (w - tw) // 2, y + (h + th) // 2), font, 0.8, color, 2)
+
+    def _draw_label(self, text, cell, color=(255, 255, 255)):
+        x, y, _, _ = cell
+        cv2.putText(self.canvas, text, (x + 8, y + 22), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 3)
+        cv2.putText(self.canvas, text, (x + 8, y + 22), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 1)
+
+    def compose(self, sources, now=None):
+        """
+        Отрисовка последних кадров
+
+        Args:
+            sources: Список (camera_id, frame или None, capture_mono) в порядке плиток
+            now: Текущее time.monotonic() (для пометки устаревших кадров)
+
+        Returns:
+            Холст (один и тот же массив при каждом вызове)
+        """
+        now = time.monotonic() if now is None else now
+        if len(sources) != len(self.cells):
+            self._layout(len(sources))
+
+        for i, (camera_id, frame, capture_mono) in enumerate(sources):
+            cell = self.cells[i]
+            stale = frame is not None and now - capture_mono > self.stale_s
+            key = (camera_id, id(frame), capture_mono, stale)
+            if self.drawn.get(i) == key:
+                self.tiles_reused += 1
+                continue
+
+            x, y, w, h = cell
+            tile = self.canvas[y:y + h, x:x + w]
+            previous = self.drawn.get(i)
+            self.drawn[i] = key
+
+            if frame is None:
+                tile[:] = 0
+                self.fits.pop(i, None)
+                self._draw_text('No frame', cell)
+            else:
+                fh, fw = frame.shape[:2]
+                scale = min(w / fw, h / fh)
+                tw, th = max(1, int(fw * scale)), max(1, int(fh * scale))
+                fit = ((w - tw) // 2, (h - th) // 2, tw, th)
+                if self.fits.get(i) != fit or (previous is not None and previous[3]):
+                    # Поля вокруг кадра очищаются только при смене размера или снятии пометки
+                    tile[:] = 0
+                    self.fits[i] = fit
+                ox, oy = fit[:2]
+                cv2.resize(frame, (tw, th), dst=tile[oy:oy + th, ox:ox + tw],
+                           interpolation=cv2.INTER_AREA)
+                self.tiles_resized += 1
+
+            if self.labels:
+                self._draw_label(str(camera_id), cell)
+            if stale:
+                self._draw_label(f"stale {now - capture_mono:.0f}s", (x, y + 24, w, h), (0, 0, 255))
+
+        return self.canvas
+
+
+class MosaicStream:
+    """Общий поток мозаики: кодируется один раз и только пока есть зрители"""
+
+    def __init__(self, config, logger, sources_fn, retain_fn=None):
+        """
+        Args:
+            config: Конфигурация (секция mosaic)
+            logger: Логгер
+            sources_fn: Функция без аргументов -> список (camera_id, frame, capture_mono)
+            retain_fn: Функция retain_fn(fps) - камерам пула хранить последний кадр
+                (fps > 0, пока у мозаики есть зрители; 0 - перестать)
+        """
+        mosaic_config = config.get('mosaic', {}) or {}
+
+        self.logger = logger
+        self.sources_fn = sources_fn
+        self.retain_fn = retain_fn
+        self.enabled = mosaic_config.get('enabled', True)
+        self.fps = float(mosaic_config.get('fps', 5))
+        self.jpeg_quality = int(mosaic_config.get('jpeg_quality', 70))
+        self.max_streams = int(mosaic_config.get('max_streams', 10))
+
+        self.composer = MosaicComposer(int(mosaic_config.get('width', 1280)),
+                                       int(mosaic_config.get('height', 720)),
+                                       int(mosaic_config.get('columns', 0)),
+                                       mosaic_config.get('labels', True),
+                                       float(mosaic_config.get('stale_s', 3.0)))
+
+        self.condition = threading.Condition()
+        self.latest = None
+        self.seq = 0
+
+        self.lock = threading.Lock()
+        self.subscribers = 0
+        self.thread = None
+
+        # Статистика
+        self.rejected_total = 0
+        self.frames_encoded = 0
+        self.compose_ms_total = 0.0
+        self.encode_ms_total = 0.0
+        self.bytes_total = 0
+        self.late_ticks = 0
+        self.last_tiles = 0
+
+    def acquire(self):
+        """
+        Место зрителя мозаики
+
+        Returns:
+            True - зритель принят (поток мозаики запускается при первом зрителе)
+        """
+        with self.lock:
+            if not self.enabled or self.subscribers >= self.max_streams:
+                self.rejected_total += 1
+                return False
+            self.subscribers += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._compose_loop, daemon=True)
+                self.thread.start()
+            return True
+
+    def release(self):
+        with self.lock:
+            self.subscribers = max(0, self.subscribers - 1)
+        with self.condition:
+            self.condition.notify_all()
+
+    def set_fps(self, fps):
+        """Частота мозаики на лету (камеры пула хранят кадры с той же частотой)"""
+        self.fps = float(fps)
+        with self.lock:
+            if self.thread is not None:
+                self._set_retain(self.fps)
+
+    def _set_retain(self, fps):
+        if self.retain_fn is None:
+            return
+        try:
+            self.retain_fn(fps)
+        except Exception as e:
+            self.logger.log_error(f"Мозаика: ошибка переключения кадров пула: {e}")
+
+    def _compose_loop(self):
+        """Тик с частотой fps: последние кадры -> холст -> JPEG"""
+        self._set_retain(self.fps)
+        print(f"🧩 Мозаика запущена ({self.composer.width}x{self.composer.height}, {self.fps} FPS)")
+        next_ts = time.monotonic()
+        while True:
+            with self.lock:
+                if self.subscribers == 0:
+                    # Под блокировкой: новый зритель не запустит поток раньше, чем пул отпустит кадры
+                    self._set_retain(0)
+                    self.thread = None
+                    break
+            try:
+                self._tick()
+            except Exception as e:
+                self.logger.log_error(f"Ошибка мозаики: {e}")
+                time.sleep(0.5)
+
+            # fps читается на каждом тике - может меняться терморегулятором
+            next_ts += 1.0 / self.fps if self.fps > 0 else 1.0
+            delay = next_ts - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Не успели - не догоняем пачкой кадров, сдвигаем расписание
+                self.late_ticks += 1
+                next_ts = time.monotonic()
+
+        print("🧩 Мозаика остановлена (нет зрителей)")
+
+    def _tick(self):
+        start = time.perf_counter()
+        sources = sorted(self.sources_fn(), key=lambda source: str(source[0]))
+        now = time.monotonic()
+        canvas = self.composer.compose(sources, now)
+        composed = time.perf_counter()
+
+        ret, buffer = cv2.imencode('.jpg', canvas, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ret:
+            return
+        jpeg = buffer.tobytes()
+        encoded_at = time.perf_counter()
+
+        # Время захвата мозаики - самый старый кадр на ней
+        captures = [capture_mono for _, frame, capture_mono in sources if frame is not None]
+        captured = CapturedFrame(canvas, camera_id='mosaic',
+                                 capture_mono=min(captures) if captures else now)
+
+        self.last_tiles = len(sources)
+        self.frames_encoded += 1
+        self.compose_ms_total += (composed - start) * 1000
+        self.encode_ms_total += (encoded_at - composed) * 1000
+        self.bytes_total += len(jpeg)
+        with self.condition:
+            self.seq += 1
+            self.latest = EncodedFrame(self.seq, jpeg, captured, False, (encoded_at - composed) * 1000)
+            self.condition.notify_all()
+
+    def wait_next(self, last_seq, timeout=2.0):
+        """
+        Ожидание кадра мозаики новее last_seq
+
+        Returns:
+            EncodedFrame или None по таймауту
+        """
+        deadline = time.time() + timeout
+        with self.condition:
+            while self.latest is None or self.latest.seq <= last_seq:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+            return self.latest
+
+    def generate(self):
+        """Генератор MJPEG мозаики (до отключения зрителя)"""
+        last_seq = 0
+        while True:
+            encoded = self.wait_next(last_seq, timeout=2.0)
+            if encoded is not None:
+                last_seq = encoded.seq
+                yield mjpeg_part(encoded.jpeg, encoded)
+
+    def get_status(self):
+        frames = self.frames_encoded
+        return {
+            'enabled': self.enabled,
+            'subscribers': self.subscribers,
+            'max_streams': self.max_streams,
+            'resolution': f"{self.composer.width}x{self.composer.height}",
+            'fps': self.fps,
+            'tiles': self.last_tiles,
+            'rejected_total': self.rejected_total,
+            'frames_encoded': frames,
+            'avg_compose_ms': round(self.compose_ms_total / frames, 2) if frames else 0.0,
+            'avg_encode_ms': round(self.encode_ms_total / frames, 2) if frames else 0.0,
+            'avg_kb': round(self.bytes_total / frames / 1024, 1) if frames else 0.0,
+            'late_ticks': self.late_ticks,
+            'tiles_resized': self.composer.tiles_resized,
+            'tiles_reused': self.composer.tiles_reused,
+        }
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+
+# motion_gate.py
+
+"""
+Детектор движения для снижения частоты стрима и записи в покое.
+
+Каждый кадр сравнивается с фоновой моделью на сильно уменьшенной
+серой копии (прореживание + усреднение). Пока в кадре ничего не меняется,
+кадры публикуются с частотой idle_fps; первый же кадр с движением
+публикуется сразу и возвращает полную частоту.
+"""
+
+import time
+
+from utils_rpi.lazy_import import lazy_import
+
+# Тяжелые модули импортируются при первом обращении: импорт сервера их не загружает
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+
+class MotionGate:
+    """Решение о публикации кадра по наличию движения"""
+
+    def __init__(self, config):
+        self.configure(config)
+
+        self.background = None
+        self.motion = True
+        self.motion_score = 0.0
+        self.last_motion_ts = 0.0
+        self.last_publish_ts = 0.0
+
+        # Статистика
+        self.frames_checked = 0
+        self.frames_skipped = 0
+        self.skip_rate = 0.0  # Скользящая доля пропущенных кадров (текущая экономия)
+        self.check_ms_total = 0.0
+        self.idle_since = None
+        self.idle_time_total = 0.0
+
+    def configure(self, config):
+        """
+        Параметры из секции motion_gate (применяются со следующего кадра)
+
+        Все значения приводятся к типам до присваивания: при ошибке
+        (ValueError / TypeError) прежние параметры остаются в силе.
+        """
+        gate_config = config.get('motion_gate', {}) or {}
+
+        enabled = gate_config.get('enabled', False)
+        idle_fps = float(gate_config.get('idle_fps', 1.0))
+        downscale_width = int(gate_config.get('downscale_width', 64))
+        threshold = float(gate_config.get('threshold', 12))
+        min_area = float(gate_config.get('min_area', 0.002))
+        alpha = float(gate_config.get('background_alpha', 0.05))
+        hold_s = float(gate_config.get('hold_s', 2.0))
+
+        if getattr(self, 'downscale_width', downscale_width) != downscale_width:
+            self.background = None  # Другой размер фоновой модели
+
+        self.enabled = enabled
+        self.idle_fps = idle_fps
+        self.downscale_width = downscale_width
+        self.threshold = threshold
+        self.min_area = min_area
+        self.alpha = alpha
+        self.hold_s = hold_s
+
+    def reset(self):
+        """Сброс фоновой модели (смена камеры)"""
+        self.background = None
+        self.motion = True
+        self.last_motion_ts = time.time()
+
+    def _small_gray(self, frame):
+        """Уменьшенная серая копия: прореживание до ~2x целевой ширины + INTER_AREA"""
+        h, w = frame.shape[:2]
+        step = max(1, w // (self.downscale_width * 2))
+        sampled = frame[::step, ::step]
+        if sampled.ndim == 3:
+            sampled = cv2.cvtColor(sampled, cv2.COLOR_BGR2GRAY)
+        height = max(1, int(round(sampled.shape[0] * self.downscale_width / sampled.shape[1])))
+        return cv2.resize(sampled, (self.downscale_width, height), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    def should_publish(self, frame, now=None):
+        """
+        Проверка кадра
+
+        Returns:
+            True - кадр нужно кодировать и публиковать (движение или пора idle-кадра)
+        """
+        if not self.enabled:
+            return True
+
+        now = now if now is not None else time.time()
+        start = time.perf_counter()
+
+        gray = self._small_gray(frame)
+        if self.background is None or self.background.shape != gray.shape:
+            self.background = gray
+            changed = 1.0
+        else:
+            diff = cv2.absdiff(gray, self.background)
+            changed = float(np.count_nonzero(diff > self.threshold)) / diff.size
+            # Медленное обновление фона: освещение и шум не считаются движением
+            cv2.accumulateWeighted(gray, self.background, self.alpha)
+
+        self.frames_checked += 1
+        self.check_ms_total += (time.perf_counter() - start) * 1000
+        self.motion_score = changed
+
+        if changed >= self.min_area:
+            self.last_motion_ts = now
+
+        was_motion = self.motion
+        self.motion = now - self.last_motion_ts <= self.hold_s
+
+        if self.motion:
+            self.skip_rate *= 0.98
+            if not was_motion and self.idle_since is not None:
+                self.idle_time_total += now - self.idle_since
+                self.idle_since = None
+            self.last_publish_ts = now
+            return True
+
+        if was_motion:
+            self.idle_since = now
+
+        # Покой: редкий кадр, чтобы клиенты видели живую картинку
+        if self.idle_fps > 0 and now - self.last_publish_ts >= 1.0 / self.idle_fps:
+            self.last_publish_ts = now
+            self.skip_rate *= 0.98
+            return True
+
+        self.frames_skipped += 1
+        self.skip_rate = self.skip_rate * 0.98 + 0.02
+        return False
+
+    def get_status(self, avg_encode_ms=0.0, avg_jpeg_bytes=0, source_fps=0.0):
+        """
+        Состояние и оценка экономии
+
+        Args:
+            avg_encode_ms: Среднее время кодирования кадра (для оценки CPU)
+            avg_jpeg_bytes: Средний размер JPEG (для оценки трафика)
+            source_fps: Частота кадров источника
+        """
+        if not self.enabled:
+            return {'enabled': False}
+
+        skipped_share = self.frames_skipped / self.frames_checked if self.frames_checked else 0.0
+        skipped_per_s = self.skip_rate * source_fps
+        idle_time = self.idle_time_total + (time.time() - self.idle_since if self.idle_since else 0.0)
+        return {
+            'enabled': True,
+            'state': 'motion' if self.motion else 'idle',
+            'motion_score': round(self.motion_score, 4),
+            'seconds_since_motion': round(time.time() - self.last_motion_ts, 1) if self.last_motion_ts else None,
+            'idle_fps': self.idle_fps,
+            'frames_checked': self.frames_checked,
+            'frames_skipped': self.frames_skipped,
+            'skipped_percent': round(skipped_share * 100, 1),
+            'idle_time_s': round(idle_time, 1),
+            'avg_check_ms': round(self.check_ms_total / self.frames_checked, 3) if self.frames_checked else 0.0,
+            # Текущая экономия: пропущенные кодирования (доля одного ядра) и трафик на клиента
+            'cpu_saved_percent': round(skipped_per_s * avg_encode_ms / 10.0, 1),
+            'cpu_saved_s': round(self.frames_skipped * avg_encode_ms / 1000.0, 1),
+            'bandwidth_saved_kb_s': round(skipped_per_s * avg_jpeg_bytes / 1024, 1),
+        }
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+# overflow_tier.py
+
+"""
+Уровень переполнения для /video_feed: урезанный поток вместо отказа.
+
+Когда достигнут MAX_CONCURRENT_STREAMS или MAX_STREAMS_PER_CLIENT, новые
+клиенты получают общую копию стрима низкого разрешения и с низкой частотой.
+Копия кодируется один раз для всех клиентов уровня и только пока у уровня
+есть подписчики. Кадры-заглушки ("нет сигнала", "слишком много клиентов")
+рисуются и сжимаются один раз и отдаются из памяти.
+"""
+
+import threading
+import time
+
+from utils_rpi.frame_hub import mjpeg_part
+from utils_rpi.lazy_import import lazy_import
+from utils_rpi.quality_controller import QualityController
+
+# Тяжелые модули импортируются при первом обращении: импорт сервера их не загружает
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+PLACEHOLDER_TEXT = {
+    'too_many': ('Too many streams', 'Please try again later'),
+    'no_signal': ('No signal', 'Stream is not running'),
+}
+
+
+class Placeholders:
+    """Кадры-заглушки: рисуются при первом обращении, дальше - из памяти"""
+
+    def __init__(self, width=640, height=480):
+        self.width = width
+        self.height = height
+        self._parts = {}
+        self._lock = threading.Lock()
+
+    def _render(self, kind):
+        title, subtitle = PLACEHOLDER_TEXT[kind]
+        img = np.full((self.height, self.width, 3), 40, dtype=np.uint8)
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        for text, scale, y, color in ((title, 1.0, 0.42, (255, 255, 255)),
+                                      (subtitle, 0.7, 0.52, (200, 200, 200))):
+            (w, _), _ = cv2.getTextSize(text, font, scale, 2)
+            cv2.putText(img, text, ((self.width - w) // 2, int(self.height * y)), font, scale, color, 2)
+        ret, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 80])
+        return mjpeg_part(buffer.tobytes())
+
+    def get_part(self, kind):
+        """Готовая часть multipart с заглушкой"""
+        part = self._parts.get(kind)
+        if part is None:
+            with self._lock:
+                part = self._parts.get(kind)
+                if part is None:
+                    part = self._parts[kind] = self._render(kind)
+        return part
+
+
+class OverflowTier:
+    """Общая копия стрима низкого разрешения для клиентов сверх лимита"""
+
+    def __init__(self, config, logger, frame_hub):
+        tier_config = config.get('overflow_tier', {}) or {}
+
+        self.logger = logger
+        self.frame_hub = frame_hub
+        self.enabled = tier_config.get('enabled', True)
+        self.width = int(tier_config.get('width', 320))
+        self.fps = float(tier_config.get('fps', 2))
+        self.jpeg_quality = int(tier_config.get('jpeg_quality', 50))
+        self.max_streams = int(tier_config.get('max_streams', 20))
+
+        self.placeholders = Placeholders()
+        self.quality = QualityController(config, 'overflow_target_kbps', self.jpeg_quality)
+
+        self.condition = threading.Condition()
+        self.latest_jpeg = None
+        self.latest_source = None
+        self.seq = 0
+        self.source_seq = 0
+
+        self.lock = threading.Lock()
+        self.subscribers = 0
+        self.thread = None
+
+        # Статистика
+        self.admitted_total = 0
+        self.rejected_total = 0
+        self.frames_encoded = 0
+        self.encode_ms_total = 0.0
+        self.bytes_total = 0
+
+    def acquire(self):
+        """
+        Место на уровне переполнения
+
+        Returns:
+            True - клиент принят (поток кодирования запускается при первом подписчике)
+        """
+        with self.lock:
+            if not self.enabled or self.subscribers >= self.max_streams:
+                self.rejected_total += 1
+                return False
+            self.subscribers += 1
+            self.admitted_total += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._encode_loop, daemon=True)
+                self.thread.start()
+            return True
+
+    def release(self):
+        with self.lock:
+            self.subscribers = max(0, self.subscribers - 1)
+        with self.condition:
+            self.condition.notify_all()
+
+    def _encode_loop(self):
+        """Уменьшение и сжатие последнего кадра FrameHub с частотой fps"""
+        next_ts = time.time()
+        while True:
+            with self.lock:
+                if self.subscribers == 0:
+                    self.thread = None
+                    return
+            try:
+                encoded = self.frame_hub.wait_next(self.source_seq, timeout=1.0)
+                if encoded is not None:
+                    self._encode(encoded)
+                # fps читается на каждом тике - может меняться терморегулятором
+                interval = 1.0 / self.fps if self.fps > 0 else 1.0
+                next_ts = max(next_ts + interval, time.time())
+                delay = next_ts - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            except Exception as e:
+                self.logger.log_error(f"Ошибка кодирования уровня переполнения: {e}")
+                time.sleep(0.5)
+
+    def _encode(self, encoded):
+        start = time.perf_counter()
+        frame = encoded.frame
+        h, w = frame.shape[:2]
+        width = int(self.width * self.quality.scale) if self.quality.enabled else self.width
+        if w > width:
+            frame = cv2.resize(frame, (width, max(1, int(h * width / w))), interpolation=cv2.INTER_AREA)
+        jpeg_quality = self.quality.jpeg_quality if self.quality.enabled else self.jpeg_quality
+        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+        if not ret:
+            return
+        self.quality.update(len(buffer), self.fps)
+
+        jpeg = buffer.tobytes()
+        self.frames_encoded += 1
+        self.encode_ms_total += (time.perf_counter() - start) * 1000
+        self.bytes_total += len(buffer)
+        self.source_seq = encoded.seq
+        with self.condition:
+            self.seq += 1
+            self.latest_jpeg = jpeg
+            self.latest_source = encoded
+            self.condition.notify_all()
+
+    def wait_next(self, last_seq, timeout=2.0):
+        """
+        Ожидание кадра уровня новее last_seq
+
+        Returns:
+            (seq, часть multipart с заголовками исходного кадра) или (last_seq, None) по таймауту
+        """
+        deadline = time.time() + timeout
+        with self.condition:
+            while self.seq <= last_seq:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return last_seq, None
+                self.condition.wait(remaining)
+            seq, jpeg, source = self.seq, self.latest_jpeg, self.latest_source
+        return seq, mjpeg_part(jpeg, source)
+
+    def generate(self, is_active):
+        """
+        Генератор MJPEG уровня переполнения
+
+        Args:
+            is_active: Функция - идет ли основной стрим (после остановки - заглушка и конец)
+        """
+        last_seq = 0
+        meter = self.quality.clients.register()
+        try:
+            while is_active():
+                seq, part = self.wait_next(last_seq, timeout=2.0)
+                if part is not None:
+                    last_seq = seq
+                    yield part
+                    meter.on_sent(len(part), seq)
+            yield self.placeholders.get_part('no_signal')
+        finally:
+            self.quality.clients.unregister(meter)
+
+    def get_status(self):
+        frames = self.frames_encoded
+        return {
+            'enabled': self.enabled,
+            'subscribers': self.subscribers,
+            'max_streams': self.max_streams,
+            'width': self.width,
+            'fps': self.fps,
+            'admitted_total': self.admitted_total,
+            'rejected_total': self.rejected_total,
+            'frames_encoded': frames,
+            'avg_encode_ms': round(self.encode_ms_total / frames, 2) if frames else 0.0,
+            'avg_kb': round(self.bytes_total / frames / 1024, 1) if frames else 0.0,
+            'adaptive_quality': self.quality.get_status(),
+        }
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+
+# overlay_meta.py
+
+"""
+Фигуры разметки для отрисовки на стороне браузера (/api/overlay/stream).
+
+Разметка, нарисованная на сервере (?overlay=tags), - отдельная копия кадра
+и отдельное кодирование на каждый вид разметки. Здесь сервер отдает только
+геометрию, а веб-интерфейс (OverlayLayer в static/js/app.js) рисует ее на
+canvas поверх обычного /video_feed: поток кодируется один раз, какие бы
+слои ни выбрали зрители.
+
+На каждый результат TagAnalysis - событие SSE с фигурами в пикселях кадра
+камеры (целые числа, компактный JSON), ключ - номер кадра (seq) и время
+захвата (cm, time.monotonic сервера - те же часы, что X-Capture-Monotonic
+в заголовках кадров /video_feed):
+
+    {"seq":182,"cm":1234.567,"w":1280,"h":720,"tags":[
+      {"id":3,"t":1,"c":[x0,y0,...,x3,y3],"a":[ox,oy,xx,xy,yx,yy,zx,zy],
+       "f":{"FRONT":[...8 чисел],...},"v":["FRONT","LEFT"]}]}
+
+c - углы метки, a - проекция осей длиной axis_length_m (как draw_axes_debug
+трекера), f / v - грани усеченной пирамиды (PyramidGeometry трекера) в позе
+целевой метки и видимые грани. Фигуры считаются один раз на результат.
+Неизменившиеся фигуры не отправляются (раз в refresh_s - повтор, чтобы
+браузер не считал разметку устаревшей).
+"""
+
+import os
+import threading
+import time
+
+import yaml
+
+from utils_rpi.lazy_import import lazy_import
+from utils_rpi.pose_feed import compact_json
+from utils_rpi.tag_analysis import import_tracker_module
+
+# Тяжелые модули импортируются при первом обращении: импорт сервера их не загружает
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+META_DEFAULTS = {
+    'enabled': True,
+    'max_subscribers': 16,
+    'axis_length_m': 0.05,
+    'pyramid': True,          # Грани пирамиды для целевой метки (секция pyramid конфигурации трекера)
+    'refresh_s': 1.0,
+    'stale_s': 2.0,           # Браузер не рисует фигуры по кадру, снятому раньше показанного на stale_s
+    'keepalive_s': 15.0,
+}
+
+
+def flat_points(points):
+    """Точки (N, 2) -> [x0, y0, x1, y1, ...] целыми пикселями"""
+    return [int(round(float(value))) for value in np.asarray(points).reshape(-1)]
+
+
+class OverlayMeta:
+    """Геометрия разметки по результатам TagAnalysis и поток SSE для браузера"""
+
+    def __init__(self, config, logger, tag_analysis):
+        meta_config = dict(META_DEFAULTS)
+        meta_config.update(config.get('overlay_meta', {}) or {})
+
+        self.logger = logger
+        self.tag_analysis = tag_analysis
+        self.enabled = meta_config['enabled']
+        self.max_subscribers = int(meta_config['max_subscribers'])
+        self.axis_length_m = float(meta_config['axis_length_m'])
+        self.pyramid_enabled = meta_config['pyramid']
+        self.refresh_s = float(meta_config['refresh_s'])
+        self.stale_s = float(meta_config['stale_s'])
+        self.keepalive_s = float(meta_config['keepalive_s'])
+
+        self.lock = threading.Lock()
+        self.subscribers = 0
+        self.rejected = 0
+        # Геометрия пирамиды в метрах: {грань: вершины (4, 3)}; загружается при первом результате
+        self.pyramid = None
+        self.pyramid_geometry = None
+        # (seq, фигуры, JSON фигур без seq / cm)
+        self._shapes = (None, None, None)
+
+        # Статистика
+        self.results_shaped = 0
+        self.shape_ms_total = 0.0
+        self.events_sent = 0
+        self.events_skipped = 0
+        self.bytes_sent = 0
+
+    def available(self):
+        return self.enabled and self.tag_analysis.running
+
+    def _load_pyramid(self):
+        """PyramidGeometry трекера (мм -> м, поза метки - в метрах)"""
+        if self.pyramid is not None or not self.pyramid_enabled:
+            return
+        self.pyramid = {}
+        try:
+            PyramidGeometry = import_tracker_module(
+                self.tag_analysis.tracker_dir, 'src.detection.pyramid_geometry').PyramidGeometry
+            path = os.path.join(self.tag_analysis.tracker_dir, self.tag_analysis.tracker_config)
+            with open(path, 'r', encoding='utf-8') as f:
+                geometry = PyramidGeometry(yaml.safe_load(f)['pyramid'])
+        except (ImportError, OSError, KeyError) as e:
+            print(f"⚠️ Разметка: геометрия пирамиды недоступна ({e})")
+            return
+        self.pyramid_geometry = geometry
+        self.pyramid = {name: geometry.get_face_vertices_3d(name).astype(np.float64) / 1000.0
+                        for name in geometry.get_all_faces()}
+
+    def _tag_shapes(self, tag, camera_matrix, dist_coeffs):
+        entry = {'id': tag['id'], 't': 1 if tag['target'] else 0, 'c': flat_points(tag['corners'])}
+        pose = tag.get('pose')
+        if pose is None:
+            return entry
+        rvec = np.array(pose['rvec'], dtype=np.float64).reshape(3, 1)
+        tvec = np.array(pose['tvec_m'], dtype=np.float64).reshape(3, 1)
+
+        size = self.axis_length_m
+        axes = np.array([[0, 0, 0], [size, 0, 0], [0, size, 0], [0, 0, size]], dtype=np.float64)
+        points, _ = cv2.projectPoints(axes, rvec, tvec, camera_matrix, dist_coeffs)
+        entry['a'] = flat_points(points)
+
+        if tag['target'] and self.pyramid:
+            faces = {}
+            visible = []
+            for name, vertices in self.pyramid.items():
+                points, _ = cv2.projectPoints(vertices, rvec, tvec, camera_matrix, dist_coeffs)
+                faces[name] = flat_points(points)
+                if self.pyramid_geometry.is_face_visible(name, rvec, tvec)[0]:
+                    visible.append(name)
+            entry['f'] = faces
+            entry['v'] = visible
+        return entry
+
+    def shapes(self, result):
+        """
+        Фигуры результата (кэш по номеру кадра)
+
+        Returns:
+            (фигуры, JSON фигур без seq / cm - для сравнения с отправленными)
+        """
+        with self.lock:
+            seq, shapes, text = self._shapes
+            if seq == result.seq:
+                return shapes, text
+
+        start = time.perf_counter()
+        self._load_pyramid()
+        width, height = result.frame_size
+        fx, fy, cx, cy = self.tag_analysis.camera_params(width, height)
+        camera_matrix = np.array([[fx, 0, cx], [0, fy, cy], [0, 0, 1]], dtype=np.float64)
+        # Поза оценена детектором без учета дисторсии - проецируем так же
+        dist_coeffs = np.zeros((4, 1))
+        shapes = {
+            'w': width,
+            'h': height,
+            'tags': [self._tag_shapes(tag, camera_matrix, dist_coeffs) for tag in result.tags],
+        }
+        text = compact_json(shapes)
+        self.results_shaped += 1
+        self.shape_ms_total += (time.perf_counter() - start) * 1000
+        with self.lock:
+            self._shapes = (result.seq, shapes, text)
+        return shapes, text
+
+    def acquire(self):
+        """Место подписчика (False - лимит)"""
+        with self.lock:
+            if self.subscribers >= self.max_subscribers:
+                self.rejected += 1
+                return False
+            self.subscribers += 1
+        self.tag_analysis.acquire_results()
+        return True
+
+    def release(self):
+        with self.lock:
+            self.subscribers = max(0, self.subscribers - 1)
+        self.tag_analysis.release_results()
+
+    def generate(self):
+        """Генератор событий SSE: первое - параметры (event: config), затем фигуры на результат"""
+        yield "retry: 2000\n\n"
+        yield f"event: config\ndata: {compact_json({'stale_s': self.stale_s, 'refresh_s': self.refresh_s})}\n\n"
+        last_seq = 0
+        last_text = None
+        last_sent = 0.0
+        last_event = time.monotonic()
+        while self.tag_analysis.running:
+            result = self.tag_analysis.wait_result(last_seq, timeout=1.0)
+            now = time.monotonic()
+            if result is None:
+                if now - last_event >= self.keepalive_s:
+                    last_event = now
+                    yield ": keepalive\n\n"
+                continue
+            last_seq = result.seq
+
+            _, text = self.shapes(result)
+            if text == last_text and now - last_sent < self.refresh_s:
+                self.events_skipped += 1
+                continue
+            last_text, last_sent, last_event = text, now, now
+            # seq и cm - в начале объекта, фигуры - готовая строка
+            event = f"id: {result.seq}\ndata: {{\"seq\":{result.seq},\"cm\":{result.capture_mono:.4f},{text[1:]}\n\n"
+            self.events_sent += 1
+            self.bytes_sent += len(event)
+            yield event
+
+    def get_status(self):
+        shaped = self.results_shaped
+        sent = self.events_sent
+        return {
+            'enabled': self.enabled,
+            'available': self.available(),
+            'subscribers': self.subscribers,
+            'max_subscribers': self.max_subscribers,
+            'rejected': self.rejected,
+            'pyramid': bool(self.pyramid),
+            'results_shaped': shaped,
+            'avg_shape_ms': round(self.shape_ms_total / shaped, 2) if shaped else 0.0,
+            'events_sent': sent,
+            'events_skipped': self.events_skipped,
+            'avg_event_bytes': round(self.bytes_sent / sent) if sent else 0,
+        }
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+
+# pose_feed.py
+
+"""
+Позы меток для внешних потребителей без видео: /api/poses/latest и поток SSE.
+
+Коду робота нужны позы, а не пиксели. PoseFeed берет результаты TagAnalysis
+и отдает для каждой метки компактный JSON (без пробелов, округленные числа):
+
+    {"tag_id":3,"rvec":[...],"tvec":[...],"euler":[r,p,y],"distance":0.41,
+     "frame_seq":1234,"capture_ts":1760000000.123}
+
+tvec и distance - в метрах, euler - roll / pitch / yaw в градусах (система
+координат трекера). Поза кодируется один раз на результат, подписчики
+получают уже готовые строки.
+
+/api/poses/stream (text/event-stream) - событие сразу после детекции
+(задержка = время детекции, без ожидания следующего кадра видео).
+Неизменившиеся позы пропускаются отдельно для каждого подписчика: смещение
+меньше translation_eps_m и поворот меньше rotation_eps_deg. Раз в refresh_s
+поза отправляется и без изменений (потребитель видит, что метка на месте),
+пропавшая метка - один раз {"tag_id":N,"lost":true,...}. Без событий дольше
+keepalive_s отправляется комментарий SSE, чтобы прокси не закрывали соединение.
+"""
+
+import json
+import threading
+import time
+from collections import deque
+
+from utils_rpi.lazy_import import lazy_import
+
+# Тяжелые модули импортируются при первом обращении: импорт сервера их не загружает
+np = lazy_import('numpy')
+
+
+FEED_DEFAULTS = {
+    'enabled': True,
+    'max_subscribers': 16,
+    'translation_eps_m': 0.0005,
+    'rotation_eps_deg': 0.2,
+    'refresh_s': 1.0,
+    'keepalive_s': 15.0,
+}
+
+
+def compact_json(value):
+    """JSON без пробелов"""
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+
+
+def pose_message(tag, result):
+    """Поза метки из результата TagAnalysis (None - поза не оценена)"""
+    pose = tag.get('pose')
+    if pose is None:
+        return None
+    return {
+        'tag_id': tag['id'],
+        'rvec': pose['rvec'],
+        'tvec': pose['tvec_m'],
+        'euler': pose['rpy_deg'],
+        'distance': pose['distance_m'],
+        'frame_seq': result.seq,
+        'capture_ts': round(result.capture_ts, 4) if result.capture_ts is not None else None,
+    }
+
+
+def pose_changed(old, new, translation_eps_m, rotation_eps_deg):
+    """Сдвиг или поворот больше порога"""
+    if np.max(np.abs(np.subtract(new['tvec'], old['tvec']))) >= translation_eps_m:
+        return True
+    # Разность углов с учетом перехода через ±180°
+    delta = (np.subtract(new['euler'], old['euler']) + 180.0) % 360.0 - 180.0
+    return np.max(np.abs(delta)) >= rotation_eps_deg
+
+
+class PoseSubscriber:
+    """Последние отправленные позы одного подписчика и статистика доставки"""
+
+    def __init__(self, client_ip):
+        self.client_ip = client_ip
+        self.started = time.monotonic()
+        # tag_id -> (поза, время отправки)
+        self.sent = {}
+        self.events = 0
+        self.poses_sent = 0
+        self.poses_skipped = 0
+        self.bytes = 0
+
+    def get_status(self):
+        elapsed = time.monotonic() - self.started
+        return {
+            'client_ip': self.client_ip,
+            'events': self.events,
+            'events_per_s': round(self.events / elapsed, 2) if elapsed > 0 else 0.0,
+            'poses_sent': self.poses_sent,
+            'poses_skipped': self.poses_skipped,
+            'avg_event_bytes': round(self.bytes / self.events) if self.events else 0,
+        }
+
+
+class PoseFeed:
+    """Последние позы и поток SSE поверх TagAnalysis"""
+
+    def __init__(self, config, logger, tag_analysis):
+        feed_config = dict(FEED_DEFAULTS)
+        feed_config.update(config.get('pose_feed', {}) or {})
+
+        self.logger = logger
+        self.tag_analysis = tag_analysis
+        self.enabled = feed_config['enabled']
+        self.max_subscribers = int(feed_config['max_subscribers'])
+        self.translation_eps_m = float(feed_config['translation_eps_m'])
+        self.rotation_eps_deg = float(feed_config['rotation_eps_deg'])
+        self.refresh_s = float(feed_config['refresh_s'])
+        self.keepalive_s = float(feed_config['keepalive_s'])
+
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.rejected = 0
+        self.latest_requests = 0
+        # Кодирование поз - один раз на результат: (seq, [(поза, строка JSON)])
+        self._encoded = (None, [])
+        # Захват кадра -> отправка события (мс)
+        self.latency_ms = deque(maxlen=200)
+
+    def available(self):
+        return self.enabled and self.tag_analysis.running
+
+    def _encode(self, result):
+        """Позы результата и их JSON (кэш по номеру кадра)"""
+        with self.lock:
+            seq, encoded = self._encoded
+            if seq == result.seq:
+                return encoded
+        encoded = []
+        for tag in result.tags:
+            message = pose_message(tag, result)
+            if message is not None:
+                encoded.append((message, compact_json(message)))
+        with self.lock:
+            self._encoded = (result.seq, encoded)
+        return encoded
+
+    def latest(self):
+        """
+        Последние позы для /api/poses/latest
+
+        Returns:
+            Словарь (frame_seq, capture_ts, age_s, poses) или None, если результатов нет
+        """
+        self.latest_requests += 1
+        result = self.tag_analysis.get_latest()
+        if result is None:
+            return None
+        return {
+            'frame_seq': result.seq,
+            'capture_ts': round(result.capture_ts, 4) if result.capture_ts is not None else None,
+            'age_s': round(time.monotonic() - result.done_mono, 3),
+            'poses': [message for message, _ in self._encode(result)],
+        }
+
+    def acquire(self, client_ip):
+        """Место подписчика потока (None - лимит)"""
+        with self.lock:
+            if len(self.subscribers) >= self.max_subscribers:
+                self.rejected += 1
+                return None
+            subscriber = PoseSubscriber(client_ip)
+            self.subscribers.add(subscriber)
+        self.tag_analysis.acquire_results()
+        return subscriber
+
+    def release(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+        self.tag_analysis.release_results()
+
+    def _select(self, subscriber, result, now):
+        """Строки JSON поз, которые нужно отправить подписчику (изменились, обновление, пропажа)"""
+        parts = []
+        seen = set()
+        for message, text in self._encode(result):
+            tag_id = message['tag_id']
+            seen.add(tag_id)
+            previous = subscriber.sent.get(tag_id)
+            if previous is not None and now - previous[1] < self.refresh_s \
+                    and not pose_changed(previous[0], message, self.translation_eps_m, self.rotation_eps_deg):
+                subscriber.poses_skipped += 1
+                continue
+            subscriber.sent[tag_id] = (message, now)
+            parts.append(text)
+        for tag_id in [tag_id for tag_id in subscriber.sent if tag_id not in seen]:
+            del subscriber.sent[tag_id]
+            parts.append(compact_json({'tag_id': tag_id, 'lost': True, 'frame_seq': result.seq}))
+        return parts
+
+    def generate(self, subscriber):
+        """
+        Генератор событий SSE: массив JSON поз на кадр (id события - номер кадра)
+
+        Args:
+            subscriber: PoseSubscriber из acquire()
+        """
+        yield "retry: 2000\n\n"
+        last_seq = 0
+        last_event = time.monotonic()
+        while self.tag_analysis.running:
+            result = self.tag_analysis.wait_result(last_seq, timeout=1.0)
+            now = time.monotonic()
+            if result is None:
+                if now - last_event >= self.keepalive_s:
+                    last_event = now
+                    yield ": keepalive\n\n"
+                continue
+            last_seq = result.seq
+
+            parts = self._select(subscriber, result, now)
+            if not parts:
+                continue
+            event = f"id: {result.seq}\ndata: [{','.join(parts)}]\n\n"
+            subscriber.events += 1
+            subscriber.poses_sent += len(parts)
+            subscriber.bytes += len(event)
+            last_event = now
+            self.latency_ms.append((time.monotonic() - result.capture_mono) * 1000)
+            yield event
+
+    def get_status(self):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        latency = np.array(list(self.latency_ms))
+        return {
+            'enabled': self.enabled,
+            'available': self.available(),
+            'subscribers': [subscriber.get_status() for subscriber in subscribers],
+            'max_subscribers': self.max_subscribers,
+            'rejected': self.rejected,
+            'latest_requests': self.latest_requests,
+            'thresholds': {'translation_eps_m': self.translation_eps_m,
+                           'rotation_eps_deg': self.rotation_eps_deg, 'refresh_s': self.refresh_s},
+            'latency_ms': {
+                'p50': round(float(np.percentile(latency, 50)), 1),
+                'p95': round(float(np.percentile(latency, 95)), 1),
+                'max': round(float(latency.max()), 1),
+            } if len(latency) else None,
+        }
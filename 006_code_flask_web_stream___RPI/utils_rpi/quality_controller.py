@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+
+# quality_controller.py
+
+"""
+Адаптивное качество JPEG под целевой битрейт.
+
+Размер JPEG при постоянном качестве сильно зависит от сцены (темная комната
+против детальной картинки), поэтому статический jpeg_quality дает скачки
+трафика. QualityController - замкнутый контур: по размеру предыдущих кадров
+(скользящее среднее) и частоте кадров подбирает качество так, чтобы битрейт
+держался около цели. Размер JPEG растет примерно экспоненциально с качеством,
+поэтому поправка считается по логарифму отношения цели к факту.
+
+Цель - фиксированный target_kbps или, если клиенты не успевают забирать кадры,
+измеренная пропускная способность самого медленного клиента (ThroughputMonitor).
+При allow_resize на минимальном качестве дополнительно уменьшается разрешение.
+"""
+
+import math
+import threading
+import time
+
+ADAPTIVE_DEFAULTS = {
+    'enabled': False,
+    'target_kbps': 4000,
+    'overflow_target_kbps': 150,
+    'min_quality': 30,
+    'max_quality': 92,
+    'use_client_throughput': True,
+    'allow_resize': False,
+    'min_scale': 0.5,
+}
+
+
+class ClientMeter:
+    """Доставка кадров одному клиенту: битрейт и пропущенные кадры за окно"""
+
+    def __init__(self, window_s=2.0):
+        self.window_s = window_s
+        self.window_start = time.time()
+        self.bytes = 0
+        self.frames = 0
+        self.skipped = 0
+        self.last_seq = None
+        self.kbps = 0.0
+        self.skip_ratio = 0.0
+
+    def on_sent(self, nbytes, seq):
+        """Кадр отдан клиенту (вызывается генератором после записи)"""
+        if self.last_seq is not None and seq > self.last_seq + 1:
+            self.skipped += seq - self.last_seq - 1
+        self.last_seq = seq
+        self.bytes += nbytes
+        self.frames += 1
+
+        now = time.time()
+        elapsed = now - self.window_start
+        if elapsed >= self.window_s:
+            self.kbps = self.bytes * 8 / 1000 / elapsed
+            total = self.frames + self.skipped
+            self.skip_ratio = self.skipped / total if total else 0.0
+            self.window_start = now
+            self.bytes = self.frames = self.skipped = 0
+
+    @property
+    def limited(self):
+        """Клиент не успевает: больше 10% кадров пропущено"""
+        return self.skip_ratio > 0.1
+
+
+class ThroughputMonitor:
+    """Измеренная пропускная способность клиентов одного потока"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.meters = set()
+
+    def register(self):
+        meter = ClientMeter()
+        with self.lock:
+            self.meters.add(meter)
+        return meter
+
+    def unregister(self, meter):
+        with self.lock:
+            self.meters.discard(meter)
+
+    def limit_kbps(self):
+        """Битрейт самого медленного не успевающего клиента или None"""
+        with self.lock:
+            rates = [m.kbps for m in self.meters if m.limited and m.kbps > 0]
+        return min(rates) if rates else None
+
+    def get_status(self):
+        with self.lock:
+            meters = list(self.meters)
+        return {
+            'clients': len(meters),
+            'limited_clients': sum(1 for m in meters if m.limited),
+            'limit_kbps': round(self.limit_kbps() or 0.0, 1) or None,
+        }
+
+
+class QualityController:
+    """Подбор качества (и масштаба) JPEG под целевой битрейт по размеру прошлых кадров"""
+
+    def __init__(self, config, target_key='target_kbps', initial_quality=None):
+        """
+        Args:
+            config: Конфигурация (секция adaptive_quality)
+            target_key: Ключ цели для этого потока (target_kbps, overflow_target_kbps)
+            initial_quality: Начальное качество (по умолчанию camera.jpeg_quality)
+        """
+        settings = dict(ADAPTIVE_DEFAULTS)
+        settings.update(config.get('adaptive_quality', {}) or {})
+
+        self.enabled = settings['enabled']
+        self.target_kbps = float(settings[target_key])
+        self.min_quality = int(settings['min_quality'])
+        self.max_quality = int(settings['max_quality'])
+        self.use_client_throughput = settings['use_client_throughput']
+        self.allow_resize = settings['allow_resize']
+        self.min_scale = float(settings['min_scale'])
+
+        if initial_quality is None:
+            initial_quality = config.get('camera', {}).get('jpeg_quality', 85)
+        self.quality = float(min(self.max_quality, max(self.min_quality, initial_quality)))
+        self.scale = 1.0
+
+        self.gain = 25.0          # Пунктов качества на единицу ошибки ln(цель/факт)
+        self.max_step = 8.0       # Ограничение шага за кадр
+        self.deadband = 0.05      # ±5% - без изменений
+        self.alpha = 0.3          # Сглаживание размера кадра
+
+        self.clients = ThroughputMonitor()
+        self.avg_bytes = None
+        self.effective_target_kbps = self.target_kbps
+        self.measured_kbps = 0.0
+        self.adjustments = 0
+        self.resizes = 0
+
+    @property
+    def jpeg_quality(self):
+        return int(round(self.quality))
+
+    def current_target_kbps(self):
+        """Цель с учетом медленных клиентов"""
+        target = self.target_kbps
+        if self.use_client_throughput:
+            limit = self.clients.limit_kbps()
+            if limit:
+                target = min(target, limit * 0.9)
+        return target
+
+    def update(self, jpeg_bytes, fps):
+        """
+        Обратная связь после кодирования кадра
+
+        Args:
+            jpeg_bytes: Размер только что сжатого кадра
+            fps: Текущая частота кадров потока
+        """
+        if not self.enabled or jpeg_bytes <= 0:
+            return
+
+        fps = max(fps, 1.0)
+        self.avg_bytes = jpeg_bytes if self.avg_bytes is None else \
+            self.avg_bytes * (1 - self.alpha) + jpeg_bytes * self.alpha
+        self.measured_kbps = self.avg_bytes * fps * 8 / 1000
+
+        self.effective_target_kbps = self.current_target_kbps()
+        target_bytes = self.effective_target_kbps * 1000 / 8 / fps
+        error = math.log(target_bytes / self.avg_bytes)
+        if abs(error) < self.deadband:
+            return
+
+        step = max(-self.max_step, min(self.max_step, error * self.gain))
+        quality = min(self.max_quality, max(self.min_quality, self.quality + step))
+        if quality != self.quality:
+            self.quality = quality
+            self.adjustments += 1
+
+        if self.allow_resize:
+            self._update_scale(error)
+
+    def _update_scale(self, error):
+        """Масштаб: вниз на минимальном качестве, вверх при большом запасе на максимальном"""
+        if self.quality <= self.min_quality and error < -0.1 and self.scale > self.min_scale:
+            self.scale = max(self.min_scale, self.scale * 0.8)
+        elif self.quality >= self.max_quality and error > 0.3 and self.scale < 1.0:
+            self.scale = min(1.0, self.scale / 0.8)
+        else:
+            return
+        # Новое разрешение - другой размер кадра, оценка начинается заново
+        self.avg_bytes = None
+        self.resizes += 1
+
+    def get_status(self):
+        if not self.enabled:
+            return {'enabled': False}
+        return {
+            'enabled': True,
+            'quality': self.jpeg_quality,
+            'scale': round(self.scale, 3),
+            'target_kbps': self.target_kbps,
+            'effective_target_kbps': round(self.effective_target_kbps, 1),
+            'measured_kbps': round(self.measured_kbps, 1),
+            'adjustments': self.adjustments,
+            'resizes': self.resizes,
+            'clients': self.clients.get_status(),
+        }
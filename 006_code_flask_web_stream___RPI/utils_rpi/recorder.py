@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+
+# recorder.py
+
+"""
+Непрерывная запись стрима в сегменты MJPEG-AVI без перекодирования.
+
+Запись получает уже сжатые кадры из FrameHub: для MJPEG камер это JPEG
+от самой камеры, для остальных - JPEG, закодированный для стрима.
+Кадры пишутся в AVI контейнер как есть, в отдельном потоке, через
+ограниченную очередь. Если диск не успевает - кадры отбрасываются
+и учитываются в статистике, поток захвата не блокируется.
+
+В запись попадают кадры после duplicate_filter и motion_gate, то есть
+с пропусками. AVI хранит постоянную частоту, поэтому кадр пишется в слот
+своего времени захвата, а пропущенные слоты - пустыми чанками 00dc
+(плеер повторяет предыдущий кадр): время воспроизведения и номера кадров
+mjpeg_index совпадают со временем захвата. Частота сегмента - измеренная
+частота источника (FrameHub.measured_fps), camera.fps - только пока ее нет;
+лишний кадр в уже занятом слоте отбрасывается.
+"""
+
+import os
+import queue
+import re
+import struct
+import threading
+import time
+from datetime import datetime
+
+AVIF_HASINDEX = 0x10
+AVIIF_KEYFRAME = 0x10
+
+# Расхождение измеренной частоты с частотой сегмента, после которого начинается новый сегмент
+FPS_TOLERANCE = 0.15
+
+# Смещения полей заголовка, которые дописываются при закрытии файла
+_RIFF_SIZE = 4
+_AVIH_US_PER_FRAME = 32
+_AVIH_MAX_BYTES_PER_SEC = 36
+_AVIH_TOTAL_FRAMES = 48
+_AVIH_SUGGESTED_BUFFER = 60
+_STRH_RATE = 132
+_STRH_LENGTH = 140
+_STRH_SUGGESTED_BUFFER = 144
+_MOVI_SIZE = 216
+_MOVI_FOURCC = 220
+_HEADER_SIZE = 224
+
+
+class MjpegAviWriter:
+    """Минимальный AVI (RIFF) контейнер для готовых JPEG кадров"""
+
+    def __init__(self, path, width, height, fps):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.fps = fps
+
+        self.file = open(path, 'wb', buffering=1024 * 1024)
+        self.index = []
+        self.frames = 0           # Чанков кадров, включая повторы
+        self.repeated = 0         # Пустых чанков (повтор предыдущего кадра)
+        self.merged = 0           # Кадров, отброшенных в уже занятом слоте
+        self.bytes_written = 0
+        self.max_frame_size = 0
+        self.first_ts = None
+        self.last_ts = None
+
+        self._write_header()
+
+    def _write_header(self):
+        """Заголовок с заглушками размеров (заполняются в close)"""
+        us_per_frame = int(1000000 / self.fps) if self.fps else 0
+        rate = int(round(self.fps * 1000)) if self.fps else 30000
+
+        avih = struct.pack('<10I16x', us_per_frame, 0, 0, AVIF_HASINDEX, 0, 0, 1, 0,
+                           self.width, self.height)
+        strh = struct.pack('<4s4sIHHIIIIIIIi4h', b'vids', b'MJPG', 0, 0, 0, 0, 1000, rate, 0, 0,
+                           0, 0xFFFFFFFF, 0, 0, 0, self.width, self.height)
+        strf = struct.pack('<IiiHH4sIiiII', 40, self.width, self.height, 1, 24, b'MJPG',
+                           self.width * self.height * 3, 0, 0, 0, 0)
+
+        strl = b'strl' + b'strh' + struct.pack('<I', len(strh)) + strh + b'strf' + struct.pack('<I', len(strf)) + strf
+        hdrl = b'hdrl' + b'avih' + struct.pack('<I', len(avih)) + avih + b'LIST' + struct.pack('<I', len(strl)) + strl
+
+        header = (b'RIFF' + struct.pack('<I', 0) + b'AVI ' +
+                  b'LIST' + struct.pack('<I', len(hdrl)) + hdrl +
+                  b'LIST' + struct.pack('<I', 4) + b'movi')
+        assert len(header) == _HEADER_SIZE
+        self.file.write(header)
+        self.position = _HEADER_SIZE
+
+    def _write_chunk(self, jpeg):
+        size = len(jpeg)
+        self.file.write(b'00dc' + struct.pack('<I', size))
+        if size:
+            self.file.write(jpeg)
+        if size % 2:
+            self.file.write(b'\x00')
+
+        self.index.append((self.position - _MOVI_FOURCC, size))
+        self.position += 8 + size + (size % 2)
+        self.frames += 1
+
+    def write_frame(self, jpeg, capture_ts):
+        """
+        Запись JPEG кадра (чанк 00dc) в слот его времени захвата
+
+        Пропущенные с прошлого кадра слоты заполняются пустыми чанками,
+        кадр в уже занятом слоте (чаще частоты записи) отбрасывается.
+
+        Returns:
+            True - кадр записан, False - слот занят
+        """
+        if self.first_ts is None:
+            self.first_ts = capture_ts
+        elif self.fps:
+            missing = int(round((capture_ts - self.first_ts) * self.fps)) - self.frames
+            if missing < 0:
+                self.merged += 1
+                return False
+            for _ in range(missing):
+                self._write_chunk(b'')
+            self.repeated += missing
+
+        self._write_chunk(jpeg)
+        self.bytes_written += len(jpeg)
+        self.max_frame_size = max(self.max_frame_size, len(jpeg))
+        self.last_ts = capture_ts
+        return True
+
+    @property
+    def duration(self):
+        if self.first_ts is None:
+            return 0.0
+        return self.last_ts - self.first_ts
+
+    def close(self):
+        """Запись индекса idx1 и реальных размеров/FPS в заголовок"""
+        movi_size = self.position - _MOVI_FOURCC
+
+        index = bytearray()
+        for offset, size in self.index:
+            index += b'00dc' + struct.pack('<III', AVIIF_KEYFRAME if size else 0, offset, size)
+        self.file.write(b'idx1' + struct.pack('<I', len(index)))
+        self.file.write(index)
+        riff_size = self.position + 8 + len(index) - 8
+
+        # Частота записи: время держат пустые чанки, а не подгонка FPS под число кадров
+        fps = self.fps or 30.0
+        max_bytes_per_sec = int(self.bytes_written / self.duration) if self.duration > 0 else 0
+
+        patches = [
+            (_RIFF_SIZE, riff_size),
+            (_AVIH_US_PER_FRAME, int(1000000 / fps)),
+            (_AVIH_MAX_BYTES_PER_SEC, max_bytes_per_sec),
+            (_AVIH_TOTAL_FRAMES, self.frames),
+            (_AVIH_SUGGESTED_BUFFER, self.max_frame_size + 8),
+            (_STRH_RATE, int(round(fps * 1000))),
+            (_STRH_LENGTH, self.frames),
+            (_STRH_SUGGESTED_BUFFER, self.max_frame_size + 8),
+            (_MOVI_SIZE, movi_size),
+        ]
+        for offset, value in patches:
+            self.file.seek(offset)
+            self.file.write(struct.pack('<I', value))
+
+        self.file.close()
+
+
+class SegmentedRecorder:
+    """Запись стрима в сегменты фиксированной длительности"""
+
+    def __init__(self, config, logger, source_fps=None):
+        """
+        Args:
+            source_fps: функция без аргументов - измеренная частота источника (0 - еще нет)
+        """
+        record_config = config.get('recording', {}) or {}
+
+        self.config = config
+        self.logger = logger
+        self.source_fps = source_fps
+
+        path = record_config.get('path', 'recordings')
+        if not os.path.isabs(path):
+            project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            path = os.path.join(project_dir, path)
+        self.path = path
+
+        self.auto_start = record_config.get('auto_start', False)
+        self.segment_seconds = record_config.get('segment_seconds', 300)
+        self.max_segment_bytes = record_config.get('max_segment_mb', 1900) * 1024 * 1024
+        self.max_gap = record_config.get('max_gap_s', 2.0)
+        self.queue = queue.Queue(maxsize=record_config.get('queue_size', 120))
+
+        self.active = False
+        self.thread = None
+        self.writer = None
+        # Кадры до первого измерения частоты источника (сегмент откроется сразу с ней)
+        self.pending = []
+        self.segment_camera = None
+        self.segment_start = None
+        self.segments = []
+
+        # Статистика
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.frames_merged = 0
+        self.frames_passthrough = 0
+        self.bytes_written = 0
+        self.write_time = 0.0
+        self.started_at = None
+        self.last_error = None
+
+    def start(self):
+        """Начало записи"""
+        if self.active:
+            return False
+
+        os.makedirs(self.path, exist_ok=True)
+        self.active = True
+        self.started_at = time.time()
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.frames_merged = 0
+        self.frames_passthrough = 0
+        self.bytes_written = 0
+        self.write_time = 0.0
+        self.last_error = None
+
+        self.thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self.thread.start()
+
+        print(f"⏺️ Запись запущена: {self.path} (сегменты по {self.segment_seconds} с)")
+        self.logger.log_info(f"Запись запущена: {self.path}")
+        return True
+
+    def stop(self):
+        """Остановка записи (оставшиеся в очереди кадры дописываются)"""
+        if not self.active:
+            return False
+
+        self.active = False
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=10.0)
+        self.thread = None
+
+        print(f"⏹️ Запись остановлена: кадров {self.frames_written}, отброшено {self.frames_dropped}")
+        self.logger.log_info(f"Запись остановлена: кадров {self.frames_written}, "
+                             f"отброшено {self.frames_dropped}")
+        return True
+
+    def on_frame(self, encoded):
+        """Подписчик FrameHub: кадр в очередь записи без блокировки"""
+        if not self.active:
+            return
+        try:
+            # Только JPEG и метаданные - BGR кадр в очереди не держим
+            self.queue.put_nowait((encoded.jpeg, encoded.capture_ts, encoded.camera_id,
+                                   encoded.width, encoded.height, encoded.passthrough))
+        except queue.Full:
+            self.frames_dropped += 1
+
+    def _writer_loop(self):
+        """Поток записи на диск"""
+        while self.active or not self.queue.empty():
+            try:
+                item = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                # Долгая пауза (стрим остановлен) - закрываем сегмент
+                if self.writer and time.time() - self.writer.last_ts > self.max_gap:
+                    self._close_segment()
+                continue
+
+            self.pending.append(item)
+            # Частота источника еще не измерена (первые кадры камеры): ждем ее до max_gap_s,
+            # чтобы не открывать сегмент с camera.fps и не начинать новый через долю секунды
+            if (self.writer is None and self.source_fps and not self.source_fps()
+                    and len(self.pending) < self.queue.maxsize
+                    and item[1] - self.pending[0][1] < self.max_gap):
+                continue
+            self._flush_pending()
+
+        self._flush_pending()
+        self._close_segment()
+
+    def _flush_pending(self):
+        """Запись отложенных кадров"""
+        pending, self.pending = self.pending, []
+        for item in pending:
+            self._write_item(item)
+
+    def _write_item(self, item):
+        """Кадр в сегмент (новый сегмент при смене камеры, размера, частоты, паузе)"""
+        jpeg, capture_ts, camera_id, width, height, passthrough = item
+        try:
+            if self._need_new_segment(capture_ts, camera_id, width, height):
+                self._close_segment()
+                self._open_segment(capture_ts, camera_id, width, height)
+
+            start = time.perf_counter()
+            written = self.writer.write_frame(jpeg, capture_ts)
+            self.write_time += time.perf_counter() - start
+            if not written:
+                self.frames_merged += 1
+                return
+
+            self.frames_written += 1
+            self.bytes_written += len(jpeg)
+            if passthrough:
+                self.frames_passthrough += 1
+
+        except Exception as e:
+            self.last_error = str(e)
+            self.frames_dropped += 1
+            self.logger.log_error(f"Ошибка записи кадра: {e}")
+            self._close_segment()
+
+    def _need_new_segment(self, capture_ts, camera_id, width, height):
+        writer = self.writer
+        if writer is None:
+            return True
+        return (capture_ts - self.segment_start >= self.segment_seconds
+                or capture_ts - writer.last_ts > self.max_gap
+                or camera_id != self.segment_camera
+                or (width, height) != (writer.width, writer.height)
+                or abs(self._record_fps() - writer.fps) > writer.fps * FPS_TOLERANCE
+                or writer.position >= self.max_segment_bytes)
+
+    def _record_fps(self):
+        """
+        Частота записи - измеренная частота источника
+
+        camera.fps - только до первых кадров: у камер, открытых без настройки,
+        он не совпадает с реальной частотой. Смена частоты больше чем на
+        FPS_TOLERANCE начинает новый сегмент.
+        """
+        measured = self.source_fps() if self.source_fps else 0.0
+        if measured > 0:
+            return round(measured, 1)
+        return float(self.config['camera'].get('fps', 15) or 15)
+
+    def _open_segment(self, capture_ts, camera_id, width, height):
+        stamp = datetime.fromtimestamp(capture_ts).strftime('%Y%m%d_%H%M%S')
+        camera_name = re.sub(r'[^A-Za-z0-9_]+', '_', str(camera_id)).strip('_') or 'camera'
+        filename = os.path.join(self.path, f"{camera_name}_{stamp}.avi")
+        # Новый сегмент в ту же секунду (смена частоты) не перезаписывает прошлый
+        suffix = 1
+        while os.path.exists(filename):
+            filename = os.path.join(self.path, f"{camera_name}_{stamp}_{suffix}.avi")
+            suffix += 1
+
+        self.writer = MjpegAviWriter(filename, width, height, self._record_fps())
+        self.segment_camera = camera_id
+        self.segment_start = capture_ts
+        print(f"📼 Новый сегмент записи: {os.path.basename(filename)}")
+
+    def _close_segment(self):
+        writer = self.writer
+        if writer is None:
+            return
+        self.writer = None
+
+        start = time.perf_counter()
+        try:
+            writer.close()
+        except Exception as e:
+            self.last_error = str(e)
+            self.logger.log_error(f"Ошибка закрытия сегмента {writer.path}: {e}")
+            return
+        self.write_time += time.perf_counter() - start
+
+        self.segments.append({
+            'file': os.path.basename(writer.path),
+            'frames': writer.frames,
+            'repeated': writer.repeated,
+            'merged': writer.merged,
+            'duration_s': round(writer.duration, 1),
+            'fps': round(writer.fps, 2),
+            'size_mb': round(writer.position / (1024 * 1024), 2),
+        })
+        self.segments = self.segments[-20:]
+        self.logger.log_info(f"Сегмент записи закрыт: {os.path.basename(writer.path)}, "
+                             f"кадров {writer.frames} (повторов {writer.repeated})")
+
+    def get_status(self):
+        """Статистика записи для API"""
+        elapsed = time.time() - self.started_at if self.started_at else 0.0
+        mbytes = self.bytes_written / (1024 * 1024)
+        writer = self.writer
+        return {
+            'active': self.active,
+            'path': self.path,
+            'segment_seconds': self.segment_seconds,
+            'current_segment': os.path.basename(writer.path) if writer else None,
+            'frames_written': self.frames_written,
+            'frames_dropped': self.frames_dropped,
+            'frames_merged': self.frames_merged,
+            'frames_passthrough': self.frames_passthrough,
+            'queue_size': self.queue.qsize(),
+            'queue_maxsize': self.queue.maxsize,
+            'mbytes_written': round(mbytes, 2),
+            # Средняя скорость записи за время работы и пропускная способность диска
+            'write_mb_s': round(mbytes / elapsed, 2) if elapsed > 0 else 0.0,
+            'disk_mb_s': round(mbytes / self.write_time, 1) if self.write_time > 0 else 0.0,
+            'segments': self.segments[-5:],
+            'last_error': self.last_error,
+        }
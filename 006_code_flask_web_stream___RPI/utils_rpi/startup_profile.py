@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+# startup_profile.py
+
+"""
+Профиль последнего успешного запуска камеры (last-known-good).
+
+Для каждого устройства запоминается сработавший бэкенд и формат захвата.
+При следующем старте этот вариант пробуется первым, без перебора
+всех бэкендов из camera.test_backends.
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+
+PROFILE_VERSION = 1
+
+
+def get_device_signature(device):
+    """
+    Подпись устройства для проверки, что железо не поменялось
+
+    Для V4L2 - имя из sysfs (/sys/class/video4linux/videoN/name),
+    для CSI - пустая строка (модель проверяется по списку CSI камер).
+    """
+    device_str = str(device)
+    if device_str.startswith('csi_'):
+        return ''
+
+    node = os.path.basename(device_str)
+    if device_str.isdigit():
+        node = f"video{device_str}"
+
+    try:
+        with open(f"/sys/class/video4linux/{node}/name", 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    except OSError:
+        return ''
+
+
+class StartupProfile:
+    """Хранилище профиля запуска в JSON файле"""
+
+    def __init__(self, config, logger):
+        profile_config = config.get('startup_profile', {}) or {}
+
+        self.logger = logger
+        self.enabled = profile_config.get('enabled', True)
+
+        path = profile_config.get('path', 'startup_profile.json')
+        if not os.path.isabs(path):
+            # Путь относительно папки проекта (рядом с config_rpi.yaml)
+            project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            path = os.path.join(project_dir, path)
+        self.path = path
+
+        self.lock = threading.Lock()
+        self.data = self._load()
+
+    def _load(self):
+        """Загрузка профиля с диска"""
+        empty = {'version': PROFILE_VERSION, 'devices': {}, 'csi_cameras': []}
+        if not self.enabled or not os.path.exists(self.path):
+            return empty
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != PROFILE_VERSION:
+                print(f"⚠️ Профиль запуска устарел (версия {data.get('version')}), игнорирую")
+                return empty
+            data.setdefault('devices', {})
+            data.setdefault('csi_cameras', [])
+            return data
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Не удалось прочитать профиль запуска {self.path}: {e}")
+            return empty
+
+    def _save(self):
+        """Атомарная запись профиля (через временный файл)"""
+        if not self.enabled:
+            return
+
+        self.data['updated'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"⚠️ Не удалось сохранить профиль запуска: {e}")
+
+    def get_device(self, device):
+        """
+        Профиль устройства, если железо не поменялось
+
+        Returns:
+            Словарь с бэкендом/форматом или None
+        """
+        if not self.enabled:
+            return None
+
+        with self.lock:
+            entry = self.data['devices'].get(str(device))
+
+        if not entry:
+            return None
+
+        signature = entry.get('signature', '')
+        if signature and signature != get_device_signature(device):
+            print(f"⚠️ Устройство {device} изменилось, профиль запуска сброшен")
+            self.invalidate(device)
+            return None
+
+        return entry
+
+    def save_device(self, device, entry):
+        """Сохранение сработавшего варианта для устройства"""
+        if not self.enabled:
+            return
+
+        entry = dict(entry)
+        entry['signature'] = get_device_signature(device)
+        entry['saved_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        with self.lock:
+            self.data['devices'][str(device)] = entry
+            self._save()
+
+        self.logger.log_info(f"💾 Профиль запуска сохранен для {device}: {entry.get('backend_name')}")
+
+    def invalidate(self, device):
+        """Удаление профиля устройства (профиль не сработал)"""
+        with self.lock:
+            if self.data['devices'].pop(str(device), None) is not None:
+                self._save()
+
+    def get_csi_cameras(self):
+        """Список CSI камер с прошлого запуска"""
+        with self.lock:
+            return list(self.data.get('csi_cameras', []))
+
+    def save_csi_cameras(self, cameras):
+        """Сохранение списка обнаруженных CSI камер"""
+        if not self.enabled:
+            return
+
+        with self.lock:
+            if self.data.get('csi_cameras') == cameras:
+                return
+            self.data['csi_cameras'] = cameras
+            self._save()
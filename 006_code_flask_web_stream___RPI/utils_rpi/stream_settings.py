@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+
+# stream_settings.py
+
+"""
+Параметры стрима, изменяемые без перезапуска сервера.
+
+Два вида параметров:
+  - кодирование (jpeg_quality, motion_gate) - FrameHub читает их на каждом кадре,
+    изменение применяется сразу;
+  - захват (width, height, fps) - применяются минимальной перенастройкой
+    устройства (set на V4L2, FrameRate / смена режима у Picamera2) без
+    остановки HTTP сервера и повторного поиска камер.
+
+Источники изменений: POST /api/stream/settings и ConfigWatcher, который
+следит за config_rpi.yaml и передает изменившиеся параметры стримеру.
+"""
+
+import copy
+import os
+import threading
+import time
+
+import yaml
+
+ENCODE_KEYS = ('jpeg_quality', 'motion_gate')
+CAPTURE_KEYS = ('width', 'height', 'fps')
+
+# Допустимые значения: ключ -> (тип, минимум, максимум)
+_LIMITS = {
+    'jpeg_quality': (int, 1, 100),
+    'width': (int, 16, 8192),
+    'height': (int, 16, 8192),
+    'fps': (float, 0.5, 240.0),
+}
+
+# Параметры секции motion_gate (как их читает MotionGate.configure)
+_MOTION_GATE_LIMITS = {
+    'enabled': (bool, None, None),
+    'idle_fps': (float, 0.0, 240.0),
+    'downscale_width': (int, 8, 1920),
+    'threshold': (float, 0.0, 255.0),
+    'min_area': (float, 0.0, 1.0),
+    'background_alpha': (float, 0.0, 1.0),
+    'hold_s': (float, 0.0, 3600.0),
+}
+
+
+def csi_key(device):
+    """Ключ секции csi_cameras для устройства csi_N"""
+    device = str(device)
+    return f"csi_{device.split('_')[1]}" if device.startswith('csi_') else 'csi_0'
+
+
+def extract_settings(config, camera_type='v4l2'):
+    """
+    Изменяемые без перезапуска параметры из конфигурации
+
+    Для CSI камеры разрешение и FPS берутся из csi_cameras.csi_N,
+    для V4L2 - из секции camera.
+    """
+    camera = config.get('camera', {}) or {}
+    if camera_type == 'csi':
+        source = (config.get('csi_cameras', {}) or {}).get(csi_key(camera.get('device', 'csi_0')), {}) or {}
+    else:
+        source = camera
+
+    settings = {'jpeg_quality': camera.get('jpeg_quality', 85)}
+    for key in CAPTURE_KEYS:
+        if source.get(key) is not None:
+            settings[key] = source[key]
+    settings['motion_gate'] = copy.deepcopy(config.get('motion_gate', {}) or {})
+    return settings
+
+
+def diff_settings(old, new):
+    """Параметры new, отличающиеся от old"""
+    return {key: value for key, value in new.items() if old.get(key) != value}
+
+
+def _check_value(value, limits):
+    """
+    Приведение значения к типу и проверка диапазона
+
+    Returns:
+        (значение, None) или (None, текст ошибки)
+    """
+    cast, low, high = limits
+    if cast is bool:
+        # bool('false') - True: принимаем только настоящие логические значения
+        if isinstance(value, bool):
+            return value, None
+        return None, 'ожидается bool'
+    try:
+        value = cast(value)
+    except (TypeError, ValueError):
+        return None, f'ожидается {cast.__name__}'
+    if not low <= value <= high:
+        return None, f'допустимо {low}..{high}'
+    return value, None
+
+
+def validate_settings(changes):
+    """
+    Проверка и приведение типов
+
+    Параметры motion_gate проверяются по отдельности: ошибка одного
+    (ключ 'motion_gate.<имя>') не отменяет остальные.
+
+    Returns:
+        (valid, errors): словарь принятых параметров и словарь ошибок по ключам
+    """
+    valid = {}
+    errors = {}
+    for key, value in changes.items():
+        if key == 'motion_gate':
+            if not isinstance(value, dict):
+                errors[key] = 'ожидается словарь'
+                continue
+            gate = {}
+            for name, gate_value in value.items():
+                if name not in _MOTION_GATE_LIMITS:
+                    errors[f'{key}.{name}'] = 'неизвестный параметр'
+                    continue
+                gate_value, error = _check_value(gate_value, _MOTION_GATE_LIMITS[name])
+                if error:
+                    errors[f'{key}.{name}'] = error
+                else:
+                    gate[name] = gate_value
+            if gate:
+                valid[key] = gate
+            continue
+
+        if key not in _LIMITS:
+            errors[key] = 'параметр не изменяется без перезапуска'
+            continue
+
+        value, error = _check_value(value, _LIMITS[key])
+        if error:
+            errors[key] = error
+            continue
+        valid[key] = value
+    return valid, errors
+
+
+class ConfigWatcher:
+    """Слежение за файлом конфигурации (опрос mtime, без зависимостей)"""
+
+    def __init__(self, path, callback, logger, interval=1.0):
+        """
+        Args:
+            path: Путь к config_rpi.yaml
+            callback: Функция callback(new_config), вызывается после успешной загрузки
+            logger: Логгер
+            interval: Период проверки (с)
+        """
+        self.path = path
+        self.callback = callback
+        self.logger = logger
+        self.interval = interval
+
+        self.running = False
+        self.thread = None
+        self.last_stat = None
+
+        # Статистика
+        self.reloads = 0
+        self.errors = 0
+        self.last_error = None
+        self.last_reload_ts = None
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.last_stat = self._stat()
+        self.running = True
+        self.thread = threading.Thread(target=self._watch_loop, daemon=True)
+        self.thread.start()
+        print(f"👀 Слежение за конфигурацией: {self.path} (каждые {self.interval} с)")
+
+    def stop(self):
+        self.running = False
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=self.interval + 1.0)
+        self.thread = None
+
+    def _watch_loop(self):
+        while self.running:
+            time.sleep(self.interval)
+            stat = self._stat()
+            if stat is None or stat == self.last_stat:
+                continue
+            self.last_stat = stat
+
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    config = yaml.safe_load(f)
+                if not isinstance(config, dict):
+                    raise ValueError('файл пуст или не является словарем')
+            except Exception as e:
+                # Файл мог быть сохранен редактором наполовину - ждем следующей записи
+                self.errors += 1
+                self.last_error = str(e)
+                self.logger.log_error(f"Конфигурация {self.path} не загружена: {e}")
+                continue
+
+            self.reloads += 1
+            self.last_reload_ts = time.time()
+            try:
+                self.callback(config)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+                self.logger.log_error(f"Ошибка применения конфигурации: {e}")
+
+    def get_status(self):
+        return {
+            'enabled': self.running,
+            'path': self.path,
+            'interval_s': self.interval,
+            'reloads': self.reloads,
+            'errors': self.errors,
+            'last_error': self.last_error,
+            'last_reload': time.strftime('%H:%M:%S', time.localtime(self.last_reload_ts))
+            if self.last_reload_ts else None,
+        }
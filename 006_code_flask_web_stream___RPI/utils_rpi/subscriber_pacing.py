@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+
+# subscriber_pacing.py
+
+"""
+Своя частота, ширина и область кадра для каждого клиента /video_feed
+(?fps=, ?width=, ?roi=).
+
+Без параметров клиент получает каждый кадр FrameHub. Панелям и настенным
+экранам хватает 2-5 FPS, поэтому клиент с ?fps= не ждет каждого нового
+кадра, а спит до своего срока по равномерной сетке (next_due += 1 / fps)
+и в срок забирает последний готовый JPEG: между кадрами клиент не
+просыпается, стоимость клиента пропорциональна его частоте, а интервалы
+не сбиваются в пачки.
+
+?width= - уменьшенная копия общего кадра. Копия одной ширины сжимается
+один раз на кадр источника для всех клиентов этой ширины (и только
+когда кому-то из них подошел срок). Ширина округляется до width_step,
+число одновременно кодируемых копий (все ширины и разметки вместе)
+ограничено max_widths: новый клиент получает ближайшую по ширине из уже
+кодируемых с той же разметкой, без разметки - основной кадр; клиенту
+разметки, для которого подходящей копии нет, отказывается (can_acquire).
+
+?roi=x,y,w,h - область кадра (цифровой зум): вырезается из кадра камеры
+в полном разрешении и масштабируется до ?width= (по умолчанию - размер
+области). Одинаковые запросы области (те же roi и width) сжимаются один раз
+на кадр для всех зрителей. Уникальных областей не больше max_rois: область
+без зрителей остается в кэше для повторного подключения, при переполнении
+вытесняется давно не использованная (LRU) - сначала без зрителей, иначе
+зрители вытесненной области отключаются.
+
+?overlay=tags - копия с разметкой (результаты анализа меток рисуются при
+кодировании копии); сочетается с ?width= и ?roi=, зрители одинаковой
+разметки и размера делят одну копию.
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+from utils_rpi.frame_hub import mjpeg_part
+from utils_rpi.lazy_import import lazy_import
+
+# Тяжелые модули импортируются при первом обращении: импорт сервера их не загружает
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+PACING_DEFAULTS = {
+    'enabled': True,
+    'min_fps': 0.2,
+    'min_width': 160,
+    'width_step': 16,
+    'max_widths': 4,
+    'max_rois': 4,
+    'jpeg_quality': None,   # None - качество основного стрима (camera.jpeg_quality)
+}
+
+# Ширина полного кадра при выборе ближайшей копии (больше любой реальной)
+_FULL_WIDTH = 1 << 16
+
+
+class FramePacer:
+    """Равномерная сетка отправки с частотой fps (без догоняющих пачек)"""
+
+    def __init__(self, fps):
+        self.interval = 1.0 / fps if fps else 0.0
+        self.next_due = None
+
+    def wait(self, is_active):
+        """Сон до срока следующего кадра (короткими шагами, чтобы заметить остановку)"""
+        if not self.interval or self.next_due is None:
+            return
+        while is_active():
+            delay = self.next_due - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(min(delay, 0.5))
+
+    def sent(self):
+        """Кадр отправлен: следующий срок по сетке, отставание не копится"""
+        now = time.monotonic()
+        if self.next_due is None:
+            self.next_due = now
+        self.next_due = max(self.next_due + self.interval, now)
+
+
+def parse_roi(value):
+    """
+    Область кадра из строки "x,y,w,h"
+
+    Все значения не больше 1 - доли кадра, иначе пиксели кадра камеры.
+
+    Returns:
+        (x, y, w, h) в долях (округление до 1e-4) или в пикселях (int), признак долей
+    """
+    parts = [float(part) for part in value.split(',')]
+    if len(parts) != 4 or parts[2] <= 0 or parts[3] <= 0 or min(parts) < 0:
+        raise ValueError('roi: ожидается x,y,w,h')
+    if max(parts) <= 1.0:
+        return tuple(round(part, 4) for part in parts), True
+    return tuple(int(round(part)) for part in parts), False
+
+
+class Rendition:
+    """Копия общего кадра: уменьшенная (width), область кадра (roi + width), с разметкой (overlay)"""
+
+    def __init__(self, width, roi=None, fractional=False, overlay=None):
+        """
+        Args:
+            width: Ширина кадра (None - как у основного стрима / размер области)
+            roi: (x, y, w, h) области кадра или None
+            fractional: roi задана в долях кадра
+            overlay: (имя, draw_fn) разметки или None; draw_fn(frame, encoded, (x0, y0, scale))
+                рисует на копии, переводя пиксели кадра камеры в пиксели копии
+        """
+        self.width = width
+        self.roi = roi
+        self.fractional = fractional
+        self.overlay = overlay
+        self.lock = threading.Lock()
+        self.subscribers = 0
+        self.source_seq = None
+        self.jpeg = None
+        self.evicted = False
+        self.last_used = time.monotonic()
+
+        # Статистика
+        self.frames_encoded = 0
+        self.frames_shared = 0
+        self.encode_ms_total = 0.0
+        self.bytes_total = 0
+
+    def _crop(self, frame):
+        """Область кадра в полном разрешении, масштабированная до width, и (x0, y0, scale) области"""
+        fh, fw = frame.shape[:2]
+        x, y, w, h = self.roi
+        if self.fractional:
+            x, y, w, h = int(x * fw), int(y * fh), int(w * fw), int(h * fh)
+        x, y = min(max(0, x), fw - 2), min(max(0, y), fh - 2)
+        w, h = max(2, min(w, fw - x)), max(2, min(h, fh - y))
+        crop = frame[y:y + h, x:x + w]
+
+        out_w = min(self.width or w, fw)
+        if out_w == w:
+            return crop, (x, y, 1.0)
+        out_h = max(2, int(h * out_w / w) // 2 * 2)
+        # Уменьшение - усреднением, цифровой зум (увеличение) - билинейно
+        interpolation = cv2.INTER_AREA if out_w < w else cv2.INTER_LINEAR
+        return cv2.resize(crop, (out_w, out_h), interpolation=interpolation), (x, y, out_w / w)
+
+    def get(self, encoded, jpeg_quality):
+        """JPEG копии кадра encoded (сжимается один раз на кадр источника)"""
+        with self.lock:
+            self.last_used = time.monotonic()
+            if self.source_seq == encoded.seq:
+                self.frames_shared += 1
+                return self.jpeg
+
+            start = time.perf_counter()
+            if self.roi is not None:
+                frame, transform = self._crop(encoded.source)
+            else:
+                frame = encoded.frame
+                h, w = frame.shape[:2]
+                if self.width and w > self.width:
+                    size = (self.width, max(2, int(h * self.width / w) // 2 * 2))
+                    frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+                transform = (0, 0, frame.shape[1] / encoded.source.shape[1])
+            if self.overlay is not None:
+                # Кадр FrameHub и область без масштаба - общие, рисуем на копии
+                if frame is encoded.frame or frame.base is not None:
+                    frame = frame.copy()
+                frame = self.overlay[1](frame, encoded, transform)
+            ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+            if not ret:
+                return None
+
+            self.jpeg = buffer.tobytes()
+            self.source_seq = encoded.seq
+            self.frames_encoded += 1
+            self.encode_ms_total += (time.perf_counter() - start) * 1000
+            self.bytes_total += len(self.jpeg)
+            return self.jpeg
+
+    def get_status(self):
+        frames = self.frames_encoded
+        return {
+            'roi': list(self.roi) if self.roi is not None else None,
+            'width': self.width,
+            'overlay': self.overlay[0] if self.overlay is not None else None,
+            'subscribers': self.subscribers,
+            'frames_encoded': frames,
+            'frames_shared': self.frames_shared,
+            'avg_encode_ms': round(self.encode_ms_total / frames, 2) if frames else 0.0,
+            'avg_kb': round(self.bytes_total / frames / 1024, 1) if frames else 0.0,
+            'idle_s': round(time.monotonic() - self.last_used, 1),
+        }
+
+
+class PacedSubscriber:
+    """Статистика доставки одного клиента с ?fps= / ?width= / ?roi="""
+
+    def __init__(self, fps, width, roi=None):
+        self.fps = fps
+        self.width = width
+        self.roi = roi
+        self.started = time.monotonic()
+        self.frames = 0
+        self.bytes = 0
+        self.last_sent = None
+        self.intervals_ms = deque(maxlen=100)
+
+    def on_sent(self, nbytes):
+        now = time.monotonic()
+        if self.last_sent is not None:
+            self.intervals_ms.append((now - self.last_sent) * 1000)
+        self.last_sent = now
+        self.frames += 1
+        self.bytes += nbytes
+
+    def get_status(self):
+        elapsed = time.monotonic() - self.started
+        status = {
+            'fps_target': self.fps,
+            'width': self.width,
+            'roi': list(self.roi) if self.roi is not None else None,
+            'fps_actual': round(self.frames / elapsed, 2) if elapsed > 0 else 0.0,
+            'frames': self.frames,
+            'avg_kb': round(self.bytes / self.frames / 1024, 1) if self.frames else 0.0,
+            'interval_ms': None,
+        }
+        if self.intervals_ms:
+            intervals = np.array(self.intervals_ms)
+            status['interval_ms'] = {
+                'mean': round(float(intervals.mean()), 1),
+                'std': round(float(intervals.std()), 1),
+                'p95': round(float(np.percentile(intervals, 95)), 1),
+            }
+        return status
+
+
+class SubscriberPacing:
+    """Клиенты /video_feed со своей частотой, шириной и областью поверх общего FrameHub"""
+
+    def __init__(self, config, logger, frame_hub):
+        pacing_config = dict(PACING_DEFAULTS)
+        pacing_config.update(config.get('subscriber_pacing', {}) or {})
+
+        self.config = config
+        self.logger = logger
+        self.frame_hub = frame_hub
+        self.enabled = pacing_config['enabled']
+        self.min_fps = float(pacing_config['min_fps'])
+        self.min_width = int(pacing_config['min_width'])
+        self.width_step = max(2, int(pacing_config['width_step']))
+        self.max_widths = max(1, int(pacing_config['max_widths']))
+        self.max_rois = max(1, int(pacing_config['max_rois']))
+        self.jpeg_quality = pacing_config['jpeg_quality']
+
+        self.lock = threading.Lock()
+        # (ширина, разметка) -> Rendition (пока есть клиенты этой ширины)
+        self.renditions = {}
+        # (roi, доли, ширина, разметка) -> Rendition в порядке использования (LRU, последняя - свежая)
+        self.rois = OrderedDict()
+        self.subscribers = set()
+        self.width_snapped = 0
+        self.width_rejected = 0
+        self.rois_evicted = 0
+
+    def parse(self, args):
+        """
+        Параметры клиента из query string
+
+        Returns:
+            (fps, width, roi): None - без ограничения; roi - (координаты, доли) или None;
+            (None, None, None), если pacing выключен
+        """
+        if not self.enabled:
+            return None, None, None
+        fps = width = roi = None
+        try:
+            if args.get('fps'):
+                fps = max(self.min_fps, float(args.get('fps')))
+        except ValueError:
+            fps = None
+        try:
+            if args.get('width'):
+                width = max(self.min_width, int(args.get('width')))
+                width = max(self.width_step, round(width / self.width_step) * self.width_step)
+        except ValueError:
+            width = None
+        try:
+            if args.get('roi'):
+                roi = parse_roi(args.get('roi'))
+        except ValueError:
+            roi = None
+        return fps, width, roi
+
+    def _match_rendition(self, width, overlay_name):
+        """
+        Кодируемая копия для клиента (вызывать под lock)
+
+        Returns:
+            Копия той же ширины, при исчерпанном max_widths - ближайшая по ширине
+            с той же разметкой, иначе None (нужна новая или подходящей нет)
+        """
+        rendition = self.renditions.get((width, overlay_name))
+        if rendition is not None or len(self.renditions) < self.max_widths:
+            return rendition
+        same_overlay = [key for key in self.renditions if key[1] == overlay_name]
+        if not same_overlay:
+            return None
+        # Полная ширина (None) - шире любой уменьшенной
+        nearest = min(same_overlay, key=lambda key: abs((key[0] or _FULL_WIDTH) - (width or _FULL_WIDTH)))
+        return self.renditions[nearest]
+
+    def can_acquire(self, width, roi=None, overlay=None):
+        """Хватит ли лимита max_widths на клиента (проверка до начала ответа, отказ учитывается)"""
+        if roi is not None or overlay is None:
+            # Области - свой лимит с вытеснением, без разметки всегда есть основной кадр
+            return True
+        with self.lock:
+            if (self._match_rendition(width, overlay[0]) is not None
+                    or len(self.renditions) < self.max_widths):
+                return True
+            self.width_rejected += 1
+            return False
+
+    def _acquire_rendition(self, width, overlay=None):
+        """
+        Копия нужной ширины, при max_widths - ближайшая из кодируемых с той же разметкой
+
+        Returns:
+            Rendition; None - основной кадр (лимит, без разметки); False - лимит, копии с разметкой нет
+        """
+        overlay_name = overlay[0] if overlay is not None else None
+        with self.lock:
+            rendition = self._match_rendition(width, overlay_name)
+            if rendition is None:
+                if len(self.renditions) >= self.max_widths:
+                    if overlay is not None:
+                        self.width_rejected += 1
+                        return False
+                    print(f"📐 Ширина {width} заменена основным кадром: уже кодируется {len(self.renditions)} копий")
+                    self.width_snapped += 1
+                    return None
+                rendition = self.renditions[(width, overlay_name)] = Rendition(width, overlay=overlay)
+            elif rendition.width != width:
+                print(f"📐 Ширина {width} заменена на {rendition.width or 'полную'}: уже кодируется {len(self.renditions)} копий")
+                self.width_snapped += 1
+            rendition.subscribers += 1
+            return rendition
+
+    def _acquire_roi(self, roi, width, overlay=None):
+        """Копия области (общая для одинаковых запросов), вытеснение LRU при max_rois"""
+        coords, fractional = roi
+        key = (coords, fractional, width, overlay[0] if overlay is not None else None)
+        with self.lock:
+            rendition = self.rois.get(key)
+            if rendition is None:
+                while len(self.rois) >= self.max_rois:
+                    self._evict_roi()
+                rendition = self.rois[key] = Rendition(width, coords, fractional, overlay)
+            self.rois.move_to_end(key)
+            rendition.subscribers += 1
+            rendition.last_used = time.monotonic()
+            return rendition
+
+    def _evict_roi(self):
+        """Вытеснение давно не использованной области (вызывать под lock): сначала без зрителей"""
+        idle = [key for key, rendition in self.rois.items() if rendition.subscribers <= 0]
+        candidates = idle or list(self.rois)
+        key = min(candidates, key=lambda k: self.rois[k].last_used)
+        rendition = self.rois.pop(key)
+        rendition.evicted = True
+        self.rois_evicted += 1
+        if rendition.subscribers > 0:
+            print(f"✂️ Область {rendition.roi} вытеснена (лимит {self.max_rois}), "
+                  f"зрителей отключено: {rendition.subscribers}")
+
+    def _release_rendition(self, rendition):
+        with self.lock:
+            rendition.subscribers -= 1
+            # Область без зрителей остается в кэше до вытеснения (повторное подключение)
+            key = (rendition.width, rendition.overlay[0] if rendition.overlay is not None else None)
+            if rendition.roi is None and rendition.subscribers <= 0 \
+                    and self.renditions.get(key) is rendition:
+                del self.renditions[key]
+
+    def _jpeg_quality(self):
+        if self.jpeg_quality is not None:
+            return int(self.jpeg_quality)
+        return int(self.config['camera'].get('jpeg_quality', 85))
+
+    def generate(self, fps, width, is_active, roi=None, overlay=None):
+        """
+        Генератор MJPEG клиента с частотой fps, шириной width и областью roi
+
+        Args:
+            fps: Частота кадров клиента (None - каждый кадр источника)
+            width: Ширина кадра (None - как у основного стрима / размер области)
+            is_active: Функция - идет ли стрим
+            roi: Область кадра из parse() или None
+            overlay: (имя, draw_fn) разметки кадра или None
+        """
+        pacer = FramePacer(fps)
+        if roi is not None:
+            rendition = self._acquire_roi(roi, width, overlay)
+        elif width or overlay is not None:
+            rendition = self._acquire_rendition(width, overlay)
+            if rendition is False:
+                # Лимит занят между can_acquire и подключением
+                return
+        else:
+            rendition = None
+        stats = PacedSubscriber(fps, rendition.width if rendition else None,
+                                rendition.roi if rendition else None)
+        with self.lock:
+            self.subscribers.add(stats)
+
+        last_seq = 0
+        try:
+            while is_active():
+                if rendition is not None and rendition.evicted:
+                    break
+                pacer.wait(is_active)
+                # В срок - последний готовый кадр (ждем, только если нового еще нет)
+                encoded = self.frame_hub.wait_next(last_seq, timeout=2.0)
+                if encoded is None:
+                    continue
+                last_seq = encoded.seq
+
+                jpeg = encoded.jpeg
+                if rendition is not None and (rendition.roi is not None or rendition.overlay is not None
+                                              or encoded.frame.shape[1] > rendition.width):
+                    jpeg = rendition.get(encoded, self._jpeg_quality())
+                    if jpeg is None:
+                        continue
+
+                yield mjpeg_part(jpeg, encoded)
+                pacer.sent()
+                stats.on_sent(len(jpeg))
+        finally:
+            with self.lock:
+                self.subscribers.discard(stats)
+            if rendition is not None:
+                self._release_rendition(rendition)
+
+    def get_status(self):
+        with self.lock:
+            subscribers = list(self.subscribers)
+            renditions = dict(self.renditions)
+            rois = list(self.rois.values())
+        return {
+            'enabled': self.enabled,
+            'subscribers': [subscriber.get_status() for subscriber in subscribers],
+            'renditions': {f"{width or 'full'}{'+' + overlay if overlay else ''}": rendition.get_status()
+                           for (width, overlay), rendition in sorted(renditions.items(), key=lambda item: (item[0][0] or 0, item[0][1] or ''))},
+            'max_widths': self.max_widths,
+            'width_snapped': self.width_snapped,
+            'width_rejected': self.width_rejected,
+            # От давно не использованной к свежей (порядок вытеснения)
+            'rois': [rendition.get_status() for rendition in rois],
+            'max_rois': self.max_rois,
+            'rois_evicted': self.rois_evicted,
+        }
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+
+# tag_analysis.py
+
+"""
+Анализ кадров стрима детектором AprilTag внутри сервера.
+
+Раньше детекции можно было увидеть только в окнах OpenCV трекера
+(09_aprilTag_Tracker/src/main.py) на рабочем столе Pi. TagAnalysis
+запускает AprilTagDetector трекера (та же конфигурация и калибровка)
+в своем потоке со своей частотой fps: берет последний кадр FrameHub,
+уменьшает до width и переводит в оттенки серого, детектирует все метки
+и кэширует результат (id, углы в пикселях кадра камеры, поза).
+
+Стрим от анализа не зависит: /video_feed?overlay=tags - копия кадра
+(Rendition в subscriber_pacing), на которую при кодировании рисуется
+последний готовый результат. Кадр не ждет детектора, поэтому разметка
+может отставать от кадра - отставание (мс от захвата до результата и
+кадров между результатом и показом) есть в статусе.
+
+Детектору нужен pyapriltags (requirements трекера); без него анализ
+выключается с предупреждением.
+"""
+
+import importlib
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+from utils_rpi.core_budget import IntervalStats
+from utils_rpi.lazy_import import lazy_import, load_now
+
+# Тяжелые модули импортируются при первом обращении: импорт сервера их не загружает
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+ANALYSIS_DEFAULTS = {
+    'enabled': False,
+    'fps': 5,
+    'width': 960,             # Ширина кадра детектора (0 - полный кадр камеры)
+    'tracker_dir': '09_aprilTag_Tracker',
+    'tracker_config': 'config/config.yaml',
+    'camera_config': 'config/camera/camera_csi.yaml',
+    'on_demand': False,       # Детектировать только пока есть зрители ?overlay=tags и потока поз
+    'stale_s': 1.0,           # Результат по кадру, снятому раньше показанного на stale_s, не рисуется
+}
+
+TARGET_COLOR = (0, 255, 255)
+TAG_COLOR = (0, 255, 0)
+
+
+class TagResult:
+    """Результат детекции одного кадра"""
+
+    __slots__ = ('seq', 'capture_ts', 'capture_mono', 'done_mono', 'frame_size', 'tags', 'detect_ms')
+
+    def __init__(self, seq, capture_ts, capture_mono, done_mono, frame_size, tags, detect_ms):
+        self.seq = seq
+        self.capture_ts = capture_ts
+        self.capture_mono = capture_mono
+        self.done_mono = done_mono
+        self.frame_size = frame_size
+        self.tags = tags
+        self.detect_ms = detect_ms
+
+    @property
+    def lag_ms(self):
+        """От захвата кадра до готового результата"""
+        return (self.done_mono - self.capture_mono) * 1000
+
+    def to_dict(self):
+        return {
+            'seq': self.seq,
+            'capture_ts': self.capture_ts,
+            'frame_size': list(self.frame_size),
+            'detect_ms': round(self.detect_ms, 1),
+            'lag_ms': round(self.lag_ms, 1),
+            'age_s': round(time.monotonic() - self.done_mono, 2),
+            'tags': self.tags,
+        }
+
+
+def import_tracker_module(tracker_dir, name):
+    """
+    Модуль трекера (src.*) без постоянного изменения sys.path
+
+    Каталог трекера добавляется в sys.path только на время импорта, как
+    в bus_camera.load_frame_bus_reader трекера: остальные модули процесса
+    не видят его пакеты (src - общее имя).
+    """
+    sys.path.insert(0, tracker_dir)
+    try:
+        return importlib.import_module(name)
+    finally:
+        sys.path.remove(tracker_dir)
+
+
+def load_tracker_detector(tracker_dir, tracker_config, camera_config, nthreads=None):
+    """
+    AprilTagDetector трекера и калибровка камеры
+
+    Returns:
+        (detector, apriltag_config, calibration): calibration - (camera_matrix,
+        dist_coeffs, calib_width, calib_height) или None
+    """
+    import yaml
+
+    # Трекер импортирует OpenCV напрямую - загружаем через прокси, чтобы время импорта учлось
+    load_now(cv2)
+    AprilTagDetector = import_tracker_module(tracker_dir, 'src.detection.apriltag_detector').AprilTagDetector
+
+    with open(os.path.join(tracker_dir, tracker_config), 'r', encoding='utf-8') as f:
+        apriltag_config = dict(yaml.safe_load(f)['apriltag'])
+    apriltag_config['detector'] = dict(apriltag_config['detector'])
+    if nthreads:
+        apriltag_config['detector']['nthreads'] = int(nthreads)
+    detector = AprilTagDetector(apriltag_config)
+
+    calibration = None
+    try:
+        with open(os.path.join(tracker_dir, camera_config), 'r', encoding='utf-8') as f:
+            calib_config = yaml.safe_load(f)['camera']['calibration']
+        camera_matrix = np.load(os.path.join(tracker_dir, calib_config['matrix_file']))
+        dist_coeffs = np.load(os.path.join(tracker_dir, calib_config['dist_file']))
+        calibration = (camera_matrix, dist_coeffs, calib_config['calib_width'], calib_config['calib_height'])
+    except (OSError, KeyError, TypeError) as e:
+        print(f"⚠️ Анализ меток: калибровка не загружена ({e}), поза по приближенной матрице")
+    return detector, apriltag_config, calibration
+
+
+class TagAnalysis:
+    """Детекция AprilTag в своем потоке и кэш последнего результата"""
+
+    def __init__(self, config, logger, frame_hub, core_budget=None, base_dir=None):
+        analysis_config = dict(ANALYSIS_DEFAULTS)
+        analysis_config.update(config.get('tag_analysis', {}) or {})
+
+        self.logger = logger
+        self.frame_hub = frame_hub
+        self.core_budget = core_budget
+        self.enabled = analysis_config['enabled']
+        self.fps = float(analysis_config['fps'])
+        self.width = int(analysis_config['width'] or 0)
+        self.on_demand = analysis_config['on_demand']
+        self.stale_s = float(analysis_config['stale_s'])
+        base_dir = base_dir or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.tracker_dir = os.path.join(base_dir, analysis_config['tracker_dir'])
+        self.tracker_config = analysis_config['tracker_config']
+        self.camera_config = analysis_config['camera_config']
+
+        self.detector = None
+        self.apriltag_config = {}
+        self.calibration = None
+        self._flip_z_axis = None
+        self._rotation_to_euler = None
+        # Матрица камеры для размера кадра детектора (пересчитывается при смене размера)
+        self._scaled_for = None
+        self._camera_params = None
+
+        self.lock = threading.Lock()
+        # Новый результат будит ожидающих (wait_result)
+        self.condition = threading.Condition(self.lock)
+        self.latest = None
+        self.overlay_subscribers = 0
+        # Потребители результатов без видео (поток поз)
+        self.result_subscribers = 0
+        self.running = False
+        self.thread = None
+        self.error = None
+
+        # Статистика
+        self.frames_analyzed = 0
+        self.frames_with_tags = 0
+        self.detect_ms_total = 0.0
+        self.intervals = IntervalStats(maxlen=200)
+        self.lag_ms = deque(maxlen=200)
+        self.overlay_frames = 0
+        self.overlay_stale = 0
+        self.overlay_seq_behind = deque(maxlen=200)
+
+    # ===== ЖИЗНЕННЫЙ ЦИКЛ =====
+
+    def start(self):
+        """Загрузка детектора трекера и запуск потока анализа"""
+        if not self.enabled or self.running:
+            return False
+        nthreads = None
+        if self.core_budget is not None and self.core_budget.enabled:
+            nthreads = self.core_budget.detection_threads
+        try:
+            self.detector, self.apriltag_config, self.calibration = load_tracker_detector(
+                self.tracker_dir, self.tracker_config, self.camera_config, nthreads)
+            math_utils = import_tracker_module(self.tracker_dir, 'src.utils.math_utils')
+            self._flip_z_axis = math_utils.flip_z_axis
+            self._rotation_to_euler = math_utils.rotation_vector_to_euler
+        except ImportError as e:
+            self.enabled = False
+            self.error = f'детектор недоступен: {e}'
+            print(f"⚠️ Анализ меток выключен: {e} (pip install pyapriltags)")
+            return False
+        except (OSError, KeyError) as e:
+            self.enabled = False
+            self.error = f'конфигурация трекера: {e}'
+            self.logger.log_error(f"Анализ меток: ошибка конфигурации трекера: {e}")
+            return False
+
+        self.running = True
+        self.thread = threading.Thread(target=self._analysis_loop, name='tag-analysis', daemon=True)
+        self.thread.start()
+        print(f"🏷️ Анализ меток запущен: {self.apriltag_config.get('family')}, {self.fps} FPS, "
+              f"ширина {self.width or 'полная'}, потоков детектора {self.apriltag_config['detector']['nthreads']}")
+        return True
+
+    def stop(self):
+        self.running = False
+
+    def wants_frames(self):
+        """Нужны ли анализу кадры (для приостановки захвата без потребителей)"""
+        return self.running and (not self.on_demand or self._has_demand())
+
+    def _has_demand(self):
+        return self.overlay_subscribers > 0 or self.result_subscribers > 0
+
+    # ===== ДЕТЕКЦИЯ =====
+
+    def camera_params(self, width, height):
+        """fx, fy, cx, cy калибровки, пересчитанные на размер кадра width x height"""
+        if self.calibration is not None:
+            matrix, _, calib_width, calib_height = self.calibration
+            sx, sy = width / calib_width, height / calib_height
+            params = [matrix[0, 0] * sx, matrix[1, 1] * sy, matrix[0, 2] * sx, matrix[1, 2] * sy]
+        else:
+            # Без калибровки - поле зрения около 60° по горизонтали
+            focal = width / (2 * np.tan(np.radians(30)))
+            params = [focal, focal, width / 2.0, height / 2.0]
+        return [float(value) for value in params]
+
+    def _camera_params_for(self, width, height):
+        """Параметры камеры для кадра детектора (кэш до смены размера)"""
+        if self._scaled_for != (width, height):
+            self._scaled_for = (width, height)
+            self._camera_params = self.camera_params(width, height)
+        return self._camera_params
+
+    def _detect(self, encoded):
+        """Детекция на уменьшенном сером кадре; углы - в пикселях кадра камеры"""
+        source = encoded.source
+        h, w = source.shape[:2]
+        scale = 1.0
+        if self.width and w > self.width:
+            scale = self.width / w
+            source = cv2.resize(source, (self.width, max(2, int(h * scale))), interpolation=cv2.INTER_AREA)
+        gray = source if source.ndim == 2 else cv2.cvtColor(source, cv2.COLOR_BGR2GRAY)
+
+        gh, gw = gray.shape[:2]
+        detections = self.detector.detector.detect(
+            gray, estimate_tag_pose=True,
+            camera_params=self._camera_params_for(gw, gh),
+            tag_size=self.detector.size_m,
+        )
+
+        tags = []
+        for detection in detections:
+            corners = np.asarray(detection.corners, dtype=np.float64) / scale
+            tag = {
+                'id': int(detection.tag_id),
+                'target': detection.tag_id == self.detector.target_id,
+                'corners': [[round(float(x), 1), round(float(y), 1)] for x, y in corners],
+                'center': [round(float(value), 1) for value in np.asarray(detection.center) / scale],
+                'decision_margin': round(float(detection.decision_margin), 1),
+                'pose': None,
+            }
+            if detection.pose_R is not None and detection.pose_t is not None:
+                rvec, _ = cv2.Rodrigues(detection.pose_R)
+                tvec = np.array(detection.pose_t).reshape(3, 1)
+                # Та же система координат, что у трекера
+                rvec, tvec = self._flip_z_axis(rvec, tvec)
+                roll, pitch, yaw = self._rotation_to_euler(rvec)
+                tag['pose'] = {
+                    'tvec_m': [round(float(value), 4) for value in tvec.ravel()],
+                    'rvec': [round(float(value), 4) for value in rvec.ravel()],
+                    'distance_m': round(float(np.linalg.norm(tvec)), 4),
+                    'rpy_deg': [round(float(roll), 1), round(float(pitch), 1), round(float(yaw), 1)],
+                    'error': float(detection.pose_err) if detection.pose_err is not None else None,
+                }
+            tags.append(tag)
+        return tags, (w, h)
+
+    def _analysis_loop(self):
+        """Последний кадр FrameHub с частотой fps -> детектор -> кэш результата"""
+        if self.core_budget is not None:
+            self.core_budget.pin_current('detection')
+        last_seq = 0
+        next_due = time.monotonic()
+        while self.running:
+            if self.on_demand and not self._has_demand():
+                self.intervals.reset()
+                time.sleep(0.2)
+                continue
+            delay = next_due - time.monotonic()
+            if delay > 0:
+                time.sleep(min(delay, 0.5))
+                continue
+            try:
+                encoded = self.frame_hub.wait_next(last_seq, timeout=1.0)
+                if encoded is None:
+                    self.intervals.reset()
+                    continue
+                last_seq = encoded.seq
+
+                start = time.perf_counter()
+                tags, frame_size = self._detect(encoded)
+                detect_ms = (time.perf_counter() - start) * 1000
+                result = TagResult(encoded.seq, encoded.capture_ts, encoded.capture_mono, time.monotonic(),
+                                   frame_size, tags, detect_ms)
+                with self.condition:
+                    self.latest = result
+                    self.condition.notify_all()
+                self.frames_analyzed += 1
+                self.frames_with_tags += 1 if tags else 0
+                self.detect_ms_total += detect_ms
+                self.intervals.tick(result.done_mono)
+                self.lag_ms.append(result.lag_ms)
+            except Exception as e:
+                self.logger.log_error(f"Ошибка анализа меток: {e}")
+                time.sleep(0.5)
+            interval = 1.0 / self.fps if self.fps > 0 else 0.0
+            next_due = max(next_due + interval, time.monotonic())
+
+    def get_latest(self):
+        """Последний результат (TagResult) или None"""
+        with self.lock:
+            return self.latest
+
+    def wait_result(self, last_seq, timeout=1.0):
+        """
+        Результат по кадру новее last_seq
+
+        Returns:
+            TagResult или None по таймауту
+        """
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while self.latest is None or self.latest.seq <= last_seq:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.running:
+                    return None
+                self.condition.wait(remaining)
+            return self.latest
+
+    # ===== РАЗМЕТКА =====
+
+    def draw(self, frame, encoded, transform):
+        """
+        Последний результат поверх кадра стрима (вызывается при кодировании копии ?overlay=tags)
+
+        Args:
+            frame: Кадр копии (рисуется на нем)
+            encoded: Кадр FrameHub, из которого получена копия
+            transform: (x0, y0, scale) - пиксели кадра камеры -> пиксели копии
+        """
+        result = self.get_latest()
+        self.overlay_frames += 1
+        # Устаревание - по времени захвата: результат неподвижной сцены остается верным
+        if result is None or encoded.capture_mono - result.capture_mono > self.stale_s:
+            self.overlay_stale += 1
+            return frame
+        self.overlay_seq_behind.append(encoded.seq - result.seq)
+
+        x0, y0, scale = transform
+        thickness = max(1, int(round(2 * scale * max(1.0, frame.shape[1] / 640))))
+        for tag in result.tags:
+            points = (np.array(tag['corners']) - (x0, y0)) * scale
+            color = TARGET_COLOR if tag['target'] else TAG_COLOR
+            cv2.polylines(frame, [points.astype(np.int32)], True, color, thickness)
+            cx, cy = (np.array(tag['center']) - (x0, y0)) * scale
+            label = f"ID {tag['id']}"
+            if tag['pose'] is not None:
+                label += f" {tag['pose']['distance_m']:.2f}m"
+            cv2.putText(frame, label, (int(cx) + 5, int(cy) - 5), cv2.FONT_HERSHEY_SIMPLEX,
+                        0.5, color, 1, cv2.LINE_AA)
+        return frame
+
+    def overlay(self, name):
+        """Разметка для ?overlay= ((имя, draw_fn) для Rendition) или None, если анализ не запущен"""
+        if name != 'tags' or not self.running:
+            return None
+        return 'tags', self.draw
+
+    def acquire_overlay(self):
+        with self.lock:
+            self.overlay_subscribers += 1
+
+    def release_overlay(self):
+        with self.lock:
+            self.overlay_subscribers = max(0, self.overlay_subscribers - 1)
+
+    def acquire_results(self):
+        with self.lock:
+            self.result_subscribers += 1
+
+    def release_results(self):
+        with self.lock:
+            self.result_subscribers = max(0, self.result_subscribers - 1)
+
+    def get_status(self):
+        analyzed = self.frames_analyzed
+        latest = self.get_latest()
+        lag = np.array(list(self.lag_ms))
+        behind = np.array(list(self.overlay_seq_behind))
+        timing = self.intervals.get_status()
+        return {
+            'enabled': self.enabled,
+            'running': self.running,
+            'error': self.error,
+            'fps_target': self.fps,
+            'fps': timing['fps'] if timing else 0.0,
+            'width': self.width,
+            'family': self.apriltag_config.get('family'),
+            'target_id': self.apriltag_config.get('target_id'),
+            'nthreads': (self.apriltag_config.get('detector') or {}).get('nthreads'),
+            'frames_analyzed': analyzed,
+            'frames_with_tags': self.frames_with_tags,
+            'result_subscribers': self.result_subscribers,
+            'avg_detect_ms': round(self.detect_ms_total / analyzed, 1) if analyzed else 0.0,
+            'lag_ms': {
+                'p50': round(float(np.percentile(lag, 50)), 1),
+                'p95': round(float(np.percentile(lag, 95)), 1),
+                'max': round(float(lag.max()), 1),
+            } if len(lag) else None,
+            'overlay': {
+                'subscribers': self.overlay_subscribers,
+                'frames': self.overlay_frames,
+                'stale': self.overlay_stale,
+                'avg_frames_behind': round(float(behind.mean()), 2) if len(behind) else None,
+            },
+            'latest': latest.to_dict() if latest is not None else None,
+        }
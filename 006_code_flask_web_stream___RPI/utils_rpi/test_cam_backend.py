@@ -1,8 +1,10 @@
 # test_cam_backend.py
 
-import cv2
 import os
 import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 # Добавляем путь к utils_rpi
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -12,6 +14,13 @@ if current_dir not in sys.path:
 print("start test_cam_backend.py")
 print(f"current_dir: {current_dir}")
 
+from startup_profile import StartupProfile
+from utils_rpi.lazy_import import lazy_import
+from virtual_camera import is_virtual_device, open_virtual_camera
+
+# Общий с сервером прокси: время импорта OpenCV попадает в camera_init.lazy_imports_ms
+cv2 = lazy_import('cv2')
+
 # Пробуем импортировать CSI Camera Manager
 try:
     from csi_camera_manager import CSICameraManager
@@ -46,10 +55,195 @@ def get_camera_backend(backend_name):
 
 # ===============================================================
 
+def _normalize_device(device):
+    """Приведение номера устройства к пути /dev/videoN"""
+    if isinstance(device, int) or str(device).isdigit():
+        return f"/dev/video{device}"
+    return str(device)
+
+
+def _fourcc_to_str(fourcc_int):
+    """Преобразование FOURCC из числа в строку"""
+    fourcc_int = int(fourcc_int)
+    return "".join(chr((fourcc_int >> (8 * i)) & 0xFF) for i in range(4))
+
+
+def _build_v4l2_candidates(camera_config, device_value, is_raspberry_pi):
+    """Список вариантов открытия V4L2 камеры в порядке приоритета"""
+    backends = []
+
+    # Если Raspberry Pi - пробуем оптимизированные варианты
+    if is_raspberry_pi:
+        # Пробуем разные варианты
+        for backend_name in camera_config['test_backends']:
+            if backend_name == "default":
+                backends.append((f"Default", device_value, cv2.CAP_ANY))
+
+            elif backend_name == "rpi_v4l2":
+                backends.append((f"V4L2", device_value, cv2.CAP_V4L2))
+
+            elif backend_name.startswith("direct_video"):
+                # Извлекаем номер из имени, например "direct_video0" -> 0
+                try:
+                    video_num = int(backend_name.replace("direct_video", ""))
+                    backends.append((f"Direct /dev/video{video_num}", f"/dev/video{video_num}", cv2.CAP_V4L2))
+                except:
+                    pass
+
+            elif backend_name == "picamera2":
+                # CSI камеры обрабатываются отдельно
+                continue
+
+    return backends
+
+
+def _probe_backend(name, device, backend, camera_config, is_raspberry_pi, logger,
+                   fourcc=None, settle=True):
+    """
+    Пробное открытие камеры одним бэкендом
+
+    Args:
+        settle: Паузы на инициализацию (при переборе). Для профиля запуска не нужны.
+
+    Returns:
+        (cam, info) при успехе или None
+    """
+    print(f"\n=== Тестируем {name} ===")
+    logger.info(f"Тестируем подключение камеры: {name}")
+
+    start_time = time.time()
+    try:
+        # Даем время на инициализацию
+        if is_raspberry_pi and settle:
+            time.sleep(0.3)
+
+        if backend is None:
+            cam = cv2.VideoCapture(device)
+        else:
+            cam = cv2.VideoCapture(device, backend)
+
+        # Настройки для Raspberry Pi
+        if is_raspberry_pi:
+            if settle:
+                time.sleep(0.2)
+
+            # Устанавливаем буфер
+            try:
+                cam.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            except:
+                pass
+
+        # Кодек ставим до разрешения (как в start_stream_internal)
+        if fourcc:
+            cam.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
+
+        # Устанавливаем разрешение если указано
+        if 'width' in camera_config and 'height' in camera_config:
+            cam.set(cv2.CAP_PROP_FRAME_WIDTH, camera_config['width'])
+            cam.set(cv2.CAP_PROP_FRAME_HEIGHT, camera_config['height'])
+            # На RPi даем время на изменение разрешения
+            if is_raspberry_pi and settle:
+                time.sleep(0.1)
+
+        # Устанавливаем FPS если указано
+        if 'fps' in camera_config:
+            cam.set(cv2.CAP_PROP_FPS, camera_config['fps'])
+
+        # Проверяем, открыта ли камера
+        if cam.isOpened():
+            print(f"✓ Устройство открыто успешно ({name})")
+
+            # Пробуем прочитать кадр
+            ret, frame = cam.read()
+
+            if ret and frame is not None and frame.size > 0:
+                # Получаем параметры камеры
+                actual_width = int(cam.get(cv2.CAP_PROP_FRAME_WIDTH))
+                actual_height = int(cam.get(cv2.CAP_PROP_FRAME_HEIGHT))
+                actual_fps = cam.get(cv2.CAP_PROP_FPS)
+
+                resolution_str = f"{actual_width}x{actual_height}"
+                fps_str = f"{actual_fps:.1f}"
+                open_ms = round((time.time() - start_time) * 1000, 1)
+
+                print(f"\n✅ {name} РАБОТАЕТ! ({open_ms} мс)")
+                print(f"   Разрешение: {resolution_str}")
+                print(f"   FPS: {fps_str}")
+                print(f"   Размер кадра: {frame.shape}")
+
+                logger.log_camera_test(name, True, resolution_str, fps_str)
+
+                info = {
+                    'type': 'v4l2',
+                    'backend_name': name,
+                    'device': device,
+                    'api': backend,
+                    'fourcc': _fourcc_to_str(cam.get(cv2.CAP_PROP_FOURCC)),
+                    'width': actual_width,
+                    'height': actual_height,
+                    'fps': actual_fps,
+                    'open_ms': open_ms,
+                }
+                return cam, info
+            else:
+                print(f"⚠️  Устройство открыто, но кадры не читаются ({name})")
+                cam.release()
+        else:
+            print(f"❌ Не удалось открыть устройство ({name})")
+
+    except Exception as e:
+        print(f"❌ Ошибка ({name}): {e}")
+        logger.log_camera_test(name, False, error=str(e))
+
+    return None
+
+
+def _probe_backends_parallel(candidates, camera_config, is_raspberry_pi, logger):
+    """
+    Параллельный перебор бэкендов
+
+    Одно устройство нельзя безопасно открывать несколькими бэкендами
+    одновременно, поэтому варианты группируются по устройству: группы
+    проверяются параллельно, варианты внутри группы - по очереди.
+    Побеждает первый сработавший вариант в порядке test_backends.
+    """
+    fourcc = camera_config.get('fourcc')
+
+    groups = OrderedDict()
+    for priority, (name, device, backend) in enumerate(candidates):
+        groups.setdefault(_normalize_device(device), []).append((priority, name, device, backend))
+
+    results = {}
+
+    def probe_group(items):
+        for priority, name, device, backend in items:
+            result = _probe_backend(name, device, backend, camera_config,
+                                    is_raspberry_pi, logger, fourcc=fourcc)
+            if result:
+                results[priority] = result
+                return
+
+    if groups:
+        print(f"🔀 Параллельная проверка {len(groups)} устройств ({len(candidates)} вариантов)")
+        with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+            list(executor.map(probe_group, groups.values()))
+
+    if not results:
+        return None
+
+    best = min(results)
+    # Освобождаем проигравшие устройства
+    for priority, (cam, _) in results.items():
+        if priority != best:
+            cam.release()
+
+    return results[best]
+
+
 def test_camera_backends(config, logger):
     """Тестируем разные способы открытия камеры согласно конфигурации"""
 
- 
+    start_time = time.time()
     camera_config = config['camera']
     backend_mode = camera_config['backend'].lower()
     is_raspberry_pi = config.get('raspberry_pi', False)
@@ -58,10 +252,24 @@ def test_camera_backends(config, logger):
     device_value = camera_config['device']
     device_str = str(device_value)  # Конвертируем в строку
     
-
     print(f"PICAMERA2_AVAILABLE = {PICAMERA2_AVAILABLE}")
     print(f"is_raspberry_pi = {is_raspberry_pi}")
-   
+
+    # Виртуальная камера (файл, папка изображений или синтетика) - без железа
+    if backend_mode == 'virtual' or is_virtual_device(device_str):
+        device = device_str if is_virtual_device(device_str) else 'virtual_0'
+        print(f"\n=== Виртуальная камера {device} ===")
+        cam = open_virtual_camera(config, device)
+        if cam is None:
+            print(f"\n❌ НЕ УДАЛОСЬ ОТКРЫТЬ ВИРТУАЛЬНУЮ КАМЕРУ!")
+            return None
+        return {'type': 'v4l2', 'camera': cam, 'device': device, 'preconfigured': True}
+
+    # Профиль последнего успешного запуска
+    profile = StartupProfile(config, logger)
+    profile_entry = profile.get_device(device_str)
+    if profile_entry:
+        print(f"⚡ Найден профиль запуска для {device_str}: {profile_entry.get('backend_name')}")
 
     # Если на Raspberry Pi и доступен Picamera2, пробуем CSI камеры
     if is_raspberry_pi and PICAMERA2_AVAILABLE:
@@ -74,16 +282,34 @@ def test_camera_backends(config, logger):
             print(f"✅ Найдено CSI камер: {len(csi_cameras)}")
             for cam in csi_cameras:
                 print(f"  • {cam['name']}")
+            profile.save_csi_cameras(csi_cameras)
             
             # Если в конфиге указана CSI камера, используем её
             if device_str.startswith('csi_'):  # Используем строку!
                 try:
                     camera_idx = int(device_str.split('_')[1])
+                    cam_info = csi_manager.get_camera_info(camera_idx)
+
+                    # Модель сенсора поменялась - профиль больше не актуален
+                    if profile_entry and cam_info and profile_entry.get('model') != cam_info.get('model'):
+                        profile.invalidate(device_str)
+
+                    open_start = time.time()
                     picam2 = csi_manager.open_csi_camera(camera_idx)
                     if picam2:
                         print(f"✅ Используем CSI камеру #{camera_idx}")
+                        profile.save_device(device_str, {
+                            'type': 'csi',
+                            'backend_name': 'picamera2',
+                            'camera_idx': camera_idx,
+                            'model': cam_info.get('model') if cam_info else None,
+                            'open_ms': round((time.time() - open_start) * 1000, 1),
+                        })
+                        print(f"⏱️ Камера найдена за {time.time() - start_time:.2f} с")
                         # Возвращаем словарь с информацией о типе камеры
-                        return {'type': 'csi', 'csi_manager': csi_manager, 'picam2': picam2}
+                        return {'type': 'csi', 'csi_manager': csi_manager, 'picam2': picam2,
+                                'camera_idx': camera_idx}
+                    profile.invalidate(device_str)
                 except (ValueError, IndexError) as e:
                     print(f"⚠️  Ошибка парсинга CSI индекса: {e}")
                 except Exception as e:
@@ -91,110 +317,36 @@ def test_camera_backends(config, logger):
     
     # Остальная логика для USB камер через V4L2
     print(f"\n=== Тестирование камеры: устройство {device_str} ===")
+
+    # Сначала пробуем вариант из профиля запуска
+    if profile_entry and profile_entry.get('type') == 'v4l2':
+        result = _probe_backend(profile_entry['backend_name'], profile_entry['device'],
+                                profile_entry.get('api'), camera_config, is_raspberry_pi,
+                                logger, fourcc=profile_entry.get('fourcc'), settle=False)
+        if result:
+            cam, info = result
+            print(f"⚡ Профиль запуска сработал, камера найдена за {time.time() - start_time:.2f} с")
+            return {'type': 'v4l2', 'camera': cam, 'device': info['device'],
+                    'preconfigured': True}
+
+        print("⚠️ Профиль запуска не сработал, выполняю полный перебор")
+        profile.invalidate(device_str)
     
     if backend_mode == "auto":
         # Автоматическое тестирование бэкендов
-        backends = []
-        
-        # Если Raspberry Pi - пробуем оптимизированные варианты
         if is_raspberry_pi:
             logger.info("Обнаружен Raspberry Pi - применяю специальные настройки")
-            
-            # Пробуем разные варианты
-            for backend_name in camera_config['test_backends']:
-                if backend_name == "default":
-                    backends.append((f"Default", device_value, cv2.CAP_ANY))
-                
-                elif backend_name == "rpi_v4l2":
-                    backends.append((f"V4L2", device_value, cv2.CAP_V4L2))
-                
-                elif backend_name.startswith("direct_video"):
-                    # Извлекаем номер из имени, например "direct_video0" -> 0
-                    try:
-                        video_num = int(backend_name.replace("direct_video", ""))
-                        backends.append((f"Direct /dev/video{video_num}", f"/dev/video{video_num}", cv2.CAP_V4L2))
-                    except:
-                        pass
-                
-                elif backend_name == "picamera2":
-                    # Уже обработали выше
-                    continue
-        
-        # Тестируем все бэкенды
-        successful_cam = None
-        
-        for name, device, backend in backends:
-            print(f"\n=== Тестируем {name} ===")
-            logger.info(f"Тестируем подключение камеры: {name}")
-            
-            try:
-                # Даем время на инициализацию
-                if is_raspberry_pi:
-                    import time
-                    time.sleep(0.3)
-                
-                if backend is None:
-                    cam = cv2.VideoCapture(device)
-                else:
-                    cam = cv2.VideoCapture(device, backend)
-                
-                # Настройки для Raspberry Pi
-                if is_raspberry_pi:
-                    time.sleep(0.2)
-                    
-                    # Устанавливаем буфер
-                    try:
-                        cam.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-                    except:
-                        pass
-                
-                # Устанавливаем разрешение если указано
-                if 'width' in camera_config and 'height' in camera_config:
-                    cam.set(cv2.CAP_PROP_FRAME_WIDTH, camera_config['width'])
-                    cam.set(cv2.CAP_PROP_FRAME_HEIGHT, camera_config['height'])
-                    # На RPi даем время на изменение разрешения
-                    if is_raspberry_pi:
-                        time.sleep(0.1)
-                
-                # Устанавливаем FPS если указано
-                if 'fps' in camera_config:
-                    cam.set(cv2.CAP_PROP_FPS, camera_config['fps'])
-                
-                # Проверяем, открыта ли камера
-                if cam.isOpened():
-                    print(f"✓ Устройство открыто успешно")
-                    
-                    # Пробуем прочитать кадр
-                    ret, frame = cam.read()
-                    
-                    if ret and frame is not None and frame.size > 0:
-                        # Получаем параметры камеры
-                        actual_width = int(cam.get(cv2.CAP_PROP_FRAME_WIDTH))
-                        actual_height = int(cam.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                        actual_fps = cam.get(cv2.CAP_PROP_FPS)
-                        
-                        resolution_str = f"{actual_width}x{actual_height}"
-                        fps_str = f"{actual_fps:.1f}"
-                        
-                        print(f"\n✅ {name} РАБОТАЕТ!")
-                        print(f"   Разрешение: {resolution_str}")
-                        print(f"   FPS: {fps_str}")
-                        print(f"   Размер кадра: {frame.shape}")
-                        
-                        logger.log_camera_test(name, True, resolution_str, fps_str)
-                        
-                        # Возвращаем камеру
-                        return {'type': 'v4l2', 'camera': cam}
-                    else:
-                        print(f"⚠️  Устройство открыто, но кадры не читаются")
-                        cam.release()
-                else:
-                    print(f"❌ Не удалось открыть устройство")
-                    
-            except Exception as e:
-                print(f"❌ Ошибка: {e}")
-                logger.log_camera_test(name, False, error=str(e))
+        candidates = _build_v4l2_candidates(camera_config, device_value, is_raspberry_pi)
+
+        result = _probe_backends_parallel(candidates, camera_config, is_raspberry_pi, logger)
+        if result:
+            cam, info = result
+            profile.save_device(device_str, info)
+            print(f"⏱️ Камера найдена за {time.time() - start_time:.2f} с")
+            # Возвращаем камеру
+            return {'type': 'v4l2', 'camera': cam, 'device': info['device'],
+                    'preconfigured': True}
     
     # Если ничего не найдено
     print(f"\n❌ НЕ НАЙДЕНА РАБОТАЮЩАЯ КАМЕРА!")
-    return None
\ No newline at end of file
+    return None
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+
+# thermal_governor.py
+
+"""
+Снижение нагрузки по температуре, троттлингу и загрузке CPU.
+
+При длительной нагрузке (несколько камер) SoC сам снижает частоту, и все
+потоки деградируют непредсказуемо. ThermalGovernor раньше этого по шагам
+поднимает "уровень давления" L и снижает параметры потоков в порядке
+приоритета: поток с priority p получает уровень деградации L - p, т.е.
+сначала дешевеют наименее важные (мозаика, пул), основной стрим - последним.
+
+Источники (стандартные пути Linux, корень sysfs_root настраивается - для
+тестов с поддельным деревом):
+  - температура: sys/class/thermal/thermal_zone0/temp (милли-°C);
+  - троттлинг: sys/devices/platform/soc/soc:firmware/get_throttled
+    (флаги прошивки Raspberry Pi: 0x1 недонапряжение, 0x2 частота ограничена,
+    0x4 троттлинг, 0x8 мягкий температурный предел);
+  - загрузка: proc/loadavg (1 мин), делится на число ядер;
+  - частота: sys/devices/system/cpu/cpu0/cpufreq/scaling_cur_freq.
+
+Решение на каждом интервале:
+  - критично (temp >= critical_c или прошивка уже ограничивает частоту) -
+    шаг вверх на каждой проверке;
+  - горячо (temp >= target_c или загрузка >= load_per_core) - шаг вверх не чаще step_s;
+  - прохладно (temp < target_c - hysteresis_c, загрузка ниже порога) дольше hold_s -
+    шаг вниз.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+THROTTLED_NOW_LIMITS = 0x2 | 0x4 | 0x8
+UNDER_VOLTAGE_NOW = 0x1
+
+GOVERNOR_DEFAULTS = {
+    'enabled': False,
+    'interval_s': 2.0,
+    'sysfs_root': '/',
+    'temp_path': 'sys/class/thermal/thermal_zone0/temp',
+    'throttled_path': 'sys/devices/platform/soc/soc:firmware/get_throttled',
+    'loadavg_path': 'proc/loadavg',
+    'freq_path': 'sys/devices/system/cpu/cpu0/cpufreq/scaling_cur_freq',
+    'target_c': 70.0,
+    'critical_c': 78.0,
+    'hysteresis_c': 5.0,
+    'load_per_core': 0.9,
+    'step_s': 10.0,
+    'hold_s': 30.0,
+}
+
+
+class GovernedStream:
+    """Поток под управлением: уровни деградации и применение параметров"""
+
+    def __init__(self, name, priority, levels, get_fn, set_fn):
+        """
+        Args:
+            name: Имя потока (ключ в streams конфигурации)
+            priority: Чем выше, тем позже снижается
+            levels: Список словарей параметров для уровней 1..N
+            get_fn: get_fn(keys) -> текущие значения параметров (базовые, до снижения)
+            set_fn: set_fn(dict) - применить параметры
+        """
+        self.name = name
+        self.priority = priority
+        self.levels = levels
+        self.get_fn = get_fn
+        self.set_fn = set_fn
+        self.level = 0
+        self.baseline = None
+        self.applied = {}
+
+    def target(self, level):
+        """Параметры для уровня: базовые значения, поверх - значения уровня"""
+        if level == 0:
+            return dict(self.baseline or {})
+        settings = dict(self.baseline or {})
+        settings.update(self.levels[level - 1])
+        return settings
+
+
+class ThermalGovernor:
+    """Уровень давления по датчикам и снижение параметров потоков по приоритету"""
+
+    def __init__(self, config, logger):
+        governor_config = dict(GOVERNOR_DEFAULTS)
+        governor_config.update(config.get('thermal_governor', {}) or {})
+
+        self.logger = logger
+        self.enabled = governor_config['enabled']
+        self.interval_s = float(governor_config['interval_s'])
+        self.sysfs_root = governor_config['sysfs_root']
+        self.paths = {key: governor_config[f'{key}_path'] for key in ('temp', 'throttled', 'loadavg', 'freq')}
+        self.target_c = float(governor_config['target_c'])
+        self.critical_c = float(governor_config['critical_c'])
+        self.hysteresis_c = float(governor_config['hysteresis_c'])
+        self.load_per_core = float(governor_config['load_per_core'])
+        self.step_s = float(governor_config['step_s'])
+        self.hold_s = float(governor_config['hold_s'])
+        self.stream_config = governor_config.get('streams', {}) or {}
+        self.cores = os.cpu_count() or 1
+
+        self.streams = {}
+        self.level = 0
+        self.max_level = 0
+        self.sensors = {}
+        self.state = 'ok'
+
+        self.running = False
+        self.thread = None
+        self.last_up_mono = 0.0
+        self.cool_since = None
+        self.level_since = time.monotonic()
+        self.decisions = deque(maxlen=int(governor_config.get('history', 20)))
+        self.time_at_level = {}
+        self.max_temp_c = None
+
+    # ===== ПОТОКИ =====
+
+    def register(self, name, get_fn, set_fn):
+        """Поток из секции streams (не описан в конфигурации - не управляется)"""
+        stream_config = self.stream_config.get(name)
+        if not stream_config or not stream_config.get('levels'):
+            return
+        stream = GovernedStream(name, int(stream_config.get('priority', 0)),
+                                list(stream_config['levels']), get_fn, set_fn)
+        self.streams[name] = stream
+        self.max_level = max(self.max_level, stream.priority + len(stream.levels))
+
+    # ===== ДАТЧИКИ =====
+
+    def _read(self, key):
+        path = os.path.join(self.sysfs_root, self.paths[key].lstrip('/'))
+        try:
+            with open(path, 'r') as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def read_sensors(self):
+        """Текущие показания (None - датчика нет)"""
+        sensors = {'temp_c': None, 'throttled': None, 'load_per_core': None, 'freq_mhz': None}
+        raw = self._read('temp')
+        if raw:
+            try:
+                sensors['temp_c'] = int(raw) / 1000.0
+            except ValueError:
+                pass
+        raw = self._read('throttled')
+        if raw:
+            try:
+                # Прошивка отдает флаги в шестнадцатеричном виде ("50005" или "0x50005")
+                sensors['throttled'] = int(raw, 16)
+            except ValueError:
+                pass
+        raw = self._read('loadavg')
+        if raw:
+            try:
+                sensors['load_per_core'] = round(float(raw.split()[0]) / self.cores, 2)
+            except (ValueError, IndexError):
+                pass
+        raw = self._read('freq')
+        if raw:
+            try:
+                sensors['freq_mhz'] = int(raw) // 1000
+            except ValueError:
+                pass
+        return sensors
+
+    # ===== РЕШЕНИЕ =====
+
+    def _classify(self, sensors):
+        """'critical', 'hot', 'cool' или 'ok' и причины"""
+        temp = sensors['temp_c']
+        throttled = sensors['throttled'] or 0
+        load = sensors['load_per_core']
+        reasons = []
+
+        if throttled & THROTTLED_NOW_LIMITS:
+            reasons.append(f'throttled=0x{throttled:x}')
+        if temp is not None and temp >= self.critical_c:
+            reasons.append(f'temp {temp:.1f}°C >= {self.critical_c}')
+        if reasons:
+            return 'critical', reasons
+
+        if temp is not None and temp >= self.target_c:
+            reasons.append(f'temp {temp:.1f}°C >= {self.target_c}')
+        if load is not None and load >= self.load_per_core:
+            reasons.append(f'load {load} >= {self.load_per_core}')
+        if throttled & UNDER_VOLTAGE_NOW:
+            reasons.append('under-voltage')
+        if reasons:
+            return 'hot', reasons
+
+        temp_cool = temp is None or temp < self.target_c - self.hysteresis_c
+        load_cool = load is None or load < self.load_per_core
+        return ('cool' if temp_cool and load_cool else 'ok'), []
+
+    def step(self, now=None):
+        """Одна проверка: датчики -> уровень -> параметры потоков"""
+        now = time.monotonic() if now is None else now
+        sensors = self.read_sensors()
+        self.sensors = sensors
+        if sensors['temp_c'] is not None:
+            self.max_temp_c = max(self.max_temp_c or sensors['temp_c'], sensors['temp_c'])
+
+        state, reasons = self._classify(sensors)
+        self.state = state
+        new_level = self.level
+        if state == 'critical' or (state == 'hot' and now - self.last_up_mono >= self.step_s):
+            self.cool_since = None
+            if self.level < self.max_level:
+                new_level = self.level + 1
+                self.last_up_mono = now
+        elif state == 'cool':
+            if self.cool_since is None:
+                self.cool_since = now
+            if self.level > 0 and now - max(self.cool_since, self.level_since) >= self.hold_s:
+                new_level = self.level - 1
+                reasons = [f'cool {now - self.cool_since:.0f} s']
+        else:
+            self.cool_since = None
+
+        if new_level != self.level:
+            self._set_level(new_level, reasons, now)
+
+    def _set_level(self, level, reasons, now):
+        elapsed = now - self.level_since
+        self.time_at_level[self.level] = self.time_at_level.get(self.level, 0.0) + elapsed
+        old_level, self.level, self.level_since = self.level, level, now
+
+        changes = {}
+        # Снижение - сначала низкий приоритет, восстановление - сначала высокий
+        for stream in sorted(self.streams.values(), key=lambda s: s.priority, reverse=level < old_level):
+            stream_level = max(0, min(level - stream.priority, len(stream.levels)))
+            if stream_level == stream.level:
+                continue
+            changed = self._apply_stream(stream, stream_level)
+            if changed:
+                changes[stream.name] = {'level': stream_level, 'settings': changed}
+
+        decision = {
+            'time': datetime.now().strftime('%H:%M:%S'),
+            'level': f'{old_level} -> {level}',
+            'reasons': reasons,
+            'sensors': dict(self.sensors),
+            'streams': changes,
+        }
+        self.decisions.append(decision)
+        arrow = '🔥' if level > old_level else '❄️'
+        print(f"{arrow} Терморегулятор: уровень {old_level} -> {level} ({', '.join(reasons) or '-'}); {changes}")
+        self.logger.log_info(f"Терморегулятор: уровень {old_level} -> {level}, причины {reasons}, потоки {changes}")
+
+    def _apply_stream(self, stream, level):
+        """Параметры уровня потоку; базовые значения запоминаются при первом снижении"""
+        keys = set()
+        for settings in stream.levels:
+            keys.update(settings)
+        if stream.baseline is None:
+            try:
+                stream.baseline = stream.get_fn(sorted(keys))
+            except Exception as e:
+                self.logger.log_error(f"Терморегулятор: не прочитать параметры {stream.name}: {e}")
+                return None
+
+        target = stream.target(level)
+        changed = {key: value for key, value in target.items() if stream.applied.get(key, stream.baseline.get(key)) != value}
+        stream.level = level
+        if not changed:
+            return None
+        try:
+            stream.set_fn(changed)
+            stream.applied.update(changed)
+        except Exception as e:
+            self.logger.log_error(f"Терморегулятор: ошибка применения {stream.name} {changed}: {e}")
+        if level == 0:
+            stream.baseline = None
+            stream.applied = {}
+        return changed
+
+    # ===== ПОТОК =====
+
+    def start(self):
+        if not self.enabled or self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, name='thermal-governor', daemon=True)
+        self.thread.start()
+        print(f"🌡️ Терморегулятор запущен: цель {self.target_c}°C, критично {self.critical_c}°C, "
+              f"уровней {self.max_level}, потоки {sorted(self.streams)}")
+
+    def stop(self):
+        self.running = False
+
+    def _loop(self):
+        while self.running:
+            try:
+                self.step()
+            except Exception as e:
+                self.logger.log_error(f"Ошибка терморегулятора: {e}")
+            time.sleep(self.interval_s)
+
+    def get_status(self):
+        now = time.monotonic()
+        time_at_level = dict(self.time_at_level)
+        time_at_level[self.level] = time_at_level.get(self.level, 0.0) + now - self.level_since
+        return {
+            'enabled': self.enabled,
+            'level': self.level,
+            'max_level': self.max_level,
+            'state': self.state,
+            'sensors': self.sensors,
+            'max_temp_c': self.max_temp_c,
+            'thresholds': {'target_c': self.target_c, 'critical_c': self.critical_c,
+                           'hysteresis_c': self.hysteresis_c, 'load_per_core': self.load_per_core},
+            'streams': {name: {'priority': stream.priority, 'level': stream.level,
+                               'applied': stream.applied, 'baseline': stream.baseline}
+                        for name, stream in self.streams.items()},
+            'time_at_level_s': {str(level): round(seconds, 1) for level, seconds in sorted(time_at_level.items())},
+            'decisions': list(self.decisions),
+        }
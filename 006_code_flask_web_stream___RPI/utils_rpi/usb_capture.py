@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+# usb_capture.py
+
+"""
+Захват USB камеры с минимальной задержкой.
+
+read() отдает самый старый кадр из очереди драйвера: при 4 буферах по
+умолчанию и кодировании медленнее камеры кадр в стриме отстает на несколько
+периодов. В режиме low_latency:
+  - очередь драйвера уменьшается (CAP_PROP_BUFFERSIZE, если драйвер принимает);
+  - grab() и retrieve() разделены: буферы, время которых (метка драйвера,
+    CAP_PROP_POS_MSEC) старше stale_ms, пропускаются без декодирования,
+    декодируется только последний;
+  - возраст кадра считается по метке буфера, а не по моменту чтения.
+
+Статистика (возраст кадра, пропущенные буферы, время grab / retrieve)
+ведется отдельно для каждой USB камеры.
+"""
+
+import time
+from collections import deque
+
+from utils_rpi.lazy_import import lazy_import
+
+# Тяжелые модули импортируются при первом обращении: импорт сервера их не загружает
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+
+# Метка дальше этого от текущего времени считается меткой другого часового источника
+_CLOCK_SANITY_S = 5.0
+
+
+def device_timestamp_to_monotonic(timestamp, arrival):
+    """
+    Метка времени устройства в шкале time.monotonic()
+
+    Время буферов V4L2 и SensorTimestamp идут в CLOCK_MONOTONIC, виртуальная
+    камера отдает time.time().
+
+    Returns:
+        Метка в time.monotonic() или None, если метки нет или она из другого источника
+    """
+    if not timestamp or timestamp <= 0:
+        return None
+    if abs(timestamp - arrival) < _CLOCK_SANITY_S:
+        return timestamp
+    if abs(timestamp - time.time()) < _CLOCK_SANITY_S:
+        return timestamp - (time.time() - time.monotonic())
+    return None
+
+
+class UsbCameraStats:
+    """Задержка и пропущенные буферы одной USB камеры"""
+
+    def __init__(self, device_path):
+        self.device_path = device_path
+        self.frames = 0
+        self.dropped_buffers = 0
+        self.timestamp_source = None  # 'driver' или 'arrival'
+        self.buffer_size = None
+        self.ages_ms = deque(maxlen=300)
+        self.grab_ms = deque(maxlen=300)
+        self.retrieve_ms = deque(maxlen=300)
+
+    @staticmethod
+    def _summary(values):
+        if not values:
+            return None
+        array = np.array(values)
+        return {
+            'p50': round(float(np.percentile(array, 50)), 2),
+            'p95': round(float(np.percentile(array, 95)), 2),
+            'max': round(float(array.max()), 2),
+        }
+
+    def get_status(self):
+        total = self.frames + self.dropped_buffers
+        return {
+            'device_path': self.device_path,
+            'buffer_size': self.buffer_size,
+            'timestamp_source': self.timestamp_source,
+            'frames': self.frames,
+            'dropped_buffers': self.dropped_buffers,
+            'dropped_percent': round(100.0 * self.dropped_buffers / total, 1) if total else 0.0,
+            'frame_age_ms': self._summary(self.ages_ms),
+            'grab_ms': self._summary(self.grab_ms),
+            'retrieve_ms': self._summary(self.retrieve_ms),
+        }
+
+
+class UsbFrameReader:
+    """Чтение кадра USB камеры: обычный read() или режим низкой задержки"""
+
+    def __init__(self, config):
+        usb_config = config.get('usb_capture', {}) or {}
+        self.low_latency = usb_config.get('low_latency', False)
+        self.buffer_count = int(usb_config.get('buffer_count', 1))
+        self.stale_ms = usb_config.get('stale_ms')  # None - один период кадра
+        self.max_drain = int(usb_config.get('max_drain', 4))
+
+        # device_path -> UsbCameraStats
+        self.cameras = {}
+
+    def _stats(self, device_path):
+        stats = self.cameras.get(device_path)
+        if stats is None:
+            stats = self.cameras[device_path] = UsbCameraStats(device_path)
+        return stats
+
+    def configure(self, camera, device_path):
+        """Уменьшение очереди драйвера (вызывать после открытия / смены режима)"""
+        stats = self._stats(str(device_path))
+        if self.low_latency:
+            try:
+                if not camera.set(cv2.CAP_PROP_BUFFERSIZE, self.buffer_count):
+                    print(f"⚠️ Драйвер {device_path} не принимает CAP_PROP_BUFFERSIZE")
+            except Exception as e:
+                print(f"⚠️ Не удалось изменить очередь буферов {device_path}: {e}")
+        try:
+            stats.buffer_size = int(camera.get(cv2.CAP_PROP_BUFFERSIZE)) or None
+        except Exception:
+            stats.buffer_size = None
+
+    def _stale_s(self, camera):
+        if self.stale_ms is not None:
+            return float(self.stale_ms) / 1000.0
+        fps = camera.get(cv2.CAP_PROP_FPS) or 30.0
+        return 1.0 / fps
+
+    def _grab_timestamp(self, camera, stats):
+        """grab() и метка буфера в time.monotonic() (или время получения)"""
+        start = time.perf_counter()
+        if not camera.grab():
+            return None
+        arrival = time.monotonic()
+        stats.grab_ms.append((time.perf_counter() - start) * 1000)
+        timestamp = device_timestamp_to_monotonic(camera.get(cv2.CAP_PROP_POS_MSEC) / 1000.0, arrival)
+        stats.timestamp_source = 'driver' if timestamp is not None else 'arrival'
+        return timestamp if timestamp is not None else arrival
+
+    def read(self, camera, device_path):
+        """
+        Кадр камеры
+
+        Returns:
+            (ret, frame, capture_mono): capture_mono - время буфера в time.monotonic()
+        """
+        stats = self._stats(str(device_path))
+
+        if not self.low_latency:
+            ret, frame = camera.read()
+            arrival = time.monotonic()
+            if not ret:
+                return False, None, None
+            timestamp = device_timestamp_to_monotonic(camera.get(cv2.CAP_PROP_POS_MSEC) / 1000.0, arrival)
+            stats.timestamp_source = 'driver' if timestamp is not None else 'arrival'
+            capture_mono = timestamp if timestamp is not None else arrival
+            stats.frames += 1
+            stats.ages_ms.append((arrival - capture_mono) * 1000)
+            return True, frame, capture_mono
+
+        capture_mono = self._grab_timestamp(camera, stats)
+        if capture_mono is None:
+            return False, None, None
+
+        # Буферы, пролежавшие в очереди дольше stale - пропускаем без декодирования
+        stale_s = self._stale_s(camera)
+        drained = 0
+        while time.monotonic() - capture_mono > stale_s and drained < self.max_drain:
+            newer = self._grab_timestamp(camera, stats)
+            if newer is None:
+                break
+            capture_mono = newer
+            drained += 1
+        stats.dropped_buffers += drained
+
+        start = time.perf_counter()
+        ret, frame = camera.retrieve()
+        done = time.monotonic()
+        stats.retrieve_ms.append((time.perf_counter() - start) * 1000)
+        if not ret or frame is None:
+            return False, None, None
+
+        stats.frames += 1
+        stats.ages_ms.append((done - capture_mono) * 1000)
+        return True, frame, capture_mono
+
+    def get_status(self):
+        return {
+            'low_latency': self.low_latency,
+            'buffer_count': self.buffer_count if self.low_latency else None,
+            'cameras': {device: stats.get_status() for device, stats in self.cameras.items()},
+        }
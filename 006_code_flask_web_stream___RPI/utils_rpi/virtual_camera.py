@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+
+# virtual_camera.py
+
+"""
+Виртуальная камера для работы стримера без реального железа.
+
+Источники кадров (virtual_camera.source в config_rpi.yaml):
+  - synthetic: сгенерированные кадры (градиент, движущийся объект, номер кадра)
+  - file: воспроизведение видеофайла
+  - images: воспроизведение папки с изображениями
+
+VirtualCamera повторяет интерфейс cv2.VideoCapture (isOpened, read, grab,
+retrieve, get, set, release), поэтому стример использует для нее тот же путь,
+что и для USB камер. Кадры отдаются в реальном времени с заданным FPS.
+"""
+
+import glob
+import os
+import threading
+import time
+from collections import deque
+
+from utils_rpi.lazy_import import lazy_import
+
+# Тяжелые модули импортируются при первом обращении: импорт сервера их не загружает
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+
+VIRTUAL_PREFIX = 'virtual'
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def is_virtual_device(device):
+    """Является ли устройство виртуальной камерой ('virtual', 'virtual_1', ...)"""
+    return str(device).startswith(VIRTUAL_PREFIX)
+
+
+def get_virtual_index(device):
+    """Индекс виртуальной камеры из имени устройства"""
+    parts = str(device).split('_')
+    if len(parts) > 1 and parts[1].isdigit():
+        return int(parts[1])
+    return 0
+
+
+def get_virtual_cameras_for_api(config):
+    """Список виртуальных камер в формате /api/cameras"""
+    virtual_config = config.get('virtual_camera', {}) or {}
+    source = virtual_config.get('source', 'synthetic')
+    width = virtual_config.get('width', 1280)
+    height = virtual_config.get('height', 720)
+
+    cameras = []
+    for idx in range(int(virtual_config.get('count', 1))):
+        cameras.append({
+            'device_path': f"{VIRTUAL_PREFIX}_{idx}",
+            'name': f"Virtual camera #{idx} ({source})",
+            'type': 'VIRTUAL',
+            'formats': ['BGR'],
+            'resolutions': [f"{width}x{height}"],
+            'is_camera': True,
+            'is_current': False
+        })
+    return cameras
+
+
+class VirtualCamera:
+    """Источник кадров с интерфейсом cv2.VideoCapture"""
+
+    def __init__(self, virtual_config, index=0):
+        """
+        Args:
+            virtual_config: Секция virtual_camera из конфигурации
+            index: Номер виртуальной камеры (влияет на цвет синтетических кадров)
+        """
+        self.index = index
+        self.source = virtual_config.get('source', 'synthetic')
+        self.path = virtual_config.get('path', '')
+        self.loop = virtual_config.get('loop', True)
+        self.realtime = virtual_config.get('realtime', True)
+        # Эмуляция MJPEG камеры: FOURCC MJPG и сжатые кадры при CONVERT_RGB=0
+        self.mjpeg = virtual_config.get('mjpeg', False)
+        self.convert_rgb = True
+        # Принимать set() разрешения и FPS (проверка перенастройки без перезапуска)
+        self.settable = virtual_config.get('settable', False)
+        # Эмуляция очереди буферов драйвера V4L2 (0 - без очереди, кадр всегда свежий)
+        self.driver_buffers = int(virtual_config.get('driver_buffers', 0) or 0)
+        self._queue = deque()
+        # Эмуляция зависшей USB камеры: через stall_after_s после открытия повторяется один буфер
+        self.stall_after_s = float(virtual_config.get('stall_after_s', 0) or 0)
+        self._stalled_frame = None
+        self._produce_start = None
+        self._produced = 0
+
+        self.width = int(virtual_config.get('width', 1280) or 0)
+        self.height = int(virtual_config.get('height', 720) or 0)
+        self.fps = float(virtual_config.get('fps', 30) or 0)
+
+        self.lock = threading.Lock()
+        self.opened = False
+        self.frame_index = 0
+        self.frame_time = 0.0
+        self.next_frame_time = None
+        self.grabbed = False
+
+        self._file = None
+        self._images = []
+        self._image_cache = {}
+        self._cache_size = int(virtual_config.get('cache_size', 64))
+        self._background = None
+
+        self._open()
+
+    def _open(self):
+        """Открытие источника кадров"""
+        if self.source == 'file':
+            self._file = cv2.VideoCapture(self.path)
+            if not self._file.isOpened():
+                print(f"❌ Виртуальная камера: не удалось открыть файл {self.path}")
+                return
+            if not self.fps:
+                self.fps = self._file.get(cv2.CAP_PROP_FPS) or 30.0
+            if not self.width or not self.height:
+                self.width = int(self._file.get(cv2.CAP_PROP_FRAME_WIDTH))
+                self.height = int(self._file.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+        elif self.source == 'images':
+            self._images = sorted(
+                p for p in glob.glob(os.path.join(self.path, '*'))
+                if p.lower().endswith(IMAGE_EXTENSIONS)
+            )
+            if not self._images:
+                print(f"❌ Виртуальная камера: нет изображений в {self.path}")
+                return
+            if not self.width or not self.height:
+                first = cv2.imread(self._images[0])
+                self.height, self.width = first.shape[:2]
+
+        else:
+            self.source = 'synthetic'
+            self.width = self.width or 1280
+            self.height = self.height or 720
+            self._background = self._make_background()
+
+        self.fps = self.fps or 30.0
+        self.opened_at = time.time()
+        self.opened = True
+        print(f"🧪 Виртуальная камера #{self.index}: {self.source} {self.width}x{self.height} @ {self.fps:.1f}fps")
+
+    def _make_background(self):
+        """Фон синтетических кадров (считается один раз)"""
+        x = np.linspace(0, 255, self.width, dtype=np.float32)
+        y = np.linspace(0, 255, self.height, dtype=np.float32)
+        background = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        background[:, :, 0] = ((x[None, :] + self.index * 80) % 256).astype(np.uint8)
+        background[:, :, 1] = y[:, None].astype(np.uint8)
+        background[:, :, 2] = (255 - x[None, :] / 2).astype(np.uint8)
+        return background
+
+    # ===== ИНТЕРФЕЙС cv2.VideoCapture =====
+
+    def isOpened(self):
+        return self.opened
+
+    def getBackendName(self):
+        return 'VIRTUAL'
+
+    def grab(self):
+        """Ожидание следующего кадра по расписанию FPS"""
+        if not self.opened:
+            return False
+
+        with self.lock:
+            period = 1.0 / self.fps
+            now = time.time()
+            if self.realtime and self.driver_buffers > 0:
+                self.frame_time = self._dequeue_buffer(period)
+            elif self.realtime:
+                if self.next_frame_time is None or now - self.next_frame_time > period:
+                    # Отстали больше чем на кадр - не догоняем пачкой
+                    self.next_frame_time = now
+                elif self.next_frame_time > now:
+                    time.sleep(self.next_frame_time - now)
+                self.frame_time = self.next_frame_time
+                self.next_frame_time += period
+            else:
+                self.frame_time = now
+
+            if self.source == 'file':
+                ok = self._file.grab()
+                if not ok and self.loop:
+                    self._file.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    ok = self._file.grab()
+                if not ok:
+                    self.grabbed = False
+                    return False
+
+            self.frame_index += 1
+            self.grabbed = True
+            return True
+
+    def _dequeue_buffer(self, period):
+        """
+        Кадр из эмулируемой очереди драйвера (время захвата самого старого буфера)
+
+        Камера снимает кадр каждые period; пока все driver_buffers буферов заняты,
+        новые кадры теряются - как у V4L2, очередь хранит самые старые кадры.
+        """
+        if self._produce_start is None:
+            self._produce_start = time.time()
+            self._produced = 0
+        while True:
+            now = time.time()
+            while self._produce_start + self._produced * period <= now:
+                if len(self._queue) < self.driver_buffers:
+                    self._queue.append(self._produce_start + self._produced * period)
+                self._produced += 1
+            if self._queue:
+                return self._queue.popleft()
+            time.sleep(max(0.0, self._produce_start + self._produced * period - now))
+
+    def retrieve(self, image=None, flag=0):
+        """Получение захваченного кадра"""
+        if not self.opened or not self.grabbed:
+            return False, None
+
+        with self.lock:
+            if self._stalled_frame is not None:
+                frame = self._stalled_frame
+            elif self.source == 'synthetic':
+                frame = self._render_synthetic()
+            elif self.source == 'file':
+                ok, frame = self._file.retrieve()
+                if not ok:
+                    return False, None
+            else:
+                frame = self._load_image((self.frame_index - 1) % len(self._images))
+                if frame is None:
+                    return False, None
+
+        if frame.shape[1] != self.width or frame.shape[0] != self.height:
+            frame = cv2.resize(frame, (self.width, self.height), interpolation=cv2.INTER_AREA)
+
+        if self.stall_after_s and self._stalled_frame is None and time.time() - self.opened_at >= self.stall_after_s:
+            print(f"🧪 Виртуальная камера #{self.index}: эмуляция зависания (повтор кадра)")
+            self._stalled_frame = frame
+
+        if self.mjpeg and not self.convert_rgb:
+            # Как OpenCV для MJPEG камеры: одномерный буфер JPEG без декодирования
+            ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
+            return (True, buffer.reshape(1, -1)) if ret else (False, None)
+        return True, frame
+
+    def read(self, image=None):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def get(self, prop_id):
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop_id == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        if prop_id == cv2.CAP_PROP_FOURCC:
+            return float(cv2.VideoWriter_fourcc(*('MJPG' if self.mjpeg else 'BGR3')))
+        if prop_id == cv2.CAP_PROP_CONVERT_RGB:
+            return 1.0 if self.convert_rgb else 0.0
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.frame_index)
+        if prop_id == cv2.CAP_PROP_POS_MSEC:
+            return self.frame_time * 1000.0
+        if prop_id == cv2.CAP_PROP_BUFFERSIZE:
+            return float(self.driver_buffers or 1)
+        return 0.0
+
+    def set(self, prop_id, value):
+        """Режим источника фиксирован (как у камеры с одним режимом), если не settable"""
+        if prop_id == cv2.CAP_PROP_CONVERT_RGB and self.mjpeg:
+            self.convert_rgb = bool(value)
+            return True
+        if prop_id == cv2.CAP_PROP_BUFFERSIZE and self.driver_buffers > 0 and value >= 1:
+            with self.lock:
+                self.driver_buffers = int(value)
+                while len(self._queue) > self.driver_buffers:
+                    self._queue.popleft()
+            return True
+        if not self.settable or value <= 0 or prop_id not in (
+                cv2.CAP_PROP_FRAME_WIDTH, cv2.CAP_PROP_FRAME_HEIGHT, cv2.CAP_PROP_FPS):
+            return False
+
+        with self.lock:
+            if prop_id == cv2.CAP_PROP_FPS:
+                self.fps = float(value)
+                return True
+            if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+                self.width = int(value)
+            else:
+                self.height = int(value)
+            if self.source == 'synthetic':
+                self._background = self._make_background()
+        return True
+
+    def release(self):
+        with self.lock:
+            if self._file is not None:
+                self._file.release()
+                self._file = None
+            self._image_cache.clear()
+            self.opened = False
+
+    # ===== ГЕНЕРАЦИЯ КАДРОВ =====
+
+    def _render_synthetic(self):
+        """Синтетический кадр: фон + движущийся квадрат + номер кадра"""
+        frame = self._background.copy()
+
+        size = max(16, self.height // 6)
+        span_x = max(1, self.width - size)
+        span_y = max(1, self.height - size)
+        x = int((self.frame_index * 7) % (2 * span_x))
+        y = int((self.frame_index * 5) % (2 * span_y))
+        x = x if x < span_x else 2 * span_x - x
+        y = y if y < span_y else 2 * span_y - y
+        cv2.rectangle(frame, (x, y), (x + size, y + size), (255, 255, 255), -1)
+
+        scale = max(0.5, self.height / 720)
+        cv2.putText(frame, f"virtual_{self.index} #{self.frame_index}", (20, int(50 * scale)),
+                    cv2.FONT_HERSHEY_SIMPLEX, scale, (0, 0, 0), max(1, int(2 * scale)))
+        cv2.putText(frame, time.strftime('%H:%M:%S') + f".{int(self.frame_time * 1000) % 1000:03d}",
+                    (20, int(100 * scale)), cv2.FONT_HERSHEY_SIMPLEX, scale, (0, 0, 0),
+                    max(1, int(2 * scale)))
+        return frame
+
+    def _load_image(self, idx):
+        """Изображение из папки (с кэшем декодированных кадров)"""
+        frame = self._image_cache.get(idx)
+        if frame is None:
+            frame = cv2.imread(self._images[idx])
+            if frame is None:
+                return None
+            if len(self._image_cache) < self._cache_size:
+                self._image_cache[idx] = frame
+        # Копия: кэшированный кадр не должен меняться при отрисовке поверх
+        return frame.copy()
+
+
+def open_virtual_camera(config, device=VIRTUAL_PREFIX):
+    """Создание виртуальной камеры по конфигурации"""
+    camera = VirtualCamera(config.get('virtual_camera', {}) or {}, get_virtual_index(device))
+    if not camera.isOpened():
+        return None
+    return camera